@@ -1,7 +1,11 @@
-# <pep8 compliant>
-
-from .xmodel import Model
-from .xanim import Anim
-from .sanim import SiegeAnim
-
-version = (0, 3, 0)  # Version specifier for PyCoD
+# <pep8 compliant>
+
+from .xmodel import Model
+from .xmodel_arrays import ModelArrays
+from .xanim import Anim
+from .xanim_arrays import AnimArrays
+from .xanim_keys import AnimKeys
+from .sanim import SiegeAnim
+from ._writer import FloatFormat
+
+version = (0, 3, 0)  # Version specifier for PyCoD
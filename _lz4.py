@@ -1,138 +1,864 @@
-try:
-    # Try to import the python-lz4 package
-    import lz4.block
+import struct
+import sys
+from io import BytesIO, SEEK_SET, SEEK_CUR, UnsupportedOperation
 
-except ImportError:
-    # If python-lz4 isn't present, fallback to using pure python
-    from io import BytesIO
+# Compression levels accepted by compress()
+LEVEL_STORE = 0  # A single literal run (no compression)
+LEVEL_FAST = 1  # Hash table match finder
+LEVEL_HIGH = 2  # Hash chain match finder
 
-    try:
-        from six import byte2int
-        from six.moves import xrange
-    except ImportError:
-        xrange = range
-
-        # If we're running Python 3 or newer, we must
-        #  define byte2int differently than with Python 2
-        import sys
-        if sys.version_info[0] >= 3:
-            import operator
-            byte2int = operator.itemgetter(0)
-        else:
-            def byte2int(_bytes):
-                return ord(_bytes[0])
 
-    class CorruptError(Exception):
-        pass
+class CorruptError(Exception):
+    pass
 
-    __support_mode__ = 'pure Python'
 
-    def uncompress(src, offset=4):
-        """uncompress a block of lz4 data.
+'''
+    ---------------------
+    ---< Pure Python >---
+    ---------------------
+'''
 
-        :param bytes src: lz4 compressed data (LZ4 Blocks)
-        :param int offset: offset that the uncompressed data starts at
-                           (Used to implicitly read the uncompressed data size)
-        :returns: uncompressed data
-        :rtype: bytearray
+# Indexing a memoryview yields ints on Python 3, but single character
+#  strings on Python 2 - so Python 2 has to work on a bytearray copy
+if sys.version_info[0] >= 3:
+    __byte_view__ = memoryview
+else:
+    __byte_view__ = bytearray
+
+__uint16__ = struct.Struct('<H')
+__uint32__ = struct.Struct('<I')
+
+MIN_MATCH = 4
+# The last match must start at least 12 bytes before the end of the block
+#  and the last 5 bytes are always literals
+MFLIMIT = 12
+LAST_LITERALS = 5
+MAX_DISTANCE = 0xffff
+
+HASH_LOG = 16
+# The number of compressed bytes pure_uncompress_stream() reads at a time
+STREAM_CHUNK_SIZE = 1 << 20
+# The fast level skips ahead faster the longer it goes without a match
+SKIP_STRENGTH = 6
+# The high level stops walking a hash chain after this many candidates,
+#  or as soon as it finds a match of at least HC_NICE_LENGTH bytes
+HC_MAX_ATTEMPTS = 16
+HC_NICE_LENGTH = 64
+
+
+def pure_uncompress(src, offset=4):
+    """uncompress a block of lz4 data.
+
+    :param bytes src: lz4 compressed data (LZ4 Blocks)
+    :param int offset: offset that the uncompressed data starts at
+                       (Used to implicitly read the uncompressed data size)
+    :returns: uncompressed data
+    :rtype: bytearray
+
+    .. seealso:: http://cyan4973.github.io/lz4/lz4_Block_format.html
+    """
+    src = __byte_view__(src)
+    src_size = len(src)
+
+    # If the uncompressed size is stored in front of the block, the output
+    #  buffer can be allocated once and filled in place. Otherwise we
+    #  fall back to growing the buffer as we go (slice assignment at the
+    #  end of a bytearray appends to it)
+    if offset >= 4:
+        dst_size = __uint32__.unpack_from(src, offset - 4)[0]
+        dst = bytearray(dst_size)
+        dst_limit = dst_size
+    else:
+        dst_size = None
+        dst = bytearray()
+        dst_limit = sys.maxsize
 
-        .. seealso:: http://cyan4973.github.io/lz4/lz4_Block_format.html
-        """
-        src = BytesIO(src)
-        if offset > 0:
-            src.read(offset)
+    sp = offset  # src position
+    dp = 0  # dst position
 
-        # if we have the original size, we could pre-allocate the buffer with
-        # bytearray(original_size), but then we would have to use indexing
-        # instad of .append() and .extend()
-        dst = bytearray()
-        min_match_len = 4
+    try:
+        while True:
+            # decode a sequence
+            token = src[sp]
+            sp += 1
+
+            literal_len = token >> 4
+            if literal_len == 0x0f:
+                len_part = 0xff
+                while len_part == 0xff:
+                    len_part = src[sp]
+                    sp += 1
+                    literal_len += len_part
 
-        def get_length(src, length):
-            """get the length of a lz4 variable length integer."""
-            if length != 0x0f:
-                return length
+            # copy the literal to the output buffer
+            if literal_len:
+                literal_end = sp + literal_len
+                if literal_end > src_size:
+                    raise CorruptError("not literal data")
+                if dp + literal_len > dst_limit:
+                    raise CorruptError(
+                        "literal exceeds the uncompressed size")
+                dst[dp:dp + literal_len] = src[sp:literal_end]
+                sp = literal_end
+                dp += literal_len
 
-            while True:
-                read_buf = src.read(1)
-                if len(read_buf) != 1:
-                    raise CorruptError("EOF at length read")
-                len_part = byte2int(read_buf)
+            # the last sequence only contains literals
+            if sp == src_size:
+                if token & 0x0f != 0:
+                    raise CorruptError(
+                        "EOF, but match-len > 0: %u" % (token & 0x0f, ))
+                break
 
-                length += len_part
+            match_offset = src[sp] | (src[sp + 1] << 8)
+            sp += 2
 
-                if len_part != 0xff:
-                    break
+            match_len = token & 0x0f
+            if match_len == 0x0f:
+                len_part = 0xff
+                while len_part == 0xff:
+                    len_part = src[sp]
+                    sp += 1
+                    match_len += len_part
+            match_len += MIN_MATCH
 
+            match_start = dp - match_offset
+            if match_offset == 0:
+                raise CorruptError("offset can't be 0")
+            if match_start < 0:
+                raise CorruptError("offset outside of the decoded data")
+            if dp + match_len > dst_limit:
+                raise CorruptError("match exceeds the uncompressed size")
+
+            if match_len <= match_offset:
+                # the match doesn't overlap the bytes it produces
+                match_end = match_start + match_len
+                dst[dp:dp + match_len] = dst[match_start:match_end]
+            else:
+                # overlapping matches repeat the last match_offset bytes
+                #  so they can be copied in whole chunks of that pattern
+                pattern = dst[match_start:dp]
+                count, remainder = divmod(match_len, match_offset)
+                dst[dp:dp + match_len] = (pattern * count +
+                                          pattern[:remainder])
+            dp += match_len
+    except IndexError:
+        raise CorruptError("premature EOF")
+
+    if dst_size is not None and dp != dst_size:
+        raise CorruptError("decoded %d bytes, expected %d" %
+                           (dp, dst_size))
+
+    return dst
+
+
+def __reference_uncompress__(src, offset=4):
+    '''
+    The original byte at a time decoder that pure_uncompress replaced - kept
+     as the reference implementation for uncompress_report()
+    '''
+    src = BytesIO(src)
+    if offset > 0:
+        src.read(offset)
+
+    dst = bytearray()
+
+    def byte2int(read_buf):
+        return bytearray(read_buf)[0]
+
+    def get_length(src, length):
+        """get the length of a lz4 variable length integer."""
+        if length != 0x0f:
             return length
 
         while True:
-            # decode a block
             read_buf = src.read(1)
-            if not read_buf:
-                raise CorruptError("EOF at reading literal-len")
-            token = byte2int(read_buf)
+            if len(read_buf) != 1:
+                raise CorruptError("EOF at length read")
+            len_part = byte2int(read_buf)
 
-            literal_len = get_length(src, (token >> 4) & 0x0f)
-
-            # copy the literal to the output buffer
-            read_buf = src.read(literal_len)
+            length += len_part
 
-            if len(read_buf) != literal_len:
-                raise CorruptError("not literal data")
-            dst.extend(read_buf)
+            if len_part != 0xff:
+                break
 
-            read_buf = src.read(2)
-            if not read_buf:
+        return length
+
+    while True:
+        # decode a block
+        read_buf = src.read(1)
+        if not read_buf:
+            raise CorruptError("EOF at reading literal-len")
+        token = byte2int(read_buf)
+
+        literal_len = get_length(src, (token >> 4) & 0x0f)
+
+        # copy the literal to the output buffer
+        read_buf = src.read(literal_len)
+
+        if len(read_buf) != literal_len:
+            raise CorruptError("not literal data")
+        dst.extend(read_buf)
+
+        read_buf = src.read(2)
+        if not read_buf:
+            if token & 0x0f != 0:
+                raise CorruptError(
+                    "EOF, but match-len > 0: %u" % (token % 0x0f, ))
+            break
+
+        if len(read_buf) != 2:
+            raise CorruptError("premature EOF")
+
+        match_offset = byte2int(read_buf[0:1]) | (byte2int(read_buf[1:2]) << 8)
+
+        if match_offset == 0:
+            raise CorruptError("offset can't be 0")
+
+        match_len = get_length(src, (token >> 0) & 0x0f)
+        match_len += MIN_MATCH
+
+        # append the sliding window of the previous literals
+        for _ in range(match_len):
+            dst.append(dst[-match_offset])
+
+    return dst
+
+
+def pure_uncompress_stream(src_file, chunk_size=STREAM_CHUNK_SIZE):
+    """uncompress a block of lz4 data incrementally.
+
+    :param file src_file: file-like object positioned at the uncompressed
+                          size that precedes the lz4 data
+    :param int chunk_size: number of compressed bytes read at a time
+                           (also the rough size of each yielded chunk)
+    :returns: generator yielding the uncompressed data in chunks
+    :rtype: generator of bytes
+
+    Only the last MAX_DISTANCE bytes of output (the lz4 match window) and
+    the current chunk of input are ever held in memory.
+    """
+    src = bytearray(src_file.read(max(chunk_size, 4)))
+    if len(src) < 4:
+        raise CorruptError("EOF at reading the uncompressed size")
+    dst_size = __uint32__.unpack_from(src, 0)[0]
+
+    src_size = len(src)
+    sp = 4  # src position
+    eof = False
+
+    # dst only holds the match window plus whatever hasn't been
+    #  yielded yet - dst_base is the absolute position of dst[0]
+    dst = bytearray()
+    dst_base = 0
+    flush_size = MAX_DISTANCE + 1 + chunk_size
+
+    while True:
+        # Parse the next sequence without consuming it - if the sequence
+        #  runs past the end of the buffered input, more input is read
+        #  and the sequence is parsed again
+        seq_start = sp
+        try:
+            token = src[sp]
+            sp += 1
+
+            literal_len = token >> 4
+            if literal_len == 0x0f:
+                len_part = 0xff
+                while len_part == 0xff:
+                    len_part = src[sp]
+                    sp += 1
+                    literal_len += len_part
+
+            literal_start = sp
+            sp += literal_len
+            if sp > src_size or (sp == src_size and not eof):
+                raise IndexError
+
+            if sp == src_size:
+                # the last sequence only contains literals
                 if token & 0x0f != 0:
                     raise CorruptError(
-                        "EOF, but match-len > 0: %u" % (token % 0x0f, ))
+                        "EOF, but match-len > 0: %u" % (token & 0x0f, ))
+                dst += src[literal_start:sp]
                 break
 
-            if len(read_buf) != 2:
-                raise CorruptError("premature EOF")
-
-            offset = byte2int([read_buf[0]]) | (byte2int([read_buf[1]]) << 8)
-
-            if offset == 0:
-                raise CorruptError("offset can't be 0")
-
-            match_len = get_length(src, (token >> 0) & 0x0f)
-            match_len += min_match_len
-
-            # append the sliding window of the previous literals
-            for _ in xrange(match_len):
-                dst.append(dst[-offset])
+            match_offset = src[sp] | (src[sp + 1] << 8)
+            sp += 2
 
-        return dst
+            match_len = token & 0x0f
+            if match_len == 0x0f:
+                len_part = 0xff
+                while len_part == 0xff:
+                    len_part = src[sp]
+                    sp += 1
+                    match_len += len_part
+            match_len += MIN_MATCH
 
-    def compress(data):
+        except IndexError:
+            if eof:
+                raise CorruptError("premature EOF")
+            chunk = src_file.read(chunk_size)
+            if not chunk:
+                eof = True
+            src = src[seq_start:] + chunk
+            src_size = len(src)
+            sp = 0
+            continue
+
+        if literal_len:
+            dst += src[literal_start:literal_start + literal_len]
+
+        dp = len(dst)
+        match_start = dp - match_offset
+        if match_offset == 0:
+            raise CorruptError("offset can't be 0")
+        if match_start < 0:
+            raise CorruptError("offset outside of the decoded data")
+
+        if match_len <= match_offset:
+            dst += dst[match_start:match_start + match_len]
+        else:
+            pattern = dst[match_start:dp]
+            count, remainder = divmod(match_len, match_offset)
+            dst += pattern * count + pattern[:remainder]
+
+        # hand out everything that has left the match window
+        if len(dst) >= flush_size:
+            flush_len = len(dst) - (MAX_DISTANCE + 1)
+            yield bytes(dst[:flush_len])
+            del dst[:flush_len]
+            dst_base += flush_len
+
+    if dst_base + len(dst) != dst_size:
+        raise CorruptError("decoded %d bytes, expected %d" %
+                           (dst_base + len(dst), dst_size))
+    if dst:
+        yield bytes(dst)
+
+
+def __write_length__(dst, length):
+    """append the extra bytes of a lz4 variable length integer."""
+    length -= 0x0f
+    dst.extend(b'\xff' * (length // 0xff))
+    dst.append(length % 0xff)
+
+
+def __write_sequence__(dst, literals, match_offset=0, match_len=0):
+    """append a single lz4 sequence (a literal run + an optional match)
+    to dst. A match_len of 0 writes the final literal-only sequence."""
+    literal_len = len(literals)
+    if match_len:
+        match_len -= MIN_MATCH
+    token = (min(literal_len, 0x0f) << 4) | min(match_len, 0x0f)
+    dst.append(token)
+    if literal_len >= 0x0f:
+        __write_length__(dst, literal_len)
+    dst.extend(literals)
+    if match_offset:
+        dst.extend(__uint16__.pack(match_offset))
+        if match_len >= 0x0f:
+            __write_length__(dst, match_len)
+
+
+def __match_length__(src, pos, ref, limit):
+    """count the number of bytes after src[pos] that match src[ref]"""
+    start = pos
+    # compare in whole chunks first, then finish byte by byte
+    while pos + 8 <= limit and src[pos:pos + 8] == src[ref:ref + 8]:
+        pos += 8
+        ref += 8
+    while pos < limit and src[pos] == src[ref]:
+        pos += 1
+        ref += 1
+    return pos - start
+
+
+def __compress_store__(src):
+    """Wrap src in a single literal-only lz4 sequence."""
+    dst = bytearray()
+    __write_sequence__(dst, src)
+    return dst
+
+
+def __compress_fast__(src):
+    """Greedy lz4 compression using a single-entry hash table.
+
+    Each position only remembers the most recent position with the same
+    hash, and the scan accelerates through data that doesn't compress.
+    """
+    src_size = len(src)
+    if src_size < MFLIMIT + 1:
+        return __compress_store__(src)
+
+    read_sequence = __uint32__.unpack_from
+    hash_shift = 32 - HASH_LOG
+    table = [-1] * (1 << HASH_LOG)
+    dst = bytearray()
+
+    anchor = 0
+    pos = 0
+    search_limit = src_size - MFLIMIT
+    match_limit = src_size - LAST_LITERALS
+    misses = 0
+
+    while pos < search_limit:
+        sequence = read_sequence(src, pos)[0]
+        h = ((sequence * 2654435761) & 0xffffffff) >> hash_shift
+        ref = table[h]
+        table[h] = pos
+
+        if (ref < 0 or pos - ref > MAX_DISTANCE or
+                read_sequence(src, ref)[0] != sequence):
+            misses += 1
+            pos += 1 + (misses >> SKIP_STRENGTH)
+            continue
+        misses = 0
+
+        # extend the match backwards into the pending literals
+        while pos > anchor and ref > 0 and src[pos - 1] == src[ref - 1]:
+            pos -= 1
+            ref -= 1
+
+        match_len = MIN_MATCH + __match_length__(
+            src, pos + MIN_MATCH, ref + MIN_MATCH, match_limit)
+
+        __write_sequence__(dst, src[anchor:pos], pos - ref, match_len)
+        pos += match_len
+        anchor = pos
+
+        # prime the table with a position inside the match
+        if pos - 2 < search_limit:
+            sequence = read_sequence(src, pos - 2)[0]
+            h = ((sequence * 2654435761) & 0xffffffff) >> hash_shift
+            table[h] = pos - 2
+
+    __write_sequence__(dst, src[anchor:])
+    return dst
+
+
+def __compress_high__(src):
+    """Greedy lz4 compression using hash chains.
+
+    Every position is linked to the previous position with the same hash,
+    and up to HC_MAX_ATTEMPTS candidates are compared to find the longest
+    match.
+    """
+    src_size = len(src)
+    if src_size < MFLIMIT + 1:
+        return __compress_store__(src)
+
+    read_sequence = __uint32__.unpack_from
+    hash_shift = 32 - HASH_LOG
+    head = [-1] * (1 << HASH_LOG)
+    # chain[pos & MAX_DISTANCE] is the previous position with the same
+    #  hash as pos - only positions inside the window are ever walked
+    chain = [-1] * (MAX_DISTANCE + 1)
+    dst = bytearray()
+
+    anchor = 0
+    pos = 0
+    next_insert = 0
+    search_limit = src_size - MFLIMIT
+    match_limit = src_size - LAST_LITERALS
+
+    while pos < search_limit:
+        # link every position up to (and including) pos into the chains
+        while next_insert <= pos:
+            sequence = read_sequence(src, next_insert)[0]
+            h = ((sequence * 2654435761) & 0xffffffff) >> hash_shift
+            chain[next_insert & MAX_DISTANCE] = head[h]
+            head[h] = next_insert
+            next_insert += 1
+
+        sequence = read_sequence(src, pos)[0]
+        best_len = 0
+        best_ref = -1
+        ref = chain[pos & MAX_DISTANCE]
+        attempts = HC_MAX_ATTEMPTS
+        while ref >= 0 and pos - ref <= MAX_DISTANCE and attempts:
+            attempts -= 1
+            if read_sequence(src, ref)[0] == sequence:
+                match_len = MIN_MATCH + __match_length__(
+                    src, pos + MIN_MATCH, ref + MIN_MATCH, match_limit)
+                if match_len > best_len:
+                    best_len = match_len
+                    best_ref = ref
+                    if match_len >= HC_NICE_LENGTH:
+                        break
+            next_ref = chain[ref & MAX_DISTANCE]
+            if next_ref >= ref:
+                break
+            ref = next_ref
+
+        if best_ref < 0:
+            pos += 1
+            continue
+
+        __write_sequence__(dst, src[anchor:pos], pos - best_ref, best_len)
+        pos += best_len
+        anchor = pos
+
+    __write_sequence__(dst, src[anchor:])
+    return dst
+
+
+__compressors__ = {
+    LEVEL_STORE: __compress_store__,
+    LEVEL_FAST: __compress_fast__,
+    LEVEL_HIGH: __compress_high__,
+}
+
+
+def pure_compress(data, level=LEVEL_FAST):
+    '''
+    Accepts a byte array as input - returns a LZ4 compatible byte array
+    level selects the match finder: LEVEL_STORE (no compression),
+     LEVEL_FAST (hash table) or LEVEL_HIGH (hash chains)
+    '''
+    if level not in __compressors__:
+        raise ValueError("Unknown LZ4 compression level %r" % level)
+    if not isinstance(data, (bytes, bytearray)):
+        data = bytes(data)
+    return __compressors__[level](data)
+
+
+class StreamReader(object):
+    '''
+    A read-only file-like object over an iterable of byte chunks
+    (such as the generator returned by uncompress_stream)
+    Seeking is only supported within the current chunk or forwards
+    '''
+
+    def __init__(self, chunks, name=None):
+        self.name = name
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self._pos = 0  # position within _buffer
+        self._base = 0  # absolute position of _buffer[0]
+
+    def __next_chunk__(self):
+        for chunk in self._chunks:
+            if chunk:
+                self._base += len(self._buffer)
+                self._buffer = chunk
+                self._pos = 0
+                return True
+        self._pos = len(self._buffer)
+        return False
+
+    def read(self, size=-1):
+        pos = self._pos
+        end = pos + size
+        if size >= 0 and end <= len(self._buffer):
+            self._pos = end
+            return self._buffer[pos:end]
+
+        parts = [self._buffer[pos:]]
+        remaining = size - len(parts[0])
+        self._pos = len(self._buffer)
+        while (size < 0 or remaining > 0) and self.__next_chunk__():
+            if size < 0:
+                take = len(self._buffer)
+            else:
+                take = min(remaining, len(self._buffer))
+                remaining -= take
+            parts.append(self._buffer[:take])
+            self._pos = take
+        return b''.join(parts)
+
+    def chunks(self):
         '''
-        Accepts a byte array as input - returns a LZ4 compatible (uncompressed)
-         byte array
+        Returns a generator over the remaining data, a chunk at a time
         '''
-        length = len(data)
-        if length > 15:
-            result = [15 << 4 | 0]  # Add the token
-
-            # Add the literal size bytes
-            result.extend([255] * (int)((length - 15) / 255))
-            result.append((int)((length - 15) % 255))
-        else:  # length <= 15
-            result = [length << 4 | 0]  # Add the token
-            if length == 15:
-                result.append(0)  # Add the empty length byte
-
-        result.extend(data)
-        return bytearray(result)
+        if self._pos < len(self._buffer):
+            yield self._buffer[self._pos:]
+            self._pos = len(self._buffer)
+        for chunk in self._chunks:
+            self._base += len(self._buffer)
+            self._buffer = chunk
+            self._pos = len(chunk)
+            yield chunk
+
+    def tell(self):
+        return self._base + self._pos
+
+    def seek(self, offset, whence=SEEK_SET):
+        if whence == SEEK_CUR:
+            offset += self.tell()
+        elif whence != SEEK_SET:
+            raise UnsupportedOperation("can't seek relative to the end of a"
+                                       " stream")
+
+        if offset < self._base:
+            raise UnsupportedOperation("can't seek backwards past the"
+                                       " current chunk of a stream")
+
+        skip = offset - self._base - len(self._buffer)
+        if skip > 0:
+            self._pos = len(self._buffer)
+            self.read(skip)
+        else:
+            self._pos = offset - self._base
+        return self.tell()
+
+    def close(self):
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+        self._buffer = b''
+        self._pos = 0
+
+
+'''
+    ------------------------
+    ---< Codec Registry >---
+    ------------------------
+'''
+
+
+class Codec(object):
+    '''
+    An LZ4 block implementation that can be used for *_bin files
+        compress(data, level) returns the compressed block
+         (without the uncompressed size)
+        uncompress(src) returns the uncompressed block
+         (src starts with the uncompressed size as a uint32)
+        uncompress_stream(src_file, chunk_size) yields the uncompressed block
+         in chunks (optional - by default the whole block is yielded at once)
+        default_level is the level used when none is given
+    '''
+    __slots__ = ('name', 'compress', 'uncompress', 'uncompress_stream',
+                 'default_level')
+
+    def __init__(self, name, compress, uncompress, uncompress_stream=None,
+                 default_level=LEVEL_FAST):
+        self.name = name
+        self.compress = compress
+        self.uncompress = uncompress
+        self.default_level = default_level
+        if uncompress_stream is None:
+            def uncompress_stream(src_file, chunk_size=None):
+                yield uncompress(src_file.read())
+        self.uncompress_stream = uncompress_stream
+
+
+# Registered codecs - the most recently registered one is preferred
+__codecs__ = []
+# Name of the codec forced with set_default_codec() (or None)
+__forced_codec__ = None
+
+
+def __update_support_info__():
+    global __support_mode__, support_info
+    __support_mode__ = get_codec().name
+    support_info = 'LZ4: Using %s' % __support_mode__
+
+
+def register_codec(name, compress, uncompress, uncompress_stream=None,
+                   default_level=LEVEL_FAST):
+    '''
+    Register an LZ4 backend (replacing any codec with the same name)
+    Unless a codec has been forced with set_default_codec(), the most
+     recently registered codec is the one that gets used
+    '''
+    unregister_codec(name)
+    __codecs__.append(Codec(name, compress, uncompress, uncompress_stream,
+                            default_level))
+    __update_support_info__()
+
+
+def unregister_codec(name):
+    global __forced_codec__
+    for codec in __codecs__:
+        if codec.name == name:
+            __codecs__.remove(codec)
+            if __forced_codec__ == name:
+                __forced_codec__ = None
+            if __codecs__:
+                __update_support_info__()
+            return
+
+
+def available_codecs():
+    '''
+    Returns the names of all registered codecs, from most to least preferred
+    '''
+    return [codec.name for codec in reversed(__codecs__)]
+
+
+def get_codec(name=None):
+    '''
+    Returns the Codec registered as name, or the default codec if name is None
+    '''
+    if name is None:
+        name = __forced_codec__
+        if name is None:
+            return __codecs__[-1]
+
+    for codec in __codecs__:
+        if codec.name == name:
+            return codec
+
+    raise ValueError("Unknown LZ4 codec '%s' - must be one of %s" %
+                     (name, repr(available_codecs())))
+
+
+def set_default_codec(name=None):
+    '''
+    Force every compress / uncompress call in this process to use the given
+     codec by default - None restores the automatic choice
+    '''
+    global __forced_codec__
+    if name is not None:
+        get_codec(name)  # Validate the name
+    __forced_codec__ = name
+    __update_support_info__()
+
+
+def compress(data, level=None, codec=None):
+    '''
+    Compress data with the given (or default) codec - level defaults to the
+     codec's default_level
+    '''
+    codec = get_codec(codec)
+    if level is None:
+        level = codec.default_level
+    return codec.compress(data, level)
+
+
+def uncompress(src, codec=None):
+    return get_codec(codec).uncompress(src)
+
+
+def uncompress_stream(src_file, chunk_size=STREAM_CHUNK_SIZE, codec=None):
+    return get_codec(codec).uncompress_stream(src_file, chunk_size)
+
+
+def __benchmark_sample__(size):
+    '''
+    Generate size bytes of xbin-like data (vertex offset, weight and UV blocks)
+    '''
+    import random
+    rand = random.Random(0)
+    blocks = []
+    total = 0
+    while total < size:
+        block = struct.pack('<HxxfffHhHhfHhff',
+                            0x9383, round(rand.uniform(-64, 64), 2),
+                            round(rand.uniform(-64, 64), 2),
+                            round(rand.uniform(-64, 64), 2),
+                            0xEA46, 1, 0xF1AB, rand.randrange(64), 1.0,
+                            0x1AD4, 1, round(rand.random(), 3),
+                            round(rand.random(), 3))
+        blocks.append(block)
+        total += len(block)
+    return b''.join(blocks)[:size]
+
+
+def benchmark(data=None, codecs=None, level=LEVEL_FAST, repeat=3):
+    '''
+    Measure the throughput of the registered codecs on this machine
+        data - the uncompressed sample (defaults to 1MB of xbin-like data)
+        codecs - the names of the codecs to measure (defaults to all of them)
+    Returns a dict of codec name -> (compress MB/s, uncompress MB/s)
+     measured against the uncompressed size, using the best of repeat runs
+    '''
+    from timeit import default_timer
+
+    if data is None:
+        data = __benchmark_sample__(1 << 20)
+    data = bytes(data)
+    megabytes = len(data) / float(1 << 20)
+
+    if codecs is None:
+        codecs = available_codecs()
+
+    results = {}
+    for name in codecs:
+        codec = get_codec(name)
+        compress_time = uncompress_time = float('inf')
+        for _ in range(repeat):
+            start = default_timer()
+            block = codec.compress(data, level)
+            compress_time = min(compress_time, default_timer() - start)
+
+            src = __uint32__.pack(len(data)) + bytes(block)
+            start = default_timer()
+            result = codec.uncompress(src)
+            uncompress_time = min(uncompress_time, default_timer() - start)
+
+            if bytes(result) != data:
+                raise CorruptError("codec '%s' failed to round-trip the"
+                                   " benchmark data" % name)
+
+        results[name] = (megabytes / max(compress_time, 1e-9),
+                         megabytes / max(uncompress_time, 1e-9))
+    return results
+
+
+def uncompress_report(data=None, level=LEVEL_FAST, repeat=3):
+    '''
+    Compare pure_uncompress with the byte at a time decoder it replaced
+        data - the uncompressed sample (defaults to 1MB of xbin-like data),
+         compressed with the pure Python compressor at the given level
+    Returns a dict of decoder name -> uncompress MB/s measured against the
+     uncompressed size, using the best of repeat runs
+    '''
+    from timeit import default_timer
+
+    if data is None:
+        data = __benchmark_sample__(1 << 20)
+    data = bytes(data)
+    megabytes = len(data) / float(1 << 20)
+    src = __uint32__.pack(len(data)) + bytes(pure_compress(data, level))
+
+    results = {}
+    for name, uncompress in (('reference', __reference_uncompress__),
+                             ('pure Python', pure_uncompress)):
+        uncompress_time = float('inf')
+        for _ in range(repeat):
+            start = default_timer()
+            result = uncompress(src)
+            uncompress_time = min(uncompress_time, default_timer() - start)
+
+            if bytes(result) != data:
+                raise CorruptError("the %s decoder failed to round-trip the"
+                                   " benchmark data" % name)
+
+        results[name] = megabytes / max(uncompress_time, 1e-9)
+    return results
+
+
+def auto_select_codec(data=None, level=LEVEL_FAST, repeat=3):
+    '''
+    Benchmark every registered codec and make the one with the fastest
+     decompression the default for this process
+    Returns the benchmark results (see benchmark())
+    '''
+    results = benchmark(data, level=level, repeat=repeat)
+    fastest = max(results, key=lambda name: results[name][1])
+    set_default_codec(fastest)
+    return results
+
+
+register_codec('pure Python', pure_compress, pure_uncompress,
+               pure_uncompress_stream)
 
+try:
+    # Try to import the python-lz4 package
+    import lz4.block
+except ImportError:
+    # If python-lz4 isn't present, the pure python codec is used
+    pass
 else:
-    # Use python-lz4 if present
-    __support_mode__ = 'python-lz4'
-
-    def compress(data):
+    def __python_lz4_compress__(data, level=LEVEL_FAST):
+        if level not in (LEVEL_STORE, LEVEL_FAST, LEVEL_HIGH):
+            raise ValueError("Unknown LZ4 compression level %r" % level)
+        # python-lz4 has no store-only mode, so the fast mode stands in for it
+        if level == LEVEL_HIGH:
+            return lz4.block.compress(data, mode='high_compression',
+                                      store_size=False)
         return lz4.block.compress(data, store_size=False)
 
-    uncompress = lz4.block.decompress
-
-support_info = 'LZ4: Using %s' % __support_mode__
+    register_codec('python-lz4', __python_lz4_compress__,
+                   lz4.block.decompress)
@@ -0,0 +1,219 @@
+# <pep8 compliant>
+
+import re
+
+# The size of the chunks that *_EXPORT files are tokenized in
+RAW_CHUNK_SIZE = 1 << 22
+
+
+def __read_raw_chunks__(file, chunk_size):
+    '''
+    Generator that yields the contents of a text file in line aligned chunks
+    '''
+    remainder = ''
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            break
+        data = remainder + data
+        end = data.rfind('\n') + 1
+        if end == 0:
+            remainder = data
+            continue
+        remainder = data[end:]
+        yield data[:end]
+    if remainder:
+        yield remainder
+
+
+__comment_re__ = re.compile(r'^[ \t]*//.*$', re.M)
+
+
+def __tokenize__(text):
+    '''
+    Split a chunk of *_EXPORT text into tokens
+    Comment lines are dropped & trailing commas are stripped from the tokens
+    '''
+    if '//' in text:
+        text = __comment_re__.sub('', text)
+    tokens = text.split()
+    if ',' in text:
+        tokens = [token.rstrip(',') for token in tokens]
+    return tokens
+
+
+def __find_token__(tokens, keywords, pos):
+    '''
+    Returns the index of the first of the keywords in tokens[pos:] or -1
+    '''
+    found = -1
+    for keyword in keywords:
+        try:
+            index = tokens.index(keyword, pos)
+        except ValueError:
+            continue
+        if found == -1 or index < found:
+            found = index
+    return found
+
+
+class ExportParser(object):
+    '''
+    Base class for the tokenizing *_EXPORT parsers
+
+    The file is read in large line aligned chunks, each of which is split
+     into tokens in one go. The keywords are dispatched through the handler
+     table of the current section - every handler takes the token list & the
+     index of its keyword and returns the index of the next token to
+     dispatch. Unknown tokens are skipped.
+
+    Subclasses provide the section_handlers, record_sizes, header_keyword,
+     __load_version__ and __finalize__ (whose result is returned by parse)
+
+    A truncated last record ends the parse - the handlers never index past
+     the end of the tokens (see record_sizes & __truncated__), so any
+     IndexError they raise is an error in the file
+    '''
+    __slots__ = ('chunks', 'tokens', 'handlers', 'done')
+
+    # Stop dispatching once fewer tokens than this are left in the current
+    #  token list and there's more of the file to tokenize, so that no
+    #  record is ever split across two token lists
+    refill_margin = 4096
+
+    # Maps each section (None before the first one) to its keyword -> handler
+    #  table
+    section_handlers = {None: {}}
+
+    # Maps each handler to the number of tokens in its line (at least) - a
+    #  record with fewer tokens left at the end of the file is truncated.
+    #  Handlers that aren't listed take a single token, and the ones that
+    #  read any further check for themselves
+    record_sizes = {}
+
+    # The keyword of the line that precedes the VERSION line
+    header_keyword = None
+
+    def __init__(self):
+        self.chunks = None
+        self.tokens = []
+        self.handlers = self.section_handlers[None]
+        self.done = False
+
+    def parse(self, file, chunk_size=None):
+        '''
+        Parse a *_EXPORT file
+        Returns the result of __finalize__
+        '''
+        if chunk_size is None:
+            chunk_size = RAW_CHUNK_SIZE
+        self.chunks = __read_raw_chunks__(file, chunk_size)
+        tokens = self.tokens = __tokenize__(self.__parse_header__())
+
+        margin = self.refill_margin
+        record_sizes = self.record_sizes
+        pos = 0
+        while not self.done:
+            left = len(tokens) - pos
+            if left < margin:
+                text = next(self.chunks, None)
+                if text is not None:
+                    tokens = tokens[pos:] + __tokenize__(text)
+                    self.tokens = tokens
+                    pos = 0
+                    continue
+                if left <= 0:
+                    break
+
+            handler = self.handlers.get(tokens[pos])
+            if handler is None:
+                pos += 1
+                continue
+            # Fewer than margin tokens are only left at the end of the file
+            if left < margin and record_sizes.get(handler, 1) > left:
+                # The last record in the file is truncated
+                break
+
+            pos = handler(self, tokens, pos)
+            # Skipping a section replaces the token list
+            tokens = self.tokens
+
+        return self.__finalize__()
+
+    def __parse_header__(self):
+        '''
+        Parse the header_keyword & VERSION lines at the start of the file
+        Returns the rest of the chunk that contained the VERSION line
+        '''
+        state = 0
+        for text in self.chunks:
+            pos = 0
+            while pos < len(text):
+                end = text.find('\n', pos)
+                if end == -1:
+                    end = len(text)
+                line_split = text[pos:end].split()
+                pos = end + 1
+                if not line_split:
+                    continue
+
+                if state == 0 and line_split[0] == self.header_keyword:
+                    state = 1
+                elif state == 1 and line_split[0] == "VERSION":
+                    self.__load_version__(int(line_split[1]))
+                    return text[pos:]
+        return ''
+
+    def __load_version__(self, version):
+        pass
+
+    def __finalize__(self):
+        return None
+
+    def __require__(self, tokens, end):
+        '''
+        Tokenize more of the file until there are at least end tokens
+        Returns False if the file ran out first
+        '''
+        while len(tokens) < end:
+            text = next(self.chunks, None)
+            if text is None:
+                return False
+            tokens.extend(__tokenize__(text))
+        return True
+
+    def __truncated__(self, tokens, end):
+        '''
+        Returns True (& ends the parse) if the file ends before there are end
+         tokens - for the handlers whose records are longer than their
+         record_sizes entry
+        '''
+        if self.__require__(tokens, end):
+            return False
+        self.done = True
+        return True
+
+    def __skip_to__(self, pos, keywords):
+        '''
+        Skip ahead to the next line that starts with any of the keywords
+         without tokenizing the skipped chunks
+        Returns the index of the keyword in (the new) self.tokens
+        '''
+        if not keywords:
+            self.done = True
+            return pos
+
+        index = __find_token__(self.tokens, keywords, pos)
+        if index != -1:
+            return index
+
+        pattern = re.compile(r'^[ \t]*(?:%s)\s' % '|'.join(keywords), re.M)
+        for text in self.chunks:
+            match = pattern.search(text)
+            if match is not None:
+                self.tokens = __tokenize__(text[match.start():])
+                return 0
+
+        self.tokens = []
+        self.done = True
+        return 0
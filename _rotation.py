@@ -0,0 +1,386 @@
+# <pep8 compliant>
+
+from array import array
+from math import sqrt, sin, acos, atan2
+
+try:
+    import numpy
+except ImportError:
+    # If NumPy isn't present, the batched conversions use pure Python
+    numpy = None
+
+'''
+    Rotation helpers shared by the anim & model modules
+
+    Rotation matrices are given as their X, Y & Z rows (like
+     FramePart.matrix & Bone.matrix) - each row is the direction of that axis
+     of the part. Quaternions are (x, y, z, w) tuples (like SiegeAnim)
+
+    The batched conversions (__matrices_to_quats__ & __quats_to_matrices__)
+     work on flat sequences of values (9 per matrix & 4 per quaternion) -
+     arrays, lists or buffers (numpy arrays, ...) - and return arrays.
+     __matrices_to_quat_list__ & __quat_list_to_matrices__ convert lists of
+     matrices (rows) & quaternions (tuples) instead. __interpolate_quats__
+     interpolates flat sequences of quaternions the same way
+'''
+
+# Use NumPy for the batched conversions (when it's installed)
+USE_NUMPY = numpy is not None
+
+# The number of refinement steps used to re-orthonormalize a matrix - each
+#  step squares the error, the 1 / 32767 error of the quantized matrices in
+#  the *_bin files is gone after 2
+ORTHONORMALIZE_ITERATIONS = 2
+
+
+def __rows_to_quat__(xx, xy, xz, yx, yy, yz, zx, zy, zz):
+    trace = xx + yy + zz
+    if trace > 0.0:
+        s = 0.5 / sqrt(trace + 1.0)
+        quat = ((yz - zy) * s, (zx - xz) * s, (xy - yx) * s, 0.25 / s)
+    elif xx > yy and xx > zz:
+        s = 2.0 * sqrt(max(1.0 + xx - yy - zz, 0.0))
+        quat = (0.25 * s, (yx + xy) / s, (zx + xz) / s, (yz - zy) / s)
+    elif yy > zz:
+        s = 2.0 * sqrt(max(1.0 + yy - xx - zz, 0.0))
+        quat = ((yx + xy) / s, 0.25 * s, (zy + yz) / s, (zx - xz) / s)
+    else:
+        s = 2.0 * sqrt(max(1.0 + zz - xx - yy, 0.0))
+        quat = ((zx + xz) / s, (zy + yz) / s, 0.25 * s, (xy - yx) / s)
+
+    # Matrices that aren't quite orthonormal (rounded text values, etc.)
+    #  don't give a unit quaternion
+    x, y, z, w = quat
+    length = sqrt(x * x + y * y + z * z + w * w)
+    return (x / length, y / length, z / length, w / length)
+
+
+def __matrix_to_quat__(matrix):
+    '''
+    Returns the unit quaternion of a rotation matrix
+    '''
+    (xx, xy, xz), (yx, yy, yz), (zx, zy, zz) = matrix
+    return __rows_to_quat__(xx, xy, xz, yx, yy, yz, zx, zy, zz)
+
+
+def __orthonormalize__(xx, xy, xz, yx, yy, yz, zx, zy, zz):
+    '''
+    Returns the (flat) orthonormal matrix closest to a slightly denormalized
+     rotation matrix - the rows are normalized, then refined with Bjorck's
+     iteration (M = (3 * I - M * M^T) * M / 2), which treats every row alike
+    '''
+    length = sqrt(xx * xx + xy * xy + xz * xz)
+    if length > 0.0:
+        xx, xy, xz = xx / length, xy / length, xz / length
+    length = sqrt(yx * yx + yy * yy + yz * yz)
+    if length > 0.0:
+        yx, yy, yz = yx / length, yy / length, yz / length
+    length = sqrt(zx * zx + zy * zy + zz * zz)
+    if length > 0.0:
+        zx, zy, zz = zx / length, zy / length, zz / length
+
+    for step in range(ORTHONORMALIZE_ITERATIONS):
+        # The dot products of the rows (M * M^T)
+        dxx = 0.5 * (xx * xx + xy * xy + xz * xz) - 1.5
+        dyy = 0.5 * (yx * yx + yy * yy + yz * yz) - 1.5
+        dzz = 0.5 * (zx * zx + zy * zy + zz * zz) - 1.5
+        dxy = 0.5 * (xx * yx + xy * yy + xz * yz)
+        dxz = 0.5 * (xx * zx + xy * zy + xz * zz)
+        dyz = 0.5 * (yx * zx + yy * zy + yz * zz)
+        xx, xy, xz, yx, yy, yz, zx, zy, zz = (
+            -(dxx * xx + dxy * yx + dxz * zx),
+            -(dxx * xy + dxy * yy + dxz * zy),
+            -(dxx * xz + dxy * yz + dxz * zz),
+            -(dxy * xx + dyy * yx + dyz * zx),
+            -(dxy * xy + dyy * yy + dyz * zy),
+            -(dxy * xz + dyy * yz + dyz * zz),
+            -(dxz * xx + dyz * yx + dzz * zx),
+            -(dxz * xy + dyz * yy + dzz * zy),
+            -(dxz * xz + dyz * yz + dzz * zz))
+    return xx, xy, xz, yx, yy, yz, zx, zy, zz
+
+
+def __numpy_matrices_to_quats__(matrices, orthonormalize):
+    m = numpy.asarray(matrices, dtype=numpy.float64).reshape(-1, 3, 3)
+    if orthonormalize:
+        lengths = numpy.sqrt((m * m).sum(axis=2))[:, :, None]
+        m = numpy.where(lengths > 0.0, m / numpy.where(lengths > 0.0,
+                                                       lengths, 1.0), m)
+        for step in range(ORTHONORMALIZE_ITERATIONS):
+            m = 1.5 * m - 0.5 * numpy.matmul(
+                numpy.matmul(m, m.transpose(0, 2, 1)), m)
+
+    xx, xy, xz = m[:, 0, 0], m[:, 0, 1], m[:, 0, 2]
+    yx, yy, yz = m[:, 1, 0], m[:, 1, 1], m[:, 1, 2]
+    zx, zy, zz = m[:, 2, 0], m[:, 2, 1], m[:, 2, 2]
+    trace = xx + yy + zz
+    quats = numpy.empty((len(m), 4))
+
+    # The same cases as __rows_to_quat__
+    case_w = trace > 0.0
+    case_x = ~case_w & (xx > yy) & (xx > zz)
+    case_y = ~case_w & ~case_x & (yy > zz)
+    case_z = ~case_w & ~case_x & ~case_y
+
+    c = case_w
+    s = 0.5 / numpy.sqrt(trace[c] + 1.0)
+    quats[c] = numpy.stack(((yz[c] - zy[c]) * s, (zx[c] - xz[c]) * s,
+                            (xy[c] - yx[c]) * s, 0.25 / s), axis=1)
+    c = case_x
+    s = 2.0 * numpy.sqrt(numpy.maximum(1.0 + xx[c] - yy[c] - zz[c], 0.0))
+    quats[c] = numpy.stack((0.25 * s, (yx[c] + xy[c]) / s,
+                            (zx[c] + xz[c]) / s, (yz[c] - zy[c]) / s), axis=1)
+    c = case_y
+    s = 2.0 * numpy.sqrt(numpy.maximum(1.0 + yy[c] - xx[c] - zz[c], 0.0))
+    quats[c] = numpy.stack(((yx[c] + xy[c]) / s, 0.25 * s,
+                            (zy[c] + yz[c]) / s, (zx[c] - xz[c]) / s), axis=1)
+    c = case_z
+    s = 2.0 * numpy.sqrt(numpy.maximum(1.0 + zz[c] - xx[c] - yy[c], 0.0))
+    quats[c] = numpy.stack(((zx[c] + xz[c]) / s, (zy[c] + yz[c]) / s,
+                            0.25 * s, (xy[c] - yx[c]) / s), axis=1)
+
+    quats /= numpy.sqrt((quats * quats).sum(axis=1))[:, None]
+    return quats
+
+
+def __numpy_quats_to_matrices__(quats):
+    q = numpy.asarray(quats, dtype=numpy.float64).reshape(-1, 4)
+    q = q / numpy.sqrt((q * q).sum(axis=1))[:, None]
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    wx, wy, wz = w * x, w * y, w * z
+    return numpy.stack((1.0 - 2.0 * (yy + zz), 2.0 * (xy + wz),
+                        2.0 * (xz - wy),
+                        2.0 * (xy - wz), 1.0 - 2.0 * (xx + zz),
+                        2.0 * (yz + wx),
+                        2.0 * (xz + wy), 2.0 * (yz - wx),
+                        1.0 - 2.0 * (xx + yy)), axis=1)
+
+
+def __numpy_interpolate_quats__(a, b, weights, slerp):
+    a = numpy.asarray(a, dtype=numpy.float64).reshape(-1, 4)
+    b = numpy.asarray(b, dtype=numpy.float64).reshape(-1, 4)
+    t = numpy.asarray(weights, dtype=numpy.float64)[:, None]
+    dot = (a * b).sum(axis=1)
+    b = numpy.where((dot < 0.0)[:, None], -b, b)
+    dot = numpy.abs(dot)[:, None]
+    if slerp:
+        # The same nlerp fallback as __slerp__
+        near = dot > 0.999999
+        angle = numpy.arccos(numpy.minimum(dot, 1.0))
+        scale = 1.0 / numpy.where(near, 1.0, numpy.sin(angle))
+        wa = numpy.where(near, 1.0 - t, numpy.sin((1.0 - t) * angle) * scale)
+        wb = numpy.where(near, t, numpy.sin(t * angle) * scale)
+        quats = a * wa + b * wb
+    else:
+        quats = a + (b - a) * t
+    quats /= numpy.sqrt((quats * quats).sum(axis=1))[:, None]
+    return quats
+
+
+def __numpy_to_array__(values, typecode):
+    result = array(typecode)
+    data = numpy.ascontiguousarray(values, dtype=result.typecode).tobytes()
+    if hasattr(result, 'frombytes'):
+        result.frombytes(data)
+    else:
+        result.fromstring(data)
+    return result
+
+
+def __check_length__(values, size, name):
+    if len(values) % size:
+        raise ValueError("Expected %d values per %s -- got %d values" %
+                         (size, name, len(values)))
+
+
+def __matrices_to_quats__(matrices, orthonormalize=True, typecode='d'):
+    '''
+    Convert a flat sequence of rotation matrices (9 values - the X, Y & Z
+     rows - per matrix) to an array of unit quaternions (4 values each)
+    If orthonormalize is True, each matrix is re-orthonormalized first (see
+     __orthonormalize__), otherwise only the quaternion is normalized
+    '''
+    if USE_NUMPY and numpy is not None:
+        matrices = numpy.asarray(matrices, dtype=numpy.float64).ravel()
+        __check_length__(matrices, 9, "matrix")
+        return __numpy_to_array__(
+            __numpy_matrices_to_quats__(matrices, orthonormalize), typecode)
+
+    __check_length__(matrices, 9, "matrix")
+    quats = []
+    extend = quats.extend
+    values = iter(matrices)
+    if orthonormalize:
+        for matrix in zip(*[values] * 9):
+            extend(__rows_to_quat__(*__orthonormalize__(*matrix)))
+    else:
+        for matrix in zip(*[values] * 9):
+            extend(__rows_to_quat__(*matrix))
+    return array(typecode, quats)
+
+
+def __quats_to_matrices__(quats, typecode='d'):
+    '''
+    Convert a flat sequence of quaternions (4 values - x, y, z, w - per
+     quaternion) to an array of rotation matrices (9 values - the X, Y & Z
+     rows - each)
+    The quaternions are normalized first
+    '''
+    if USE_NUMPY and numpy is not None:
+        quats = numpy.asarray(quats, dtype=numpy.float64).ravel()
+        __check_length__(quats, 4, "quaternion")
+        return __numpy_to_array__(__numpy_quats_to_matrices__(quats),
+                                  typecode)
+
+    __check_length__(quats, 4, "quaternion")
+    matrices = []
+    extend = matrices.extend
+    for x, y, z, w in zip(*[iter(quats)] * 4):
+        length = sqrt(x * x + y * y + z * z + w * w)
+        row_x, row_y, row_z = __quat_to_matrix__((x / length, y / length,
+                                                  z / length, w / length))
+        extend(row_x)
+        extend(row_y)
+        extend(row_z)
+    return array(typecode, matrices)
+
+
+def __interpolate_quats__(quats_a, quats_b, weights, slerp=True,
+                          typecode='d'):
+    '''
+    Interpolate from each unit quaternion of quats_a to the one of quats_b
+     (flat sequences of 4 values per quaternion) - weights holds the
+     interpolation weight of each pair. The quaternions of quats_b are
+     aligned with quats_a first, so the shortest path is taken
+    Uses slerp, or the faster nlerp if slerp is False
+    Returns an array of the interpolated quaternions
+    '''
+    if len(quats_a) != len(quats_b) or len(quats_a) != 4 * len(weights):
+        raise ValueError("Expected 2 quaternions per weight -- got %d & %d "
+                         "values for %d weights" %
+                         (len(quats_a), len(quats_b), len(weights)))
+    if USE_NUMPY and numpy is not None:
+        return __numpy_to_array__(__numpy_interpolate_quats__(
+            quats_a, quats_b, weights, slerp), typecode)
+
+    interpolate = __slerp__ if slerp else __nlerp__
+    quats = []
+    extend = quats.extend
+    for a, b, t in zip(zip(*[iter(quats_a)] * 4), zip(*[iter(quats_b)] * 4),
+                       weights):
+        extend(interpolate(a, __quat_align__(b, a), t))
+    return array(typecode, quats)
+
+
+def __matrices_to_quat_list__(matrices, orthonormalize=True):
+    '''
+    Returns the unit quaternion (tuple) of each rotation matrix (rows) in a
+     list (see __matrices_to_quats__)
+    numpy is only used to orthonormalize the matrices - otherwise building
+     the array from the rows costs more than it saves
+    '''
+    if orthonormalize and USE_NUMPY and numpy is not None:
+        if not matrices:
+            return []
+        quats = __numpy_matrices_to_quats__(
+            numpy.array(matrices, dtype=numpy.float64), orthonormalize)
+        return [tuple(quat) for quat in quats.tolist()]
+
+    if orthonormalize:
+        return [__rows_to_quat__(*__orthonormalize__(xx, xy, xz, yx, yy, yz,
+                                                     zx, zy, zz))
+                for (xx, xy, xz), (yx, yy, yz), (zx, zy, zz) in matrices]
+    return [__rows_to_quat__(xx, xy, xz, yx, yy, yz, zx, zy, zz)
+            for (xx, xy, xz), (yx, yy, yz), (zx, zy, zz) in matrices]
+
+
+def __quat_list_to_matrices__(quats):
+    '''
+    Returns the rotation matrix (a list of row tuples) of each quaternion in
+     a list - the quaternions are normalized first
+    '''
+    matrices = []
+    for x, y, z, w in quats:
+        length = sqrt(x * x + y * y + z * z + w * w)
+        matrices.append(__quat_to_matrix__((x / length, y / length,
+                                            z / length, w / length)))
+    return matrices
+
+
+def __quat_to_matrix__(quat):
+    '''
+    Returns the rotation matrix of a unit quaternion
+    '''
+    x, y, z, w = quat
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    wx, wy, wz = w * x, w * y, w * z
+    return [(1.0 - 2.0 * (yy + zz), 2.0 * (xy + wz), 2.0 * (xz - wy)),
+            (2.0 * (xy - wz), 1.0 - 2.0 * (xx + zz), 2.0 * (yz + wx)),
+            (2.0 * (xz + wy), 2.0 * (yz - wx), 1.0 - 2.0 * (xx + yy))]
+
+
+def __quat_align__(quat, reference):
+    '''
+    Returns quat or -quat (the same rotation), whichever is in the same
+     hemisphere as reference - so interpolating between them takes the
+     shortest path
+    '''
+    if (quat[0] * reference[0] + quat[1] * reference[1] +
+            quat[2] * reference[2] + quat[3] * reference[3]) < 0.0:
+        return (-quat[0], -quat[1], -quat[2], -quat[3])
+    return quat
+
+
+def __nlerp__(a, b, t):
+    '''
+    Returns the normalized linear interpolation of the (aligned) quaternions
+     a & b
+    '''
+    x = a[0] + (b[0] - a[0]) * t
+    y = a[1] + (b[1] - a[1]) * t
+    z = a[2] + (b[2] - a[2]) * t
+    w = a[3] + (b[3] - a[3]) * t
+    length = sqrt(x * x + y * y + z * z + w * w)
+    return (x / length, y / length, z / length, w / length)
+
+
+def __quat_delta__(a, b):
+    '''
+    Returns the rotation from a to b as a rotation vector (the axis scaled by
+     the angle in radians) - taking the shortest path, so its length is at
+     most pi
+    '''
+    # conjugate(a) * b
+    ax, ay, az, aw = a
+    bx, by, bz, bw = b
+    x = aw * bx - ax * bw - ay * bz + az * by
+    y = aw * by + ax * bz - ay * bw - az * bx
+    z = aw * bz - ax * by + ay * bx - az * bw
+    w = aw * bw + ax * bx + ay * by + az * bz
+    if w < 0.0:
+        x, y, z, w = -x, -y, -z, -w
+    length = sqrt(x * x + y * y + z * z)
+    if length < 1e-12:
+        return (2.0 * x, 2.0 * y, 2.0 * z)
+    scale = 2.0 * atan2(length, w) / length
+    return (x * scale, y * scale, z * scale)
+
+
+def __slerp__(a, b, t):
+    '''
+    Returns the spherical linear interpolation of the (aligned) quaternions
+     a & b
+    '''
+    dot = a[0] * b[0] + a[1] * b[1] + a[2] * b[2] + a[3] * b[3]
+    if dot > 0.999999:
+        # sin(angle) is too small to divide by - the arc is nearly straight
+        return __nlerp__(a, b, t)
+    angle = acos(max(min(dot, 1.0), -1.0))
+    scale = 1.0 / sin(angle)
+    wa = sin((1.0 - t) * angle) * scale
+    wb = sin(t * angle) * scale
+    return (a[0] * wa + b[0] * wb, a[1] * wa + b[1] * wb,
+            a[2] * wa + b[2] * wb, a[3] * wa + b[3] * wb)
@@ -0,0 +1,298 @@
+# <pep8 compliant>
+
+import re
+
+# The number of records (vertices, faces, frames, ...) that are formatted in
+#  a single operation
+WRITE_BATCH_SIZE = 1 << 12
+
+# Buffered text is written to the file once it grows past this many
+#  characters
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+# The supported FloatFormat modes
+FLOAT_MODES = ('fixed', 'trim', 'shortest')
+
+# Matches the trailing zeros of a fractional part that isn't all zeros
+__trailing_zeros_re__ = re.compile(r'\.(\d*?[1-9])0+(?!\d)')
+
+# Matches a number in exponent notation (as written by repr)
+__exponent_re__ = re.compile(r'(-?)(\d)(?:\.(\d+))?e([-+]\d+)')
+
+
+def __positional__(match):
+    '''
+    Rewrite a number in exponent notation without the exponent
+    '''
+    sign, digit, fraction, exponent = match.groups()
+    digits = digit + (fraction or '')
+    point = int(exponent) + 1
+    if point <= 0:
+        return sign + '0.' + '0' * -point + digits
+    if point >= len(digits):
+        return sign + digits + '0' * (point - len(digits))
+    return sign + digits[:point] + '.' + digits[point:]
+
+
+class FloatFormat(object):
+    '''
+    The policy for how the floats (every %f field) of a text export are
+     written
+        mode - one of FLOAT_MODES
+            'fixed' - always write precision decimals (the default, which is
+             the same as %f)
+            'trim' - write precision decimals without the trailing zeros
+             (like __clean_float2str__) - 0.500000 is written as 0.5
+            'shortest' - write the shortest string that reads back as the
+             same float (precision is ignored)
+    None of the modes use exponent notation, which the game tools don't
+     handle consistently
+    '''
+    __slots__ = ('mode', 'precision', 'field', 'zeros')
+
+    def __init__(self, mode='fixed', precision=6):
+        if mode not in FLOAT_MODES:
+            vargs = (mode, repr(FLOAT_MODES))
+            raise ValueError(
+                "Invalid float format mode: '%s' - must be one of %s" % vargs)
+        if mode != 'shortest' and not 0 <= precision <= 17:
+            raise ValueError(
+                "Invalid float precision: %d - must be in [0, 17]" %
+                precision)
+        self.mode = mode
+        self.precision = precision
+        # The format specifier that replaces %f in the templates
+        if mode == 'shortest':
+            self.field = '%r'
+        elif precision != 6:
+            self.field = '%%.%df' % precision
+        else:
+            self.field = None
+        # The fractional part of a whole number
+        if mode == 'shortest':
+            self.zeros = '.0'
+        elif mode == 'trim' and precision != 0:
+            self.zeros = '.' + '0' * precision
+        else:
+            self.zeros = None
+
+    def format(self, template, values):
+        '''
+        Apply a format template (whose floats are %f fields) to a tuple of
+         values according to this policy
+        Every %f field must be followed by whitespace & any text in the
+         template that isn't produced by a %f field must not contain numbers
+         with a fractional part
+        '''
+        if self.field is not None:
+            template = template.replace('%f', self.field)
+        text = template % values
+        if self.zeros is None:
+            return text
+
+        if self.mode == 'shortest' and 'e' in text:
+            text = __exponent_re__.sub(__positional__, text)
+        # Whole numbers are by far the most common case, so they're trimmed
+        #  with plain replaces before the (much slower) regex
+        zeros = self.zeros
+        text = text.replace(zeros + ' ', ' ').replace(zeros + '\n', '\n')
+        if self.mode == 'trim':
+            text = __trailing_zeros_re__.sub(r'.\1', text)
+        return text
+
+
+# The default FloatFormat - the same output as %f
+DEFAULT_FLOAT_FORMAT = FloatFormat()
+
+
+class ExportWriter(object):
+    '''
+    Buffers the text of an *_EXPORT file, so that it's written to the file
+     in a few large chunks instead of a line at a time
+
+    The records of a section are formatted in batches - the format templates
+     of the records in a batch are joined & applied to their flattened values
+     in a single % operation (see write_batch), according to float_format
+    '''
+    __slots__ = ('file', 'chunks', 'size', 'buffer_size', 'float_format')
+
+    def __init__(self, file, float_format=None, buffer_size=None):
+        if float_format is None:
+            float_format = DEFAULT_FLOAT_FORMAT
+        if buffer_size is None:
+            buffer_size = WRITE_BUFFER_SIZE
+        self.file = file
+        self.float_format = float_format
+        self.chunks = []
+        self.size = 0
+        self.buffer_size = buffer_size
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def write_batch(self, formats, values):
+        '''
+        Format a batch of records
+        formats is the list of the records' format templates & values is the
+         flattened list of all of their values
+        '''
+        if formats:
+            self.write(self.float_format.format("".join(formats),
+                                                tuple(values)))
+
+    def flush(self):
+        if self.chunks:
+            self.file.write("".join(self.chunks))
+            self.chunks = []
+            self.size = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def __benchmark_model__(vert_count):
+    '''
+    Generate a single mesh model with vert_count vertices & as many faces
+    '''
+    import random
+    from .xmodel import Model, Bone, Mesh, Vertex, Face, FaceVertex, Material
+    rand = random.Random(0)
+    model = Model()
+    for bone_index in range(16):
+        bone = Bone("bone_%d" % bone_index, bone_index - 1)
+        bone.offset = (rand.uniform(-8, 8), rand.uniform(-8, 8), 0.0)
+        bone.matrix = [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)]
+        model.bones.append(bone)
+    model.materials.append(Material("mtl", "Lambert", {"color": "img.tga"}))
+
+    mesh = Mesh("mesh")
+    for _ in range(vert_count):
+        weights = [(rand.randrange(16), 0.5), (rand.randrange(16), 0.5)]
+        offset = (rand.uniform(-64, 64), rand.uniform(-64, 64),
+                  rand.uniform(-64, 64))
+        mesh.verts.append(Vertex(offset, weights))
+    for _ in range(vert_count):
+        face = Face(0, 0)
+        face.indices = [FaceVertex(vert_index, (0.0, 0.0, 1.0),
+                                   (1.0, 1.0, 1.0, 1.0),
+                                   (rand.random(), rand.random()))
+                        for vert_index in rand.sample(range(vert_count), 3)]
+        mesh.faces.append(face)
+    model.meshes.append(mesh)
+    return model
+
+
+def __benchmark_anim__(frame_count, part_count):
+    '''
+    Generate an anim with frame_count frames of part_count parts
+    '''
+    import random
+    from .xanim import Anim, PartInfo, Frame, FramePart
+    rand = random.Random(0)
+    anim = Anim()
+    anim.framerate = 30.0
+    anim.parts = [PartInfo("part_%d" % part_index)
+                  for part_index in range(part_count)]
+    for frame_index in range(frame_count):
+        frame = Frame(frame_index)
+        for _ in range(part_count):
+            offset = (rand.uniform(-8, 8), rand.uniform(-8, 8),
+                      rand.uniform(-8, 8))
+            matrix = [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)]
+            frame.parts.append(FramePart(offset, matrix))
+        anim.frames.append(frame)
+    return anim
+
+
+def __measure_export__(asset, path, repeat, **kwargs):
+    '''
+    Returns the best time of repeat calls to asset.WriteFile_Raw(path, ...)
+    '''
+    from timeit import default_timer
+    best = float('inf')
+    for _ in range(repeat):
+        start = default_timer()
+        asset.WriteFile_Raw(path, **kwargs)
+        best = min(best, default_timer() - start)
+    return best
+
+
+def benchmark(vert_counts=(1000, 10000, 50000), frame_counts=(100, 500, 2000),
+              part_count=64, repeat=3):
+    '''
+    Measure how long Model.WriteFile_Raw & Anim.WriteFile_Raw take to export
+     synthetic assets of increasing size on this machine
+        vert_counts - the vertex (& face) counts of the test models
+        frame_counts - the frame counts of the test anims (with part_count
+         parts each)
+    Returns a dict of ('model', vertex count) / ('anim', frame count) ->
+     seconds, using the best of repeat runs
+    '''
+    import os
+    import shutil
+    import tempfile
+
+    results = {}
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "benchmark.XMODEL_EXPORT")
+        for vert_count in vert_counts:
+            model = __benchmark_model__(vert_count)
+            model.version = 6
+            results[('model', vert_count)] = __measure_export__(model, path,
+                                                                repeat)
+
+        path = os.path.join(temp_dir, "benchmark.XANIM_EXPORT")
+        for frame_count in frame_counts:
+            anim = __benchmark_anim__(frame_count, part_count)
+            anim.version = 3
+            results[('anim', frame_count)] = __measure_export__(anim, path,
+                                                                repeat)
+    finally:
+        shutil.rmtree(temp_dir)
+    return results
+
+
+def float_format_report(float_formats=None, vert_count=20000,
+                        frame_count=500, part_count=64, repeat=3):
+    '''
+    Measure the output size & throughput of Model.WriteFile_Raw &
+     Anim.WriteFile_Raw for each of the float_formats (defaults to every
+     mode, with the trim mode at a few precisions)
+    Returns a list of (FloatFormat, asset type, file size in bytes, seconds,
+     MB/s) tuples, using the best of repeat runs - the throughput is measured
+     against each file's own size
+    '''
+    import os
+    import shutil
+    import tempfile
+
+    if float_formats is None:
+        float_formats = [FloatFormat('fixed'), FloatFormat('fixed', 4),
+                         FloatFormat('trim'), FloatFormat('trim', 4),
+                         FloatFormat('shortest')]
+
+    model = __benchmark_model__(vert_count)
+    model.version = 6
+    anim = __benchmark_anim__(frame_count, part_count)
+    anim.version = 3
+
+    results = []
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for asset_type, asset in (('model', model), ('anim', anim)):
+            path = os.path.join(temp_dir, "report.EXPORT")
+            for float_format in float_formats:
+                seconds = __measure_export__(asset, path, repeat,
+                                             float_format=float_format)
+                size = os.path.getsize(path)
+                results.append((float_format, asset_type, size, seconds,
+                                size / float(1 << 20) / max(seconds, 1e-9)))
+    finally:
+        shutil.rmtree(temp_dir)
+    return results
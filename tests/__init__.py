@@ -0,0 +1 @@
+# <pep8 compliant>
@@ -0,0 +1,109 @@
+# <pep8 compliant>
+
+'''
+Assets built in code & helpers shared by the tests
+'''
+
+from math import cos, radians, sin, sqrt
+
+from ..xanim import Anim, Frame, FramePart, Note, PartInfo
+from ..xmodel import Bone, Face, FaceVertex, Material, Mesh, Model, Vertex
+
+
+def __graph__(value):
+    '''
+    Convert an object (and everything it references) to nested tuples of
+     its __slots__ values so that two object graphs can be compared
+    '''
+    if isinstance(value, (list, tuple)):
+        return tuple([__graph__(item) for item in value])
+    if isinstance(value, dict):
+        return tuple(sorted([(key, __graph__(item))
+                             for key, item in value.items()]))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(value))
+
+    # The private slots are caches derived from the public ones
+    slots = [slot for cls in type(value).__mro__
+             for slot in getattr(cls, '__slots__', ())
+             if not slot.startswith('__')]
+    if not slots:
+        return value
+    return (type(value).__name__,) + tuple(
+        [(slot, __graph__(getattr(value, slot, None))) for slot in slots])
+
+
+def __z_rotation__(degrees):
+    '''
+    Returns the rotation matrix (as 3 row tuples) of degrees around Z
+    '''
+    c, s = cos(radians(degrees)), sin(radians(degrees))
+    return [(c, -s, 0.0), (s, c, 0.0), (0.0, 0.0, 1.0)]
+
+
+def __axis_rotation__(axis, angle):
+    '''
+    Returns the rotation matrix (as 3 row tuples) of angle radians around
+     axis
+    '''
+    length = sqrt(sum([value * value for value in axis]))
+    x, y, z = [value / length for value in axis]
+    c, s = cos(angle), sin(angle)
+    t = 1.0 - c
+    return [(t * x * x + c, t * x * y - s * z, t * x * z + s * y),
+            (t * x * y + s * z, t * y * y + c, t * y * z - s * x),
+            (t * x * z - s * y, t * y * z + s * x, t * z * z + c)]
+
+
+def __make_model__(version):
+    '''
+    Build a small model that uses every feature of the given version
+    '''
+    model = Model()
+    for i in range(6):
+        # The last bone is cosmetic in version 7
+        bone = Bone('bone_%d' % i, i - 1, cosmetic=(version == 7 and i == 5))
+        bone.offset = (i * 1.5, -0.25 * i, 2.0)
+        bone.matrix = [(1.0, 0.0, 0.0), (0.0, 0.6, -0.8), (0.0, 0.8, 0.6)]
+        model.bones.append(bone)
+
+    for i in range(2):
+        material = Material('mtl_%d' % i, 'Lambert',
+                            {'color': 'mtl_%d_col.tga' % i})
+        material.phong = 0.5 * i
+        model.materials.append(material)
+
+    for m in range(2):
+        mesh = Mesh('mesh_%d' % m)
+        for i in range(12):
+            weights = [(i % 6, 0.75), ((i + m + 1) % 6, 0.25)][:1 + i % 2]
+            mesh.verts.append(Vertex((i * 0.5, m - i * 0.25, 1.0 / (i + 1)),
+                                     weights))
+        for i in range(10):
+            face = Face(m, i % 2)
+            face.indices = [FaceVertex((i + corner) % 12,
+                                       (0.0, 0.6, 0.8),
+                                       (1.0, 0.5, 0.25, 1.0),
+                                       (0.125 * corner, 0.1 * i))
+                            for corner in range(3)]
+            mesh.faces.append(face)
+        model.meshes.append(mesh)
+    return model
+
+
+def __make_anim__(frame_count=8, part_count=4, degrees=30.0):
+    '''
+    Build an anim at 30 fps with notes on frames 2 & 4 - on frame f, part p
+     is at (2f + p, f / 2, -0.25) & rotated f * degrees around Z
+    '''
+    anim = Anim()
+    anim.framerate = 30.0
+    anim.parts = [PartInfo('part_%d' % i) for i in range(part_count)]
+    for f in range(frame_count):
+        frame = Frame(f)
+        frame.parts = [FramePart((f * 2.0 + p, f * 0.5, -0.25),
+                                 __z_rotation__(f * degrees))
+                       for p in range(part_count)]
+        anim.frames.append(frame)
+    anim.notes = [Note(2, 'start'), Note(4, 'end')]
+    return anim
@@ -0,0 +1,150 @@
+# <pep8 compliant>
+
+'''
+Check that the lazy bone & material groups of meshes are rebuilt after the
+ verts or faces change
+Run from the directory that contains PyCoD:
+    python -m unittest PyCoD.tests.test_groups
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..xmodel import Face, FaceVertex, Mesh, Model, Vertex
+from ._fixtures import __make_model__
+
+
+def __sorted_groups__(groups):
+    return [sorted(group) for group in groups]
+
+
+def __make_face__(material_id, vert_ids):
+    face = Face(0, material_id)
+    face.indices = [FaceVertex(vert_id, (0.0, 0.0, 1.0),
+                               (1.0, 1.0, 1.0, 1.0), (0.0, 0.0))
+                    for vert_id in vert_ids]
+    return face
+
+
+class GroupsTest(unittest.TestCase):
+    def setUp(self):
+        self.mesh = Mesh('mesh')
+        self.mesh.verts = [Vertex((0.0, 0.0, 0.0), [(0, 1.0)]),
+                           Vertex((1.0, 0.0, 0.0), [(0, 0.5), (1, 0.5)]),
+                           Vertex((0.0, 1.0, 0.0), [(1, 1.0)])]
+        self.mesh.faces = [__make_face__(0, (0, 1, 2)),
+                           __make_face__(0, (2, 1, 0))]
+
+    def test_build(self):
+        # Without group counts the groups fit the ids that are used
+        mesh = self.mesh
+        self.assertEqual(__sorted_groups__(mesh.bone_groups),
+                         [[(0, 1.0), (1, 0.5)], [(1, 0.5), (2, 1.0)]])
+        self.assertEqual(__sorted_groups__(mesh.material_groups),
+                         [[0, 1, 2]])
+        self.assertIs(mesh.bone_groups, mesh.bone_groups)
+        self.assertIs(mesh.material_groups, mesh.material_groups)
+
+    def test_resize(self):
+        mesh = self.mesh
+        bone_groups = mesh.bone_groups
+        material_groups = mesh.material_groups
+
+        mesh.verts.append(Vertex((1.0, 1.0, 0.0), [(2, 1.0)]))
+        self.assertIsNot(mesh.bone_groups, bone_groups)
+        self.assertEqual(__sorted_groups__(mesh.bone_groups)[2], [(3, 1.0)])
+        self.assertIs(mesh.material_groups, material_groups)
+
+        mesh.faces.append(__make_face__(1, (1, 2, 3)))
+        self.assertIsNot(mesh.material_groups, material_groups)
+        self.assertEqual(__sorted_groups__(mesh.material_groups),
+                         [[0, 1, 2], [1, 2, 3]])
+
+    def test_replace(self):
+        mesh = self.mesh
+        mesh.bone_groups
+        mesh.material_groups
+
+        # New lists of the same length
+        mesh.verts = [Vertex(vert.offset, [(0, 1.0)]) for vert in mesh.verts]
+        mesh.faces = [__make_face__(1, (0, 1, 2)), __make_face__(1, (0, 1, 2))]
+        self.assertEqual(__sorted_groups__(mesh.bone_groups),
+                         [[(0, 1.0), (1, 1.0), (2, 1.0)]])
+        self.assertEqual(__sorted_groups__(mesh.material_groups),
+                         [[], [0, 1, 2]])
+
+    def test_invalidate(self):
+        # Changes made in place need invalidate_groups
+        mesh = self.mesh
+        mesh.bone_groups
+        mesh.material_groups
+        mesh.verts[0].weights = [(1, 1.0)]
+        mesh.faces[1].material_id = 1
+        self.assertEqual(len(mesh.bone_groups[0]), 2)
+        self.assertEqual(len(mesh.material_groups), 1)
+
+        mesh.invalidate_groups()
+        self.assertEqual(__sorted_groups__(mesh.bone_groups),
+                         [[(1, 0.5)], [(0, 1.0), (1, 0.5), (2, 1.0)]])
+        self.assertEqual(__sorted_groups__(mesh.material_groups),
+                         [[0, 1, 2], [0, 1, 2]])
+
+    def test_set(self):
+        # Assigned groups are kept until the verts / faces change
+        mesh = self.mesh
+        mesh.bone_groups = [[]]
+        mesh.material_groups = [[], []]
+        self.assertEqual(mesh.bone_groups, [[]])
+        self.assertEqual(mesh.material_groups, [[], []])
+
+        mesh.verts.pop()
+        mesh.faces.pop()
+        self.assertEqual(__sorted_groups__(mesh.bone_groups),
+                         [[(0, 1.0), (1, 0.5)], [(1, 0.5)]])
+        self.assertEqual(__sorted_groups__(mesh.material_groups),
+                         [[0, 1, 2]])
+
+    def test_build_groups(self):
+        model = __make_model__(7)
+        lazy = [(__sorted_groups__(mesh.bone_groups),
+                 __sorted_groups__(mesh.material_groups))
+                for mesh in model.meshes]
+        for mesh in model.meshes:
+            mesh.invalidate_groups()
+        model.build_groups()
+        for mesh, (bone_groups, material_groups) in zip(model.meshes, lazy):
+            # Built now & not again on access
+            built = mesh.bone_groups, mesh.material_groups
+            self.assertIs(mesh.bone_groups, built[0])
+            self.assertIs(mesh.material_groups, built[1])
+            self.assertEqual(__sorted_groups__(built[0]), bone_groups)
+            self.assertEqual(__sorted_groups__(built[1]), material_groups)
+
+    def test_loaded(self):
+        # Split meshes have a group for each bone & material of the model,
+        #  even the unused ones
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'groups.xmodel_bin')
+            __make_model__(7).WriteFile_Bin(path, version=7)
+            model = Model.FromFile_Bin(path)
+            for mesh in model.meshes:
+                self.assertEqual(len(mesh.bone_groups), len(model.bones))
+                self.assertEqual(len(mesh.material_groups),
+                                 len(model.materials))
+                self.assertNotIn(0, mesh.material_groups[1])
+                mesh.faces.append(__make_face__(1, (0, 1, 2)))
+                self.assertIn(0, mesh.material_groups[1])
+
+            model = Model.FromFile_Bin(path, sections=('geometry',))
+            for mesh in model.meshes:
+                self.assertEqual(mesh.bone_groups, [])
+                self.assertEqual(mesh.material_groups, [])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
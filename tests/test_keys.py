@@ -0,0 +1,141 @@
+# <pep8 compliant>
+
+'''
+Check that the anims expanded from the keys of Anim.reduce_keys stay within
+ the tolerances of the original
+Run from the directory that contains PyCoD:
+    python -m unittest PyCoD.tests.test_keys
+'''
+
+import random
+import unittest
+from math import asin, cos, pi, sin, sqrt
+
+from .. import xanim_keys
+from .._rotation import __matrix_to_quat__
+from ..xanim import Anim, Frame, FramePart, Note, PartInfo
+from ._fixtures import __axis_rotation__
+
+
+def __angle__(a, b):
+    '''
+    Returns the angle (in radians) of the rotation between two matrices
+    '''
+    qa, qb = __matrix_to_quat__(a), __matrix_to_quat__(b)
+    # The distance between the quaternions is 2 * sin(angle / 4)
+    chord = min([sqrt(sum([(x - sign * y) ** 2 for x, y in zip(qa, qb)]))
+                 for sign in (1.0, -1.0)])
+    return 4.0 * asin(min(chord / 2.0, 1.0))
+
+
+def __make_anim__(rng, frame_count):
+    '''
+    Build an anim with irregular frame numbers & a smooth, a stepped & a
+     noisy part
+    '''
+    anim = Anim()
+    anim.framerate = 30.0
+    anim.parts = [PartInfo(name) for name in ('smooth', 'stepped', 'noisy')]
+    anim.notes = [Note(1, 'start')]
+    number = 0
+    offset = [0.0, 0.0, 0.0]
+    axis = [0.0, 0.0, 1.0]
+    angle = 0.0
+    for f in range(frame_count):
+        frame = Frame(number)
+        number += rng.randint(1, 3)
+        t = frame.frame / 10.0
+        smooth = FramePart((sin(t), cos(t * 0.5) * 2.0, t * 0.1),
+                           __axis_rotation__((1.0, 2.0, 0.5), sin(t) * pi),
+                           (1.0, 1.0 + 0.25 * sin(t), 1.0))
+        step = float(f // 7)
+        stepped = FramePart((step, 0.0, -step),
+                            __axis_rotation__((0.0, 1.0, 0.0), step * 0.3))
+        for i in range(3):
+            offset[i] += rng.uniform(-0.05, 0.05)
+            axis[i] += rng.uniform(-0.1, 0.1)
+        angle += rng.uniform(-0.05, 0.1)
+        noisy = FramePart(tuple(offset), __axis_rotation__(axis, angle),
+                          (1.0 + offset[0] * 0.1, 1.0, 1.0))
+        frame.parts = [smooth, stepped, noisy]
+        anim.frames.append(frame)
+    return anim
+
+
+class ReduceKeysTest(unittest.TestCase):
+    def assertWithin(self, anim, position_tolerance, angle_tolerance,
+                     scale_tolerance):
+        keys = anim.reduce_keys(position_tolerance, angle_tolerance,
+                                scale_tolerance)
+        expanded = keys.to_anim()
+        self.assertEqual([frame.frame for frame in expanded.frames],
+                         [frame.frame for frame in anim.frames])
+        self.assertEqual([(note.frame, note.string)
+                          for note in expanded.notes],
+                         [(note.frame, note.string) for note in anim.notes])
+
+        # Allow for the rounding of the interpolation
+        margin = 1e-9
+        for frame, expanded_frame in zip(anim.frames, expanded.frames):
+            for part, expanded_part in zip(frame.parts, expanded_frame.parts):
+                for a, b in zip(part.offset, expanded_part.offset):
+                    self.assertLessEqual(abs(a - b),
+                                         position_tolerance + margin)
+                for a, b in zip(part.scale, expanded_part.scale):
+                    self.assertLessEqual(abs(a - b), scale_tolerance + margin)
+                self.assertLessEqual(__angle__(part.matrix,
+                                               expanded_part.matrix),
+                                     angle_tolerance + margin)
+        return keys
+
+    def test_tolerances(self):
+        rng = random.Random(23)
+        anim = __make_anim__(rng, 120)
+        for tolerances in ((1e-4, 1e-4, 1e-4), (0.01, 0.01, 0.01),
+                           (0.1, 0.05, 0.02), (0.0, 0.0, 0.0)):
+            self.assertWithin(anim, *tolerances)
+
+        # Looser tolerances need fewer keys
+        counts = [self.assertWithin(anim, tolerance, tolerance,
+                                    tolerance).stats()['keys']
+                  for tolerance in (1e-4, 0.01, 0.1)]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertLess(counts[-1], counts[0])
+
+    def test_constant(self):
+        # The stepped part's channels hold their values between the steps
+        rng = random.Random(23)
+        keys = self.assertWithin(__make_anim__(rng, 30), 1e-4, 1e-4, 1e-4)
+        stepped = keys.parts[1]
+        self.assertEqual(stepped.scales.frames, [0])
+        for channel in (stepped.offsets, stepped.rotations):
+            # A key on either side of each step (& the first & last frames)
+            for step in range(7, 30, 7):
+                self.assertIn(step - 1, channel.frames)
+                self.assertIn(step, channel.frames)
+            self.assertLessEqual(channel.key_count, 2 * (30 // 7) + 2)
+        self.assertGreater(keys.constant_segments, 0)
+
+    def test_default_tolerances(self):
+        rng = random.Random(23)
+        anim = __make_anim__(rng, 60)
+        keys = anim.reduce_keys()
+        self.assertEqual(
+            keys.stats(),
+            self.assertWithin(anim, xanim_keys.POSITION_TOLERANCE,
+                              xanim_keys.ANGLE_TOLERANCE,
+                              xanim_keys.SCALE_TOLERANCE).stats())
+
+    def test_invalid(self):
+        anim = __make_anim__(random.Random(23), 10)
+        for kwargs in ({'position_tolerance': -1e-4},
+                       {'angle_tolerance': float('nan')},
+                       {'scale_tolerance': -1.0}):
+            self.assertRaises(ValueError, anim.reduce_keys, **kwargs)
+
+        anim.frames[3].frame = anim.frames[2].frame
+        self.assertRaises(ValueError, anim.reduce_keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# <pep8 compliant>
+
+'''
+Compare the tokenized *_EXPORT parsers with the line based reference
+ parsers (see TOKENIZED_PARSER) - both must build the same object graph
+Run from the directory that contains PyCoD:
+    python -m unittest PyCoD.tests.test_parser
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from itertools import combinations
+
+from .. import _parser, xanim, xmodel
+from ..xanim import Anim
+from ..xmodel import Model
+from ._fixtures import __graph__, __make_anim__, __make_model__
+
+
+class TokenizedParserTest(unittest.TestCase):
+    # Chunk sizes small enough to split most lines (& tokens)
+    tiny_chunk_sizes = (1, 7, 64)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.model_paths = {}
+        for version in Model.supported_versions:
+            path = os.path.join(cls.tmp_dir, 'v%d.XMODEL_EXPORT' % version)
+            __make_model__(version).WriteFile_Raw(path, version=version)
+            cls.model_paths[version] = path
+        cls.anim_path = os.path.join(cls.tmp_dir, 'anim.XANIM_EXPORT')
+        __make_anim__().WriteFile_Raw(cls.anim_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def setUp(self):
+        self.chunk_size = _parser.RAW_CHUNK_SIZE
+
+    def tearDown(self):
+        xmodel.TOKENIZED_PARSER = True
+        xanim.TOKENIZED_PARSER = True
+        _parser.RAW_CHUNK_SIZE = self.chunk_size
+
+    def load_model(self, tokenized, path, **kwargs):
+        xmodel.TOKENIZED_PARSER = tokenized
+        return __graph__(Model.FromFile_Raw(path, **kwargs))
+
+    def load_anim(self, tokenized, path, **kwargs):
+        xanim.TOKENIZED_PARSER = tokenized
+        return __graph__(Anim.FromFile_Raw(path, **kwargs))
+
+    def assertSameModel(self, path, **kwargs):
+        self.assertEqual(self.load_model(False, path, **kwargs),
+                         self.load_model(True, path, **kwargs))
+
+    def assertSameAnim(self, path, **kwargs):
+        self.assertEqual(self.load_anim(False, path, **kwargs),
+                         self.load_anim(True, path, **kwargs))
+
+    def test_model_versions(self):
+        for version, path in sorted(self.model_paths.items()):
+            for split_meshes in (True, False):
+                self.assertSameModel(path, split_meshes=split_meshes)
+
+    def test_model_sections(self):
+        supported = Model.supported_sections
+        subsets = [subset for count in range(len(supported))
+                   for subset in combinations(supported, count)]
+        for version, path in sorted(self.model_paths.items()):
+            for sections in subsets:
+                self.assertSameModel(path, sections=sections)
+
+    def test_model_chunk_sizes(self):
+        for version, path in sorted(self.model_paths.items()):
+            expected = self.load_model(False, path)
+            for chunk_size in self.tiny_chunk_sizes:
+                _parser.RAW_CHUNK_SIZE = chunk_size
+                self.assertEqual(self.load_model(True, path), expected)
+                self.assertEqual(
+                    self.load_model(True, path, sections=('bones',)),
+                    self.load_model(False, path, sections=('bones',)))
+
+    def test_model_corrupt_bone_index(self):
+        # An error in the file isn't mistaken for the end of the file
+        path = os.path.join(self.tmp_dir, 'corrupt.XMODEL_EXPORT')
+        with open(self.model_paths[6]) as file:
+            text = file.read()
+        with open(path, 'w') as file:
+            file.write(text.replace('BONE 5 ', 'BONE 9 ', 1))
+        for tokenized in (False, True):
+            self.assertRaises(IndexError, self.load_model, tokenized, path)
+
+    def test_anim(self):
+        self.assertSameAnim(self.anim_path)
+        self.assertSameAnim(self.anim_path, frames=(2, 5))
+        self.assertSameAnim(self.anim_path, parts=('part_1', 'part_3'))
+
+    def test_anim_chunk_sizes(self):
+        expected = self.load_anim(False, self.anim_path)
+        for chunk_size in self.tiny_chunk_sizes:
+            _parser.RAW_CHUNK_SIZE = chunk_size
+            self.assertEqual(self.load_anim(True, self.anim_path), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# <pep8 compliant>
+
+'''
+Compare the summary read by XBinIO.ProbeFile_Bin with a full load
+Run from the directory that contains PyCoD:
+    python -m unittest PyCoD.tests.test_probe
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import xbin
+from ..xanim import Anim
+from ..xmodel import Face, FaceVertex, Mesh, Model, Vertex
+from ._fixtures import __make_anim__, __make_model__
+
+
+def __make_large_model__():
+    '''
+    Build a model with more vertices than a uint16 can index, so its faces
+     use the int32 vertex index blocks
+    '''
+    model = __make_model__(7)
+    mesh = Mesh('mesh_large')
+    mesh.verts = [Vertex((i * 0.001, 0.0, 0.0), [(0, 1.0)])
+                  for i in range(70000)]
+    for i in range(4):
+        face = Face(len(model.meshes), 0)
+        face.indices = [FaceVertex(69990 + i + corner, (0.0, 0.0, 1.0),
+                                   (1.0, 1.0, 1.0, 1.0), (0.0, 0.0))
+                        for corner in range(3)]
+        mesh.faces.append(face)
+    model.meshes.append(mesh)
+    return model
+
+
+class ProbeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def assertSections(self, info, data, names):
+        '''
+        The sections must cover the whole block stream in order, & each one
+         must hold the names listed for it in names
+        '''
+        ranges = sorted(info.sections.values())
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for previous, section in zip(ranges, ranges[1:]):
+            self.assertEqual(previous[1], section[0])
+        for section, section_names in names.items():
+            start, end = info.sections[section]
+            for name in section_names:
+                self.assertIn(name.encode('utf-8'), bytes(data[start:end]))
+
+    def assertModel(self, model, version):
+        path = os.path.join(self.tmp_dir, 'probe.xmodel_bin')
+        model.WriteFile_Bin(path, version=version)
+        info = Model.ProbeFile_Bin(path)
+        loaded = Model.FromFile_Bin(path)
+
+        self.assertEqual(info.asset_type, 'MODEL')
+        self.assertEqual(info.version, version)
+        self.assertEqual(info.bones, [bone.name for bone in loaded.bones])
+        self.assertEqual(info.cosmetic_count,
+                         len([bone for bone in loaded.bones
+                              if bone.cosmetic]))
+        self.assertEqual(info.vertex_count,
+                         sum([len(mesh.verts) for mesh in model.meshes]))
+        self.assertEqual(info.face_count,
+                         sum([len(mesh.faces) for mesh in loaded.meshes]))
+        self.assertEqual(info.objects, [mesh.name for mesh in loaded.meshes])
+        self.assertEqual(info.materials,
+                         [material.name for material in loaded.materials])
+        self.assertEqual(sorted(info.sections),
+                         ['bones', 'faces', 'header', 'materials', 'objects',
+                          'vertices'])
+
+        data = xbin.__encode_model__(model, version)
+        self.assertSections(info, data, {'bones': info.bones,
+                                         'objects': info.objects,
+                                         'materials': info.materials})
+
+    def test_model(self):
+        for version in (6, 7):
+            self.assertModel(__make_model__(version), version)
+
+    def test_large_model(self):
+        self.assertModel(__make_large_model__(), 7)
+
+    def test_anim(self):
+        anim = __make_anim__()
+        path = os.path.join(self.tmp_dir, 'probe.xanim_bin')
+        anim.WriteFile_Bin(path)
+        info = Anim.ProbeFile_Bin(path)
+        loaded = Anim.FromFile_Bin(path)
+
+        self.assertEqual(info.asset_type, 'ANIM')
+        self.assertEqual(info.version, 3)
+        self.assertEqual(info.parts, [part.name for part in loaded.parts])
+        self.assertEqual(info.framerate, loaded.framerate)
+        self.assertEqual(info.frame_count, len(loaded.frames))
+        self.assertEqual(info.notes,
+                         [(note.frame, note.string) for note in loaded.notes])
+        self.assertEqual(sorted(info.sections),
+                         ['frames', 'header', 'notes', 'parts'])
+
+        data = xbin.__encode_anim__(anim, 3)
+        self.assertSections(info, data,
+                            {'parts': info.parts,
+                             'notes': [note[1] for note in info.notes]})
+
+    def test_expected_type(self):
+        path = os.path.join(self.tmp_dir, 'probe.xanim_bin')
+        __make_anim__().WriteFile_Bin(path)
+        self.assertRaises(TypeError, Model.ProbeFile_Bin, path,
+                          expected_type='MODEL')
+
+
+if __name__ == '__main__':
+    unittest.main()
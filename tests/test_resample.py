@@ -0,0 +1,114 @@
+# <pep8 compliant>
+
+'''
+Resample anims that were built in code (rather than loaded from a file)
+Run from the directory that contains PyCoD:
+    python -m unittest PyCoD.tests.test_resample
+'''
+
+import unittest
+from array import array
+from math import atan2, degrees
+
+from ..xanim_arrays import AnimArrays
+from ._fixtures import __make_anim__
+
+
+def __z_angle__(matrix):
+    '''
+    Returns the rotation around Z (in degrees) of a matrix built by
+     _fixtures.__z_rotation__
+    '''
+    return degrees(atan2(matrix[1][0], matrix[0][0]))
+
+
+class ResampleTest(unittest.TestCase):
+    def test_anim_framerate(self):
+        resampled = __make_anim__(5, 2).resample(framerate=60.0)
+        self.assertIsNone(resampled.version)
+        self.assertEqual(resampled.framerate, 60.0)
+        self.assertEqual([frame.frame for frame in resampled.frames],
+                         list(range(9)))
+        self.assertEqual([note.frame for note in resampled.notes], [4, 8])
+        for frame in resampled.frames:
+            for p, part in enumerate(frame.parts):
+                self.assertAlmostEqual(part.offset[0], frame.frame + p)
+                self.assertAlmostEqual(part.offset[1], frame.frame * 0.25)
+                self.assertAlmostEqual(__z_angle__(part.matrix),
+                                       frame.frame * 15.0)
+
+    def test_anim_frame_count(self):
+        resampled = __make_anim__(5, 2).resample(frame_count=3)
+        self.assertEqual(resampled.framerate, 15.0)
+        self.assertEqual([frame.frame for frame in resampled.frames],
+                         [0, 1, 2])
+        self.assertEqual([note.frame for note in resampled.notes], [1, 2])
+        # Every new frame lands on an old one (0, 2 & 4)
+        for frame in resampled.frames:
+            for p, part in enumerate(frame.parts):
+                self.assertAlmostEqual(part.offset[0], frame.frame * 4.0 + p)
+                self.assertAlmostEqual(__z_angle__(part.matrix),
+                                       frame.frame * 60.0)
+
+    def test_arrays_frame_count(self):
+        arrays = AnimArrays('d')
+        arrays.framerate = 30.0
+        arrays.part_names = ['part_0', 'part_1']
+        arrays.frame_numbers = array('i', range(5))
+        arrays.offsets = array('d', [value for f in range(5) for p in range(2)
+                                     for value in (f * 2.0 + p, 0.0, 0.0)])
+        arrays.matrices = array('d', (1, 0, 0, 0, 1, 0, 0, 0, 1)) * 10
+        arrays.note_frames = array('i', (2, 4))
+        arrays.note_strings = ['start', 'end']
+
+        resampled = arrays.resample(frame_count=3)
+        self.assertIsNone(resampled.version)
+        self.assertEqual(resampled.framerate, 15.0)
+        self.assertEqual(list(resampled.frame_numbers), [0, 1, 2])
+        self.assertEqual(list(resampled.note_frames), [1, 2])
+        anim = resampled.to_anim()
+        self.assertEqual([frame.parts[1].offset[0] for frame in anim.frames],
+                         [1.0, 5.0, 9.0])
+
+    def test_slerp_nlerp(self):
+        # The new frames are a third of the way between the old ones, where
+        #  nlerp (unlike slerp) doesn't rotate at a constant speed
+        anim = __make_anim__(3, 1, degrees=60.0)
+        slerped = anim.resample(framerate=90.0)
+        nlerped = anim.resample(framerate=90.0, slerp=False)
+        for frame in range(7):
+            expected = frame * 20.0
+            slerp_angle = __z_angle__(slerped.frames[frame].parts[0].matrix)
+            nlerp_angle = __z_angle__(nlerped.frames[frame].parts[0].matrix)
+            self.assertAlmostEqual(slerp_angle, expected)
+            self.assertAlmostEqual(nlerp_angle, expected, delta=0.5)
+            if frame % 3:
+                self.assertNotAlmostEqual(nlerp_angle, expected, places=2)
+            else:
+                self.assertAlmostEqual(nlerp_angle, expected)
+
+    def test_invalid_arguments(self):
+        anim = __make_anim__(5, 2)
+        for kwargs in ({}, {'framerate': 60.0, 'frame_count': 3},
+                       {'framerate': 0.0}, {'framerate': -30.0},
+                       {'frame_count': 1}):
+            self.assertRaises(ValueError, anim.resample, **kwargs)
+
+        # A framerate can't be resampled without knowing the current one
+        anim.framerate = None
+        self.assertRaises(ValueError, anim.resample, framerate=60.0)
+
+        # A single frame can't be spread over a frame count
+        self.assertRaises(ValueError, __make_anim__(1, 2).resample,
+                          frame_count=3)
+
+        anim = __make_anim__(5, 2)
+        anim.frames[1], anim.frames[2] = anim.frames[2], anim.frames[1]
+        self.assertRaises(ValueError, anim.resample, framerate=60.0)
+
+        anim.frames[2] = None
+        self.assertRaises(ValueError, anim.resample, framerate=60.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
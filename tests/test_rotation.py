@@ -0,0 +1,150 @@
+# <pep8 compliant>
+
+'''
+Convert rotation matrices to quaternions & back, with & without NumPy (see
+ _rotation.USE_NUMPY)
+Run from the directory that contains PyCoD:
+    python -m unittest PyCoD.tests.test_rotation
+'''
+
+import random
+import unittest
+from math import pi
+
+from .. import _rotation
+from .._rotation import (__matrices_to_quat_list__, __matrices_to_quats__,
+                         __quat_list_to_matrices__, __quats_to_matrices__)
+from ._fixtures import __axis_rotation__
+
+
+def __flatten__(matrices):
+    return [value for matrix in matrices for row in matrix for value in row]
+
+
+def __unflatten__(values):
+    return [[tuple(values[m + r:m + r + 3]) for r in (0, 3, 6)]
+            for m in range(0, len(values), 9)]
+
+
+def __quantize__(matrix):
+    '''
+    Round each value the way the matrices in *_bin files are stored
+    '''
+    return [tuple([int(value * 32767.0) / 32767.0 for value in row])
+            for row in matrix]
+
+
+class RotationTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(24)
+        axes = [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0),
+                (1.0, 1.0, 1.0)]
+        # The half turns have a w of 0, the other edge case
+        cls.matrices = [__axis_rotation__(axis, angle) for axis in axes
+                        for angle in (0.0, pi * 0.5, pi, pi - 1e-7)]
+        cls.matrices += [__axis_rotation__([rng.uniform(-1, 1)
+                                            for i in range(3)],
+                                           rng.uniform(-pi, pi))
+                         for i in range(200)]
+
+    def setUp(self):
+        self.use_numpy = _rotation.USE_NUMPY
+        self.modes = [False]
+        if _rotation.numpy is not None:
+            self.modes.append(True)
+
+    def tearDown(self):
+        _rotation.USE_NUMPY = self.use_numpy
+
+    def assertMatrices(self, matrices, expected, delta):
+        self.assertEqual(len(matrices), len(expected))
+        for matrix, expected_matrix in zip(matrices, expected):
+            for row, expected_row in zip(matrix, expected_matrix):
+                for value, expected_value in zip(row, expected_row):
+                    self.assertAlmostEqual(value, expected_value, delta=delta)
+
+    def assertUnit(self, quats):
+        for quat in quats:
+            self.assertAlmostEqual(sum([value * value for value in quat]),
+                                   1.0)
+
+    def assertOrthonormal(self, matrices):
+        for matrix in matrices:
+            for a in range(3):
+                for b in range(3):
+                    dot = sum([x * y for x, y in zip(matrix[a], matrix[b])])
+                    self.assertAlmostEqual(dot, 1.0 if a == b else 0.0,
+                                           delta=1e-12)
+
+    def test_round_trip(self):
+        for use_numpy in self.modes:
+            _rotation.USE_NUMPY = use_numpy
+            for orthonormalize in (True, False):
+                quats = __matrices_to_quat_list__(self.matrices,
+                                                  orthonormalize)
+                self.assertUnit(quats)
+                self.assertMatrices(__quat_list_to_matrices__(quats),
+                                    self.matrices, 1e-12)
+
+                flat = __matrices_to_quats__(__flatten__(self.matrices),
+                                             orthonormalize)
+                self.assertEqual(len(flat), 4 * len(self.matrices))
+                for quat, expected in zip(zip(*[iter(flat)] * 4), quats):
+                    for value, expected_value in zip(quat, expected):
+                        self.assertAlmostEqual(value, expected_value,
+                                               delta=1e-12)
+                self.assertMatrices(__unflatten__(__quats_to_matrices__(flat)),
+                                    self.matrices, 1e-12)
+
+    def test_quantized(self):
+        # The quantized matrices are re-orthonormalized, so they convert
+        #  back to true rotations that are within the quantization error
+        quantized = [__quantize__(matrix) for matrix in self.matrices]
+        for use_numpy in self.modes:
+            _rotation.USE_NUMPY = use_numpy
+            quats = __matrices_to_quat_list__(quantized)
+            self.assertUnit(quats)
+            matrices = __quat_list_to_matrices__(quats)
+            self.assertOrthonormal(matrices)
+            self.assertMatrices(matrices, self.matrices, 1e-4)
+
+            flat = __quats_to_matrices__(__matrices_to_quats__(
+                __flatten__(quantized)))
+            self.assertOrthonormal(__unflatten__(flat))
+            self.assertMatrices(__unflatten__(flat), matrices, 1e-12)
+
+    def test_unnormalized(self):
+        # The quaternions are normalized before they're converted
+        for use_numpy in self.modes:
+            _rotation.USE_NUMPY = use_numpy
+            quats = __matrices_to_quat_list__(self.matrices)
+            scaled = [tuple([value * 3.0 for value in quat])
+                      for quat in quats]
+            self.assertMatrices(__quat_list_to_matrices__(scaled),
+                                self.matrices, 1e-12)
+            flat = [value for quat in scaled for value in quat]
+            self.assertMatrices(__unflatten__(__quats_to_matrices__(flat)),
+                                self.matrices, 1e-12)
+
+    def test_typecode(self):
+        for use_numpy in self.modes:
+            _rotation.USE_NUMPY = use_numpy
+            quats = __matrices_to_quats__(__flatten__(self.matrices),
+                                          typecode='f')
+            self.assertEqual(quats.typecode, 'f')
+            matrices = __quats_to_matrices__(quats, typecode='f')
+            self.assertEqual(matrices.typecode, 'f')
+            self.assertMatrices(__unflatten__(matrices), self.matrices, 1e-5)
+
+    def test_invalid_length(self):
+        for use_numpy in self.modes:
+            _rotation.USE_NUMPY = use_numpy
+            self.assertRaises(ValueError, __matrices_to_quats__, [1.0] * 10)
+            self.assertRaises(ValueError, __quats_to_matrices__, [1.0] * 5)
+        self.assertEqual(__matrices_to_quat_list__([]), [])
+        self.assertEqual(len(__matrices_to_quats__([])), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# <pep8 compliant>
+
+'''
+Load subsets of the sections of models (see Model.supported_sections) from
+ both xmodel_bin & XMODEL_EXPORT files
+Run from the directory that contains PyCoD:
+    python -m unittest PyCoD.tests.test_sections
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from itertools import combinations
+
+from ..xmodel import Model
+from ..xmodel_arrays import ModelArrays
+from ._fixtures import __graph__, __make_model__
+
+
+# The attributes that each section fills in
+__model_attrs__ = {'bones': ('bones',),
+                   'geometry': ('meshes',),
+                   'materials': ('materials',)}
+__arrays_attrs__ = {'bones': ('bones',),
+                    'geometry': ('mesh_names', 'positions', 'weight_offsets',
+                                 'weight_bones', 'weight_values',
+                                 'face_vertices', 'normals', 'colors', 'uvs',
+                                 'face_meshes', 'face_materials'),
+                    'materials': ('materials',)}
+
+
+class SectionsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        model = __make_model__(7)
+        cls.bin_path = os.path.join(cls.tmp_dir, 'sections.xmodel_bin')
+        model.WriteFile_Bin(cls.bin_path, version=7)
+        cls.raw_path = os.path.join(cls.tmp_dir, 'sections.XMODEL_EXPORT')
+        model.WriteFile_Raw(cls.raw_path, version=7)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def assertSections(self, load, path, empty, attrs):
+        '''
+        Every subset of the sections must load the same values as a full
+         load for its sections & leave the rest as they are in empty
+        '''
+        supported = Model.supported_sections
+        full = load(path)
+        self.assertEqual(full.sections, frozenset(supported))
+        for count in range(len(supported) + 1):
+            for sections in combinations(supported, count):
+                loaded = load(path, sections=sections)
+                self.assertEqual(loaded.sections, frozenset(sections))
+                for section in supported:
+                    expected = full if section in sections else empty
+                    for attr in attrs[section]:
+                        self.assertEqual(
+                            __graph__(getattr(loaded, attr)),
+                            __graph__(getattr(expected, attr)),
+                            "%s with sections=%r" % (attr, sections))
+
+    def test_model_bin(self):
+        self.assertSections(Model.FromFile_Bin, self.bin_path, Model(),
+                            __model_attrs__)
+
+    def test_model_raw(self):
+        self.assertSections(Model.FromFile_Raw, self.raw_path, Model(),
+                            __model_attrs__)
+
+    def test_arrays_bin(self):
+        self.assertSections(ModelArrays.FromFile_Bin, self.bin_path,
+                            ModelArrays(), __arrays_attrs__)
+
+    def test_arrays_raw(self):
+        self.assertSections(ModelArrays.FromFile_Raw, self.raw_path,
+                            ModelArrays(), __arrays_attrs__)
+
+    def test_invalid_section(self):
+        for load, path in ((Model.FromFile_Bin, self.bin_path),
+                           (Model.FromFile_Raw, self.raw_path),
+                           (ModelArrays.FromFile_Bin, self.bin_path),
+                           (ModelArrays.FromFile_Raw, self.raw_path)):
+            self.assertRaises(ValueError, load, path,
+                              sections=('bones', 'verts'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# <pep8 compliant>
+
+'''
+Compare the meshes split by Model.__generate_meshes__ with the previous
+ algorithm, which kept a vertex map per mesh
+Run from the directory that contains PyCoD:
+    python -m unittest PyCoD.tests.test_split_meshes
+'''
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from ..xmodel import Face, FaceVertex, Mesh, Model, Vertex
+from ._fixtures import __graph__, __make_model__
+
+
+def __split_meshes__(mesh_count, default_mesh):
+    '''
+    Split default_mesh the way __generate_meshes__ used to (without changing
+     it) - returns a (verts, face vertex indices) pair for each mesh
+    '''
+    meshes = [([], []) for i in range(mesh_count)]
+    vertex_map = [[None] * len(default_mesh.verts)
+                  for i in range(mesh_count)]
+    for face in default_mesh.faces:
+        mesh_id = face.mesh_id
+        verts, faces = meshes[mesh_id]
+        indices = []
+        for ind in face.indices:
+            vert_id = vertex_map[mesh_id][ind.vertex]
+            if vert_id is None:
+                vert_id = len(verts)
+                vertex_map[mesh_id][ind.vertex] = vert_id
+                verts.append(default_mesh.verts[ind.vertex])
+            indices.append(vert_id)
+        faces.append(tuple(indices))
+    return meshes
+
+
+def __make_default_mesh__(rng, mesh_count, vert_count, face_count, shared):
+    '''
+    Build an unsplit mesh - each face belongs to a random mesh (given by a
+     negative id half of the time) & uses the verts of another mesh with a
+     probability of shared
+    '''
+    default_mesh = Mesh('$default')
+    default_mesh.verts = [Vertex((i, 0.0, 0.0),
+                                 [(rng.randrange(4), 1.0)])
+                          for i in range(vert_count)]
+    for i in range(face_count):
+        mesh_id = rng.randrange(mesh_count)
+        face = Face(mesh_id - mesh_count if rng.random() < 0.5 else mesh_id,
+                    rng.randrange(3))
+        face.indices = []
+        for corner in range(3):
+            if rng.random() < shared:
+                vert_id = rng.randrange(vert_count)
+            else:
+                # The verts are spread evenly over the meshes
+                vert_id = rng.randrange(mesh_id, vert_count, mesh_count)
+            face.indices.append(FaceVertex(vert_id, (0.0, 0.0, 1.0),
+                                           (1.0, 1.0, 1.0, 1.0), (0.0, 0.0)))
+        default_mesh.faces.append(face)
+    return default_mesh
+
+
+class SplitMeshesTest(unittest.TestCase):
+    def assertSplit(self, model, default_mesh):
+        '''
+        Split default_mesh into the meshes of model & compare them with the
+         previous algorithm
+        '''
+        expected = __split_meshes__(len(model.meshes), default_mesh)
+        model.__generate_meshes__(default_mesh)
+        for mesh, (verts, faces) in zip(model.meshes, expected):
+            self.assertEqual(len(mesh.verts), len(verts))
+            for vert, expected_vert in zip(mesh.verts, verts):
+                self.assertIs(vert, expected_vert)
+            self.assertEqual([tuple([ind.vertex for ind in face.indices])
+                              for face in mesh.faces], faces)
+
+            # Each group holds every (vert, weight) / vert once
+            bone_groups = [[] for i in range(len(model.bones))]
+            material_groups = [set() for i in range(len(model.materials))]
+            for vert_id, vert in enumerate(verts):
+                for bone_id, weight in vert.weights:
+                    bone_groups[bone_id].append((vert_id, weight))
+            for face, indices in zip(mesh.faces, faces):
+                material_groups[face.material_id].update(indices)
+            self.assertEqual([sorted(group) for group in mesh.bone_groups],
+                             [sorted(set(group)) for group in bone_groups])
+            self.assertEqual([sorted(group)
+                              for group in mesh.material_groups],
+                             [sorted(group) for group in material_groups])
+
+    def test_random(self):
+        rng = random.Random(17)
+        for mesh_count in (1, 2, 5, 40):
+            for shared in (0.0, 0.1, 1.0):
+                model = Model()
+                model.bones = [None] * 4
+                model.materials = [None] * 3
+                model.meshes = [Mesh('mesh_%d' % i)
+                                for i in range(mesh_count)]
+                self.assertSplit(model, __make_default_mesh__(
+                    rng, mesh_count, 200, 300, shared))
+
+    def test_files(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for version in Model.supported_versions:
+                path = os.path.join(tmp_dir, 'split.XMODEL_EXPORT')
+                __make_model__(version).WriteFile_Raw(path, version=version)
+                model = Model.FromFile_Raw(path)
+                default_mesh = Model.FromFile_Raw(path, split_meshes=False)
+                expected = __split_meshes__(len(model.meshes),
+                                            default_mesh.meshes[0])
+                for mesh, (verts, faces) in zip(model.meshes, expected):
+                    self.assertEqual(__graph__(mesh.verts), __graph__(verts))
+                    self.assertEqual(
+                        [tuple([ind.vertex for ind in face.indices])
+                         for face in mesh.faces], faces)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# <pep8 compliant>
+
+'''
+Compare Mesh.weld with a naive weld that looks every face corner up in a
+ dict of tuples
+Run from the directory that contains PyCoD:
+    python -m unittest PyCoD.tests.test_weld
+'''
+
+import random
+import unittest
+from math import floor
+
+from ..xmodel import Face, FaceVertex, Mesh, Model, Vertex
+from ._fixtures import __make_model__
+
+
+def __tuple__(values):
+    return None if values is None else tuple(values)
+
+
+def __naive_weld__(mesh, epsilon=None):
+    '''
+    Returns the (vertex index, normal, color, uv) tuple of each unique
+     render vertex & the index of the render vertex of each face corner
+    '''
+    vertices = []
+    indices = []
+    lookup = {}
+    for face in mesh.faces:
+        for ind in face.indices:
+            corner = (ind.vertex, __tuple__(ind.normal),
+                      __tuple__(ind.color), __tuple__(ind.uv))
+            if epsilon is None:
+                key = corner
+            else:
+                key = (ind.vertex,) + tuple(
+                    [tuple([int(floor(value / epsilon + 0.5))
+                            for value in values])
+                     for values in corner[1:]])
+            if key not in lookup:
+                lookup[key] = len(vertices)
+                vertices.append(corner)
+            indices.append(lookup[key])
+    return vertices, indices
+
+
+def __make_mesh__(rng, vert_count, face_count, jitter=0.0, as_list=False):
+    '''
+    Build a mesh whose corners pick their values from small pools, so many
+     of them are the same (or within jitter of each other)
+    '''
+    normals = [(rng.uniform(-1, 1), rng.uniform(-1, 1), rng.uniform(-1, 1))
+               for i in range(4)]
+    colors = [(rng.random(), rng.random(), rng.random(), 1.0)
+              for i in range(2)]
+    uvs = [(rng.random(), rng.random()) for i in range(3)]
+
+    def pick(pool):
+        values = [value + rng.uniform(-jitter, jitter)
+                  for value in rng.choice(pool)]
+        return values if as_list else tuple(values)
+
+    mesh = Mesh('mesh')
+    mesh.verts = [Vertex((i, 0.0, 0.0), [(0, 1.0)])
+                  for i in range(vert_count)]
+    for i in range(face_count):
+        face = Face(0, 0)
+        face.indices = [FaceVertex(rng.randrange(vert_count), pick(normals),
+                                   pick(colors), pick(uvs))
+                        for corner in range(3)]
+        mesh.faces.append(face)
+    return mesh
+
+
+class WeldTest(unittest.TestCase):
+    def assertWeld(self, mesh, epsilon=None):
+        vertices, indices = __naive_weld__(mesh, epsilon)
+        buffer = mesh.weld(epsilon)
+        self.assertEqual([(vertex[0],) + tuple([__tuple__(values)
+                                                for values in vertex[1:]])
+                          for vertex in buffer.vertices], vertices)
+        self.assertEqual(list(buffer.indices), indices)
+        self.assertEqual(buffer.corner_count, 3 * len(mesh.faces))
+        self.assertAlmostEqual(buffer.dedup_ratio,
+                               float(len(indices)) / len(vertices))
+        return buffer
+
+    def test_exact(self):
+        rng = random.Random(19)
+        for vert_count in (1, 10, 100):
+            mesh = __make_mesh__(rng, vert_count, 200)
+            buffer = self.assertWeld(mesh)
+            # Every corner keeps its exact values
+            corners = [(ind.vertex, ind.normal, ind.color, ind.uv)
+                       for face in mesh.faces for ind in face.indices]
+            self.assertEqual([buffer.vertices[index]
+                              for index in buffer.indices], corners)
+
+    def test_epsilon(self):
+        rng = random.Random(19)
+        for epsilon in (1e-6, 1e-4, 0.01):
+            self.assertWeld(__make_mesh__(rng, 10, 200, 1e-5), epsilon)
+
+        # The jitter keeps almost every corner apart unless an epsilon is
+        #  given
+        mesh = __make_mesh__(rng, 10, 200, 1e-7)
+        exact = self.assertWeld(mesh)
+        welded = self.assertWeld(mesh, 1e-3)
+        self.assertLess(len(welded.vertices), len(exact.vertices))
+        self.assertLessEqual(len(welded.vertices), 10 * 4 * 2 * 3)
+
+    def test_lists(self):
+        rng = random.Random(19)
+        mesh = __make_mesh__(rng, 10, 200, as_list=True)
+        self.assertWeld(mesh)
+        self.assertWeld(mesh, 1e-4)
+
+    def test_model(self):
+        model = __make_model__(7)
+        buffers = model.weld()
+        self.assertEqual(len(buffers), len(model.meshes))
+        for mesh, buffer in zip(model.meshes, buffers):
+            self.assertEqual(buffer.vertices, self.assertWeld(mesh).vertices)
+
+        self.assertEqual(Model().weld(), [])
+        buffer = Mesh('empty').weld()
+        self.assertEqual(buffer.vertices, [])
+        self.assertEqual(buffer.corner_count, 0)
+        self.assertEqual(buffer.dedup_ratio, 1.0)
+
+    def test_invalid_epsilon(self):
+        mesh = __make_model__(7).meshes[0]
+        for epsilon in (0.0, -1e-4):
+            self.assertRaises(ValueError, mesh.weld, epsilon)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,24 @@
 
 from time import strftime
 import os
+import re
+import struct
 
-from .xbin import XBinIO, validate_version
+from .xbin import (XBinIO, XBinDecoder, validate_version, __unpack_int16__,
+                   __unpack_int32__, __unpack_frame_part_skip__,
+                   __skip_frame__)
+from ._parser import ExportParser, __tokenize__, __find_token__
+from ._writer import ExportWriter, WRITE_BATCH_SIZE
+from ._rotation import __matrices_to_quat_list__, __quat_list_to_matrices__
 
 # Can be int or float
 #  Changes the internal type for frames indices
 FRAME_TYPE = float
 
+# Parse XANIM_EXPORT files with the tokenizing AnimExportParser
+#  When disabled the (slower) line based reference parser is used instead
+TOKENIZED_PARSER = True
+
 '''
     -------------------
     ---< NT_EXPORT >---
@@ -69,8 +80,7 @@ class NoteTrack(object):
         file.write("FIRSTFRAME %d\n" % self.first_frame)
         file.write("NUMFRAMES %d\n" % self.frame_count)
         file.write("NUMKEYS %d\n" % len(self.notes))
-        for note in self.notes:
-            file.write("FRAME %d \"%s\"\n" % (note.frame, note.string))
+        file.write(__format_notes__(self.notes))
         file.close()
 
     """
@@ -106,10 +116,193 @@ def __clamp_multi__(value, clamp_range=(-1.0, 1.0)):
     return tuple([max(min(v, clamp_range[1]), clamp_range[0]) for v in value])
 
 
+def __clamp_matrix__(matrix):
+    '''
+    Returns the values of a 3x3 matrix as a flat list, clamped to [-1, 1]
+    '''
+    values = list(matrix[0][:3])
+    values.extend(matrix[1][:3])
+    values.extend(matrix[2][:3])
+    if min(values) < -1.0 or max(values) > 1.0:
+        return [max(min(v, 1.0), -1.0) for v in values]
+    return values
+
+
 def __clean_float2str__(value):
     return ('%f' % value).rstrip('0').rstrip('.')
 
 
+def __format_notes__(notes):
+    return "".join(["FRAME %d \"%s\"\n" % (note.frame, note.string)
+                    for note in notes])
+
+
+__part_format__ = ("PART %d\n"
+                   "OFFSET %f %f %f\n"
+                   "SCALE %f %f %f\n"
+                   "X %f %f %f\n"
+                   "Y %f %f %f\n"
+                   "Z %f %f %f\n\n")
+
+
+def __write_frames_raw__(file, frames):
+    '''
+    Write the frames of an XANIM_EXPORT file, WRITE_BATCH_SIZE parts at a time
+    '''
+    frame_formats = {}
+    formats = []
+    values = []
+    part_total = 0
+    for frame in frames:
+        parts = frame.parts
+        fmt = frame_formats.get(len(parts))
+        if fmt is None:
+            fmt = "FRAME %s\n" + __part_format__ * len(parts)
+            frame_formats[len(parts)] = fmt
+        formats.append(fmt)
+        values.append(__clean_float2str__(frame.frame))
+        for part_index, part in enumerate(parts):
+            values.append(part_index)
+            values.extend(part.offset[:3])
+            values.extend(part.scale[:3])
+            values.extend(__clamp_matrix__(part.matrix))
+        part_total += len(parts)
+        if part_total >= WRITE_BATCH_SIZE:
+            file.write_batch(formats, values)
+            formats = []
+            values = []
+            part_total = 0
+    file.write_batch(formats, values)
+
+
+def __find_notetrack_file__(anim_filepath):
+    notetrack_basepath = os.path.splitext(anim_filepath)[0]
+    for ext in ['.NT_EXPORT', '.nt_export']:
+        path = notetrack_basepath + ext
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def __load_notetrack_file__(filepath, frame_numbers):
+    '''
+    Load the notes from the NT_EXPORT file that belongs to the XANIM_EXPORT
+     file at filepath (whose frames are numbered frame_numbers)
+    Returns the list of Notes, or None if there's no matching NT_EXPORT file
+    '''
+    notetrack_filepath = __find_notetrack_file__(filepath)
+    if notetrack_filepath is None:
+        return None
+
+    nt = NoteTrack.FromFile_Raw(notetrack_filepath)
+    first_frame = min(frame_numbers)
+    frame_count = len(frame_numbers)
+    if nt.frame_count != frame_count or nt.first_frame != first_frame:
+        basename = os.path.basename
+        args = (basename(notetrack_filepath), basename(filepath))
+        fmt = ("Notetrack file '%s' doesn't match anim '%s'"
+               " - skipping...")
+        print(fmt % args)
+        return None
+    return nt.notes
+
+
+def __frame_range__(frames):
+    '''
+    Returns the (start, end) bounds of a frames=(start, end) load option -
+     either bound can be None to leave that side of the range open
+    '''
+    start, end = frames
+    if start is None:
+        start = float('-inf')
+    if end is None:
+        end = float('inf')
+    return start, end
+
+
+def __select_parts__(parts, names):
+    '''
+    Returns the indices of the parts whose names are in names (in the order
+     of parts)
+    Raises a ValueError if any of the names isn't the name of a part
+    '''
+    names = set(names)
+    indices = [index for index, part in enumerate(parts)
+               if part.name in names]
+    missing = names.difference([parts[index].name for index in indices])
+    if missing:
+        raise ValueError("Unknown part(s): %s" %
+                         ", ".join(sorted(repr(name) for name in missing)))
+    return indices
+
+
+# Matches the FRAME lines of the frames section & the NOTETRACKS line that
+#  follows it
+__frame_line_re__ = re.compile(
+    r'^[ \t]*(?:FRAME[ \t]+([^\s,]+)|NOTETRACKS\s)', re.M)
+
+
+def __frame_layouts__(part_count):
+    '''
+    Returns a dict that maps the stride of the tokens of a part in a standard
+     frame (without & with the SCALE line) to the (offset, expected tokens)
+     of the part indices & keywords
+    '''
+    indices = [str(i) for i in range(part_count)]
+    layouts = {}
+    for stride, keywords in ((18, ('PART', 'OFFSET', 'X', 'Y', 'Z')),
+                             (22, ('PART', 'OFFSET', 'SCALE',
+                                   'X', 'Y', 'Z'))):
+        layout = [(1, indices)]
+        offset = 0
+        for keyword in keywords:
+            layout.append((offset, [keyword] * part_count))
+            offset += 2 if keyword == 'PART' else 4
+        layouts[stride] = layout
+    return layouts
+
+
+def __match_frame_layout__(parser, tokens, pos, part_count, layouts):
+    '''
+    Check whether the parts of the frame whose first part token is at pos
+     use one of the standard layouts (see __frame_layouts__)
+    Returns the (stride, end) of the frame's part tokens, or None
+    '''
+    if part_count == 0:
+        return 18, pos
+    if not parser.__require__(tokens, pos + 18 * part_count):
+        return None
+    stride = 22 if tokens[pos + 6] == 'SCALE' else 18
+    end = pos + stride * part_count
+    if not parser.__require__(tokens, end):
+        return None
+    for offset, expected in layouts[stride]:
+        if tokens[pos + offset:end:stride] != expected:
+            return None
+    return stride, end
+
+
+def __token_vec3__(tokens, pos):
+    return (float(tokens[pos]),
+            float(tokens[pos + 1]),
+            float(tokens[pos + 2]))
+
+
+def __load_part_tokens__(tokens, pos, stride):
+    '''
+    Returns the FramePart for the tokens of a part of a frame that uses a
+     standard layout (see __frame_layouts__), starting at pos
+    '''
+    x = pos + stride - 12
+    matrix = [__token_vec3__(tokens, x + 1),
+              __token_vec3__(tokens, x + 5),
+              __token_vec3__(tokens, x + 9)]
+    offset = __token_vec3__(tokens, pos + 3)
+    if stride == 22:
+        return FramePart(offset, matrix, __token_vec3__(tokens, pos + 7))
+    return FramePart(offset, matrix)
+
+
 class PartInfo(object):
     '''In the context of an XANIM_EXPORT file, a 'part' is essentially a
     bone'''
@@ -338,34 +531,64 @@ class Anim(XBinIO, object):
 
         # Automatically load the matching NT_EXPORT file if requested
         if use_notetrack_file:
-            def find_notetrack_file(anim_filepath):
-                notetrack_basepath = os.path.splitext(anim_filepath)[0]
-                for ext in ['.NT_EXPORT', '.nt_export']:
-                    path = notetrack_basepath + ext
-                    if os.path.exists(path):
-                        return path
-                return None
-
-            filepath = os.path.realpath(file.name)
-            notetrack_filepath = find_notetrack_file(filepath)
-            if notetrack_filepath is not None:
-                nt = NoteTrack.FromFile_Raw(notetrack_filepath)
-                first_frame = min([f.frame for f in self.frames])
-                frame_count = len(self.frames)
-                if nt.frame_count != frame_count or (
-                        nt.first_frame != first_frame):
-                    basename = os.path.basename
-                    args = (basename(notetrack_filepath), basename(filepath))
-                    fmt = ("Notetrack file '%s' doesn't match anim '%s'"
-                           " - skipping...")
-                    print(fmt % args)
-                    return lines_read
-                else:
-                    self.notes.extend(nt.notes)
+            notes = __load_notetrack_file__(os.path.realpath(file.name),
+                                            [f.frame for f in self.frames])
+            if notes is not None:
+                self.notes.extend(notes)
 
         return lines_read
 
-    def LoadFile_Raw(self, path, use_notetrack_file=False):
+    def __select__(self, frames=None, parts=None):
+        '''
+        Drop the frames (& notes) outside of the frames=(start, end) range &
+         the parts that aren't named in parts from the loaded anim
+        '''
+        if parts is not None:
+            indices = __select_parts__(self.parts, parts)
+            self.parts = [self.parts[index] for index in indices]
+            for frame in self.frames:
+                if frame is not None:
+                    frame.parts = [frame.parts[index] for index in indices]
+        if frames is not None:
+            start, end = __frame_range__(frames)
+            self.frames = [frame for frame in self.frames
+                           if frame is not None and
+                           start <= frame.frame < end]
+            self.notes = [note for note in self.notes
+                          if start <= note.frame < end]
+
+    def LoadFile_Raw(self, path, use_notetrack_file=False,
+                     frames=None, parts=None):
+        '''
+        Load an XANIM_EXPORT file
+        frames=(start, end) only loads the frames numbered [start, end) & the
+         notes on them, parts=[names] only loads the named parts - the lines
+         of the other frames & parts are skipped without being converted
+        '''
+        if not TOKENIZED_PARSER:
+            self.__load_raw_reference__(path, use_notetrack_file)
+            self.__select__(frames, parts)
+            return
+
+        file = open(path, "r")
+        try:
+            parser = AnimExportParser(self, frames, parts)
+            parser.parse(file)
+        finally:
+            file.close()
+
+        # Automatically load the matching NT_EXPORT file if requested
+        if use_notetrack_file:
+            notes = __load_notetrack_file__(os.path.realpath(path),
+                                            parser.frame_numbers)
+            if notes is not None:
+                self.notes.extend(notes)
+                self.__select__(frames)
+
+    def __load_raw_reference__(self, path, use_notetrack_file):
+        '''
+        Load an XANIM_EXPORT file using the line based reference parser
+        '''
         file = open(path, "r")
         # file automatically keeps track of what line its on across calls
         self.__load_header__(file)
@@ -376,8 +599,10 @@ class Anim(XBinIO, object):
 
     # Write an XANIM_EXPORT file
     # if embed_notes is False, a NT_EXPORT file will be created
+    # float_format is the FloatFormat used for the floats (%f by default)
     def WriteFile_Raw(self, path, version=3,
-                      header_message="", embed_notes=True):
+                      header_message="", embed_notes=True,
+                      float_format=None):
         first_frame = 0
         last_frame = 0
         if self.frames:
@@ -390,7 +615,7 @@ class Anim(XBinIO, object):
             err = (fmt % (last_frame - first_frame, len(self.frames)))
             raise ValueError(err)
 
-        file = open(path, "w")
+        file = ExportWriter(open(path, "w"), float_format)
         file.write(header_message)
         file.write("// Export time: %s\n\n" % strftime("%a %b %d %H:%M:%S %Y"))
 
@@ -401,24 +626,13 @@ class Anim(XBinIO, object):
         file.write("VERSION %d\n\n" % self.version)
 
         file.write("NUMPARTS %d\n" % len(self.parts))
-        for part_index, part in enumerate(self.parts):
-            file.write("PART %d \"%s\"\n" % (part_index, part.name))
+        file.write("".join(["PART %d \"%s\"\n" % (part_index, part.name)
+                            for part_index, part in enumerate(self.parts)]))
         file.write("\n")
 
         file.write("FRAMERATE %s\n" % __clean_float2str__(self.framerate))
         file.write("NUMFRAMES %d\n" % len(self.frames))
-        for frame in self.frames:
-            file.write("FRAME %s\n" % __clean_float2str__(frame.frame))
-            for part_index, part in enumerate(frame.parts):
-                file.write("PART %d\n" % part_index)
-                # TODO: Investigate precision options?
-                offset = (part.offset[0], part.offset[1], part.offset[2])
-                scale = (part.scale[0], part.scale[1], part.scale[2])
-                file.write("OFFSET %f %f %f\n" % offset)
-                file.write("SCALE %f %f %f\n" % scale)
-                file.write("X %f %f %f\n" % __clamp_multi__(part.matrix[0]))
-                file.write("Y %f %f %f\n" % __clamp_multi__(part.matrix[1]))
-                file.write("Z %f %f %f\n\n" % __clamp_multi__(part.matrix[2]))
+        __write_frames_raw__(file, self.frames)
 
         # NOTE: Despite having the same version number
         #   BO1 supports the NUMKEYS style embedded notetracks
@@ -439,9 +653,7 @@ class Anim(XBinIO, object):
                 if track_count != 0:
                     file.write("NOTETRACK 0\n")
                     file.write("NUMKEYS %d\n" % len(self.notes))
-                    for note in self.notes:
-                        file.write("FRAME %d \"%s\"\n" %
-                                   (note.frame, note.string))
+                    file.write(__format_notes__(self.notes))
                     file.write("\n")
 
         # Write a NT_EXPORT file
@@ -465,21 +677,33 @@ class Anim(XBinIO, object):
         file.close()
 
     @staticmethod
-    def FromFile_Raw(filepath):
+    def FromFile_Raw(filepath, frames=None, parts=None):
         '''
         Load from an XANIM_EXPORT file and return the resulting Anim()
         '''
         anim = Anim()
-        anim.LoadFile_Raw(filepath)
+        anim.LoadFile_Raw(filepath, frames=frames, parts=parts)
         return anim
 
-    def LoadFile_Bin(self, path, is_compressed=True, dump=False):
+    def LoadFile_Bin(self, path, is_compressed=True, dump=False,
+                     frames=None, parts=None):
+        '''
+        Load an XANIM_BIN file
+        frames=(start, end) only loads the frames numbered [start, end) & the
+         notes on them, parts=[names] only loads the named parts - the blocks
+         of the other frames & parts are skipped without being decoded
+        '''
         file = open(path, "rb")
 
         if is_compressed:
             file = XBinIO.__decompress_internal__(file, dump)
 
-        self.__xbin_loadfile_internal__(file, 'ANIM')
+        if frames is None and parts is None:
+            self.__xbin_loadfile_internal__(file, 'ANIM')
+        else:
+            self.__xbin_loadfile_internal__(file, 'ANIM',
+                                            decoder_type=AnimSubsetDecoder,
+                                            frames=frames, parts=parts)
         file.close()
 
     def WriteFile_Bin(self, path, version=3, header_message=""):
@@ -490,10 +714,521 @@ class Anim(XBinIO, object):
                                                      header_message)
 
     @staticmethod
-    def FromFile_Bin(filepath, is_compressed=True, dump=False):
+    def FromFile_Bin(filepath, is_compressed=True, dump=False,
+                     frames=None, parts=None):
         '''
         Load from a XANIM_BIN file and return the resulting Anim()
         '''
         anim = Anim()
-        anim.LoadFile_Bin(filepath, is_compressed, dump)
+        anim.LoadFile_Bin(filepath, is_compressed, dump, frames, parts)
         return anim
+
+    def reduce_keys(self, position_tolerance=None, angle_tolerance=None,
+                    scale_tolerance=None):
+        '''
+        Reduce the anim to the keys needed to rebuild each frame within the
+         given tolerances (see xanim_keys.AnimKeys.from_anim) - any tolerance
+         that's None uses the xanim_keys default
+        Returns an AnimKeys, use its to_anim() to expand it back to an Anim
+        '''
+        from . import xanim_keys
+        if position_tolerance is None:
+            position_tolerance = xanim_keys.POSITION_TOLERANCE
+        if angle_tolerance is None:
+            angle_tolerance = xanim_keys.ANGLE_TOLERANCE
+        if scale_tolerance is None:
+            scale_tolerance = xanim_keys.SCALE_TOLERANCE
+        return xanim_keys.AnimKeys.from_anim(self, position_tolerance,
+                                             angle_tolerance,
+                                             scale_tolerance)
+
+    def resample(self, framerate=None, frame_count=None, slerp=True):
+        '''
+        Returns a new Anim resampled to a framerate or to frame_count frames
+         (see xanim_arrays.AnimArrays.resample) - the parts missing from a
+         frame are treated as being at the rest transform
+        '''
+        from .xanim_arrays import AnimArrays
+        if any(frame is None for frame in self.frames):
+            raise ValueError("Every frame must be loaded to resample the "
+                             "anim")
+        arrays = AnimArrays.from_anim(self, 'd')
+        return arrays.resample(framerate, frame_count, slerp).to_anim()
+
+    def __rotated_parts__(self):
+        return [part for frame in self.frames if frame is not None
+                for part in frame.parts
+                if part is not None and part.offset is not None]
+
+    def quaternions(self, orthonormalize=True):
+        '''
+        Returns the rotation of every part on every frame as an (x, y, z, w)
+         quaternion - a list (per frame) of lists (per part), which has None
+         for the missing frames & parts
+        Every matrix is converted in a single batch, if orthonormalize is
+         True they're re-orthonormalized first (the matrices loaded from
+         xanim_bin files are quantized)
+        '''
+        quats = iter(__matrices_to_quat_list__(
+            [part.matrix for part in self.__rotated_parts__()],
+            orthonormalize))
+        result = [None] * len(self.frames)
+        for index, frame in enumerate(self.frames):
+            if frame is not None:
+                result[index] = [
+                    next(quats)
+                    if part is not None and part.offset is not None
+                    else None for part in frame.parts]
+        return result
+
+    def set_quaternions(self, quats):
+        '''
+        Set the matrix of every part on every frame from its quaternion -
+         quats has the same layout as the result of quaternions()
+        '''
+        parts = self.__rotated_parts__()
+        quats = [quat for frame_quats in quats if frame_quats is not None
+                 for quat in frame_quats if quat is not None]
+        if len(quats) != len(parts):
+            raise ValueError("Expected a quaternion for each of the %d "
+                             "parts -- got %d" % (len(parts), len(quats)))
+        for part, matrix in zip(parts, __quat_list_to_matrices__(quats)):
+            part.matrix = matrix
+
+
+class AnimExportParser(ExportParser):
+    '''
+    Tokenizing XANIM_EXPORT parser
+
+    Frames using the standard layout (every part in order, with or without
+     a SCALE line) are checked & converted at once, using strided slices of
+     the token list. Any other frame (e.g. one where the SCALE line is only
+     used by some of the parts) falls back to the handlers for the
+     individual keywords.
+
+    frames=(start, end) & parts=[names] limit the frames & parts that are
+     loaded (see Anim.LoadFile_Raw) - the frames outside of the range are
+     skipped over to the next FRAME line, without tokenizing the chunks in
+     between whenever possible
+
+    The line based loaders (Anim.__load_frames__, Frame.__load_part__, etc.)
+     are kept as the reference implementation (see TOKENIZED_PARSER)
+    '''
+    __slots__ = ('anim', 'part_count', 'parts_read', 'frame_count',
+                 'frame_index', 'frame', 'part_index', 'active',
+                 'frame_layouts', 'frame_range', 'frame_numbers',
+                 'part_names', 'part_map')
+
+    header_keyword = "ANIMATION"
+
+    # Maps each section (None before the first one) to its keyword -> handler
+    #  table - filled in below
+    section_handlers = {}
+
+    def __init__(self, anim, frames=None, parts=None):
+        ExportParser.__init__(self)
+        self.anim = anim
+        anim.frames = []
+        anim.notes = []
+
+        self.part_count = 0
+        self.parts_read = 0
+        self.frame_count = 0
+        self.frame_index = 0
+        self.frame = None  # The current Frame
+        self.part_index = None  # The index of the current part
+        self.active = None  # The current FramePart
+        self.frame_layouts = __frame_layouts__(0)
+
+        # The (start, end) of the frames to load (None for every frame)
+        self.frame_range = None if frames is None else __frame_range__(frames)
+        # The numbers of all of the frames in the file, loaded or not
+        self.frame_numbers = []
+        # The names of the parts to load (None for every part) & the indices
+        #  of the loaded parts in the file
+        self.part_names = parts
+        self.part_map = None
+
+    def __load_version__(self, version):
+        self.anim.version = version
+
+    def __finalize__(self):
+        anim = self.anim
+        frame_range = self.frame_range
+        if frame_range is None:
+            # Any missing frames are left as None
+            if len(anim.frames) < self.frame_count:
+                anim.frames.extend([None] * (self.frame_count -
+                                             len(anim.frames)))
+        else:
+            start, end = frame_range
+            anim.notes = [note for note in anim.notes
+                          if start <= note.frame < end]
+        return anim
+
+    def __end_parts__(self):
+        if self.part_names is not None:
+            parts = self.anim.parts
+            self.part_map = __select_parts__(parts, self.part_names)
+            self.anim.parts = [parts[index] for index in self.part_map]
+        self.handlers = self.section_handlers['frames']
+
+    def __end_frame__(self):
+        self.frame = None
+        self.part_index = None
+        self.active = None
+        if self.frame_index == self.frame_count:
+            self.handlers = self.section_handlers['notetracks']
+
+    def __in_range__(self, frame_number):
+        frame_range = self.frame_range
+        return (frame_range is None or
+                frame_range[0] <= frame_number < frame_range[1])
+
+    def __load_parts_fast__(self, frame, tokens, pos, stride, end):
+        '''
+        Load all of the parts of a frame that uses the standard layout with
+         the given stride
+        '''
+        if self.part_map is not None:
+            frame.parts = [__load_part_tokens__(tokens, pos + index * stride,
+                                                stride)
+                           for index in self.part_map]
+            return
+
+        def column(start):
+            return map(float, tokens[start:end:stride])
+
+        offsets = zip(column(pos + 3), column(pos + 4), column(pos + 5))
+        x = pos + stride - 12
+        rows_x = zip(column(x + 1), column(x + 2), column(x + 3))
+        rows_y = zip(column(x + 5), column(x + 6), column(x + 7))
+        rows_z = zip(column(x + 9), column(x + 10), column(x + 11))
+        if stride == 22:
+            scales = zip(column(pos + 7), column(pos + 8), column(pos + 9))
+            frame.parts = [FramePart(offset, [row_x, row_y, row_z], scale)
+                           for offset, scale, row_x, row_y, row_z
+                           in zip(offsets, scales, rows_x, rows_y, rows_z)]
+        else:
+            frame.parts = [FramePart(offset, [row_x, row_y, row_z])
+                           for offset, row_x, row_y, row_z
+                           in zip(offsets, rows_x, rows_y, rows_z)]
+
+    def __skip_frames__(self, tokens, pos):
+        '''
+        Skip over the parts of a frame that's outside of the frame range
+        Returns the index of the next FRAME (or NOTETRACKS) token in (the new)
+         self.tokens
+        '''
+        # NOTETRACKS can only follow the last frame, so it's only searched for
+        #  when there isn't another frame in the tokens
+        index = __find_token__(tokens, ('FRAME',), pos)
+        if index == -1:
+            index = __find_token__(tokens, ('NOTETRACKS',), pos)
+        if index != -1:
+            return index
+
+        # Search the rest of the file for the next frame that's in the range
+        #  (or the last frame), without tokenizing the frames before it
+        for text in self.chunks:
+            for match in __frame_line_re__.finditer(text):
+                frame_number = match.group(1)
+                if frame_number is not None:
+                    frame_number = FRAME_TYPE(frame_number)
+                    if (not self.__in_range__(frame_number) and
+                            self.frame_index + 1 < self.frame_count):
+                        self.frame_numbers.append(frame_number)
+                        self.frame_index += 1
+                        continue
+                self.tokens = __tokenize__(text[match.start():])
+                return 0
+
+        self.tokens = []
+        self.done = True
+        return 0
+
+    # Section Handlers
+
+    def LoadNumParts(self, tokens, pos):
+        part_count = int(tokens[pos + 1])
+        self.anim.parts = [PartInfo(None)] * part_count
+        self.part_count = part_count
+        self.frame_layouts = __frame_layouts__(part_count)
+        if part_count == 0:
+            self.__end_parts__()
+        return pos + 2
+
+    def LoadFramerate(self, tokens, pos):
+        self.anim.framerate = float(tokens[pos + 1])
+        return pos + 2
+
+    def LoadNumFrames(self, tokens, pos):
+        frame_count = int(tokens[pos + 1])
+        self.anim.frames = []
+        self.frame_count = frame_count
+        self.frame_index = 0
+        if frame_count == 0:
+            self.handlers = self.section_handlers['notetracks']
+        return pos + 2
+
+    def LoadNumKeys(self, tokens, pos):
+        # Every FRAME line after the first (non-empty) NUMKEYS line is a note
+        if int(tokens[pos + 1]) != 0:
+            self.handlers = self.section_handlers['notes']
+        return pos + 2
+
+    # Parts
+
+    def LoadPartInfo(self, tokens, pos):
+        index = int(tokens[pos + 1])
+        self.anim.parts[index] = PartInfo(tokens[pos + 2].strip('"'))
+        self.parts_read += 1
+        if self.parts_read == self.part_count:
+            self.__end_parts__()
+        return pos + 3
+
+    # Frames
+
+    def LoadFrame(self, tokens, pos):
+        frame_number = FRAME_TYPE(tokens[pos + 1])
+        self.frame_numbers.append(frame_number)
+        self.frame_index += 1
+        self.parts_read = 0
+        self.part_index = None
+        self.active = None
+        pos += 2
+
+        if not self.__in_range__(frame_number):
+            self.frame = None
+            if self.frame_index == self.frame_count:
+                self.__end_frame__()
+                return pos
+            return self.__skip_frames__(tokens, pos)
+
+        part_map = self.part_map
+        frame = Frame(frame_number)
+        frame.parts = [FramePart()] * (self.part_count if part_map is None
+                                       else len(part_map))
+        self.anim.frames.append(frame)
+        self.frame = frame
+
+        match = __match_frame_layout__(self, tokens, pos, self.part_count,
+                                       self.frame_layouts)
+        if match is None:
+            return pos
+        stride, end = match
+        self.__load_parts_fast__(frame, tokens, pos, stride, end)
+        self.__end_frame__()
+        return end
+
+    def LoadPart(self, tokens, pos):
+        part_index = int(tokens[pos + 1])
+        if part_index >= self.part_count:
+            fmt = ("part_count does not index part_index -- "
+                   "%d not in [0, %d)")
+            raise ValueError(fmt % (part_index, self.part_count))
+        if self.part_map is not None:
+            # The parts that aren't loaded are parsed into a throwaway part
+            part_index = (self.part_map.index(part_index)
+                          if part_index in self.part_map else -1)
+        self.part_index = part_index
+        self.active = None
+        return pos + 2
+
+    def LoadPartOffset(self, tokens, pos):
+        if self.frame is None or self.part_index is None:
+            return pos + 1
+        part = FramePart((float(tokens[pos + 1]),
+                          float(tokens[pos + 2]),
+                          float(tokens[pos + 3])))
+        if self.part_index >= 0:
+            self.frame.parts[self.part_index] = part
+        self.active = part
+        return pos + 4
+
+    def LoadPartScale(self, tokens, pos):
+        if self.active is None:
+            return pos + 1
+        self.active.scale = (float(tokens[pos + 1]),
+                             float(tokens[pos + 2]),
+                             float(tokens[pos + 3]))
+        return pos + 4
+
+    def __load_row__(self, tokens, pos, row):
+        if self.active is None:
+            return pos + 1
+        self.active.matrix[row] = (float(tokens[pos + 1]),
+                                   float(tokens[pos + 2]),
+                                   float(tokens[pos + 3]))
+        return pos + 4
+
+    def LoadPartX(self, tokens, pos):
+        return self.__load_row__(tokens, pos, 0)
+
+    def LoadPartY(self, tokens, pos):
+        return self.__load_row__(tokens, pos, 1)
+
+    def LoadPartZ(self, tokens, pos):
+        if self.active is None:
+            return pos + 1
+        pos = self.__load_row__(tokens, pos, 2)
+        self.part_index = None
+        self.active = None
+        self.parts_read += 1
+        if self.parts_read == self.part_count:
+            self.__end_frame__()
+        return pos
+
+    # Notes
+
+    def LoadNote(self, tokens, pos):
+        frame = FRAME_TYPE(tokens[pos + 1])
+        string = tokens[pos + 2].strip('"')
+        self.anim.notes.append(Note(frame, string))
+        return pos + 3
+
+
+AnimExportParser.section_handlers = {
+    None: {
+        "NUMPARTS": AnimExportParser.LoadNumParts,
+        "PART": AnimExportParser.LoadPartInfo,
+    },
+    'frames': {
+        "FRAMERATE": AnimExportParser.LoadFramerate,
+        "NUMFRAMES": AnimExportParser.LoadNumFrames,
+        "FRAME": AnimExportParser.LoadFrame,
+        "PART": AnimExportParser.LoadPart,
+        "OFFSET": AnimExportParser.LoadPartOffset,
+        "SCALE": AnimExportParser.LoadPartScale,
+        "X": AnimExportParser.LoadPartX,
+        "Y": AnimExportParser.LoadPartY,
+        "Z": AnimExportParser.LoadPartZ,
+    },
+    'notetracks': {
+        "NUMKEYS": AnimExportParser.LoadNumKeys,
+    },
+    'notes': {
+        "FRAME": AnimExportParser.LoadNote,
+    },
+}
+
+
+def __build_record_sizes__(cls):
+    '''
+    Build the handler -> record size table (see ExportParser.record_sizes)
+     for the XANIM_EXPORT parser class cls
+    '''
+    sizes = dict.fromkeys((cls.LoadNumParts, cls.LoadFramerate,
+                           cls.LoadNumFrames, cls.LoadNumKeys, cls.LoadFrame,
+                           cls.LoadPart), 2)
+    sizes.update(dict.fromkeys((cls.LoadPartInfo, cls.LoadNote), 3))
+    sizes.update(dict.fromkeys((cls.LoadPartOffset, cls.LoadPartScale,
+                                cls.LoadPartX, cls.LoadPartY,
+                                cls.LoadPartZ), 4))
+    return sizes
+
+
+AnimExportParser.record_sizes = __build_record_sizes__(AnimExportParser)
+
+
+class AnimSubsetDecoder(XBinDecoder):
+    '''
+    XBinDecoder that only decodes the frames in a frames=(start, end) range
+     & the parts named in parts=[names] (see Anim.LoadFile_Bin)
+
+    The part blocks of a frame are written in fixed size runs, so the frames
+     outside of the range & the parts that aren't loaded are checked & skipped
+     over without being decoded. Any blocks that aren't laid out that way
+     are decoded into throwaway frames & parts instead
+    '''
+    __slots__ = ('frame_range', 'part_names', 'part_map')
+
+    # Maps each block hash to its handler - filled in below
+    handlers = {}
+
+    def __init__(self, target, expected_type, skip_sections=(),
+                 frames=None, parts=None):
+        XBinDecoder.__init__(self, target, expected_type, skip_sections)
+        target.frames = []
+        target.notes = []
+        self.frame_range = (None if frames is None
+                            else __frame_range__(frames))
+        self.part_names = parts
+        # Maps the index of each loaded part in the file to its index in the
+        #  loaded anim (None for every part - filled in by the first frame)
+        self.part_map = None
+
+    def result(self):
+        target = self.target
+        if self.part_names is not None:
+            indices = __select_parts__(target.parts, self.part_names)
+            target.parts = [target.parts[index] for index in indices]
+        if self.frame_range is not None:
+            start, end = self.frame_range
+            target.notes = [note for note in target.notes
+                            if start <= note.frame < end]
+        return None
+
+    def __init_part_map__(self):
+        parts = self.target.parts
+        if self.part_names is None:
+            indices = range(len(parts))
+        else:
+            indices = __select_parts__(parts, self.part_names)
+        self.part_map = dict((index, i) for i, index in enumerate(indices))
+
+    def LoadFrameIndex(self, data, pos):
+        frame_number = __unpack_int32__(data, pos + 4)[0]
+        if self.part_map is None:
+            self.__init_part_map__()
+
+        frame_range = self.frame_range
+        if (frame_range is not None and
+                not frame_range[0] <= frame_number < frame_range[1]):
+            # Any part blocks that can't be skipped go to a throwaway frame
+            self.active_frame = None
+            end = __skip_frame__(data, pos)
+            return end if end is not None else pos + 8
+
+        frame = Frame(frame_number)
+        frame.parts = [None] * len(self.part_map)
+        self.active_frame = frame
+        self.target.frames.append(frame)
+        return pos + 8
+
+    def LoadPartIndex(self, data, pos):
+        index = __unpack_int16__(data, pos + 2)[0]
+        frame = self.active_frame
+        part_index = None
+        if frame is not None:
+            part_index = self.part_map.get(index)
+            if part_index is None:
+                try:
+                    (offset_hash, x_hash, y_hash,
+                     z_hash) = __unpack_frame_part_skip__(data, pos + 4)
+                except struct.error:
+                    pass
+                else:
+                    if (offset_hash == 0x9383 and x_hash == 0xDCFD and
+                            y_hash == 0xCCDC and z_hash == 0xFCBF):
+                        return pos + 44
+
+        frame_part = FramePart(matrix=[])
+        if part_index is not None:
+            frame.parts[part_index] = frame_part
+        self.active_thing = frame_part
+        return pos + 4
+
+    def LoadNotetracksBegin(self, data, pos):
+        __unpack_int16__(data, pos + 2)
+        # The part indices in the notetracks don't belong to the frames
+        self.active_frame = None
+        return pos + 4
+
+
+AnimSubsetDecoder.handlers = dict(XBinDecoder.handlers)
+AnimSubsetDecoder.handlers.update({
+    0x745A: AnimSubsetDecoder.LoadPartIndex,
+    0xC723: AnimSubsetDecoder.LoadFrameIndex,
+    0xC7F3: AnimSubsetDecoder.LoadNotetracksBegin,
+})
@@ -0,0 +1,1041 @@
+# <pep8 compliant>
+
+from array import array
+from itertools import islice
+from time import strftime
+
+import os
+import struct
+
+from .xbin import XBinIO, XBinDecoder, validate_version
+from .xbin import (__unpack_int16__, __unpack_int32__, __unpack_vec3__,
+                   __unpack_short_vec3__, __load_string__, padded,
+                   __str_packable__, __pack_block__, __pack_int16_block__,
+                   __pack_int32_block__, __pack_string__)
+from .xanim import (Anim, PartInfo, Frame, FramePart, Note, NoteTrack,
+                    __clean_float2str__, __load_notetrack_file__,
+                    __frame_layouts__, __match_frame_layout__,
+                    __build_record_sizes__)
+from .xmodel_arrays import INDEX_TYPE, FLOAT_TYPE, __zeros__, __as_array__
+from ._parser import ExportParser
+from ._writer import ExportWriter
+from ._rotation import (__matrices_to_quats__, __quats_to_matrices__,
+                        __interpolate_quats__)
+from . import xanim
+
+# Typecode of the frame number arrays when the numbers are floats
+NUMBER_TYPE = 'd'
+
+# The rest transform of a part - a zero offset & an identity matrix
+__REST_OFFSET__ = (0.0, 0.0, 0.0)
+__REST_MATRIX__ = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0)
+__REST_SCALE__ = (1.0, 1.0, 1.0)
+
+# The interpolation weights (see AnimArrays.resample) closer than this to 0 or
+#  1 use the frame instead
+__RESAMPLE_EPSILON__ = 1e-6
+
+# The blocks that make up a single part of a frame
+#  (part index block + offset block + matrix blocks)
+__FRAME_PART_FORMAT__ = 'HhHxxfffHhhhHhhhHhhh'
+
+
+def __number_type__(numbers):
+    '''
+    Returns the typecode of an array that holds the frame numbers without
+     changing their type
+    '''
+    for number in numbers:
+        if not isinstance(number, int):
+            return NUMBER_TYPE
+    return INDEX_TYPE
+
+
+def __raw_number_type__():
+    return NUMBER_TYPE if xanim.FRAME_TYPE is float else INDEX_TYPE
+
+
+def __resample_sources__(numbers, ratio, frame_count):
+    '''
+    Find the source frames of each of frame_count frames, taken every
+     1 / ratio frames (by frame number) starting at the first frame
+    Returns the index of the frame before each new frame & the weight of the
+     frame after it (0.0 if the new frame lands on a frame)
+    '''
+    sources = [0] * frame_count
+    weights = [0.0] * frame_count
+    if not numbers:
+        return sources, weights
+    first = numbers[0]
+    last = numbers[-1]
+    last_index = len(numbers) - 1
+    index = 0
+    for k in range(frame_count):
+        position = min(first + k / ratio, last)
+        while index < last_index and numbers[index + 1] <= position:
+            index += 1
+        if index == last_index:
+            sources[k] = index
+            continue
+        start = numbers[index]
+        weight = (position - start) / float(numbers[index + 1] - start)
+        if weight > 1.0 - __RESAMPLE_EPSILON__:
+            sources[k] = index + 1
+        else:
+            sources[k] = index
+            if weight >= __RESAMPLE_EPSILON__:
+                weights[k] = weight
+    return sources, weights
+
+
+def __lerp_block__(values, start, size, weight):
+    '''
+    Returns the size values at start, interpolated towards the size values
+     after them
+    '''
+    return [a + (b - a) * weight
+            for a, b in zip(values[start:start + size],
+                            values[start + size:start + 2 * size])]
+
+
+class AnimArrays(XBinIO, object):
+    '''
+    Columnar (array backed) representation of an Anim
+
+    Every frame stores a transform for every part - the transform of part p
+     in frame f is transform f * part_count + p of:
+
+        offsets     3 floats per transform
+        matrices    9 floats (the X, Y & Z rows) per transform
+        scales      3 floats per transform, or None if none of the parts are
+                     scaled (they all use the default scale of (1, 1, 1))
+
+    frame_numbers holds the number of each frame, note_frames & note_strings
+     the frame & string of each note. The frame numbers are stored as ints
+     (INDEX_TYPE) when they're ints & as NUMBER_TYPE when they're floats (see
+     xanim.FRAME_TYPE), so they convert back to the same Python type
+
+    The float arrays use float_type. All of the arrays support the buffer
+     protocol (memoryview, numpy.frombuffer, ...)
+
+    Parts that are missing from a frame are left at the rest transform (a
+     zero offset & an identity matrix)
+    '''
+    __slots__ = ('framerate', 'float_type', 'part_names',
+                 'frame_numbers', 'offsets', 'matrices', 'scales',
+                 'note_frames', 'note_strings')
+
+    def __init__(self, float_type=FLOAT_TYPE):
+        super(XBinIO, self).__init__()
+        self.framerate = None
+        self.float_type = float_type
+        self.part_names = []
+        self.__init_frames__(0, INDEX_TYPE)
+        self.note_frames = array(INDEX_TYPE)
+        self.note_strings = []
+
+    def __init_frames__(self, frame_count, number_type):
+        transform_count = frame_count * len(self.part_names)
+        self.frame_numbers = __zeros__(number_type, frame_count)
+        self.offsets = __zeros__(self.float_type, 3 * transform_count)
+        self.matrices = array(self.float_type,
+                              __REST_MATRIX__) * transform_count
+        self.scales = None
+
+    def __init_scales__(self):
+        self.scales = array(self.float_type,
+                            __REST_SCALE__) * (len(self.offsets) // 3)
+
+    def __add_frame__(self, frame_number):
+        '''
+        Append a frame with every part at the rest transform
+        Returns the index of its first transform
+        '''
+        part_count = len(self.part_names)
+        float_type = self.float_type
+        self.frame_numbers.append(frame_number)
+        self.offsets.extend(__zeros__(float_type, 3 * part_count))
+        self.matrices.extend(array(float_type,
+                                   __REST_MATRIX__) * part_count)
+        if self.scales is not None:
+            self.scales.extend(array(float_type,
+                                     __REST_SCALE__) * part_count)
+        return (len(self.frame_numbers) - 1) * part_count
+
+    def __truncate_frames__(self, frame_count):
+        transform_count = frame_count * len(self.part_names)
+        del self.frame_numbers[frame_count:]
+        del self.offsets[3 * transform_count:]
+        del self.matrices[9 * transform_count:]
+        if self.scales is not None:
+            del self.scales[3 * transform_count:]
+
+    def part_count(self):
+        return len(self.part_names)
+
+    def frame_count(self):
+        return len(self.frame_numbers)
+
+    def quaternions(self, orthonormalize=True):
+        '''
+        Returns the rotation of every transform as a quaternion - an array
+         (of float_type) with 4 values (x, y, z, w) per transform
+        If orthonormalize is True, the matrices are re-orthonormalized first
+         (the matrices loaded from xanim_bin files are quantized)
+        '''
+        return __matrices_to_quats__(self.matrices, orthonormalize,
+                                     self.float_type)
+
+    def set_quaternions(self, quats):
+        '''
+        Set the matrix of every transform from its quaternion - quats holds
+         4 values (x, y, z, w) per transform (see quaternions)
+        '''
+        if len(quats) != 4 * (len(self.matrices) // 9):
+            raise ValueError("Expected a quaternion for each of the %d "
+                             "transforms -- got %d values" %
+                             (len(self.matrices) // 9, len(quats)))
+        self.matrices = __quats_to_matrices__(quats, self.float_type)
+
+    def resample(self, framerate=None, frame_count=None, slerp=True):
+        '''
+        Returns a new AnimArrays resampled to a framerate or to frame_count
+         frames (only one of them can be given), keeping the duration of the
+         anim. The frame numbers & the note frames are scaled to match
+
+        The new frames that land on a frame are copied from it, the rest are
+         interpolated from the frames around them - linearly for the offsets
+         & scales, & with slerp for the rotations (nlerp if slerp is False).
+         Each frame is interpolated as a whole & every rotation is converted
+         & interpolated in a single batch
+        '''
+        if (framerate is None) == (frame_count is None):
+            raise ValueError("Expected either a framerate or a frame_count")
+
+        numbers = self.frame_numbers
+        for a, b in zip(numbers, numbers[1:]):
+            if not b > a:
+                raise ValueError("The frame numbers must be increasing -- "
+                                 "%r follows %r" % (b, a))
+        span = numbers[-1] - numbers[0] if numbers else 0
+
+        if framerate is not None:
+            if not framerate > 0:
+                raise ValueError("Invalid framerate: %r - must be > 0" %
+                                 framerate)
+            if not self.framerate:
+                raise ValueError("Can't resample an anim without a "
+                                 "framerate")
+            ratio = framerate / float(self.framerate)
+            frame_count = int(round(span * ratio)) + 1 if numbers else 0
+        else:
+            if frame_count < 2 or not span > 0:
+                raise ValueError("Resampling to %r frames needs a frame_count "
+                                 ">= 2 & an anim with more than 1 frame" %
+                                 frame_count)
+            ratio = (frame_count - 1) / float(span)
+            if self.framerate is not None:
+                framerate = self.framerate * ratio
+
+        resampled = AnimArrays(self.float_type)
+        resampled.version = getattr(self, 'version', None)
+        resampled.framerate = framerate
+        resampled.part_names = list(self.part_names)
+        start = int(round(numbers[0] * ratio)) if numbers else 0
+        resampled.frame_numbers = array(numbers.typecode,
+                                        range(start, start + frame_count))
+        resampled.note_frames = array(self.note_frames.typecode,
+                                      [int(round(frame * ratio))
+                                       for frame in self.note_frames])
+        resampled.note_strings = list(self.note_strings)
+
+        sources, weights = __resample_sources__(numbers, ratio, frame_count)
+        part_count = len(self.part_names)
+        size = 9 * part_count
+        float_type = self.float_type
+
+        # Convert the rotations of the frames around the in-between frames
+        #  (once each) & interpolate them all at once
+        matrices = self.matrices
+        needed = sorted(set(index for source, weight in zip(sources, weights)
+                            if weight for index in (source, source + 1)))
+        needed_matrices = array(float_type)
+        for index in needed:
+            needed_matrices.extend(matrices[index * size:(index + 1) * size])
+        quats = __matrices_to_quats__(needed_matrices)
+        slots = dict((index, slot) for slot, index in enumerate(needed))
+        quat_size = 4 * part_count
+        quats_a = array(quats.typecode)
+        quats_b = array(quats.typecode)
+        for source, weight in zip(sources, weights):
+            if weight:
+                q = slots[source] * quat_size
+                quats_a.extend(quats[q:q + quat_size])
+                q = slots[source + 1] * quat_size
+                quats_b.extend(quats[q:q + quat_size])
+        interpolated = __quats_to_matrices__(__interpolate_quats__(
+            quats_a, quats_b, [weight for weight in weights if weight
+                               for part in range(part_count)], slerp),
+            float_type)
+
+        new_matrices = array(float_type)
+        position = 0
+        for source, weight in zip(sources, weights):
+            if weight:
+                new_matrices.extend(interpolated[position:position + size])
+                position += size
+            else:
+                m = source * size
+                new_matrices.extend(matrices[m:m + size])
+        resampled.matrices = new_matrices
+
+        size = 3 * part_count
+        for name in ('offsets', 'scales'):
+            values = getattr(self, name)
+            if values is None:
+                setattr(resampled, name, None)
+                continue
+            new_values = array(float_type)
+            for source, weight in zip(sources, weights):
+                v = source * size
+                if weight:
+                    new_values.extend(__lerp_block__(values, v, size, weight))
+                else:
+                    new_values.extend(values[v:v + size])
+            setattr(resampled, name, new_values)
+        return resampled
+
+    @staticmethod
+    def from_anim(anim, float_type=FLOAT_TYPE):
+        '''
+        Build an AnimArrays from an Anim
+        '''
+        arrays = AnimArrays(float_type)
+        arrays.version = getattr(anim, 'version', None)
+        arrays.framerate = anim.framerate
+        arrays.part_names = [part.name for part in anim.parts]
+
+        part_count = len(anim.parts)
+        frame_parts = [frame.parts for frame in anim.frames]
+        for parts in frame_parts:
+            if len(parts) != part_count:
+                raise ValueError("Every frame must have a transform for "
+                                 "each of the %d parts" % part_count)
+
+        arrays.__init_frames__(0, __number_type__(frame.frame
+                                                  for frame in anim.frames))
+        arrays.frame_numbers.extend(frame.frame for frame in anim.frames)
+
+        # Missing parts use the rest transform
+        parts = [part if part is not None and part.offset is not None
+                 else None for parts in frame_parts for part in parts]
+        arrays.offsets = array(float_type, [
+            value for part in parts
+            for value in (part.offset if part is not None
+                          else __REST_OFFSET__)])
+        arrays.matrices = array(float_type, [
+            value for part in parts
+            for row in (part.matrix if part is not None
+                        else (__REST_MATRIX__[0:3], __REST_MATRIX__[3:6],
+                              __REST_MATRIX__[6:9]))
+            for value in row])
+        if any(part is not None and tuple(part.scale) != (1, 1, 1)
+               for part in parts):
+            arrays.scales = array(float_type, [
+                value for part in parts
+                for value in (part.scale if part is not None
+                              else __REST_SCALE__)])
+
+        notes = anim.notes
+        arrays.note_frames = array(__number_type__(note.frame
+                                                   for note in notes),
+                                   [note.frame for note in notes])
+        arrays.note_strings = [note.string for note in notes]
+        return arrays
+
+    def to_anim(self):
+        '''
+        Build an Anim from the arrays
+        '''
+        anim = Anim()
+        anim.version = getattr(self, 'version', None)
+        anim.framerate = self.framerate
+        anim.parts = [PartInfo(name) for name in self.part_names]
+
+        # Walk the transforms in order, taking 3 values (or 3 rows) at a time
+        part_count = len(self.part_names)
+        offsets = zip(*[iter(self.offsets)] * 3)
+        rows = iter(zip(*[iter(self.matrices)] * 3))
+        if self.scales is None:
+            transforms = iter(zip(offsets, rows, rows, rows))
+        else:
+            transforms = iter(zip(offsets, rows, rows, rows,
+                                  zip(*[iter(self.scales)] * 3)))
+        frames = [None] * len(self.frame_numbers)
+        for frame_index, frame_number in enumerate(self.frame_numbers):
+            frame = Frame(frame_number)
+            if self.scales is None:
+                frame.parts = [FramePart(offset, [row_x, row_y, row_z])
+                               for offset, row_x, row_y, row_z
+                               in islice(transforms, part_count)]
+            else:
+                frame.parts = [FramePart(offset, [row_x, row_y, row_z], scale)
+                               for offset, row_x, row_y, row_z, scale
+                               in islice(transforms, part_count)]
+            frames[frame_index] = frame
+        anim.frames = frames
+
+        anim.notes = [Note(frame, string) for frame, string
+                      in zip(self.note_frames, self.note_strings)]
+        return anim
+
+    def LoadFile_Raw(self, path, use_notetrack_file=False):
+        '''
+        Load an XANIM_EXPORT file straight into the arrays
+        '''
+        file = open(path, "r")
+        try:
+            AnimArraysParser(self).parse(file)
+        finally:
+            file.close()
+
+        # Automatically load the matching NT_EXPORT file if requested
+        if use_notetrack_file:
+            notes = __load_notetrack_file__(os.path.realpath(path),
+                                            self.frame_numbers)
+            if notes is not None:
+                self.note_frames.extend(note.frame for note in notes)
+                self.note_strings.extend(note.string for note in notes)
+
+    # Write an XANIM_EXPORT file
+    # if embed_notes is False, a NT_EXPORT file will be created
+    # float_format is the FloatFormat used for the floats (%f by default)
+    def WriteFile_Raw(self, path, version=3,
+                      header_message="", embed_notes=True,
+                      float_format=None):
+        '''
+        Write an XANIM_EXPORT file - the output is the same as
+         to_anim().WriteFile_Raw(...)
+        '''
+        frame_numbers = self.frame_numbers
+        first_frame = 0
+        last_frame = 0
+        if frame_numbers:
+            first_frame = min(frame_numbers)
+            last_frame = max(frame_numbers) + 1
+
+        if last_frame - first_frame != len(frame_numbers):
+            fmt = ("The keyed frame count and number of frames do not match"
+                   " (%d != %d)")
+            err = (fmt % (last_frame - first_frame, len(frame_numbers)))
+            raise ValueError(err)
+
+        file = ExportWriter(open(path, "w"), float_format)
+        file.write(header_message)
+        file.write("// Export time: %s\n\n" % strftime("%a %b %d %H:%M:%S %Y"))
+
+        # If there is no current version, fallback to the argument
+        version = validate_version(self, version)
+
+        file.write("ANIMATION\n")
+        file.write("VERSION %d\n\n" % self.version)
+
+        part_count = len(self.part_names)
+        file.write("NUMPARTS %d\n" % part_count)
+        file.write("".join(["PART %d \"%s\"\n" % (part_index, name)
+                            for part_index, name
+                            in enumerate(self.part_names)]))
+        file.write("\n")
+
+        file.write("FRAMERATE %s\n" % __clean_float2str__(self.framerate))
+        file.write("NUMFRAMES %d\n" % len(frame_numbers))
+
+        # Each frame is formatted in a single operation, with the values of
+        #  its parts interleaved into a single list
+        frame_format = "FRAME %s\n" + ("PART %d\n"
+                                       "OFFSET %f %f %f\n"
+                                       "SCALE %f %f %f\n"
+                                       "X %f %f %f\n"
+                                       "Y %f %f %f\n"
+                                       "Z %f %f %f\n\n") * part_count
+        values = [1.0] * (1 + 16 * part_count)
+        values[1::16] = range(part_count)
+        offsets = __as_array__(self.offsets, self.float_type)
+        matrices = __as_array__(self.matrices, self.float_type)
+        scales = self.scales
+        if scales is not None:
+            scales = __as_array__(scales, self.float_type)
+        for frame_index, frame_number in enumerate(frame_numbers):
+            o = 3 * part_count * frame_index
+            m = 9 * part_count * frame_index
+            o_end = o + 3 * part_count
+            m_end = m + 9 * part_count
+            values[0] = __clean_float2str__(frame_number)
+            for i in range(3):
+                values[2 + i::16] = offsets[o + i:o_end:3]
+                if scales is not None:
+                    values[5 + i::16] = scales[o + i:o_end:3]
+
+            matrix = matrices[m:m_end]
+            if matrix and (min(matrix) < -1.0 or max(matrix) > 1.0):
+                matrix = [max(min(v, 1.0), -1.0) for v in matrix]
+            for i in range(9):
+                values[8 + i::16] = matrix[i::9]
+            file.write_batch([frame_format], values)
+
+        # WAW Style (see Anim.WriteFile_Raw)
+        file.write("NOTETRACKS\n\n")
+        notes = list(zip(self.note_frames, self.note_strings))
+        if embed_notes is True:
+            for part_index in range(part_count):
+                file.write("PART %d\n" % part_index)
+                track_count = 0 if part_index != 0 else (
+                    1 if notes else 0)
+                file.write("NUMTRACKS %d\n\n" % track_count)
+                if track_count != 0:
+                    file.write("NOTETRACK 0\n")
+                    file.write("NUMKEYS %d\n" % len(notes))
+                    file.write("".join(["FRAME %d \"%s\"\n" % note
+                                        for note in notes]))
+                    file.write("\n")
+
+        # Write a NT_EXPORT file
+        else:
+            notetrack = NoteTrack()
+            notetrack.notes = [Note(frame, string)
+                               for frame, string in notes]
+            notetrack.first_frame = first_frame
+            notetrack.frame_count = last_frame - first_frame
+
+            _dir = os.path.dirname(path)
+            _file = os.path.splitext(os.path.basename(path))[0]
+
+            notetrack.WriteFile_Raw("%s/%s.NT_EXPORT" % (_dir, _file))
+
+        file.close()
+
+    @staticmethod
+    def FromFile_Raw(filepath, use_notetrack_file=False,
+                     float_type=FLOAT_TYPE):
+        '''
+        Load from an XANIM_EXPORT file and return the resulting AnimArrays
+        '''
+        arrays = AnimArrays(float_type)
+        arrays.LoadFile_Raw(filepath, use_notetrack_file)
+        return arrays
+
+    def LoadFile_Bin(self, path, is_compressed=True, dump=False):
+        '''
+        Load an XANIM_BIN file straight into the arrays
+        '''
+        file = open(path, "rb")
+
+        if is_compressed:
+            file = XBinIO.__decompress_internal__(file, dump)
+
+        try:
+            self.__xbin_loadfile_internal__(file, 'ANIM',
+                                            decoder_type=AnimArraysDecoder)
+        finally:
+            file.close()
+
+    def WriteFile_Bin(self, path, version=3, header_message=""):
+        '''
+        Write an XANIM_BIN file - the output is the same as
+         to_anim().WriteFile_Bin(...)
+        '''
+        # If there is no current version, fallback to the argument
+        version = validate_version(self, version)
+        data = __encode_anim_arrays__(self, version, header_message)
+        with open(path, "wb") as real_file:
+            XBinIO.__compress_buffer_internal__(data, real_file,
+                                                close_files=False)
+
+    @staticmethod
+    def FromFile_Bin(filepath, is_compressed=True, dump=False,
+                     float_type=FLOAT_TYPE):
+        '''
+        Load from a XANIM_BIN file and return the resulting AnimArrays
+        '''
+        arrays = AnimArrays(float_type)
+        arrays.LoadFile_Bin(filepath, is_compressed, dump)
+        return arrays
+
+
+class AnimArraysParser(ExportParser):
+    '''
+    Tokenizing XANIM_EXPORT parser that fills an AnimArrays
+
+    Frames using the standard layout (every part in order, with or without
+     a SCALE line) are checked & converted into the arrays at once, using
+     strided slices of the token list. Any other frame falls back to the
+     handlers for the individual keywords.
+
+    The notes are loaded the same way Anim.LoadFile_Raw loads them
+    '''
+    __slots__ = ('anim', 'number_type', 'part_count', 'parts_read',
+                 'frame_count', 'frame_index', 'active', 'frame_layouts')
+
+    header_keyword = "ANIMATION"
+
+    # Maps each section (None before the first one) to its keyword -> handler
+    #  table - filled in below
+    section_handlers = {}
+
+    def __init__(self, anim):
+        ExportParser.__init__(self)
+        self.anim = anim
+        self.number_type = __raw_number_type__()
+        anim.note_frames = array(self.number_type)
+        anim.note_strings = []
+
+        self.part_count = 0
+        self.parts_read = 0
+        self.frame_count = 0
+        self.frame_index = 0
+        # The index of the current transform
+        self.active = None
+        # See __frame_layouts__
+        self.frame_layouts = __frame_layouts__(0)
+
+    def __load_version__(self, version):
+        self.anim.version = version
+
+    def __finalize__(self):
+        # Drop the frames that were missing from the file
+        if self.frame_index < self.frame_count:
+            self.anim.__truncate_frames__(self.frame_index)
+        return self.anim
+
+    def __end_frame__(self):
+        self.active = None
+        if self.frame_index == self.frame_count:
+            self.handlers = self.section_handlers['notetracks']
+
+    def __load_frame_fast__(self, tokens, pos, transform):
+        '''
+        Load all of the parts of the frame whose first token is at pos
+        Returns the position after the frame, or None if the frame doesn't
+         use the standard layout
+        '''
+        part_count = self.part_count
+        match = __match_frame_layout__(self, tokens, pos, part_count,
+                                       self.frame_layouts)
+        if match is None:
+            return None
+        stride, end = match
+
+        anim = self.anim
+        float_type = anim.float_type
+        offsets = anim.offsets
+        matrices = anim.matrices
+        o = 3 * transform
+        o_end = o + 3 * part_count
+        m = 9 * transform
+        m_end = m + 9 * part_count
+        for i in range(3):
+            offsets[o + i:o_end:3] = array(
+                float_type, map(float, tokens[pos + 3 + i:end:stride]))
+        if stride == 22:
+            if anim.scales is None:
+                anim.__init_scales__()
+            scales = anim.scales
+            for i in range(3):
+                scales[o + i:o_end:3] = array(
+                    float_type, map(float, tokens[pos + 7 + i:end:stride]))
+        x = stride - 12
+        for i in range(9):
+            start = pos + x + 4 * (i // 3) + 1 + i % 3
+            matrices[m + i:m_end:9] = array(
+                float_type, map(float, tokens[start:end:stride]))
+        return end
+
+    def __load_vec3__(self, target, index, tokens, pos):
+        values = (float(tokens[pos + 1]),
+                  float(tokens[pos + 2]),
+                  float(tokens[pos + 3]))
+        target[index:index + 3] = array(self.anim.float_type, values)
+        return pos + 4
+
+    # Section Handlers
+
+    def LoadNumParts(self, tokens, pos):
+        part_count = int(tokens[pos + 1])
+        self.anim.part_names = [None] * part_count
+        self.part_count = part_count
+        self.frame_layouts = __frame_layouts__(part_count)
+        if part_count == 0:
+            self.handlers = self.section_handlers['frames']
+        return pos + 2
+
+    def LoadFramerate(self, tokens, pos):
+        self.anim.framerate = float(tokens[pos + 1])
+        return pos + 2
+
+    def LoadNumFrames(self, tokens, pos):
+        frame_count = int(tokens[pos + 1])
+        self.anim.__init_frames__(frame_count, self.number_type)
+        self.frame_count = frame_count
+        self.frame_index = 0
+        if frame_count == 0:
+            self.handlers = self.section_handlers['notetracks']
+        return pos + 2
+
+    def LoadNumKeys(self, tokens, pos):
+        # Every FRAME line after the first (non-empty) NUMKEYS line is a note
+        if int(tokens[pos + 1]) != 0:
+            self.handlers = self.section_handlers['notes']
+        return pos + 2
+
+    # Parts
+
+    def LoadPartInfo(self, tokens, pos):
+        index = int(tokens[pos + 1])
+        self.anim.part_names[index] = tokens[pos + 2].strip('"')
+        self.parts_read += 1
+        if self.parts_read == self.part_count:
+            self.handlers = self.section_handlers['frames']
+        return pos + 3
+
+    # Frames
+
+    def LoadFrame(self, tokens, pos):
+        frame_number = xanim.FRAME_TYPE(tokens[pos + 1])
+        frame_index = self.frame_index
+        self.anim.frame_numbers[frame_index] = frame_number
+        self.frame_index += 1
+        self.parts_read = 0
+        self.active = None
+
+        end = self.__load_frame_fast__(tokens, pos + 2,
+                                       frame_index * self.part_count)
+        if end is None:
+            return pos + 2
+        self.__end_frame__()
+        return end
+
+    def LoadPart(self, tokens, pos):
+        part_index = int(tokens[pos + 1])
+        if part_index >= self.part_count:
+            fmt = ("part_count does not index part_index -- "
+                   "%d not in [0, %d)")
+            raise ValueError(fmt % (part_index, self.part_count))
+        self.active = (self.frame_index - 1) * self.part_count + part_index
+        return pos + 2
+
+    def LoadPartOffset(self, tokens, pos):
+        if self.active is None:
+            return pos + 1
+        return self.__load_vec3__(self.anim.offsets, 3 * self.active,
+                                  tokens, pos)
+
+    def LoadPartScale(self, tokens, pos):
+        if self.active is None:
+            return pos + 1
+        if self.anim.scales is None:
+            self.anim.__init_scales__()
+        return self.__load_vec3__(self.anim.scales, 3 * self.active,
+                                  tokens, pos)
+
+    def LoadPartX(self, tokens, pos):
+        if self.active is None:
+            return pos + 1
+        return self.__load_vec3__(self.anim.matrices, 9 * self.active,
+                                  tokens, pos)
+
+    def LoadPartY(self, tokens, pos):
+        if self.active is None:
+            return pos + 1
+        return self.__load_vec3__(self.anim.matrices, 9 * self.active + 3,
+                                  tokens, pos)
+
+    def LoadPartZ(self, tokens, pos):
+        if self.active is None:
+            return pos + 1
+        pos = self.__load_vec3__(self.anim.matrices, 9 * self.active + 6,
+                                 tokens, pos)
+        self.active = None
+        self.parts_read += 1
+        if self.parts_read == self.part_count:
+            self.__end_frame__()
+        return pos
+
+    # Notes
+
+    def LoadNote(self, tokens, pos):
+        frame = xanim.FRAME_TYPE(tokens[pos + 1])
+        string = tokens[pos + 2].strip('"')
+        self.anim.note_frames.append(frame)
+        self.anim.note_strings.append(string)
+        return pos + 3
+
+
+AnimArraysParser.section_handlers = {
+    None: {
+        "NUMPARTS": AnimArraysParser.LoadNumParts,
+        "PART": AnimArraysParser.LoadPartInfo,
+    },
+    'frames': {
+        "FRAMERATE": AnimArraysParser.LoadFramerate,
+        "NUMFRAMES": AnimArraysParser.LoadNumFrames,
+        "FRAME": AnimArraysParser.LoadFrame,
+        "PART": AnimArraysParser.LoadPart,
+        "OFFSET": AnimArraysParser.LoadPartOffset,
+        "SCALE": AnimArraysParser.LoadPartScale,
+        "X": AnimArraysParser.LoadPartX,
+        "Y": AnimArraysParser.LoadPartY,
+        "Z": AnimArraysParser.LoadPartZ,
+    },
+    'notetracks': {
+        "NUMKEYS": AnimArraysParser.LoadNumKeys,
+    },
+    'notes': {
+        "FRAME": AnimArraysParser.LoadNote,
+    },
+}
+
+
+AnimArraysParser.record_sizes = __build_record_sizes__(AnimArraysParser)
+
+
+class AnimArraysDecoder(XBinDecoder):
+    '''
+    XBinDecoder that decodes the frames of an xanim_bin file into an
+     AnimArrays
+
+    Frames whose parts are all written in order, the way the writers lay
+     them out, are unpacked with a single struct & copied into the arrays
+     using strided slices. Any other frame falls back to the handlers for
+     the individual blocks
+    '''
+    __slots__ = ('unpack_frame', 'frame_layout', 'in_notetracks',
+                 'transform', 'matrix_row')
+
+    # Maps each block hash to its handler - filled in below
+    handlers = {}
+
+    def __init__(self, target, expected_type, skip_sections=()):
+        XBinDecoder.__init__(self, target, expected_type, skip_sections)
+        self.__init_frame_layout__(0)
+        self.in_notetracks = False
+        # The index of the current transform & the matrix row to load next
+        self.transform = None
+        self.matrix_row = 0
+
+    def __init_frame_layout__(self, part_count):
+        self.unpack_frame = struct.Struct(
+            '<' + __FRAME_PART_FORMAT__ * part_count).unpack_from
+        # The (offset, expected values) of the hashes & part indices
+        self.frame_layout = (
+            (0, (0x745A,) * part_count),
+            (1, tuple(range(part_count))),
+            (2, (0x9383,) * part_count),
+            (6, (0xDCFD,) * part_count),
+            (10, (0xCCDC,) * part_count),
+            (14, (0xFCBF,) * part_count))
+
+    def LoadPartCount(self, data, pos):
+        part_count = __unpack_int16__(data, pos + 2)[0]
+        target = self.target
+        target.part_names = [None] * part_count
+        target.__init_frames__(0, INDEX_TYPE)
+        self.__init_frame_layout__(part_count)
+        return pos + 4
+
+    def LoadPartInfo(self, data, pos):
+        index = __unpack_int16__(data, pos + 2)[0]
+        name, end = __load_string__(data, pos + 4)
+        self.target.part_names[index] = name
+        return pos + padded(end - pos)
+
+    def LoadFrameIndex(self, data, pos):
+        frame_number = __unpack_int32__(data, pos + 4)[0]
+        values = None
+        try:
+            values = self.unpack_frame(data, pos + 8)
+        except struct.error:
+            # Retry once more data is available, unless this is the end of
+            #  the data (where the frame has to be incomplete)
+            if not self.final:
+                raise
+
+        target = self.target
+        transform = target.__add_frame__(frame_number)
+        self.transform = None
+
+        if values is None:
+            return pos + 8
+        for offset, expected in self.frame_layout:
+            if values[offset::18] != expected:
+                return pos + 8
+
+        float_type = target.float_type
+        part_count = len(target.part_names)
+        offsets = target.offsets
+        matrices = target.matrices
+        o = 3 * transform
+        o_end = o + 3 * part_count
+        m = 9 * transform
+        m_end = m + 9 * part_count
+        for i in range(3):
+            offsets[o + i:o_end:3] = array(float_type, values[3 + i::18])
+        for i in range(9):
+            start = 7 + 4 * (i // 3) + i % 3
+            matrices[m + i:m_end:9] = array(
+                float_type, [v / 32767.0 for v in values[start::18]])
+        return pos + 8 + 44 * part_count
+
+    def LoadPartIndex(self, data, pos):
+        index = __unpack_int16__(data, pos + 2)[0]
+        frame_count = len(self.target.frame_numbers)
+        if frame_count and not self.in_notetracks:
+            self.transform = ((frame_count - 1) *
+                              len(self.target.part_names) + index)
+        self.matrix_row = 0
+        return pos + 4
+
+    def LoadOffset(self, data, pos):
+        offset = __unpack_vec3__(data, pos + 4)
+        if self.transform is not None:
+            i = 3 * self.transform
+            self.target.offsets[i:i + 3] = array(self.target.float_type,
+                                                 offset)
+        return pos + 16
+
+    def LoadBoneScale(self, data, pos):
+        scale = __unpack_vec3__(data, pos + 4)
+        if self.transform is not None:
+            target = self.target
+            if target.scales is None:
+                target.__init_scales__()
+            i = 3 * self.transform
+            target.scales[i:i + 3] = array(target.float_type, scale)
+        return pos + 16
+
+    def LoadBoneMatrix(self, data, pos):
+        x, y, z = __unpack_short_vec3__(data, pos + 2)
+        if self.transform is not None and self.matrix_row < 3:
+            i = 9 * self.transform + 3 * self.matrix_row
+            self.target.matrices[i:i + 3] = array(
+                self.target.float_type, (x / 32767.0, y / 32767.0,
+                                         z / 32767.0))
+            self.matrix_row += 1
+        return pos + 8
+
+    def LoadNotetracksBegin(self, data, pos):
+        __unpack_int16__(data, pos + 2)
+        # The part indices in the notetracks don't belong to the frames
+        self.in_notetracks = True
+        self.transform = None
+        return pos + 4
+
+    def LoadNoteFrame(self, data, pos):
+        frame = __unpack_int32__(data, pos + 4)[0]
+        string, end = __load_string__(data, pos + 8)
+        self.target.note_frames.append(frame)
+        self.target.note_strings.append(string)
+        return pos + padded(end - pos)
+
+
+AnimArraysDecoder.handlers = dict(XBinDecoder.handlers)
+AnimArraysDecoder.handlers.update({
+    0x9279: AnimArraysDecoder.LoadPartCount,
+    0x360B: AnimArraysDecoder.LoadPartInfo,
+    0x745A: AnimArraysDecoder.LoadPartIndex,
+    0xC723: AnimArraysDecoder.LoadFrameIndex,
+    0x9383: AnimArraysDecoder.LoadOffset,
+    0x1C56: AnimArraysDecoder.LoadBoneScale,
+    0xDCFD: AnimArraysDecoder.LoadBoneMatrix,
+    0xCCDC: AnimArraysDecoder.LoadBoneMatrix,
+    0xFCBF: AnimArraysDecoder.LoadBoneMatrix,
+    0xC7F3: AnimArraysDecoder.LoadNotetracksBegin,
+    0x1675: AnimArraysDecoder.LoadNoteFrame,
+})
+
+
+def __encode_anim_arrays__(arrays, version, header_message=""):
+    '''
+    Encode an AnimArrays as the (uncompressed) block stream of an xanim_bin
+     file - the result is the same as __encode_anim__(arrays.to_anim(), ...)
+    The parts of each frame are packed with a single struct
+    Returns the buffer (a bytearray)
+    '''
+    comment = None
+    if header_message != '':
+        comment = __str_packable__(header_message)
+    part_names = [__str_packable__(name) for name in arrays.part_names]
+    note_strings = [__str_packable__(string)
+                    for string in arrays.note_strings]
+    part_count = len(part_names)
+    frame_count = len(arrays.frame_numbers)
+
+    # Compute the exact size of the block stream
+    size = 4 + 4 + 4  # anim, version & part count blocks
+    if comment is not None:
+        size += 4 + padded(len(comment) + 1)
+    for name in part_names:
+        size += 4 + padded(len(name) + 1)
+    size += 4 + 8  # framerate & frame count blocks
+    size += (8 + 44 * part_count) * frame_count
+    size += 4
+    for string in note_strings:
+        size += 8 + padded(len(string) + 1)
+
+    buffer = bytearray(size)
+    pos = 0
+
+    if comment is not None:
+        __pack_block__(buffer, pos, 0xC355)
+        pos = __pack_string__(buffer, pos + 4, comment)
+    __pack_block__(buffer, pos, 0x7AAC)
+    __pack_int16_block__(buffer, pos + 4, 0x24D1, version)
+    __pack_int16_block__(buffer, pos + 8, 0x9279, part_count)
+    pos += 12
+
+    for part_index, name in enumerate(part_names):
+        __pack_int16_block__(buffer, pos, 0x360B, part_index)
+        pos = __pack_string__(buffer, pos + 4, name)
+
+    __pack_int16_block__(buffer, pos, 0x92D3, int(arrays.framerate))
+    __pack_int32_block__(buffer, pos + 4, 0xB917, frame_count)
+    pos += 12
+
+    # The values of every part of a frame, interleaved the same way the
+    #  blocks are
+    pack_frame = struct.Struct('<' +
+                               __FRAME_PART_FORMAT__ * part_count).pack_into
+    values = [0] * (18 * part_count)
+    values[0::18] = [0x745A] * part_count
+    values[1::18] = range(part_count)
+    values[2::18] = [0x9383] * part_count
+    values[6::18] = [0xDCFD] * part_count
+    values[10::18] = [0xCCDC] * part_count
+    values[14::18] = [0xFCBF] * part_count
+
+    offsets = __as_array__(arrays.offsets, arrays.float_type)
+    matrices = __as_array__(arrays.matrices, arrays.float_type)
+    for frame_index, frame_number in enumerate(arrays.frame_numbers):
+        __pack_int32_block__(buffer, pos, 0xC723, int(frame_number))
+        pos += 8
+
+        o = 3 * part_count * frame_index
+        m = 9 * part_count * frame_index
+        for i in range(3):
+            values[3 + i::18] = offsets[o + i:o + 3 * part_count:3]
+        # Same as xbin.__clamp_float_to_short__
+        matrix = [int(v * 32767) for v in matrices[m:m + 9 * part_count]]
+        if matrix and (min(matrix) < -32768 or max(matrix) > 32767):
+            matrix = [max(min(v, 32767), -32768) for v in matrix]
+        for i in range(9):
+            values[7 + 4 * (i // 3) + i % 3::18] = matrix[i::9]
+        pack_frame(buffer, pos, *values)
+        pos += 44 * part_count
+
+    __pack_int16_block__(buffer, pos, 0x7A6C, len(note_strings))
+    pos += 4
+    for note_index, frame in enumerate(arrays.note_frames):
+        __pack_int32_block__(buffer, pos, 0x1675, int(frame))
+        pos = __pack_string__(buffer, pos + 8, note_strings[note_index])
+
+    assert pos == size
+    return buffer
@@ -0,0 +1,356 @@
+# <pep8 compliant>
+
+from math import sqrt
+
+from .xanim import Anim, PartInfo, Frame, FramePart, Note
+from ._rotation import (__matrix_to_quat__, __quat_to_matrix__,
+                        __quat_align__, __quat_delta__, __slerp__)
+
+# The default tolerances of AnimKeys.from_anim - position & scale
+#  tolerances are per axis, the angle tolerance is in radians
+POSITION_TOLERANCE = 0.0001
+ANGLE_TOLERANCE = 0.0001
+SCALE_TOLERANCE = 0.0001
+
+
+def __validate_tolerance__(name, tolerance):
+    if not tolerance >= 0.0:
+        raise ValueError("Invalid %s: %r - must be >= 0" % (name, tolerance))
+    return tolerance
+
+
+def __reduce_channel__(times, values, tolerance, delta=None):
+    '''
+    Find the keys of a channel - values holds its value on each frame & times
+     the number of each frame
+    Each segment starts at the previous key & is extended for as long as
+     every frame in it stays within tolerance (on each axis) of either the
+     value of the previous key (a constant segment) or the line from it to
+     the value of the last frame (a linear segment). Constant segments are
+     preferred, & consecutive constant segments are merged
+
+    The segments are fit to delta(key value, value) - a 3D vector, the
+     difference of the (3D) values by default
+
+    Returns the frame index of each key & the index of the frame that its
+     value comes from, plus the number of constant segments
+    '''
+    count = len(values)
+    key_frames = [0]
+    key_sources = [0]
+    constant_segments = 0
+    if count < 2:
+        return key_frames, key_sources, constant_segments
+
+    inf = float('inf')
+    start = 0
+    anchor = values[0]
+    previous_constant = False
+    while start < count - 1:
+        start_time = times[start]
+        if delta is None:
+            anchor_x, anchor_y, anchor_z = anchor
+        # The slopes (from the key) that keep every frame so far within
+        #  tolerance
+        low_x = low_y = low_z = -inf
+        high_x = high_y = high_z = inf
+        end = None
+        constant = False
+        for index in range(start + 1, count):
+            if delta is None:
+                x, y, z = values[index]
+                x -= anchor_x
+                y -= anchor_y
+                z -= anchor_z
+            else:
+                x, y, z = delta(anchor, values[index])
+            span = float(times[index] - start_time)
+
+            if (low_x <= 0.0 <= high_x and low_y <= 0.0 <= high_y and
+                    low_z <= 0.0 <= high_z and abs(x) <= tolerance and
+                    abs(y) <= tolerance and abs(z) <= tolerance):
+                constant = True
+            elif (low_x <= x / span <= high_x and
+                  low_y <= y / span <= high_y and
+                  low_z <= z / span <= high_z):
+                constant = False
+            else:
+                break
+            end = index
+
+            low = (x - tolerance) / span
+            if low > low_x:
+                low_x = low
+            low = (y - tolerance) / span
+            if low > low_y:
+                low_y = low
+            low = (z - tolerance) / span
+            if low > low_z:
+                low_z = low
+            high = (x + tolerance) / span
+            if high < high_x:
+                high_x = high
+            high = (y + tolerance) / span
+            if high < high_y:
+                high_y = high
+            high = (z + tolerance) / span
+            if high < high_z:
+                high_z = high
+            if low_x > high_x or low_y > high_y or low_z > high_z:
+                break
+
+        if constant:
+            constant_segments += 1
+            if previous_constant:
+                # Extend the previous constant segment instead
+                key_frames[-1] = end
+                constant_segments -= 1
+            else:
+                key_frames.append(end)
+                key_sources.append(key_sources[-1])
+        else:
+            key_frames.append(end)
+            key_sources.append(end)
+            anchor = values[end]
+        previous_constant = constant
+        start = end
+
+    # A channel that's constant throughout only needs the first key
+    if len(key_frames) == 2 and previous_constant:
+        del key_frames[1:]
+        del key_sources[1:]
+    return key_frames, key_sources, constant_segments
+
+
+def __expand_channel__(times, channel, lerp, keys=None):
+    '''
+    Returns the value of a channel on each frame - the frames between two
+     keys use lerp(key_a, key_b, t) where keys holds the interpolation keys
+     (the channel's values by default)
+    '''
+    count = len(times)
+    frames = channel.frames
+    values = channel.values
+    if keys is None:
+        keys = values
+    dense = [None] * count
+    if not frames:
+        return dense
+    for k in range(len(frames) - 1):
+        start, end = frames[k], frames[k + 1]
+        value = values[k]
+        dense[start] = value
+        if value is values[k + 1] or value == values[k + 1]:
+            dense[start + 1:end] = [value] * (end - start - 1)
+            continue
+        key_a, key_b = keys[k], keys[k + 1]
+        start_time = times[start]
+        span = float(times[end] - start_time)
+        for index in range(start + 1, end):
+            dense[index] = lerp(key_a, key_b,
+                                (times[index] - start_time) / span)
+    last = frames[-1]
+    dense[last:] = [values[-1]] * (count - last)
+    return dense
+
+
+def __lerp__(a, b, t):
+    return tuple(x + (y - x) * t for x, y in zip(a, b))
+
+
+def __slerp_matrix__(a, b, t):
+    return __quat_to_matrix__(__slerp__(a, b, t))
+
+
+class KeyChannel(object):
+    '''
+    The keys of one channel (offset, rotation or scale) of a part
+        frames - the (increasing) frame index of each key, starting at 0
+        values - the value of each key (an offset / scale tuple, or rotation
+                  matrix rows)
+    The frames between two keys are interpolated linearly (slerp for
+     rotations) and the last key is held until the end of the anim
+    '''
+    __slots__ = ('frames', 'values')
+
+    def __init__(self, frames=None, values=None):
+        self.frames = [] if frames is None else frames
+        self.values = [] if values is None else values
+
+    @property
+    def key_count(self):
+        return len(self.frames)
+
+
+class PartKeys(object):
+    __slots__ = ('offsets', 'rotations', 'scales')
+
+    def __init__(self, offsets=None, rotations=None, scales=None):
+        self.offsets = KeyChannel() if offsets is None else offsets
+        self.rotations = KeyChannel() if rotations is None else rotations
+        self.scales = KeyChannel() if scales is None else scales
+
+
+class AnimKeys(object):
+    '''
+    Keyframe reduced representation of an Anim
+
+    Each part keeps separate offset, rotation & scale channels (see
+     KeyChannel), that only have keys on the frames where the transform
+     can't be interpolated from the keys around it within the tolerances
+     given to from_anim. to_anim expands the keys back to a transform for
+     every part on every frame (for the writers)
+
+    frame_numbers holds the number of every frame of the original anim, the
+     key frames are indices into it
+    '''
+    __slots__ = ('version', 'framerate', 'part_names', 'frame_numbers',
+                 'parts', 'notes', 'constant_segments')
+
+    def __init__(self):
+        self.version = None
+        self.framerate = None
+        self.part_names = []
+        self.frame_numbers = []
+        self.parts = []
+        self.notes = []
+        # The number of constant segments in the channels (see stats)
+        self.constant_segments = 0
+
+    @staticmethod
+    def from_anim(anim, position_tolerance=POSITION_TOLERANCE,
+                  angle_tolerance=ANGLE_TOLERANCE,
+                  scale_tolerance=SCALE_TOLERANCE):
+        '''
+        Reduce an Anim to the keys that are needed to rebuild each frame
+        Every (interpolated) offset & scale stays within position_tolerance &
+         scale_tolerance of the original on each axis, & every rotation
+         within angle_tolerance radians of it
+        '''
+        position_tolerance = __validate_tolerance__("position tolerance",
+                                                    position_tolerance)
+        angle_tolerance = __validate_tolerance__("angle tolerance",
+                                                 angle_tolerance)
+        scale_tolerance = __validate_tolerance__("scale tolerance",
+                                                 scale_tolerance)
+        # Rotations are fit as rotation vectors (relative to the key at the
+        #  start of the segment, so the segments are slerps) - two rotations
+        #  are at most as far apart as their rotation vectors
+        rotation_tolerance = angle_tolerance / sqrt(3.0)
+
+        part_count = len(anim.parts)
+        frames = anim.frames
+        for frame in frames:
+            if (frame is None or len(frame.parts) != part_count or
+                    any(part is None or part.offset is None
+                        for part in frame.parts)):
+                raise ValueError("Every frame must have a transform for "
+                                 "each of the %d parts" % part_count)
+        times = [frame.frame for frame in frames]
+        for a, b in zip(times, times[1:]):
+            if not b > a:
+                raise ValueError("The frame numbers must be increasing -- "
+                                 "%r follows %r" % (b, a))
+
+        keys = AnimKeys()
+        keys.version = getattr(anim, 'version', None)
+        keys.framerate = anim.framerate
+        keys.part_names = [part.name for part in anim.parts]
+        keys.frame_numbers = times
+        keys.notes = [Note(note.frame, note.string) for note in anim.notes]
+        if not frames:
+            keys.parts = [PartKeys() for part in anim.parts]
+            return keys
+
+        constant_segments = 0
+        for part_index in range(part_count):
+            parts = [frame.parts[part_index] for frame in frames]
+            channels = []
+
+            offsets = [tuple(part.offset) for part in parts]
+            scales = [tuple(part.scale) for part in parts]
+            matrices = [part.matrix for part in parts]
+            quats = [__matrix_to_quat__(matrix) for matrix in matrices]
+
+            for values, sources, tolerance, delta in (
+                    (offsets, offsets, position_tolerance, None),
+                    (quats, matrices, rotation_tolerance, __quat_delta__),
+                    (scales, scales, scale_tolerance, None)):
+                key_frames, key_sources, constants = __reduce_channel__(
+                    times, values, tolerance, delta)
+                channels.append(KeyChannel(key_frames,
+                                           [sources[source]
+                                            for source in key_sources]))
+                constant_segments += constants
+            keys.parts.append(PartKeys(*channels))
+
+        keys.constant_segments = constant_segments
+        return keys
+
+    def to_anim(self):
+        '''
+        Build an Anim with a transform for every part on every frame from
+         the keys
+        '''
+        anim = Anim()
+        anim.version = self.version
+        anim.framerate = self.framerate
+        anim.parts = [PartInfo(name) for name in self.part_names]
+
+        times = self.frame_numbers
+        frames = [Frame(number) for number in times]
+        for frame in frames:
+            frame.parts = [None] * len(self.parts)
+        for part_index, part in enumerate(self.parts):
+            offsets = __expand_channel__(times, part.offsets, __lerp__)
+            scales = __expand_channel__(times, part.scales, __lerp__)
+
+            # Rotations are interpolated along the shortest arc between the
+            #  quaternions of the key matrices
+            quats = []
+            quat = (0.0, 0.0, 0.0, 1.0)
+            for matrix in part.rotations.values:
+                quat = __quat_align__(__matrix_to_quat__(matrix), quat)
+                quats.append(quat)
+            matrices = __expand_channel__(times, part.rotations,
+                                          __slerp_matrix__, quats)
+
+            for frame, offset, matrix, scale in zip(frames, offsets,
+                                                    matrices, scales):
+                frame.parts[part_index] = FramePart(offset, list(matrix),
+                                                    scale)
+        anim.frames = frames
+
+        anim.notes = [Note(note.frame, note.string) for note in self.notes]
+        return anim
+
+    def stats(self):
+        '''
+        Returns a dict of the size of the reduced anim:
+            offset_keys, rotation_keys, scale_keys - the keys of each channel
+            keys - the keys of all of the channels
+            dense_keys - the keys without any reduction (a key per channel,
+                          part & frame)
+            constant_channels - the channels left with a single key
+            constant_segments - the constant (held) stretches between keys,
+                                 the rest are linearly interpolated
+            ratio - dense_keys / keys
+        '''
+        counts = {'offset_keys': 0, 'rotation_keys': 0, 'scale_keys': 0}
+        constant_channels = 0
+        for part in self.parts:
+            for name, channel in (('offset_keys', part.offsets),
+                                  ('rotation_keys', part.rotations),
+                                  ('scale_keys', part.scales)):
+                counts[name] += channel.key_count
+                if channel.key_count == 1:
+                    constant_channels += 1
+
+        keys = sum(counts.values())
+        dense_keys = 3 * len(self.parts) * len(self.frame_numbers)
+        counts['keys'] = keys
+        counts['dense_keys'] = dense_keys
+        counts['constant_channels'] = constant_channels
+        counts['constant_segments'] = self.constant_segments
+        counts['ratio'] = dense_keys / float(keys) if keys else 1.0
+        return counts
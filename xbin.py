@@ -2,6 +2,7 @@
 
 import struct
 import os
+import mmap
 from io import BytesIO
 
 from . import _lz4 as lz4
@@ -9,16 +10,29 @@ from . import _lz4 as lz4
 LOG_BLOCKS = False
 LZ4_VERBOSE = False
 
+# Decompress *_bin files incrementally while they're being parsed instead of
+#  decompressing the whole file up front (see XBinIO.__decompress_internal__)
+LZ4_STREAMING = False
+
+# The default compression level used when writing *_bin files
+#  (one of lz4.LEVEL_STORE, lz4.LEVEL_FAST or lz4.LEVEL_HIGH), None uses the
+#  default level of the codec (LEVEL_FAST). LEVEL_STORE skips compression,
+#  which writes faster with the pure Python codec at the cost of file size
+LZ4_COMPRESSION_LEVEL = None
+
 __LZ4_DISPLAY_SUPPORT_INFO__ = True
 
 
-def print_lz4_support_info(force=False):
+def print_lz4_support_info(force=False, codec=None):
     '''
     Print the lz4 support info
     'force' can be used to force the info to print again after the first time
+    'codec' is the codec actually in use, if it isn't the default one
     '''
     global __LZ4_DISPLAY_SUPPORT_INFO__
-    if __LZ4_DISPLAY_SUPPORT_INFO__ | force:
+    if codec is not None and codec is not lz4.get_codec():
+        print('LZ4: Using %s' % codec.name)
+    elif __LZ4_DISPLAY_SUPPORT_INFO__ | force:
         print(lz4.support_info)
         __LZ4_DISPLAY_SUPPORT_INFO__ = False
 
@@ -54,6 +68,29 @@ def validate_version(self, version):
     return version
 
 
+def map_file(file):
+    '''
+    Memory-map an open file for reading
+    Returns the mmap object, or None if the file can't be mapped
+    '''
+    try:
+        fileno = file.fileno()
+    except (AttributeError, IOError, ValueError):
+        return None
+
+    try:
+        data = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        # Empty files can't be mapped
+        return None
+
+    # The blocks are read front to back, so let the OS read ahead and drop
+    #  pages that have already been decoded
+    if hasattr(data, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        data.madvise(mmap.MADV_SEQUENTIAL)
+    return data
+
+
 def padded(size):
     return (size + 0x3) & 0xFFFFFFFFFFFFFC
 
@@ -87,6 +124,47 @@ else:
     __str_packable__ = __str_utf8__
 
 
+# Initial read size used when scanning a file for a string's null terminator
+__STRING_READ_SIZE__ = 256
+
+
+def __read_string__(file):
+    '''
+    Read the null terminated string at the current position of file
+    The terminator is found by scanning whole buffered reads instead of
+     reading byte by byte. The file position is left undefined
+    Returns a tuple of (string, position after the null terminator)
+    '''
+    start = file.tell()
+    chunks = []
+    read_size = __STRING_READ_SIZE__
+    while True:
+        chunk = file.read(read_size)
+        end = chunk.find(b'\x00')
+        if end >= 0:
+            chunks.append(chunk[:end])
+            break
+        if not chunk:
+            raise struct.error("unterminated string at 0x%X" % start)
+        chunks.append(chunk)
+        read_size *= 2
+    data = b''.join(chunks)
+    return data.decode("utf-8"), start + len(data) + 1
+
+
+def __load_string_reference__(file):
+    '''
+    The original byte at a time string reader that __read_string__ replaced
+     - kept as the reference implementation for string_benchmark()
+    '''
+    _bytes = b''
+    b = file.read(1)
+    while not b == b'\x00':
+        _bytes += b
+        b = file.read(1)
+    return _bytes.decode("utf-8")
+
+
 class XBlock(object):
     '''
     This is a namespace-like class that contains all of the block read/write
@@ -98,18 +176,15 @@ class XBlock(object):
 
     @staticmethod
     def LoadString(file):
-        _bytes = b''
-        b = file.read(1)
-        while not b == b'\x00':
-            _bytes += b
-            b = file.read(1)
-        return _bytes.decode("utf-8")
+        string, end = __read_string__(file)
+        file.seek(end)
+        return string
 
     @staticmethod
     def LoadString_Aligned(file):
         start = file.tell()
-        string = XBlock.LoadString(file)
-        file.seek(start + padded(file.tell() - start))
+        string, end = __read_string__(file)
+        file.seek(start + padded(end - start))
         return string
 
     @staticmethod
@@ -132,8 +207,8 @@ class XBlock(object):
     def LoadCommentBlock(file):
         start = file.tell() - 2
         file.seek(start + 4)
-        string = XBlock.LoadString(file)
-        file.seek(start + padded(file.tell() - start))
+        string, end = __read_string__(file)
+        file.seek(start + padded(end - start))
         return string
 
     @staticmethod
@@ -141,9 +216,9 @@ class XBlock(object):
         start = file.tell() - 2
         file.seek(start + 4)
         data = file.read(8)
-        result = struct.unpack('ii', data)
-        result = (result[0], result[1], XBlock.LoadString(file))
-        file.seek(start + padded(file.tell() - start))
+        string, end = __read_string__(file)
+        result = struct.unpack('ii', data) + (string,)
+        file.seek(start + padded(end - start))
         return result
 
     @staticmethod
@@ -228,20 +303,19 @@ class XBlock(object):
     def LoadObjectBlock(file):
         start = file.tell() - 2
         data = file.read(2)
-        result = struct.unpack('h', data) + (XBlock.LoadString(file),)
-        file.seek(start + padded(file.tell() - start))
+        string, end = __read_string__(file)
+        result = struct.unpack('h', data) + (string,)
+        file.seek(start + padded(end - start))
         return result
 
     @staticmethod
     def LoadMaterialBlock(file):
         from .xmodel import deserialize_image_string
-        start = file.tell() - 2
         data = file.read(2)
         name = XBlock.LoadString_Aligned(file)
         _type = XBlock.LoadString_Aligned(file)
         imgs = deserialize_image_string(XBlock.LoadString_Aligned(file))
         result = struct.unpack('h', data) + (name, _type, imgs)
-        file.seek(start + padded(file.tell() - start))
         return result
 
     @staticmethod
@@ -249,8 +323,9 @@ class XBlock(object):
         start = file.tell() - 2
         file.seek(start + 4)
         data = file.read(4)
-        result = struct.unpack('i', data) + (XBlock.LoadString(file),)
-        file.seek(start + padded(file.tell() - start))
+        string, end = __read_string__(file)
+        result = struct.unpack('i', data) + (string,)
+        file.seek(start + padded(end - start))
         return result
 
     @staticmethod
@@ -484,7 +559,1464 @@ class XBlock(object):
                            0x1675, int(note.frame), string)
         end = file.tell() + len(data)
         file.write(data)
-        file.write(bytearray(0) * padding(end))
+        file.write(bytearray(padding(end)))
+
+
+# Precompiled structs used by the block decoder
+__unpack_uint16__ = struct.Struct('<H').unpack_from
+__unpack_int16__ = struct.Struct('<h').unpack_from
+__unpack_int32__ = struct.Struct('<i').unpack_from
+__unpack_float__ = struct.Struct('<f').unpack_from
+__unpack_vec2__ = struct.Struct('<ff').unpack_from
+__unpack_vec3__ = struct.Struct('<fff').unpack_from
+__unpack_vec4__ = struct.Struct('<ffff').unpack_from
+__unpack_short_vec3__ = struct.Struct('<hhh').unpack_from
+__unpack_weight__ = struct.Struct('<hf').unpack_from
+__unpack_tri__ = struct.Struct('<BB').unpack_from
+__unpack_tri16__ = struct.Struct('<HH').unpack_from
+__unpack_color__ = struct.Struct('<BBBB').unpack_from
+__unpack_bone_info__ = struct.Struct('<ii').unpack_from
+# Runs of blocks that are decoded together (see XBinDecoder's fast paths)
+#  offset block + weight count block
+__unpack_vertex__ = struct.Struct('<HxxfffHh').unpack_from
+#  weight block (including its hash)
+__unpack_vertex_weight__ = struct.Struct('<Hhf').unpack_from
+#  normal block + color block + single layer uv block
+__unpack_face_vertex__ = struct.Struct('<HhhhHxxBBBBHhff').unpack_from
+# Runs of blocks that are only checked & skipped over
+#  offset block + weight count block
+__unpack_vertex_skip__ = struct.Struct('<H14xHh').unpack_from
+#  normal block + color block + uv block header
+__unpack_face_vertex_skip__ = struct.Struct('<H6xH6xHh').unpack_from
+#  offset block + matrix blocks (after a part index block)
+__unpack_frame_part_skip__ = struct.Struct('<H14xH6xH6xH6x').unpack_from
+
+
+def __load_string__(data, pos):
+    '''
+    Decode the null terminated string at data[pos]
+    Returns a tuple of (string, position after the null terminator)
+    '''
+    end = data.find(b'\x00', pos)
+    if end < 0:
+        # Treated like any other block that runs past the end of the data
+        raise struct.error("unterminated string at 0x%X" % pos)
+    return data[pos:end].decode('utf-8'), end + 1
+
+
+def __bad_block__(block_hash, pos):
+    if block_hash in XBinDecoder.blocks:
+        raise NotImplementedError(
+            "Unimplemented Block '%s' at 0x%X" %
+            (XBinDecoder.blocks[block_hash][0], pos + 2))
+    raise ValueError("Unknown Block Hash 0x%X at 0x%X" %
+                     (block_hash, pos))
+
+
+# Size of every fixed-size block
+__block_sizes__ = {
+    0x46C8: 4, 0x7AAC: 4, 0x24D1: 4,
+
+    0x76BA: 4, 0x7836: 8, 0xDD9A: 4, 0x9383: 16, 0x1C56: 16,
+    0xDCFD: 8, 0xCCDC: 8, 0xFCBF: 8,
+
+    0x950D: 4, 0x2AEC: 8, 0x8F03: 4, 0xB097: 8, 0xEA46: 4, 0xF1AB: 8,
+
+    0xBE92: 8, 0x562F: 4, 0x6711: 8, 0x89EC: 8, 0x6DD8: 8,
+
+    0x62AF: 4, 0xA1B2: 4,
+    0x6DAB: 20, 0x37FF: 20, 0x4265: 20, 0xC835: 12, 0xFE0C: 12,
+    0x7E24: 12, 0x317C: 20, 0xE593: 20, 0x7D76: 12, 0x83C7: 12, 0x5CD2: 8,
+
+    0x9279: 4, 0x745A: 4, 0x92D3: 4, 0xB917: 8, 0xC723: 8,
+    0xC7F3: 4, 0x9016: 4, 0x7A6C: 4, 0x4643: 4,
+
+    0x6EEE: 20,
+}
+
+# Offset of the string in each block that ends with a single string
+__string_block_offsets__ = {
+    0xC355: 4, 0xF099: 12, 0x87D4: 4, 0x360B: 4, 0x1675: 8,
+}
+
+
+def __string_end__(data, pos):
+    '''
+    Returns the position after the null terminator of the string at pos
+    '''
+    end = data.find(b'\x00', pos)
+    if end < 0:
+        raise struct.error("unterminated string at 0x%X" % pos)
+    return end + 1
+
+
+def __block_end__(data, pos):
+    '''
+    Returns the position after the block at pos without decoding it
+    '''
+    block_hash = __unpack_uint16__(data, pos)[0]
+    size = __block_sizes__.get(block_hash)
+    if size is not None:
+        return pos + size
+
+    if block_hash == 0x1AD4:
+        return pos + 4 + 8 * __unpack_int16__(data, pos + 2)[0]
+
+    if block_hash == 0xA700:
+        # Each of the strings is individually aligned
+        end = pos + 4
+        for i in range(3):
+            end = pos + padded(__string_end__(data, end) - pos)
+        return end
+
+    offset = __string_block_offsets__.get(block_hash)
+    if offset is None:
+        __bad_block__(block_hash, pos)
+    return pos + padded(__string_end__(data, pos + offset) - pos)
+
+
+def __skip_vertex__(data, pos):
+    '''
+    Skip over the vertex (index, offset, weight count & weight blocks) at pos
+    Returns the position after it, or None if the blocks at pos aren't laid
+     out like a vertex
+    '''
+    try:
+        block_hash = __unpack_uint16__(data, pos)[0]
+        if block_hash == 0x8F03:
+            pos += 4
+        elif block_hash == 0xB097:
+            pos += 8
+        else:
+            return None
+        offset_hash, count_hash, weight_count = __unpack_vertex_skip__(data,
+                                                                       pos)
+    except struct.error:
+        return None
+    if offset_hash != 0x9383 or count_hash != 0xEA46:
+        return None
+    pos += 20 + 8 * weight_count
+    return pos if pos <= len(data) else None
+
+
+def __skip_face__(data, pos):
+    '''
+    Skip over the face (triangle info block & 3 face vertices) at pos
+    Returns the position after it, or None if the blocks at pos aren't laid
+     out like a face
+    '''
+    try:
+        block_hash = __unpack_uint16__(data, pos)[0]
+        if block_hash == 0x562F:
+            pos += 4
+        elif block_hash == 0x6711:
+            pos += 8
+        else:
+            return None
+        for i in range(3):
+            block_hash = __unpack_uint16__(data, pos)[0]
+            if block_hash == 0x8F03:
+                pos += 4
+            elif block_hash == 0xB097:
+                pos += 8
+            else:
+                return None
+            (normal_hash, color_hash, uv_hash,
+             layer_count) = __unpack_face_vertex_skip__(data, pos)
+            if (normal_hash != 0x89EC or color_hash != 0x6DD8 or
+                    uv_hash != 0x1AD4):
+                return None
+            pos += 20 + 8 * layer_count
+    except struct.error:
+        return None
+    return pos if pos <= len(data) else None
+
+
+def __skip_frame__(data, pos):
+    '''
+    Skip over the frame (frame block & the part blocks that follow it) at pos
+    Returns the position after it, or None if the blocks at pos aren't laid
+     out like a frame
+    '''
+    size = len(data)
+    try:
+        if __unpack_uint16__(data, pos)[0] != 0xC723:
+            return None
+        pos += 8
+        while pos < size and __unpack_uint16__(data, pos)[0] == 0x745A:
+            (offset_hash, x_hash, y_hash,
+             z_hash) = __unpack_frame_part_skip__(data, pos + 4)
+            if (offset_hash != 0x9383 or x_hash != 0xDCFD or
+                    y_hash != 0xCCDC or z_hash != 0xFCBF):
+                return None
+            pos += 44
+    except struct.error:
+        return None
+    return pos if pos <= size else None
+
+
+# Skips a single vertex, face or frame when its first block is found
+__run_skippers__ = {
+    0x8F03: __skip_vertex__, 0xB097: __skip_vertex__,
+    0x562F: __skip_face__, 0x6711: __skip_face__,
+    0xC723: __skip_frame__,
+}
+
+
+def __skip_run__(skip, data, pos):
+    '''
+    Skip over the run of vertices, faces or frames that starts at pos
+    '''
+    end = pos
+    next_pos = skip(data, end)
+    while next_pos is not None:
+        end = next_pos
+        next_pos = skip(data, end)
+    if end == pos:
+        # Not laid out the way it's normally written, so only the block
+        #  itself can be skipped
+        return __block_end__(data, pos)
+    return end
+
+
+class XBinDecoder(object):
+    '''
+    Decodes the block stream of an x*_bin file into a Model or an Anim
+
+    Every block handler takes the data buffer and the position of the block
+     (including its hash) and returns the position of the next block.
+    Handlers read everything they need before modifying the target, so a
+     block that runs past the end of the buffer can be retried once more
+     data is available (see decode_stream)
+    '''
+    __slots__ = ('target', 'expected_type', 'asset_type',
+                 'active_thing', 'active_tri', 'active_frame',
+                 'dummy_mesh', 'cosmetic_count', 'xmodel', 'xanim',
+                 'block_handlers', 'final', 'pool')
+
+    # Maps each block hash to its (description, handler) - filled in below
+    blocks = {}
+    # Maps each block hash to its handler (only the implemented blocks)
+    handlers = {}
+    # Maps each section that can be skipped to the blocks that only appear in
+    #  that section
+    sections = {}
+    # Blocks that appear in more than one section
+    shared_blocks = frozenset()
+
+    def __init__(self, target, expected_type, skip_sections=()):
+        '''
+        skip_sections is a collection of the sections (see
+         XBinDecoder.sections) to skip over instead of decoding
+        '''
+        from . import xmodel as XModel
+        from . import xanim as XAnim
+        self.xmodel = XModel
+        self.xanim = XAnim
+
+        # Subclasses can provide their own handler table
+        self.block_handlers = type(self).handlers
+        if skip_sections:
+            self.block_handlers = dict(self.block_handlers)
+            for section in skip_sections:
+                for block_hash in XBinDecoder.sections[section]:
+                    self.block_handlers[block_hash] = XBinDecoder.SkipSection
+        self.final = True
+
+        self.target = target
+        self.expected_type = expected_type
+        self.asset_type = None
+        self.active_thing = None
+        self.active_tri = None
+        self.active_frame = None
+        self.dummy_mesh = XModel.Mesh("$default")
+        self.cosmetic_count = 0
+        # The ValuePool of the load (see xmodel.INTERN_VALUES)
+        self.pool = XModel.ValuePool() if XModel.INTERN_VALUES else None
+
+    def decode(self, data, pos=0, final=True):
+        '''
+        Decode all of the blocks in data, starting at pos
+        If final is False, decoding stops at the first block that runs past
+         the end of data instead of raising an error
+        Returns the position after the last decoded block
+        '''
+        handlers = self.block_handlers
+        size = len(data)
+        block_start = pos
+        self.final = final
+        try:
+            if LOG_BLOCKS:
+                while pos < size:
+                    block_start = pos
+                    pos = self.__log_block__(data, pos)
+            while pos < size:
+                block_start = pos
+                block_hash = __unpack_uint16__(data, pos)[0]
+                handler = handlers.get(block_hash)
+                if handler is None:
+                    __bad_block__(block_hash, pos)
+                pos = handler(self, data, pos)
+        except struct.error:
+            if final:
+                raise
+            return block_start
+        return pos
+
+    def __log_block__(self, data, pos):
+        block_hash = __unpack_uint16__(data, pos)[0]
+        handler = self.block_handlers.get(block_hash)
+        if handler is None:
+            __bad_block__(block_hash, pos)
+        print("Loading Block: '%s' at 0x%X" %
+              (XBinDecoder.blocks[block_hash][0], pos + 2))
+        end = handler(self, data, pos)
+        print("        Data: %s" % repr(bytes(data[pos + 2:end])))
+        return end
+
+    def decode_stream(self, chunks):
+        '''
+        Decode the blocks from an iterable of data chunks as they arrive
+        '''
+        data = b''
+        pos = 0
+        for chunk in chunks:
+            if pos < len(data):
+                data = data[pos:] + chunk
+                pos = 0
+            else:
+                # The last block's padding may extend into the new chunk
+                pos -= len(data)
+                data = chunk
+            pos = self.decode(data, pos, final=False)
+        self.decode(data, pos, final=True)
+
+    def result(self):
+        # Return the dummy mesh for splitting if we imported a model
+        if self.asset_type == 'MODEL':
+            return self.dummy_mesh
+        return None
+
+    # Generic
+
+    def SkipInt16Block(self, data, pos):
+        __unpack_int16__(data, pos + 2)
+        return pos + 4
+
+    def SkipInt32Block(self, data, pos):
+        __unpack_int32__(data, pos + 4)
+        return pos + 8
+
+    def SkipCommentBlock(self, data, pos):
+        string, end = __load_string__(data, pos + 4)
+        return pos + padded(end - pos)
+
+    def SkipExtraData(self, data, pos):
+        # TODO: Figure out what the "extra data" is
+        # It appears to always be 2 bytes of padding followed by 16 bytes
+        #  of data and only seems to appear in xanim_bin files...
+        __unpack_vec4__(data, pos + 4)
+        return pos + 20
+
+    def SkipBlock(self, data, pos):
+        return __block_end__(data, pos)
+
+    def SkipVertices(self, data, pos):
+        return __skip_run__(__skip_vertex__, data, pos)
+
+    def SkipFaces(self, data, pos):
+        return __skip_run__(__skip_face__, data, pos)
+
+    def SkipFrames(self, data, pos):
+        return __skip_run__(__skip_frame__, data, pos)
+
+    def SkipSection(self, data, pos):
+        '''
+        Skip over the section that the block at pos belongs to
+        If the data runs out first, skipping stops at the last block that
+         only belongs to the section, so it can pick up from there once more
+         data is available
+        '''
+        block_hash = __unpack_uint16__(data, pos)[0]
+        for section_blocks in XBinDecoder.sections.values():
+            if block_hash in section_blocks:
+                break
+        shared_blocks = XBinDecoder.shared_blocks
+        size = len(data)
+        start = pos
+        resume = pos
+        try:
+            while pos < size:
+                block_hash = __unpack_uint16__(data, pos)[0]
+                if block_hash in section_blocks:
+                    resume = pos
+                elif block_hash not in shared_blocks:
+                    # Start of the next section
+                    return pos
+                skip = __run_skippers__.get(block_hash)
+                next_pos = skip(data, pos) if skip is not None else None
+                if next_pos is None:
+                    next_pos = __block_end__(data, pos)
+                    if next_pos > size:
+                        raise struct.error("block runs past the end of the "
+                                           "data")
+                pos = next_pos
+        except struct.error:
+            if self.final or resume == start:
+                raise
+            return resume
+
+        if self.final:
+            return pos
+        if resume == start:
+            raise struct.error("section runs past the end of the data")
+        return resume
+
+    def InitModel(self, data, pos):
+        self.__init_asset__('MODEL')
+        return self.SkipInt16Block(data, pos)
+
+    def InitAnim(self, data, pos):
+        self.__init_asset__('ANIM')
+        return self.SkipInt16Block(data, pos)
+
+    def __init_asset__(self, asset_type):
+        self.asset_type = asset_type
+        if self.expected_type != asset_type:
+            raise TypeError("Found %s asset. Expected %s" %
+                            (asset_type, self.expected_type))
+
+    def LoadVersion(self, data, pos):
+        self.target.version = __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    # Model-specific
+
+    def LoadBoneCount(self, data, pos):
+        self.target.bones = [None] * __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadCosmeticCount(self, data, pos):
+        self.cosmetic_count = __unpack_int32__(data, pos + 4)[0]
+        return pos + 8
+
+    def LoadSBoneCount(self, data, pos):
+        raise NotImplementedError("Siege models are not supported yet")
+
+    def LoadBoneInfo(self, data, pos):
+        index, parent = __unpack_bone_info__(data, pos + 4)
+        name, end = __load_string__(data, pos + 12)
+        bones = self.target.bones
+        cosmetic = (index >= (len(bones) - self.cosmetic_count))
+        bones[index] = self.xmodel.Bone(name, parent, cosmetic)
+        return pos + padded(end - pos)
+
+    def LoadBoneIndex(self, data, pos):
+        bone = self.target.bones[__unpack_int16__(data, pos + 2)[0]]
+        bone.matrix = []
+        self.active_thing = bone
+        return pos + 4
+
+    def LoadOffset(self, data, pos):
+        self.active_thing.offset = __unpack_vec3__(data, pos + 4)
+        return pos + 16
+
+    def LoadBoneScale(self, data, pos):
+        self.active_thing.scale = __unpack_vec3__(data, pos + 4)
+        return pos + 16
+
+    def LoadBoneMatrix(self, data, pos):
+        x, y, z = __unpack_short_vec3__(data, pos + 2)
+        self.active_thing.matrix.append((x / 32767.0, y / 32767.0,
+                                         z / 32767.0))
+        return pos + 8
+
+    def LoadVertexCount(self, data, pos):
+        self.dummy_mesh.verts = [None] * __unpack_uint16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadVertex32Count(self, data, pos):
+        self.dummy_mesh.verts = [None] * __unpack_int32__(data, pos + 4)[0]
+        return pos + 8
+
+    def LoadVertexIndex(self, data, pos):
+        index = __unpack_uint16__(data, pos + 2)[0]
+        return self.__load_vertex_index__(data, pos + 4, index)
+
+    def LoadVertex32Index(self, data, pos):
+        index = __unpack_int32__(data, pos + 4)[0]
+        return self.__load_vertex_index__(data, pos + 8, index)
+
+    def __load_vertex_index__(self, data, pos, index):
+        '''
+        Handles the vertex index that starts a vertex or a face vertex
+        pos is the position right after the index block
+        '''
+        if self.active_tri is None:
+            vertex = self.xmodel.Vertex()
+            self.dummy_mesh.verts[index] = vertex
+            self.active_thing = vertex
+            return self.__load_vertex_fast__(data, pos, vertex)
+
+        face_vert = self.xmodel.FaceVertex(index)
+        self.active_tri.indices.append(face_vert)
+        self.active_thing = face_vert
+        return self.__load_face_vertex_fast__(data, pos, face_vert)
+
+    # Fast paths
+    # Vertices and face vertices are (almost) always written as a fixed run
+    #  of blocks, so the whole run is unpacked at once when the block hashes
+    #  match - otherwise the blocks are left to their individual handlers
+
+    def __load_vertex_fast__(self, data, pos, vertex):
+        try:
+            (offset_hash, x, y, z,
+             count_hash, weight_count) = __unpack_vertex__(data, pos)
+        except struct.error:
+            return pos
+        if offset_hash != 0x9383 or count_hash != 0xEA46:
+            return pos
+
+        weights = [None] * weight_count
+        weight_pos = pos + 20
+        try:
+            for i in range(weight_count):
+                weight_hash, bone, influence = __unpack_vertex_weight__(
+                    data, weight_pos)
+                if weight_hash != 0xF1AB:
+                    return pos
+                weights[i] = (bone, influence)
+                weight_pos += 8
+        except struct.error:
+            return pos
+
+        if self.pool is not None:
+            self.pool.intern_weights(weights)
+        vertex.offset = (x, y, z)
+        vertex.weights = weights
+        return weight_pos
+
+    def __load_face_vertex_fast__(self, data, pos, face_vert):
+        try:
+            (normal_hash, nx, ny, nz,
+             color_hash, r, g, b, a,
+             uv_hash, layer_count, u, v) = __unpack_face_vertex__(data, pos)
+        except struct.error:
+            return pos
+        if (normal_hash != 0x89EC or color_hash != 0x6DD8 or
+                uv_hash != 0x1AD4 or layer_count != 1):
+            return pos
+
+        face_vert.normal = (nx / 32767.0, ny / 32767.0, nz / 32767.0)
+        face_vert.color = (r / 255.0, g / 255.0, b / 255.0, a / 255.0)
+        face_vert.uv = (u, v)
+        if self.pool is not None:
+            self.pool.intern_face_vertex(face_vert)
+        return pos + 28
+
+    def LoadVertexWeightCount(self, data, pos):
+        __unpack_int16__(data, pos + 2)
+        self.active_thing.weights = []
+        return pos + 4
+
+    def LoadVertexWeight(self, data, pos):
+        weight = __unpack_weight__(data, pos + 2)
+        if self.pool is not None:
+            weight = self.pool.weights.setdefault(weight, weight)
+        self.active_thing.weights.append(weight)
+        return pos + 8
+
+    def LoadTriCount(self, data, pos):
+        __unpack_int32__(data, pos + 4)
+        self.dummy_mesh.faces = []
+        return pos + 8
+
+    def LoadTriInfo(self, data, pos):
+        object_index, material_index = __unpack_tri__(data, pos + 2)
+        self.__load_tri__(object_index, material_index)
+        return pos + 4
+
+    def LoadTri16Info(self, data, pos):
+        object_index, material_index = __unpack_tri16__(data, pos + 4)
+        self.__load_tri__(object_index, material_index)
+        return pos + 8
+
+    def __load_tri__(self, object_index, material_index):
+        tri = self.xmodel.Face(object_index, material_index)
+        tri.indices = []
+        self.dummy_mesh.faces.append(tri)
+        self.active_tri = tri
+
+    def LoadTriVertNormal(self, data, pos):
+        x, y, z = __unpack_short_vec3__(data, pos + 2)
+        normal = (x / 32767.0, y / 32767.0, z / 32767.0)
+        if self.pool is not None:
+            normal = self.pool.normals.setdefault(normal, normal)
+        self.active_thing.normal = normal
+        return pos + 8
+
+    def LoadTriVertColor(self, data, pos):
+        r, g, b, a = __unpack_color__(data, pos + 4)
+        color = (r / 255.0, g / 255.0, b / 255.0, a / 255.0)
+        if self.pool is not None:
+            color = self.pool.colors.setdefault(color, color)
+        self.active_thing.color = color
+        return pos + 8
+
+    def LoadTriVertUV(self, data, pos):
+        layer_count = __unpack_int16__(data, pos + 2)[0]
+        end = pos + 4 + 8 * layer_count
+        if end > len(data):
+            raise struct.error("UV block runs past the end of the data")
+        # Technically there is support for additional UV layers
+        #  but we're only using the first one at the moment
+        uv = __unpack_vec2__(data, pos + 4) if layer_count > 0 else ()
+        if self.pool is not None:
+            uv = self.pool.uvs.setdefault(uv, uv)
+        self.active_thing.uv = uv
+        return end
+
+    def LoadObjectCount(self, data, pos):
+        self.target.meshes = [None] * __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadObjectInfo(self, data, pos):
+        index = __unpack_int16__(data, pos + 2)[0]
+        name, end = __load_string__(data, pos + 4)
+        self.target.meshes[index] = self.xmodel.Mesh(name)
+        return pos + padded(end - pos)
+
+    def LoadMaterialCount(self, data, pos):
+        self.target.materials = [None] * __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadMaterialInfo(self, data, pos):
+        index = __unpack_int16__(data, pos + 2)[0]
+        # Each of the strings is individually aligned
+        name, end = __load_string__(data, pos + 4)
+        _type, end = __load_string__(data, pos + padded(end - pos))
+        images, end = __load_string__(data, pos + padded(end - pos))
+        images = self.xmodel.deserialize_image_string(images)
+        material = self.xmodel.Material(name, _type, images)
+        self.target.materials[index] = material
+        self.active_thing = material
+        return pos + padded(end - pos)
+
+    def LoadMaterialTransparency(self, data, pos):
+        self.active_thing.transparency = __unpack_vec4__(data, pos + 4)
+        return pos + 20
+
+    def LoadMaterialAmbientColor(self, data, pos):
+        self.active_thing.color_ambient = __unpack_vec4__(data, pos + 4)
+        return pos + 20
+
+    def LoadMaterialIncandescence(self, data, pos):
+        self.active_thing.incandescence = __unpack_vec4__(data, pos + 4)
+        return pos + 20
+
+    def LoadMaterialCoeffs(self, data, pos):
+        self.active_thing.coeffs = __unpack_vec2__(data, pos + 4)
+        return pos + 12
+
+    def LoadMaterialGlow(self, data, pos):
+        self.active_thing.glow = __unpack_vec2__(data, pos + 4)
+        return pos + 12
+
+    def LoadMaterialRefractive(self, data, pos):
+        self.active_thing.refractive = __unpack_vec2__(data, pos + 4)
+        return pos + 12
+
+    def LoadMaterialSpecularColor(self, data, pos):
+        self.active_thing.color_specular = __unpack_vec4__(data, pos + 4)
+        return pos + 20
+
+    def LoadMaterialReflectiveColor(self, data, pos):
+        self.active_thing.color_reflective = __unpack_vec4__(data, pos + 4)
+        return pos + 20
+
+    def LoadMaterialReflective(self, data, pos):
+        self.active_thing.reflective = __unpack_vec2__(data, pos + 4)
+        return pos + 12
+
+    def LoadMaterialBlinn(self, data, pos):
+        self.active_thing.blinn = __unpack_vec2__(data, pos + 4)
+        return pos + 12
+
+    def LoadMaterialPhong(self, data, pos):
+        self.active_thing.phong = __unpack_float__(data, pos + 4)[0]
+        return pos + 8
+
+    # Anim-specific
+
+    def LoadPartCount(self, data, pos):
+        self.target.parts = [None] * __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadPartInfo(self, data, pos):
+        index = __unpack_int16__(data, pos + 2)[0]
+        name, end = __load_string__(data, pos + 4)
+        self.target.parts[index] = self.xanim.PartInfo(name)
+        return pos + padded(end - pos)
+
+    def LoadPartIndex(self, data, pos):
+        index = __unpack_int16__(data, pos + 2)[0]
+        frame_part = self.xanim.FramePart(matrix=[])
+        self.active_frame.parts[index] = frame_part
+        self.active_thing = frame_part
+        return pos + 4
+
+    def LoadFramerate(self, data, pos):
+        self.target.framerate = __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadFrameIndex(self, data, pos):
+        frame = self.xanim.Frame(__unpack_int32__(data, pos + 4)[0])
+        frame.parts = [None] * len(self.target.parts)
+        self.active_frame = frame
+        self.target.frames.append(frame)
+        return pos + 8
+
+    def LoadNotetracksBegin(self, data, pos):
+        __unpack_int16__(data, pos + 2)
+        # Activate a dummy frame, as notetracks sometimes contain part
+        # indices.
+        # If the active_frame isn't reset, the bone data for
+        #  the most recently loaded frame will be corrupted
+        dummy_frame = self.xanim.Frame(-1)
+        dummy_frame.parts = [None] * len(self.target.parts)
+        self.active_frame = dummy_frame
+        return pos + 4
+
+    def LoadNoteFrame(self, data, pos):
+        frame = __unpack_int32__(data, pos + 4)[0]
+        string, end = __load_string__(data, pos + 8)
+        self.target.notes.append(self.xanim.Note(frame, string))
+        return pos + padded(end - pos)
+
+
+XBinDecoder.blocks = {
+    0xC355: ("Comment block", XBinDecoder.SkipCommentBlock),
+    0x46C8: ("Model identification block", XBinDecoder.InitModel),
+    0x7AAC: ("Animation block", XBinDecoder.InitAnim),
+    0x24D1: ("Version block", XBinDecoder.LoadVersion),
+
+    # Model Specific
+    0x76BA: ("Bone count block", XBinDecoder.LoadBoneCount),
+    0x7836: ("Cosmetic bone count block", XBinDecoder.LoadCosmeticCount),
+    0xF099: ("Bone block", XBinDecoder.LoadBoneInfo),
+    0xDD9A: ("Bone index block", XBinDecoder.LoadBoneIndex),
+    0x9383: ("Vert / Bone offset block", XBinDecoder.LoadOffset),
+    0x1C56: ("Bone scale block", XBinDecoder.LoadBoneScale),
+    0xDCFD: ("Bone x matrix", XBinDecoder.LoadBoneMatrix),
+    0xCCDC: ("Bone y matrix", XBinDecoder.LoadBoneMatrix),
+    0xFCBF: ("Bone z matrix", XBinDecoder.LoadBoneMatrix),
+
+    0x950D: ("Number of verts", XBinDecoder.LoadVertexCount),
+    0x2AEC: ("Number of verts32", XBinDecoder.LoadVertex32Count),
+    0x8F03: ("Vert info block marker", XBinDecoder.LoadVertexIndex),
+    0xB097: ("Vert32 info block marker", XBinDecoder.LoadVertex32Index),
+    0xEA46: ("Vert weighted bones count", XBinDecoder.LoadVertexWeightCount),
+    0xF1AB: ("Vert bone weight info", XBinDecoder.LoadVertexWeight),
+
+    0xBE92: ("Number of faces block", XBinDecoder.LoadTriCount),
+    0x562F: ("Triangle info block", XBinDecoder.LoadTriInfo),
+    0x6711: ("Triangle info (16) block", XBinDecoder.LoadTri16Info),
+    0x89EC: ("Normal info", XBinDecoder.LoadTriVertNormal),
+    0x6DD8: ("Color info", XBinDecoder.LoadTriVertColor),
+    0x1AD4: ("UV info", XBinDecoder.LoadTriVertUV),
+
+    0x62AF: ("Number of objects block", XBinDecoder.LoadObjectCount),
+    0x87D4: ("Object info block", XBinDecoder.LoadObjectInfo),
+
+    0xA1B2: ("Number of materials", XBinDecoder.LoadMaterialCount),
+    0xA700: ("Material info block", XBinDecoder.LoadMaterialInfo),
+    0x6DAB: ("Material transparency", XBinDecoder.LoadMaterialTransparency),
+    0x37FF: ("Material ambient color", XBinDecoder.LoadMaterialAmbientColor),
+    0x4265: ("Material incandescence", XBinDecoder.LoadMaterialIncandescence),
+    0xC835: ("Material coeffs", XBinDecoder.LoadMaterialCoeffs),
+    0xFE0C: ("Material glow", XBinDecoder.LoadMaterialGlow),
+    0x7E24: ("Material refractive", XBinDecoder.LoadMaterialRefractive),
+    0x317C: ("Material specular color", XBinDecoder.LoadMaterialSpecularColor),
+    0xE593: ("Material reflective color",
+             XBinDecoder.LoadMaterialReflectiveColor),
+    0x7D76: ("Material reflective", XBinDecoder.LoadMaterialReflective),
+    0x83C7: ("Material blinn", XBinDecoder.LoadMaterialBlinn),
+    0x5CD2: ("Material phong", XBinDecoder.LoadMaterialPhong),
+
+    # Animation Specific
+    0x9279: ("NumParts block", XBinDecoder.LoadPartCount),
+    0x360B: ("Part info block", XBinDecoder.LoadPartInfo),
+    0x745A: ("Part index block", XBinDecoder.LoadPartIndex),
+    0x92D3: ("Framerate block", XBinDecoder.LoadFramerate),
+    0xB917: ("NumFrames block", XBinDecoder.SkipInt32Block),
+    0xC723: ("Frame block", XBinDecoder.LoadFrameIndex),
+
+    0xC7F3: ("Notetrack section block", XBinDecoder.LoadNotetracksBegin),
+    0x9016: ("NumTracks block", XBinDecoder.SkipInt16Block),
+    0x7A6C: ("NumKeys block", XBinDecoder.SkipInt16Block),
+    0x4643: ("Notetrack block", XBinDecoder.SkipInt16Block),
+    0x1675: ("Note frame block", XBinDecoder.LoadNoteFrame),
+
+    # Misc (Unimplemented)
+    0xBCD4: ("FIRSTFRAME", None),
+    0x1FC2: ("NUMSBONES", XBinDecoder.LoadSBoneCount),
+    0xB35E: ("NUMSWEIGHTS", None),
+    0xEF69: ("QUATERNION", None),
+    0xA65B: ("NUMIKPITCHLAYERS", None),
+    0x1D7D: ("IKPITCHLAYER", None),
+    0xA58B: ("ROTATION", None),
+    0x6EEE: ("EXTRA", XBinDecoder.SkipExtraData),
+}
+
+XBinDecoder.handlers = dict(
+    (block_hash, block[1])
+    for block_hash, block in XBinDecoder.blocks.items()
+    if block[1] is not None)
+
+XBinDecoder.sections = {
+    'bones': frozenset((0x76BA, 0x7836, 0xF099, 0xDD9A, 0x1C56,
+                        0xDCFD, 0xCCDC, 0xFCBF)),
+    'geometry': frozenset((0x950D, 0x2AEC, 0x8F03, 0xB097, 0xEA46, 0xF1AB,
+                           0xBE92, 0x562F, 0x6711, 0x89EC, 0x1AD4,
+                           0x62AF, 0x87D4)),
+    'materials': frozenset((0xA1B2, 0xA700, 0x6DAB, 0x37FF, 0x4265,
+                            0xC835, 0xFE0C, 0x7E24, 0x317C, 0xE593,
+                            0x7D76, 0x83C7, 0x5CD2)),
+}
+
+# Offset blocks are used by both bones and vertices, color blocks by both
+#  face vertices and materials
+XBinDecoder.shared_blocks = frozenset((0x9383, 0x6DD8))
+
+
+class XBinInfo(object):
+    '''
+    Summary of an x*_bin file (see XBinIO.ProbeFile_Bin)
+
+    bones, objects, materials and parts are lists of names
+    notes is a list of (frame, string) tuples
+    sections maps each section name ('header', 'bones', 'vertices', 'faces',
+     'objects', 'materials', 'parts', 'frames' or 'notes') to the (start, end)
+     byte offsets of its blocks in the uncompressed block stream
+    '''
+    __slots__ = ('asset_type', 'version', 'bones', 'cosmetic_count',
+                 'vertex_count', 'face_count', 'objects', 'materials',
+                 'parts', 'framerate', 'frame_count', 'notes', 'sections')
+
+    def __init__(self):
+        self.asset_type = None
+        self.version = None
+        self.bones = []
+        self.cosmetic_count = 0
+        self.vertex_count = 0
+        self.face_count = 0
+        self.objects = []
+        self.materials = []
+        self.parts = []
+        self.framerate = None
+        self.frame_count = 0
+        self.notes = []
+        self.sections = {}
+
+
+class XBinProbe(XBinDecoder):
+    '''
+    Walks the block stream of an x*_bin file without building the asset
+
+    Only the names and counts are read into an XBinInfo. Vertex, face and
+     frame payloads are skipped over by their known sizes - a whole run of
+     them at a time, falling back to skipping block by block whenever the
+     blocks aren't laid out the way they're normally written
+    '''
+    __slots__ = ('info', )
+
+    # Maps each block hash to its handler - filled in below
+    handlers = {}
+    # Maps each block hash to the XBinInfo section it belongs to (if it's
+    #  specific to a single section)
+    block_sections = {}
+
+    def __init__(self, expected_type=None):
+        self.info = XBinInfo()
+        self.expected_type = expected_type
+
+    def probe(self, data, pos=0):
+        '''
+        Walk all of the blocks in data, starting at pos
+        Returns the resulting XBinInfo
+        '''
+        handlers = XBinProbe.handlers
+        block_sections = XBinProbe.block_sections
+        spans = {}
+        section = None
+        span = None
+        size = len(data)
+        while pos < size:
+            block_hash = __unpack_uint16__(data, pos)[0]
+            handler = handlers.get(block_hash)
+            if handler is None:
+                __bad_block__(block_hash, pos)
+
+            block_section = block_sections.get(block_hash, section)
+            if block_section != section:
+                section = block_section
+                span = spans.setdefault(section, [pos, pos])
+            pos = handler(self, data, pos)
+            if span is not None:
+                span[1] = pos
+
+        if pos > size:
+            raise struct.error("block runs past the end of the data")
+
+        info = self.info
+        for name, span in spans.items():
+            info.sections[name] = tuple(span)
+        return info
+
+    def __init_asset__(self, asset_type):
+        self.info.asset_type = asset_type
+        if self.expected_type not in (None, asset_type):
+            raise TypeError("Found %s asset. Expected %s" %
+                            (asset_type, self.expected_type))
+
+    def LoadVersion(self, data, pos):
+        self.info.version = __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    # Model-specific
+
+    def LoadBoneCount(self, data, pos):
+        self.info.bones = [None] * __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadCosmeticCount(self, data, pos):
+        self.info.cosmetic_count = __unpack_int32__(data, pos + 4)[0]
+        return pos + 8
+
+    def LoadBoneInfo(self, data, pos):
+        index = __unpack_bone_info__(data, pos + 4)[0]
+        name, end = __load_string__(data, pos + 12)
+        self.info.bones[index] = name
+        return pos + padded(end - pos)
+
+    def LoadVertexCount(self, data, pos):
+        self.info.vertex_count = __unpack_uint16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadVertex32Count(self, data, pos):
+        self.info.vertex_count = __unpack_int32__(data, pos + 4)[0]
+        return pos + 8
+
+    def LoadTriCount(self, data, pos):
+        self.info.face_count = __unpack_int32__(data, pos + 4)[0]
+        return pos + 8
+
+    def LoadObjectInfo(self, data, pos):
+        name, end = __load_string__(data, pos + 4)
+        self.info.objects.append(name)
+        return pos + padded(end - pos)
+
+    def LoadMaterialInfo(self, data, pos):
+        # Each of the strings is individually aligned
+        name, end = __load_string__(data, pos + 4)
+        _type, end = __load_string__(data, pos + padded(end - pos))
+        images, end = __load_string__(data, pos + padded(end - pos))
+        self.info.materials.append(name)
+        return pos + padded(end - pos)
+
+    # Anim-specific
+
+    def LoadPartCount(self, data, pos):
+        self.info.parts = [None] * __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadPartInfo(self, data, pos):
+        index = __unpack_int16__(data, pos + 2)[0]
+        name, end = __load_string__(data, pos + 4)
+        self.info.parts[index] = name
+        return pos + padded(end - pos)
+
+    def LoadFramerate(self, data, pos):
+        self.info.framerate = __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadFrameCount(self, data, pos):
+        self.info.frame_count = __unpack_int32__(data, pos + 4)[0]
+        return pos + 8
+
+    def LoadNoteFrame(self, data, pos):
+        frame = __unpack_int32__(data, pos + 4)[0]
+        string, end = __load_string__(data, pos + 8)
+        self.info.notes.append((frame, string))
+        return pos + padded(end - pos)
+
+
+XBinProbe.handlers = {
+    0xC355: XBinDecoder.SkipCommentBlock,
+    0x46C8: XBinDecoder.InitModel,
+    0x7AAC: XBinDecoder.InitAnim,
+    0x24D1: XBinProbe.LoadVersion,
+
+    # Model Specific
+    0x76BA: XBinProbe.LoadBoneCount,
+    0x7836: XBinProbe.LoadCosmeticCount,
+    0xF099: XBinProbe.LoadBoneInfo,
+    0xDD9A: XBinDecoder.SkipBlock,
+    0x9383: XBinDecoder.SkipBlock,
+    0x1C56: XBinDecoder.SkipBlock,
+    0xDCFD: XBinDecoder.SkipBlock,
+    0xCCDC: XBinDecoder.SkipBlock,
+    0xFCBF: XBinDecoder.SkipBlock,
+
+    0x950D: XBinProbe.LoadVertexCount,
+    0x2AEC: XBinProbe.LoadVertex32Count,
+    0x8F03: XBinDecoder.SkipVertices,
+    0xB097: XBinDecoder.SkipVertices,
+    0xEA46: XBinDecoder.SkipBlock,
+    0xF1AB: XBinDecoder.SkipBlock,
+
+    0xBE92: XBinProbe.LoadTriCount,
+    0x562F: XBinDecoder.SkipFaces,
+    0x6711: XBinDecoder.SkipFaces,
+    0x89EC: XBinDecoder.SkipBlock,
+    0x6DD8: XBinDecoder.SkipBlock,
+    0x1AD4: XBinDecoder.SkipBlock,
+
+    0x62AF: XBinDecoder.SkipBlock,
+    0x87D4: XBinProbe.LoadObjectInfo,
+
+    0xA1B2: XBinDecoder.SkipBlock,
+    0xA700: XBinProbe.LoadMaterialInfo,
+    0x6DAB: XBinDecoder.SkipBlock,
+    0x37FF: XBinDecoder.SkipBlock,
+    0x4265: XBinDecoder.SkipBlock,
+    0xC835: XBinDecoder.SkipBlock,
+    0xFE0C: XBinDecoder.SkipBlock,
+    0x7E24: XBinDecoder.SkipBlock,
+    0x317C: XBinDecoder.SkipBlock,
+    0xE593: XBinDecoder.SkipBlock,
+    0x7D76: XBinDecoder.SkipBlock,
+    0x83C7: XBinDecoder.SkipBlock,
+    0x5CD2: XBinDecoder.SkipBlock,
+
+    # Animation Specific
+    0x9279: XBinProbe.LoadPartCount,
+    0x360B: XBinProbe.LoadPartInfo,
+    0x745A: XBinDecoder.SkipBlock,
+    0x92D3: XBinProbe.LoadFramerate,
+    0xB917: XBinProbe.LoadFrameCount,
+    0xC723: XBinDecoder.SkipFrames,
+
+    0xC7F3: XBinDecoder.SkipBlock,
+    0x9016: XBinDecoder.SkipBlock,
+    0x7A6C: XBinDecoder.SkipBlock,
+    0x4643: XBinDecoder.SkipBlock,
+    0x1675: XBinProbe.LoadNoteFrame,
+
+    0x6EEE: XBinDecoder.SkipBlock,
+}
+
+XBinProbe.block_sections = {
+    0xC355: 'header', 0x46C8: 'header', 0x7AAC: 'header', 0x24D1: 'header',
+
+    0x76BA: 'bones', 0x7836: 'bones', 0xF099: 'bones', 0xDD9A: 'bones',
+    0x1C56: 'bones',
+
+    0x950D: 'vertices', 0x2AEC: 'vertices', 0xEA46: 'vertices',
+    0xF1AB: 'vertices',
+
+    0xBE92: 'faces', 0x562F: 'faces', 0x6711: 'faces', 0x89EC: 'faces',
+    0x1AD4: 'faces',
+
+    0x62AF: 'objects', 0x87D4: 'objects',
+
+    0xA1B2: 'materials', 0xA700: 'materials', 0x6DAB: 'materials',
+    0x37FF: 'materials', 0x4265: 'materials', 0xC835: 'materials',
+    0xFE0C: 'materials', 0x7E24: 'materials', 0x317C: 'materials',
+    0xE593: 'materials', 0x7D76: 'materials', 0x83C7: 'materials',
+    0x5CD2: 'materials',
+
+    0x9279: 'parts', 0x360B: 'parts',
+
+    0x92D3: 'frames', 0xB917: 'frames', 0xC723: 'frames', 0x745A: 'frames',
+
+    0xC7F3: 'notes', 0x9016: 'notes', 0x7A6C: 'notes', 0x4643: 'notes',
+    0x1675: 'notes',
+}
+
+
+# Precompiled structs used by the block encoder
+#  (every one of them includes the block hash)
+__pack_block__ = struct.Struct('<Hxx').pack_into
+__pack_int16_block__ = struct.Struct('<Hh').pack_into
+__pack_uint16_block__ = struct.Struct('<HH').pack_into
+__pack_int32_block__ = struct.Struct('<Hxxi').pack_into
+__pack_uint32_block__ = struct.Struct('<HxxI').pack_into
+__pack_float_block__ = struct.Struct('<Hxxf').pack_into
+__pack_vec2_block__ = struct.Struct('<Hxxff').pack_into
+__pack_vec3_block__ = struct.Struct('<Hxxfff').pack_into
+__pack_vec4_block__ = struct.Struct('<Hxxffff').pack_into
+__pack_color_block__ = struct.Struct('<HxxBBBB').pack_into
+__pack_weight_block__ = struct.Struct('<Hhf').pack_into
+__pack_tri_block__ = struct.Struct('<HBB').pack_into
+__pack_tri16_block__ = struct.Struct('<HHHH').pack_into
+__pack_bone_info_block__ = struct.Struct('<Hxxii').pack_into
+# Runs of blocks that are encoded together
+#  all three matrix row blocks
+__pack_matrix__ = struct.Struct('<HhhhHhhhHhhh').pack_into
+#  vertex index block + offset block + weight count block
+__pack_vertex16__ = struct.Struct('<HHHxxfffHh').pack_into
+__pack_vertex32__ = struct.Struct('<HxxIHxxfffHh').pack_into
+#  vertex index block + normal block + color block + single layer uv block
+__pack_face_vertex16__ = struct.Struct('<HHHhhhHxxBBBBHhff').pack_into
+__pack_face_vertex32__ = struct.Struct('<HxxIHhhhHxxBBBBHhff').pack_into
+#  part index block + offset block + matrix blocks
+__pack_frame_part__ = struct.Struct('<HhHxxfffHhhhHhhhHhhh').pack_into
+
+# Size of the fixed-size blocks written for every material
+#  (color + 5 vec4 blocks + 5 vec2 blocks + phong)
+__MATERIAL_BLOCKS_SIZE__ = 8 + 5 * 20 + 5 * 12 + 8
+
+
+def __pack_string__(buffer, pos, string):
+    '''
+    Copy an encoded string into the (zero filled) buffer at pos
+    Returns the position after the string's null terminator & padding
+    '''
+    size = len(string)
+    buffer[pos:pos + size] = string
+    return pos + padded(size + 1)
+
+
+def __pack_matrix_rows__(buffer, pos, matrix):
+    clamp = __clamp_float_to_short__
+    r0, r1, r2 = matrix
+    __pack_matrix__(buffer, pos,
+                    0xDCFD, clamp(r0[0]), clamp(r0[1]), clamp(r0[2]),
+                    0xCCDC, clamp(r1[0]), clamp(r1[1]), clamp(r1[2]),
+                    0xFCBF, clamp(r2[0]), clamp(r2[1]), clamp(r2[2]))
+    return pos + 24
+
+
+def __model_head_size__(comment, bone_names, cosmetic_count):
+    '''
+    Returns the size of the blocks that precede the vertices of an
+     xmodel_bin file (see __pack_model_head__)
+    '''
+    size = 4 + 4 + 4  # model, version & bone count blocks
+    if comment is not None:
+        size += 4 + padded(len(comment) + 1)
+    if cosmetic_count > 0:
+        size += 8
+    for name in bone_names:
+        size += 12 + padded(len(name) + 1)
+    size += (4 + 16 + 16 + 24) * len(bone_names)
+    return size
+
+
+def __pack_model_head__(buffer, pos, version, comment,
+                        bones, bone_names, cosmetic_count):
+    '''
+    Pack the comment, model, version & bone blocks of an xmodel_bin file
+    Returns the position after them
+    '''
+    if comment is not None:
+        __pack_block__(buffer, pos, 0xC355)
+        pos = __pack_string__(buffer, pos + 4, comment)
+    __pack_block__(buffer, pos, 0x46C8)
+    __pack_int16_block__(buffer, pos + 4, 0x24D1, version)
+    __pack_int16_block__(buffer, pos + 8, 0x76BA, len(bones))
+    pos += 12
+    if cosmetic_count > 0:
+        __pack_uint32_block__(buffer, pos, 0x7836, cosmetic_count)
+        pos += 8
+
+    for bone_index, bone in enumerate(bones):
+        __pack_bone_info_block__(buffer, pos, 0xF099, bone_index, bone.parent)
+        pos = __pack_string__(buffer, pos + 12, bone_names[bone_index])
+
+    for bone_index, bone in enumerate(bones):
+        __pack_int16_block__(buffer, pos, 0xDD9A, bone_index)
+        __pack_vec3_block__(buffer, pos + 4, 0x9383, *bone.offset)
+        __pack_vec3_block__(buffer, pos + 20, 0x1C56, *bone.scale)
+        pos = __pack_matrix_rows__(buffer, pos + 36, bone.matrix)
+    return pos
+
+
+def __model_tail_size__(mesh_names, material_strings):
+    '''
+    Returns the size of the blocks that follow the faces of an xmodel_bin
+     file (see __pack_model_tail__)
+    '''
+    size = 4
+    for name in mesh_names:
+        size += 4 + padded(len(name) + 1)
+    size += 4
+    for strings in material_strings:
+        size += 4 + __MATERIAL_BLOCKS_SIZE__
+        for string in strings:
+            size += padded(len(string) + 1)
+    return size
+
+
+def __pack_model_tail__(buffer, pos, mesh_names,
+                        materials, material_strings):
+    '''
+    Pack the object & material blocks of an xmodel_bin file
+    Returns the position after them
+    '''
+    # Objects
+    __pack_int16_block__(buffer, pos, 0x62AF, len(mesh_names))
+    pos += 4
+    for mesh_index, name in enumerate(mesh_names):
+        __pack_int16_block__(buffer, pos, 0x87D4, mesh_index)
+        pos = __pack_string__(buffer, pos + 4, name)
+
+    # Materials
+    __pack_int16_block__(buffer, pos, 0xA1B2, len(materials))
+    pos += 4
+    for material_index, material in enumerate(materials):
+        __pack_int16_block__(buffer, pos, 0xA700, material_index)
+        pos += 4
+        for string in material_strings[material_index]:
+            pos = __pack_string__(buffer, pos, string)
+
+        __pack_color_block__(buffer, pos, 0x6DD8,
+                             *[int(c * 255) for c in material.color])
+        __pack_vec4_block__(buffer, pos + 8, 0x6DAB, *material.transparency)
+        __pack_vec4_block__(buffer, pos + 28, 0x37FF, *material.color_ambient)
+        __pack_vec4_block__(buffer, pos + 48, 0x4265, *material.incandescence)
+        __pack_vec2_block__(buffer, pos + 68, 0xC835, *material.coeffs)
+        __pack_vec2_block__(buffer, pos + 80, 0xFE0C, *material.glow)
+        __pack_vec2_block__(buffer, pos + 92, 0x7E24, *material.refractive)
+        __pack_vec4_block__(buffer, pos + 104, 0x317C,
+                            *material.color_specular)
+        __pack_vec4_block__(buffer, pos + 124, 0xE593,
+                            *material.color_reflective)
+        __pack_vec2_block__(buffer, pos + 144, 0x7D76, *material.reflective)
+        __pack_vec2_block__(buffer, pos + 156, 0x83C7, *material.blinn)
+        __pack_float_block__(buffer, pos + 168, 0x5CD2, material.phong)
+        pos += __MATERIAL_BLOCKS_SIZE__
+    return pos
+
+
+def __model_strings__(header_message, bones, mesh_names, materials,
+                      extended_features=True):
+    '''
+    Encode the strings of an xmodel_bin file
+    Returns (comment, bone_names, mesh_names, material_strings)
+    '''
+    from .xmodel import serialize_image_string
+
+    comment = None
+    if header_message != '':
+        comment = __str_packable__(header_message)
+    bone_names = [__str_packable__(bone.name) for bone in bones]
+    mesh_names = [__str_packable__(name) for name in mesh_names]
+    material_strings = [
+        (__str_packable__(material.name),
+         __str_packable__(material.type),
+         __str_packable__(serialize_image_string(material.images,
+                                                 extended_features)))
+        for material in materials]
+    return comment, bone_names, mesh_names, material_strings
+
+
+def __encode_model__(model, version, extended_features=True,
+                     header_message=""):
+    '''
+    Encode a Model as the (uncompressed) block stream of an xmodel_bin file
+    The exact size of the stream is computed up front so that every block
+     can be packed straight into a single preallocated buffer
+    Returns the buffer (a bytearray)
+    '''
+    comment, bone_names, mesh_names, material_strings = __model_strings__(
+        header_message, model.bones, [mesh.name for mesh in model.meshes],
+        model.materials, extended_features)
+
+    cosmetic_count = 0
+    for bone in model.bones:
+        if bone.cosmetic:
+            cosmetic_count = cosmetic_count + 1
+
+    # Used to offset the vertex indices for each mesh
+    vert_offsets = [0]
+    weight_count = 0
+    face_count = 0
+    tri16_count = 0
+    for mesh in model.meshes:
+        vert_offsets.append(vert_offsets[-1] + len(mesh.verts))
+        for vert in mesh.verts:
+            weight_count += len(vert.weights)
+        face_count += len(mesh.faces)
+        for face in mesh.faces:
+            if face.mesh_id > 255 or face.material_id > 255:
+                tri16_count += 1
+    vert_count = vert_offsets[-1]
+    use_vertex32 = version == 7 and vert_count > 0xFFFF
+    index_size = 8 if use_vertex32 else 4
+
+    # Compute the exact size of the block stream
+    size = __model_head_size__(comment, bone_names, cosmetic_count)
+    size += index_size + (index_size + 16 + 4) * vert_count
+    size += 8 * weight_count
+    size += 8 + 4 * (face_count + tri16_count)
+    size += 3 * (index_size + 8 + 8 + 12) * face_count
+    size += __model_tail_size__(mesh_names, material_strings)
+
+    buffer = bytearray(size)
+    pos = __pack_model_head__(buffer, 0, version, comment,
+                              model.bones, bone_names, cosmetic_count)
+
+    # Vertices
+    if use_vertex32:
+        __pack_uint32_block__(buffer, pos, 0x2AEC, vert_count)
+        pack_vertex = __pack_vertex32__
+        pack_face_vertex = __pack_face_vertex32__
+        index_hash = 0xB097
+    else:
+        __pack_uint16_block__(buffer, pos, 0x950D, vert_count)
+        pack_vertex = __pack_vertex16__
+        pack_face_vertex = __pack_face_vertex16__
+        index_hash = 0x8F03
+    pos += index_size
+
+    vertex_size = index_size + 16 + 4
+    pack_weight = __pack_weight_block__
+    for mesh_index, mesh in enumerate(model.meshes):
+        vert_index = vert_offsets[mesh_index]
+        for vert in mesh.verts:
+            weights = vert.weights
+            x, y, z = vert.offset
+            pack_vertex(buffer, pos, index_hash, vert_index,
+                        0x9383, x, y, z, 0xEA46, len(weights))
+            pos += vertex_size
+            for bone, influence in weights:
+                pack_weight(buffer, pos, 0xF1AB, bone, influence)
+                pos += 8
+            vert_index += 1
+
+    # Faces
+    __pack_uint32_block__(buffer, pos, 0xBE92, face_count)
+    pos += 8
+
+    clamp = __clamp_float_to_short__
+    face_vertex_size = index_size + 8 + 8 + 12
+    for mesh_index, mesh in enumerate(model.meshes):
+        vert_offset = vert_offsets[mesh_index]
+        for face in mesh.faces:
+            mesh_id = face.mesh_id
+            material_id = face.material_id
+            if mesh_id > 255 or material_id > 255:
+                __pack_tri16_block__(buffer, pos, 0x6711, 0x0,
+                                     mesh_id, material_id)
+                pos += 8
+            else:
+                __pack_tri_block__(buffer, pos, 0x562F, mesh_id, material_id)
+                pos += 4
+            for ind in face.indices:
+                normal = ind.normal
+                r, g, b, a = ind.color
+                u, v = ind.uv
+                pack_face_vertex(buffer, pos,
+                                 index_hash, ind.vertex + vert_offset,
+                                 0x89EC, clamp(normal[0]), clamp(normal[1]),
+                                 clamp(normal[2]),
+                                 0x6DD8, int(r * 255), int(g * 255),
+                                 int(b * 255), int(a * 255),
+                                 0x1AD4, 1, u, v)
+                pos += face_vertex_size
+
+    pos = __pack_model_tail__(buffer, pos, mesh_names,
+                              model.materials, material_strings)
+
+    assert pos == size
+    return buffer
+
+
+def __encode_anim__(anim, version, header_message=""):
+    '''
+    Encode an Anim as the (uncompressed) block stream of an xanim_bin file
+    Like __encode_model__, the whole stream is packed into a single
+     preallocated buffer
+    Returns the buffer (a bytearray)
+    '''
+    comment = None
+    if header_message != '':
+        comment = __str_packable__(header_message)
+    part_names = [__str_packable__(part.name) for part in anim.parts]
+    note_strings = [__str_packable__(note.string) for note in anim.notes]
+
+    # Compute the exact size of the block stream
+    size = 4 + 4 + 4  # anim, version & part count blocks
+    if comment is not None:
+        size += 4 + padded(len(comment) + 1)
+    for name in part_names:
+        size += 4 + padded(len(name) + 1)
+    size += 4 + 8  # framerate & frame count blocks
+    for frame in anim.frames:
+        size += 8 + 44 * len(frame.parts)
+    size += 4
+    for string in note_strings:
+        size += 8 + padded(len(string) + 1)
+
+    buffer = bytearray(size)
+    pos = 0
+
+    if comment is not None:
+        __pack_block__(buffer, pos, 0xC355)
+        pos = __pack_string__(buffer, pos + 4, comment)
+    __pack_block__(buffer, pos, 0x7AAC)
+    __pack_int16_block__(buffer, pos + 4, 0x24D1, version)
+    __pack_int16_block__(buffer, pos + 8, 0x9279, len(anim.parts))
+    pos += 12
+
+    for part_index, name in enumerate(part_names):
+        __pack_int16_block__(buffer, pos, 0x360B, part_index)
+        pos = __pack_string__(buffer, pos + 4, name)
+
+    __pack_int16_block__(buffer, pos, 0x92D3, int(anim.framerate))
+    __pack_int32_block__(buffer, pos + 4, 0xB917, len(anim.frames))
+    pos += 12
+
+    clamp = __clamp_float_to_short__
+    pack_frame_part = __pack_frame_part__
+    for frame in anim.frames:
+        __pack_int32_block__(buffer, pos, 0xC723, int(frame.frame))
+        pos += 8
+        for part_index, part in enumerate(frame.parts):
+            x, y, z = part.offset
+            r0, r1, r2 = part.matrix
+            pack_frame_part(buffer, pos, 0x745A, part_index,
+                            0x9383, x, y, z,
+                            0xDCFD, clamp(r0[0]), clamp(r0[1]), clamp(r0[2]),
+                            0xCCDC, clamp(r1[0]), clamp(r1[1]), clamp(r1[2]),
+                            0xFCBF, clamp(r2[0]), clamp(r2[1]), clamp(r2[2]))
+            pos += 44
+
+    __pack_int16_block__(buffer, pos, 0x7A6C, len(anim.notes))
+    pos += 4
+    for note_index, note in enumerate(anim.notes):
+        __pack_int32_block__(buffer, pos, 0x1675, int(note.frame))
+        pos = __pack_string__(buffer, pos + 8, note_strings[note_index])
+
+    assert pos == size
+    return buffer
+
+
+class DecompressedFile(object):
+    '''
+    A whole decompressed *_bin file - the decoders read data (the buffer
+     returned by the codec) in place instead of copying it into a BytesIO
+    '''
+    __slots__ = ('name', 'data')
+
+    def __init__(self, data, name=None):
+        self.name = name
+        self.data = data
+
+    def close(self):
+        self.data = None
 
 
 class XBinIO(object):
@@ -495,7 +2027,19 @@ class XBinIO(object):
         return
 
     @staticmethod
-    def __decompress_internal__(file, dump=False):
+    def __decompress_internal__(file, dump=False, stream=None, codec=None):
+        '''
+        Decompress an *LZ4* file and return a file-like object over the result
+         (a DecompressedFile, or an lz4.StreamReader when streaming)
+        If stream is True, the data is decompressed incrementally as it's read
+         instead of all at once (defaults to LZ4_STREAMING)
+        codec is the name of the lz4 codec to use (defaults to the process
+         wide default - see lz4.set_default_codec)
+        '''
+        if stream is None:
+            stream = LZ4_STREAMING
+        codec = lz4.get_codec(codec)
+
         filepath = os.path.realpath(file.name)
         bin_magic = file.read(5)
 
@@ -504,9 +2048,16 @@ class XBinIO(object):
                              repr(bin_magic))
 
         if LZ4_VERBOSE:
-            print_lz4_support_info()
+            print_lz4_support_info(codec=codec)
             print("LZ4: Decompressing File: '%s'" % os.path.basename(filepath))
-        data = lz4.uncompress(file.read())
+
+        if stream:
+            return lz4.StreamReader(
+                XBinIO.__decompress_stream_internal__(file, filepath,
+                                                      dump, codec),
+                filepath)
+
+        data = codec.uncompress(file.read())
         if LZ4_VERBOSE:
             print('LZ4: Done')
         file.close()
@@ -516,498 +2067,225 @@ class XBinIO(object):
             dump_file.write(data)
             dump_file.close()
 
-        return BytesIO(data)
+        return DecompressedFile(data, filepath)
 
     @staticmethod
-    def __compress_internal__(in_file, out_file, close_files=True):
-        if LZ4_VERBOSE:
-            print_lz4_support_info()
-            print('LZ4: Encoding')
-        in_file.seek(0, os.SEEK_END)
-        uncompressed_size = in_file.tell()
+    def __decompress_stream_internal__(file, filepath, dump, codec):
+        '''
+        Generator that yields the decompressed chunks of file,
+        owns (and closes) both file and the optional dump file
+        '''
+        dump_file = None
+        try:
+            if dump:
+                dump_name = os.path.splitext(filepath)[0]
+                dump_file = open("%s.dump" % dump_name, "wb")
+            for chunk in codec.uncompress_stream(file,
+                                                 lz4.STREAM_CHUNK_SIZE):
+                if dump_file is not None:
+                    dump_file.write(chunk)
+                yield chunk
+            if LZ4_VERBOSE:
+                print('LZ4: Done')
+        finally:
+            file.close()
+            if dump_file is not None:
+                dump_file.close()
+
+    @staticmethod
+    def __compress_internal__(in_file, out_file, close_files=True,
+                              level=None, codec=None):
         in_file.seek(0, os.SEEK_SET)
-        compressed_data = lz4.compress(in_file.read())
+        data = in_file.read()
         if close_files:
             in_file.close()
+        XBinIO.__compress_buffer_internal__(data, out_file, close_files,
+                                            level, codec)
+
+    @staticmethod
+    def __compress_buffer_internal__(data, out_file, close_files=True,
+                                     level=None, codec=None):
+        '''
+        Compress an uncompressed block stream (bytes or a bytearray) straight
+         into out_file
+        '''
+        if level is None:
+            level = LZ4_COMPRESSION_LEVEL
+        codec = lz4.get_codec(codec)
+        if level is None:
+            level = codec.default_level
+        if LZ4_VERBOSE:
+            print_lz4_support_info(codec=codec)
+            print('LZ4: Encoding')
+        compressed_data = codec.compress(data, level)
         if LZ4_VERBOSE:
             print('LZ4: Done')
         out_file.write(b'*LZ4*')
-        out_file.write(struct.pack('I', uncompressed_size))
+        out_file.write(struct.pack('I', len(data)))
         out_file.write(compressed_data)
         if close_files:
             out_file.close()
 
-    def __xbin_loadfile_internal__(self, file, expected_type):
+    def __xbin_loadfile_internal__(self, file, expected_type,
+                                   skip_sections=(), decoder_type=None,
+                                   **decoder_args):
         '''
         Load an x*_bin file
         file is a handle to the file
         target_type = 'ANIM' or 'MODEL'
+        skip_sections are the sections (see XBinDecoder.sections) to skip
+        decoder_type is the XBinDecoder (sub)class to decode the blocks with
+         & decoder_args are any extra arguments for it
         '''
-
-        from . import xmodel as XModel
-        from . import xanim as XAnim
-
-        class LoadState(object):
-            __slots__ = ('active_thing', 'active_tri',
-                         'active_frame', 'asset_type')
-
-            def __init__(self):
-                self.active_thing = None
-                self.active_tri = None
-                self.active_frame = None
-                self.asset_type = None
-
-        state = LoadState()
-        dummy_mesh = XModel.Mesh("$default")
-
-        cosmetic_count = 0
-
-        def InitModel(file):
-            XBlock.LoadInt16Block(file)
-            state.asset_type = 'MODEL'
-            if expected_type != state.asset_type:
-                raise TypeError("Found %s asset. Expected %s" %
-                                (state.asset_type, expected_type))
-
-        def InitAnim(file):
-            XBlock.LoadInt16Block(file)
-            state.asset_type = 'ANIM'
-            if expected_type != state.asset_type:
-                raise TypeError("Found %s asset. Expected %s" %
-                                (state.asset_type, expected_type))
-
-        def LoadVersion(file):
-            self.version = XBlock.LoadInt16Block(file)
-
-        def LoadBoneCount(file):
-            self.bones = [None] * XBlock.LoadInt16Block(file)
-
-        def LoadCosmeticCount(file):
-            cosmetic_count = XBlock.LoadInt32Block(file)
-
-        def LoadSBoneCount(file):
-            raise NotImplementedError("Siege models are not supported yet")
-
-        def LoadBoneInfo(file):
-            index, parent, name = XBlock.LoadBoneBlock(file)
-            cosmetic = (index >= (len(self.bones) - cosmetic_count))
-            self.bones[index] = XModel.Bone(name, parent, cosmetic)
-
-        def LoadBoneIndex(file):
-            index = XBlock.LoadInt16Block(file)
-            bone = self.bones[index]
-            bone.matrix = []
-            state.active_thing = bone
-
-        def LoadOffset(file):
-            data = XBlock.LoadVec3Block(file)
-            state.active_thing.offset = data
-            return data
-
-        def LoadBoneScale(file):
-            data = XBlock.LoadVec3Block(file)
-            state.active_thing.scale = data
-
-        def LoadBoneMatrix(file):
-            data = XBlock.LoadShortVec3Block(file)
-            state.active_thing.matrix.append(data)
-            return data
-
-        def LoadVertexCount(file):
-            dummy_mesh.verts = [None] * XBlock.LoadUInt16Block(file)
-
-        def LoadVertex32Count(file):
-            dummy_mesh.verts = [None] * XBlock.LoadInt32Block(file)
-
-        def LoadVertexIndex(file):
-            index = XBlock.LoadUInt16Block(file)
-            if state.active_tri is None:
-                vertex = XModel.Vertex()
-                dummy_mesh.verts[index] = vertex
-                state.active_thing = vertex
-            else:
-                face_vert = XModel.FaceVertex(index)
-                state.active_tri.indices.append(face_vert)
-                state.active_thing = face_vert
-
-        def LoadVertex32Index(file):
-            index = XBlock.LoadInt32Block(file)
-            if state.active_tri is None:
-                vertex = XModel.Vertex()
-                dummy_mesh.verts[index] = vertex
-                state.active_thing = vertex
+        if decoder_type is None:
+            decoder_type = XBinDecoder
+        decoder = decoder_type(self, expected_type, skip_sections,
+                               **decoder_args)
+        if isinstance(file, lz4.StreamReader):
+            decoder.decode_stream(file.chunks())
+        elif isinstance(file, DecompressedFile):
+            decoder.decode(file.data)
+        elif isinstance(file, BytesIO):
+            decoder.decode(file.getvalue(), file.tell())
+        else:
+            # Uncompressed files are decoded straight from a memory map
+            #  when possible
+            data = map_file(file)
+            if data is None:
+                decoder.decode(file.read())
             else:
-                face_vert = XModel.FaceVertex(index)
-                state.active_tri.indices.append(face_vert)
-                state.active_thing = face_vert
-
-        def LoadVertexWeightCount(file):
-            # state.active_thing.weights = [None] * XBlock.LoadInt16Block(file)
-            XBlock.LoadInt16Block(file)
-            state.active_thing.weights = []
-
-        def LoadVertexWeight(file):
-            state.active_thing.weights.append(
-                XBlock.LoadVertexWeightBlock(file))
+                try:
+                    decoder.decode(data, file.tell())
+                finally:
+                    data.close()
+        return decoder.result()
 
-        def LoadTriCount(file):
-            XBlock.LoadInt32Block(file)
-            dummy_mesh.faces = []
-
-        def LoadTriInfo(file):
-            object_index, material_index = XBlock.LoadTriangleBlock(file)
-            tri = XModel.Face(object_index, material_index)
-            tri.indices = []
-            dummy_mesh.faces.append(tri)
-            state.active_tri = tri
-
-        def LoadTri16Info(file):
-            object_index, material_index = XBlock.LoadTriangle16Block(file)
-            tri = XModel.Face(object_index, material_index)
-            tri.indices = []
-            dummy_mesh.faces.append(tri)
-            state.active_tri = tri
-
-        def LoadTriVertNormal(file):
-            state.active_thing.normal = XBlock.LoadShortVec3Block(file)
-
-        def LoadTriVertColor(file):
-            state.active_thing.color = XBlock.LoadColorBlock(file)
-
-        def LoadTriVertUV(file):
-            state.active_thing.uv = XBlock.LoadUVBlock(file)
-
-        def LoadObjectCount(file):
-            self.meshes = [None] * XBlock.LoadInt16Block(file)
-
-        def LoadObjectInfo(file):
-            index, name = XBlock.LoadObjectBlock(file)
-            self.meshes[index] = XModel.Mesh(name)
-
-        def LoadMaterialCount(file):
-            self.materials = [None] * XBlock.LoadInt16Block(file)
-
-        def LoadMaterialInfo(file):
-            index, name, _type, images = XBlock.LoadMaterialBlock(file)
-            material = XModel.Material(name, _type, images)
-            self.materials[index] = material
-            state.active_thing = material
-
-        def LoadMaterialTransparency(file):
-            state.active_thing.transparency = XBlock.LoadVec4Block(file)
-
-        def LoadMaterialAmbientColor(file):
-            state.active_thing.color_ambient = XBlock.LoadVec4Block(file)
-
-        def LoadMaterialIncandescence(file):
-            state.active_thing.incandescence = XBlock.LoadVec4Block(file)
-
-        def LoadMaterialCoeffs(file):
-            state.active_thing.coeffs = XBlock.LoadVec2Block(file)
-
-        def LoadMaterialGlow(file):
-            state.active_thing.glow = XBlock.LoadVec2Block(file)
-
-        def LoadMaterialRefractive(file):
-            state.active_thing.refractive = XBlock.LoadVec2Block(file)
-
-        def LoadMaterialSpecularColor(file):
-            state.active_thing.color_specular = XBlock.LoadVec4Block(file)
-
-        def LoadMaterialReflectiveColor(file):
-            state.active_thing.color_reflective = XBlock.LoadVec4Block(file)
-
-        def LoadMaterialReflective(file):
-            state.active_thing.reflective = XBlock.LoadVec2Block(file)
-
-        def LoadMaterialBlinn(file):
-            state.active_thing.blinn = XBlock.LoadVec2Block(file)
-
-        def LoadMaterialPhong(file):
-            state.active_thing.phong = XBlock.LoadFloatBlock(file)
-
-        # Animation
-        def LoadPartCount(file):
-            self.parts = [None] * XBlock.LoadInt16Block(file)
-
-        def LoadPartInfo(file):
-            index, name = XBlock.LoadObjectBlock(file)
-            self.parts[index] = XAnim.PartInfo(name)
-
-        def LoadPartIndex(file):
-            index = XBlock.LoadInt16Block(file)
-            frame_part = XAnim.FramePart(matrix=[])
-            state.active_frame.parts[index] = frame_part
-            state.active_thing = frame_part
-            return index
-
-        def LoadFramerate(file):
-            self.framerate = XBlock.LoadInt16Block(file)
-
-        def LoadFrameCount(file):
-            XBlock.LoadInt32Block(file)
-
-        def LoadFrameIndex(file):
-            frame = XAnim.Frame(XBlock.LoadInt32Block(file))
-            frame.parts = [None] * len(self.parts)
-            state.active_frame = frame
-            self.frames.append(frame)
-            return frame.frame
-
-        def LoadNotetracksBegin(file):
-            # Activate a dummy frame, as notetracks sometimes contain part
-            # indices.
-            # If the active_frame isn't reset, the bone data for
-            #  the most recently loaded frame will be corrupted
-            dummy_frame = XAnim.Frame(-1)
-            dummy_frame.parts = [None] * len(self.parts)
-            state.active_frame = dummy_frame
-            XBlock.LoadInt16Block(file)
-
-        def LoadNoteFrame(file):
-            frame, string = XBlock.LoadNoteFrameBlock(file)
-            self.notes.append(XAnim.Note(frame, string))
-
-        hashmap = {
-            0xC355: ("Comment block", XBlock.LoadCommentBlock),
-            0x46C8: ("Model identification block", InitModel),
-            0x7AAC: ("Animation block", InitAnim),
-            0x24D1: ("Version block", LoadVersion),
-
-            # Model Specific
-            0x76BA: ("Bone count block", LoadBoneCount),
-            0x7836: ("Cosmetic bone count block", LoadCosmeticCount),
-            0xF099: ("Bone block", LoadBoneInfo),  # friggin porter
-            0xDD9A: ("Bone index block", LoadBoneIndex),
-            0x9383: ("Vert / Bone offset block", LoadOffset),
-            0x1C56: ("Bone scale block", LoadBoneScale),
-            0xDCFD: ("Bone x matrix", LoadBoneMatrix),
-            0xCCDC: ("Bone y matrix", LoadBoneMatrix),
-            0xFCBF: ("Bone z matrix", LoadBoneMatrix),  # 0x95D0 - friggin porter  # nopep8
-
-            0x950D: ("Number of verts", LoadVertexCount),
-            0x2AEC: ("Number of verts32", LoadVertex32Count),
-            0x8F03: ("Vert info block marker", LoadVertexIndex),
-            0xB097: ("Vert32 info block marker", LoadVertex32Index),
-            0xEA46: ("Vert weighted bones count", LoadVertexWeightCount),
-            0xF1AB: ("Vert bone weight info", LoadVertexWeight),  # friggin porter  # nopep8
-
-            0xBE92: ("Number of faces block", LoadTriCount),
-            0x562F: ("Triangle info block", LoadTriInfo),
-            0x6711: ("Triangle info (16) block", LoadTri16Info),
-            0x89EC: ("Normal info", LoadTriVertNormal),
-            0x6DD8: ("Color info", LoadTriVertColor),
-            0x1AD4: ("UV info", LoadTriVertUV),
-
-            0x62AF: ("Number of objects block", LoadObjectCount),
-            0x87D4: ("Object info block", LoadObjectInfo),
-
-            0xA1B2: ("Number of materials", LoadMaterialCount),
-            0xA700: ("Material info block", LoadMaterialInfo),
-            0x6DAB: ("Material transparency", LoadMaterialTransparency),
-            0x37FF: ("Material ambient color", LoadMaterialAmbientColor),
-            0x4265: ("Material incandescence", LoadMaterialIncandescence),
-            0xC835: ("Material coeffs", LoadMaterialCoeffs),
-            0xFE0C: ("Material glow", LoadMaterialGlow),
-            0x7E24: ("Material refractive", LoadMaterialRefractive),
-            0x317C: ("Material specular color", LoadMaterialSpecularColor),
-            0xE593: ("Material reflective color", LoadMaterialReflectiveColor),
-            0x7D76: ("Material reflective", LoadMaterialReflective),
-            0x83C7: ("Material blinn", LoadMaterialBlinn),
-            0x5CD2: ("Material phong", LoadMaterialPhong),
-
-            # Animation Specific
-            0x9279: ("NumParts block", LoadPartCount),
-            0x360B: ("Part info block", LoadPartInfo),
-            0x745A: ("Part index block", LoadPartIndex),
-            0x92D3: ("Framerate block", LoadFramerate),
-            0xB917: ("NumFrames block", LoadFrameCount),
-            0xC723: ("Frame block", LoadFrameIndex),
-
-            0xC7F3: ("Notetrack section block", LoadNotetracksBegin),
-            0x9016: ("NumTracks block", XBlock.LoadInt16Block),
-            0x7A6C: ("NumKeys block", XBlock.LoadInt16Block),
-            0x4643: ("Notetrack block", XBlock.LoadInt16Block),
-            0x1675: ("Note frame block", LoadNoteFrame),
-
-            # Misc (Unimplemented)
-            0xBCD4: ("FIRSTFRAME", None),
-            0x1FC2: ("NUMSBONES", LoadSBoneCount),
-            0xB35E: ("NUMSWEIGHTS", None),
-            0xEF69: ("QUATERNION", None),
-            0xA65B: ("NUMIKPITCHLAYERS", None),
-            0x1D7D: ("IKPITCHLAYER", None),
-            0xA58B: ("ROTATION", None),
-            0x6EEE: ("EXTRA", XBlock.SkipExtraData)
-        }
-
-        # Read all blocks
-        data = file.read(2)
-        while data:
-            block_hash = struct.unpack('H', data)[0]
-            if block_hash in hashmap:
-                offset = file.tell()
-                data = hashmap[block_hash]
-                if data[1] is None:
-                    raise NotImplementedError(
-                        "Unimplemented Block '%s' at 0x%X" %
-                        (data[0], offset))
-                else:
-                    if LOG_BLOCKS:
-                        print("Loading Block: '%s' at 0x%X" %
-                              (data[0], offset))
-                    val = data[1](file)
-                    if LOG_BLOCKS:
-                        print("        Data: %s" % repr(val))
-
-                # Read the next block hash
-                data = file.read(2)
-            else:
-                offset = file.tell() - 2
-                raise ValueError("Unknown Block Hash 0x%X at 0x%X" %
-                                 (block_hash, offset))
+    @staticmethod
+    def ProbeFile_Bin(path, is_compressed=True, expected_type=None):
+        '''
+        Read the summary of an xmodel_bin or xanim_bin file without loading
+         the asset itself. Returns an XBinInfo
+        expected_type can be 'MODEL' or 'ANIM' to reject the other type
+        '''
+        file = open(path, "rb")
+        try:
+            if is_compressed:
+                file = XBinIO.__decompress_internal__(file, stream=False)
+            return XBinIO.__xbin_probe_internal__(file, expected_type)
+        finally:
+            file.close()
 
-        # Return the dummy mesh for splitting if we imported a model
-        if state.asset_type == 'MODEL':
-            return dummy_mesh
+    @staticmethod
+    def __xbin_probe_internal__(file, expected_type=None):
+        probe = XBinProbe(expected_type)
+        if isinstance(file, DecompressedFile):
+            return probe.probe(file.data)
+        if isinstance(file, BytesIO):
+            return probe.probe(file.getvalue(), file.tell())
+
+        data = map_file(file)
+        if data is None:
+            return probe.probe(file.read())
+        try:
+            return probe.probe(data, file.tell())
+        finally:
+            data.close()
 
     def __xbin_writefile_model_internal__(self, filepath, version=7,
                                           extended_features=True,
                                           header_message=""):
-        model = self
-
-        real_file = open(filepath, "wb")
-        file = BytesIO()
-        if header_message != '':
-            XBlock.WriteCommentBlock(file, header_message)
-        XBlock.WriteModelBlock(file)
         version = validate_version(self, version)
-        XBlock.WriteVersionBlock(file, version)
-
-        cosmetic_count = 0
-        for bone in model.bones:
-            if bone.cosmetic:
-                cosmetic_count = cosmetic_count + 1
-
-        XBlock.WriteBoneCountBlock(file, len(model.bones))
-        if cosmetic_count > 0:
-            XBlock.WriteCosmeticInfoBlock(file, cosmetic_count)
+        data = __encode_model__(self, version, extended_features,
+                                header_message)
+        with open(filepath, "wb") as real_file:
+            XBinIO.__compress_buffer_internal__(data, real_file,
+                                                close_files=False)
 
-        for bone_index, bone in enumerate(model.bones):
-            XBlock.WriteBoneInfoBlock(file, bone_index, bone)
-
-        for bone_index, bone in enumerate(model.bones):
-            XBlock.WriteBoneIndexBlock(file, bone_index)
-            XBlock.WriteOffsetBlock(file, bone.offset)
-            XBlock.WriteMetaVec3Block(file, 0x1C56, bone.scale)  # needed?
-            XBlock.WriteMatrixBlock(file, bone.matrix)
+    def __xbin_writefile_anim_internal__(self, filepath, version=3,
+                                         header_message=""):
+        version = validate_version(self, version)
+        data = __encode_anim__(self, version, header_message)
+        with open(filepath, "wb") as real_file:
+            XBinIO.__compress_buffer_internal__(data, real_file,
+                                                close_files=False)
 
-        # Used to offset the vertex indices for each mesh
-        vert_offsets = [0]
-        for mesh in model.meshes:
-            prev_index = len(vert_offsets) - 1
-            vert_offsets.append(vert_offsets[prev_index] + len(mesh.verts))
 
-        vert_count = vert_offsets[len(vert_offsets) - 1]
+def __load_note_reference__(file):
+    '''
+    XBlock.LoadNoteFrameBlock using the reference string reader
+    '''
+    start = file.tell() - 2
+    file.seek(start + 4)
+    data = file.read(4)
+    result = struct.unpack('i', data) + (__load_string_reference__(file),)
+    file.seek(start + padded(file.tell() - start))
+    return result
 
-        if version == 7 and vert_count > 0xFFFF:
-            WriteVertexCountBlock = XBlock.WriteVertex32Count
-            WriteVertexIndexBlock = XBlock.WriteVertex32Index
-        else:
-            WriteVertexCountBlock = XBlock.WriteVertex16Count
-            WriteVertexIndexBlock = XBlock.WriteVertex16Index
-
-        WriteVertexCountBlock(file, vert_count)
-        for mesh_index, mesh in enumerate(model.meshes):
-            vert_offset = vert_offsets[mesh_index]
-            for vert_index, vert in enumerate(mesh.verts):
-                WriteVertexIndexBlock(file, vert_index + vert_offset)
-                XBlock.WriteOffsetBlock(file, vert.offset)
-                XBlock.WriteMetaInt16Block(file, 0xEA46, len(vert.weights))
-                for weight in vert.weights:
-                    XBlock.WriteVertexWeightBlock(file, weight)
-
-        # Faces
-        face_count = sum([len(mesh.faces) for mesh in model.meshes])
-        XBlock.WriteMetaInt32Block(file, 0xBE92, face_count)
-        for mesh_index, mesh in enumerate(model.meshes):
-            vert_offset = vert_offsets[mesh_index]
-            for face in mesh.faces:
-                XBlock.WriteFaceInfoBlock(file, face)
-                for i in range(3):
-                    ind = face.indices[i]
-                    WriteVertexIndexBlock(file, ind.vertex + vert_offset)
-                    XBlock.WriteFaceVertexNormalBlock(file, ind.normal)
-                    XBlock.WriteColorBlock(file, ind.color)
-                    XBlock.WriteFaceVertexUVBlock(file, 1, ind.uv)
-
-        # Objects
-        XBlock.WriteMetaInt16Block(file, 0x62AF, len(model.meshes))
-        for mesh_index, mesh in enumerate(model.meshes):
-            XBlock.WriteMetaObjectInfo(file, 0x87D4, mesh_index, mesh.name)
-
-        # Materials
-        XBlock.WriteMetaInt16Block(file, 0xA1B2, len(model.materials))
-        for material_index, material in enumerate(model.materials):
-            XBlock.WriteMaterialInfoBlock(file, material_index,
-                                          material, extended_features)
-
-            XBlock.WriteColorBlock(file, material.color)
-            XBlock.WriteMetaVec4Block(file, 0x6DAB, material.transparency)
-            XBlock.WriteMetaVec4Block(file, 0x37FF, material.color_ambient)
-            XBlock.WriteMetaVec4Block(file, 0x4265, material.incandescence)
-            XBlock.WriteMetaVec2Block(file, 0xC835, material.coeffs)
-            XBlock.WriteMetaVec2Block(file, 0xFE0C, material.glow)
-            XBlock.WriteMetaVec2Block(file, 0x7E24, material.refractive)
-            XBlock.WriteMetaVec4Block(file, 0x317C, material.color_specular)
-            XBlock.WriteMetaVec4Block(file, 0xE593, material.color_reflective)
-            XBlock.WriteMetaVec2Block(file, 0x7D76, material.reflective)
-            XBlock.WriteMetaVec2Block(file, 0x83C7, material.blinn)
-            XBlock.WriteMetaFloatBlock(file, 0x5CD2, material.phong)
-
-        XBinIO.__compress_internal__(file, real_file, close_files=True)
 
-    def __xbin_writefile_anim_internal__(self, filepath, version=3,
-                                         header_message=""):
-        anim = self
-        real_file = open(filepath, "wb")
-        file = BytesIO()
-        if header_message != '':
-            XBlock.WriteCommentBlock(file, header_message)
-        XBlock.WriteAnimBlock(file)
-        version = validate_version(self, version)
-        XBlock.WriteVersionBlock(file, version)
-        XBlock.WritePartCount(file, len(anim.parts))
-
-        for part_index, part in enumerate(anim.parts):
-            XBlock.WritePartInfo(file, part_index, part.name)
-
-        XBlock.WriteFramerate(file, anim.framerate)
-        XBlock.WriteFrameCount(file, len(anim.frames))
-
-        for frame in anim.frames:
-            XBlock.WriteFrameIndex(file, frame.frame)
-            for part_index, part in enumerate(frame.parts):
-                XBlock.WritePartIndex(file, part_index)
-                XBlock.WriteOffsetBlock(file, part.offset)
-                XBlock.WriteMatrixBlock(file, part.matrix)
-
-        XBlock.WriteMetaInt16Block(file, 0x7A6C, len(anim.notes))
-        if anim.notes:
-            for note in anim.notes:
-                XBlock.WriteNoteFrame(file, note)
-
-            # Deprecated
-            # for part_index, part in enumerate(anim.parts):
-            #     XBlock.WriteMetaInt16Block(file, 0xC7F3, part_index)
-            #     track_count = 0
-            #     track_count = 0 if part_index != 0 else (
-            #         1 if len(anim.notes) != 0 else 0)
-            #     XBlock.WriteMetaInt16Block(file, 0x9016, track_count)
-            #     if track_count != 0:
-            #         XBlock.WriteMetaInt16Block(file, 0x4643, 0)
-            #         XBlock.WriteMetaInt16Block(file, 0x7A6C, len(anim.notes))
-            #         for note in anim.notes:
-            #             XBlock.WriteNoteFrame(file, note)
-
-        XBinIO.__compress_internal__(file, real_file, close_files=True)
+def string_benchmark(note_count=5000, string_lengths=(200, 500), repeat=3):
+    '''
+    Measure how long the strings of an xanim_bin with note_count notetrack
+     notes (each string_lengths[0] to string_lengths[1] characters long)
+     take to read on this machine
+    Returns a dict of reader name -> seconds, using the best of repeat runs:
+        'reference' - the note blocks read with the byte at a time string
+         reader that __read_string__ replaced
+        'LoadNoteFrameBlock' - the note blocks read with XBlock
+        'LoadFile_Bin' - the whole file loaded by an Anim
+    '''
+    import random
+    import shutil
+    import tempfile
+    from timeit import default_timer
+    from .xanim import Anim, Note
+    from ._writer import __benchmark_anim__
+
+    rand = random.Random(0)
+    letters = 'abcdefghijklmnopqrstuvwxyz_'
+    anim = __benchmark_anim__(10, 4)
+    anim.notes = [Note(index % 10,
+                       ''.join([rand.choice(letters) for _ in
+                                range(rand.randint(*string_lengths))]))
+                  for index in range(note_count)]
+
+    blocks = BytesIO()
+    for note in anim.notes:
+        XBlock.WriteNoteFrame(blocks, note)
+    blocks = blocks.getvalue()
+
+    def read_notes(load_note):
+        file = BytesIO(blocks)
+        notes = []
+        for _ in range(note_count):
+            file.read(2)
+            notes.append(load_note(file))
+        return notes
+
+    expected = [(note.frame, note.string) for note in anim.notes]
+
+    results = {}
+    for name, load_note in (('reference', __load_note_reference__),
+                            ('LoadNoteFrameBlock', XBlock.LoadNoteFrameBlock)):
+        best = float('inf')
+        for _ in range(repeat):
+            start = default_timer()
+            notes = read_notes(load_note)
+            best = min(best, default_timer() - start)
+            if notes != expected:
+                raise ValueError("%s failed to read the benchmark notes" %
+                                 name)
+        results[name] = best
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, 'benchmark.xanim_bin')
+        anim.WriteFile_Bin(path)
+        best = float('inf')
+        for _ in range(repeat):
+            start = default_timer()
+            Anim().LoadFile_Bin(path)
+            best = min(best, default_timer() - start)
+        results['LoadFile_Bin'] = best
+    finally:
+        shutil.rmtree(temp_dir)
+    return results
@@ -1,870 +1,1981 @@
-# <pep8 compliant>
-
-from itertools import repeat
-from time import strftime
-from math import sqrt
-
-import re
-
-from .xbin import XBinIO, validate_version
-
-
-def __clamp_float__(value, clamp_range=(-1.0, 1.0)):
-    return max(min(value, clamp_range[1]), clamp_range[0])
-
-
-def __clamp_multi__(value, clamp_range=(-1.0, 1.0)):
-    return tuple([max(min(v, clamp_range[1]), clamp_range[0]) for v in value])
-
-# Black Ops Note
-#  NORMAL 0.0 0.0 0.000000000000000000001 <works fine>
-#  NORMAL 0.0 0.0 0.0000000000000000000001 <assert>
-#  NORMAL 0.0 0.0 0.00000000000000000000001 <Vertex normal = 0 error>
-
-
-def __clamp_normal__(value):
-    value = __clamp_multi__(value)
-    if sum([abs(v) for v in value]) == 0:
-        return (0.0, 0.0, 1.0)
-    return value
-
-
-def __normalized__(iterable):
-    d = 1.0 / sqrt(sum([v * v for v in iterable]))
-    return [v * d for v in iterable]
-
-
-def deserialize_image_string(ref_string):
-    if not ref_string:
-        return {"color": "$none.tga"}
-
-    out = {}
-    for key, value in re.findall(r'\s*(\S+?)\s*:\s*(\S+)\s*', ref_string):
-        out[key.lower()] = value.lstrip()
-
-    if not out:
-        out = {"color": ref_string}
-    return out
-
-
-def serialize_image_string(image_dict, extended_features=True):
-    if extended_features is True:
-        out = ""
-        prefix = ''
-        for key, value in image_dict.items():
-            out += "%s%s:%s" % (prefix, key, value)
-            prefix = ' '
-        return out
-    else:
-        # For xmodel_export version 5, the material name and image ref
-        #  may be the same -
-        # in which case - the image dict extension shouldn't be used
-        if 'color' in image_dict:  # use the color map
-            return image_dict['color']
-        elif image_dict != 0:  # if it cant be found, grab the first image
-            key, value = image_dict.items()[0]
-            return value
-        return ""
-
-
-class Bone(object):
-    __slots__ = ('name', 'parent', 'offset', 'matrix', 'scale', 'cosmetic')
-
-    def __init__(self, name, parent=-1, cosmetic=False):
-        self.name = name
-        self.parent = parent
-        self.offset = None
-        self.matrix = [None] * 3
-        self.scale = (1.0, 1.0, 1.0)
-        self.cosmetic = cosmetic
-
-
-class Vertex(object):
-    __slots__ = ("offset", "weights")
-
-    def __init__(self, offset=None, weights=None):
-        self.offset = offset
-        if weights is None:
-            # An array of tuples in the format (bone index, influence)
-            self.weights = []
-        else:
-            self.weights = weights
-
-    def __load_vert__(self, file, vert_count, mesh, vert_tok='VERT'):
-        lines_read = 0
-        state = 0
-
-        vert_index = -1
-
-        bone_count = 0  # The number of bones influencing this vertex
-        bones_read = 0  # The number of bone weights we've read for this vert
-
-        for line in file:
-            lines_read += 1
-
-            line_split = line.split()
-            if not line_split:
-                continue
-
-            for i, split in enumerate(line_split):
-                if split[-1:] == ',':
-                    line_split[i] = split.rstrip(",")
-
-            if state == 0 and line_split[0] == vert_tok:
-                vert_index = int(line_split[1])
-                if vert_index >= vert_count:
-                    fmt = ("vert_count does not index vert_index -- "
-                           "%d not in [0, %d)")
-                    raise ValueError(fmt % (vert_index, vert_count))
-                state = 1
-            elif state == 1 and line_split[0] == "OFFSET":
-                self.offset = tuple([float(v)
-                                     for v in line_split[1:4]])  # TODO
-                state = 2
-            elif state == 2 and line_split[0] == "BONES":
-                bone_count = int(line_split[1])
-                self.weights = [None] * bone_count
-                state = 3
-            elif state == 3 and line_split[0] == "BONE":
-                bone = int(line_split[1])
-                influence = float(line_split[2])
-                self.weights[bones_read] = ((bone, influence))
-                bones_read += 1
-                if bones_read == bone_count:
-                    state = -1
-                    return lines_read
-
-        return lines_read
-
-    def save(self, file, index, vert_tok_suffix=""):
-        file.write("VERT%s %d\n" % (vert_tok_suffix, index))
-        file.write("OFFSET %f %f %f\n" % self.offset)
-        file.write("BONES %d\n" % len(self.weights))
-        for weight in self.weights:
-            file.write("BONE %d %f\n" % weight)
-        file.write("\n")
-
-
-class FaceVertex(object):
-    __slots__ = ("vertex", "normal", "color", "uv")
-
-    def __init__(self, vertex=None, normal=None, color=None, uv=None):
-        self.vertex = vertex
-        self.normal = normal
-        self.color = color
-        self.uv = uv
-
-    def save(self, file, version, index_offset, vert_tok_suffix=""):
-        vert_id = self.vertex + index_offset
-        normal = __clamp_normal__(self.normal)
-        if version == 5:
-            file.write("VERT %d %f %f %f %f %f\n" %
-                       ((vert_id,) + normal + self.uv))
-        else:
-            file.write("VERT%s %d\n" % (vert_tok_suffix, vert_id))
-            file.write("NORMAL %f %f %f\n" % normal)
-            file.write("COLOR %f %f %f %f\n" % self.color)
-            file.write("UV 1 %f %f\n\n" % self.uv)
-
-
-class Face(object):
-    __slots__ = ('mesh_id', 'material_id', 'indices')
-
-    def __init__(self, mesh_id, material_id):
-        self.mesh_id = mesh_id
-        self.material_id = material_id
-        self.indices = [None] * 3
-
-    def __load_face__(self, file, version, face_count, vert_tok='VERT'):
-        lines_read = 0
-        state = 0
-
-        tri_number = -1
-        vert_number = -1
-
-        for line in file:
-            lines_read += 1
-
-            line_split = line.split()
-            if not line_split:
-                continue
-
-            for i, split in enumerate(line_split):
-                if split[-1:] == ',':
-                    line_split[i] = split.rstrip(",")
-
-            # Support both TRI & TRI16
-            if state == 0 and line_split[0].startswith("TRI"):
-                tri_number += 1
-                self.mesh_id = int(line_split[1])
-                self.material_id = int(line_split[2])
-                state = 1
-            elif state == 1 and line_split[0] == vert_tok:
-                vert = FaceVertex()
-                vert.vertex = int(line_split[1])
-                vert_number += 1
-
-                if version == 5:
-                    vert.normal = tuple([float(v)
-                                         for v in line_split[2:5]])  # TODO
-                    vert.uv = (float(line_split[5]), float(line_split[6]))
-                    self.indices[vert_number] = vert
-                    if vert_number == 2:
-                        return lines_read
-                    else:
-                        continue
-
-                # for Version 6, continue loading the vertex properties for the
-                # last vertex
-                else:
-                    state = 2
-
-            elif state == 2 and line_split[0] == "NORMAL":
-                vert.normal = (float(line_split[1]),
-                               float(line_split[2]),
-                               float(line_split[3]))
-                state = 3
-            elif state == 3 and line_split[0] == "COLOR":
-                vert.color = (float(line_split[1]),
-                              float(line_split[2]),
-                              float(line_split[3]),
-                              float(line_split[4]))
-                state = 4
-            elif state == 4 and line_split[0] == "UV":
-                vert.uv = (float(line_split[2]), float(line_split[3]))
-                self.indices[vert_number] = vert
-                if vert_number == 2:
-                    return lines_read
-                else:
-                    state = 1
-
-        return lines_read
-
-    def save(self, file, version, index_offset, vert_tok_suffix=""):
-        # Only use TRI16 if we're using version 7 or newer, etc.
-        if version >= 7 and (self.mesh_id > 255 or self.material_id > 255):
-            token = "TRI16"
-        else:
-            token = "TRI"
-        file.write("%s %d %d %d %d\n" %
-                   (token, self.mesh_id, self.material_id, 0, 0))
-        for i in range(3):
-            self.indices[i].save(file, version, index_offset,
-                                 vert_tok_suffix=vert_tok_suffix)
-        file.write("\n")
-
-    def isValid(self):
-        '''
-        Checks to make sure that the face consists of 3 vertices,
-        all of which refer to different vertex indices
-        '''
-        if(len(self.indices) != 3):
-            return False
-
-        indices = [index.vertex for index in self.indices]
-
-        if indices[0] == indices[1]:
-            return False
-
-        if indices[0] == indices[2]:
-            return False
-
-        if indices[1] == indices[2]:
-            return False
-
-        return True
-
-
-class Material(object):
-    __slots__ = (
-        'name', 'type', 'images', 'color',
-        'color_ambient', 'color_specular', 'color_reflective',
-        'transparency', 'incandescence',
-        'coeffs', 'glow',
-        'refractive', 'reflective',
-        'blinn', 'phong'
-    )
-
-    def __init__(self, name, material_type, images):
-        self.name = name
-        self.type = material_type
-        self.images = images
-        self.color = (0.0, 0.0, 0.0, 1.0)
-        self.color_ambient = (0.0, 0.0, 0.0, 1.0)
-        self.color_specular = (-1.0, -1.0, -1.0, 1.0)
-        self.color_reflective = (-1.0, -1.0, -1.0, 1.0)
-        self.transparency = (0.0, 0.0, 0.0, 1.0)
-        self.incandescence = (0.0, 0.0, 0.0, 1.0)
-        self.coeffs = (0.8, 0.0)
-        self.glow = (0.0, 0)
-        self.refractive = (6, 1.0)
-        self.reflective = (-1, 1.0)
-        self.blinn = (-1.0, -1.0)
-        self.phong = -1.0
-
-    def save(self, file, version, material_index, extended_features=True):
-        imgs = serialize_image_string(
-            self.images, extended_features=extended_features)
-        if version == 5:
-            file.write('MATERIAL %d "%s"\n' % (material_index, imgs))
-        else:
-            file.write('MATERIAL %d "%s" "%s" "%s"\n' %
-                       (material_index, self.name, self.type, imgs))
-            file.write("COLOR %f %f %f %f\n" % self.color)
-            file.write("TRANSPARENCY %f %f %f %f\n" % self.transparency)
-            file.write("AMBIENTCOLOR %f %f %f %f\n" % self.color_ambient)
-            file.write("INCANDESCENCE %f %f %f %f\n" % self.incandescence)
-            file.write("COEFFS %f %f\n" % self.coeffs)
-            file.write("GLOW %f %d\n" % self.glow)
-            file.write("REFRACTIVE %d %f\n" % self.refractive)
-            file.write("SPECULARCOLOR %f %f %f %f\n" % self.color_specular)
-            file.write("REFLECTIVECOLOR %f %f %f %f\n" % self.color_reflective)
-            file.write("REFLECTIVE %d %f\n" % self.reflective)
-            file.write("BLINN %f %f\n" % self.blinn)
-            file.write("PHONG %f\n\n" % self.phong)
-
-
-class Mesh(object):
-    __slots__ = ('name', 'verts', 'faces', 'bone_groups',
-                 'material_groups', '__vert_tok')
-
-    def __init__(self, name):
-        self.name = name
-
-        self.verts = []
-        self.faces = []
-
-        self.bone_groups = []
-        self.material_groups = []
-
-        # Used for handling VERT vs VERT32 without using a ton of if statements
-        self.__vert_tok = 'VERT'
-
-    def __load_verts__(self, file, model):
-        lines_read = 0
-        vert_count = 0
-
-        bones = model.bones
-        # version = model.version
-        self.bone_groups = [[] for i in repeat(None, len(bones))]
-
-        for line in file:
-            lines_read += 1
-
-            line_split = line.split()
-            if not line_split:
-                continue
-
-            if line_split[0] == 'NUMVERTS':
-                self.__vert_tok = 'VERT'
-            elif line_split[0] == 'NUMVERTS32':
-                self.__vert_tok = 'VERT32'
-            else:
-                continue
-
-            vert_count = int(line_split[1])
-            self.verts = [Vertex() for i in range(vert_count)]
-            break
-
-        vert_tok = self.__vert_tok
-        for vertex in self.verts:
-            lines_read += vertex.__load_vert__(file,
-                                               vert_count, self, vert_tok)
-
-        return lines_read
-
-    def __load_faces__(self, file, version):
-        lines_read = 0
-        face_count = 0
-
-        self.material_groups = []
-
-        for line in file:
-            lines_read += 1
-
-            line_split = line.split()
-            if not line_split:
-                continue
-
-            for i, split in enumerate(line_split):
-                if split[-1:] == ',':
-                    line_split[i] = split.rstrip(",")
-
-            if line_split[0] == "NUMFACES":
-                face_count = int(line_split[1])
-                self.faces = [Face(None, None) for i in range(face_count)]
-                break
-
-        vert_tok = self.__vert_tok
-        for face in self.faces:
-            lines_read += face.__load_face__(file, version,
-                                             face_count, vert_tok=vert_tok)
-
-        return lines_read
-
-
-class Model(XBinIO, object):
-    __slots__ = ('name', 'bones', 'meshes', 'materials')
-    supported_versions = [5, 6, 7]
-
-    def __init__(self, name='$model'):
-        super(XBinIO, self).__init__()
-        self.name = name
-
-        self.bones = []
-        self.meshes = []
-        self.materials = []
-
-    def __load_header__(self, file):
-        lines_read = 0
-        state = 0
-        for line in file:
-            lines_read += 1
-
-            line_split = line.split()
-            if not line_split:
-                continue
-
-            if state == 0 and line_split[0] == "MODEL":
-                state = 1
-            elif state == 1 and line_split[0] == "VERSION":
-                self.version = int(line_split[1])
-                if self.version not in Model.supported_versions:
-                    fmt = "Invalid model version: %d - must be one of %s"
-                    vargs = (self.version, repr(Model.supported_versions))
-                    raise ValueError(fmt % vargs)
-                return lines_read
-
-        return lines_read
-
-    def __load_bone__(self, file, bone_count):
-        lines_read = 0
-
-        # keeps track of the importer state for a given bone
-        state = 0
-
-        bone_index = -1
-        bone = None
-
-        for line in file:
-            lines_read += 1
-
-            line_split = line.split()
-            if not line_split:
-                continue
-
-            for i, split in enumerate(line_split):
-                if split[-1:] == ',':
-                    line_split[i] = split.rstrip(",")
-
-            if state == 0 and line_split[0] == "BONE":
-                bone_index = int(line_split[1])
-                if bone_index >= bone_count:
-                    fmt = ("bone_count does not index bone_index -- "
-                           "%d not in [0, %d)")
-                    raise ValueError(fmt % (bone_index, bone_count))
-                state = 1
-            elif state == 1 and line_split[0] == "OFFSET":
-                bone = self.bones[bone_index]
-                bone.offset = (float(line_split[1]),
-                               float(line_split[2]),
-                               float(line_split[3]))
-                state = 2
-            # SCALE ... is ignored as its always 1
-            elif state == 2 and line_split[0] == "X":
-                x = (float(line_split[1]),
-                     float(line_split[2]),
-                     float(line_split[3]))
-                bone.matrix[0] = x
-                state = 3
-            elif state == 3 and line_split[0] == "Y":
-                y = (float(line_split[1]),
-                     float(line_split[2]),
-                     float(line_split[3]))
-                bone.matrix[1] = y
-                state = 4
-            elif state == 4 and line_split[0] == "Z":
-                z = (float(line_split[1]),
-                     float(line_split[2]),
-                     float(line_split[3]))
-                bone.matrix[2] = z
-                state = -1
-                return lines_read
-
-        return lines_read
-
-    def __load_bones__(self, file):
-        lines_read = 0
-        bone_count = 0
-        bones_read = 0
-        cosmetic_count = 0
-        for line in file:
-            lines_read += 1
-
-            line_split = line.split()
-            if not line_split:
-                continue
-
-            # TODO: Reordering these token checks may improve performance
-            if line_split[0] == "NUMCOSMETICS":
-                cosmetic_count = int(line_split[1])
-            elif line_split[0] == "NUMBONES":
-                bone_count = int(line_split[1])
-                self.bones = [Bone(None)] * bone_count
-            elif line_split[0] == "BONE":
-                index = int(line_split[1])
-                parent = int(line_split[2])
-                cosmetic = (index >= (bone_count - cosmetic_count))
-                self.bones[index] = Bone(line_split[3].strip('"'),
-                                         parent, cosmetic)
-                bones_read += 1
-                if bones_read == bone_count:
-                    break
-
-        for _ in range(bone_count):
-            lines_read += self.__load_bone__(file, bone_count)
-
-        return lines_read
-
-    def __load_meshes__(self, file):
-        lines_read = 0
-        mesh_count = 0
-        meshes_read = 0
-        for line in file:
-            lines_read += 1
-
-            line_split = line.split()
-            if not line_split:
-                continue
-
-            if line_split[0] == "NUMOBJECTS":
-                mesh_count = int(line_split[1])
-                self.meshes = [None] * mesh_count
-            elif line_split[0] == "OBJECT":
-                index = int(line_split[1])
-                self.meshes[index] = Mesh(line_split[2].strip('"'))
-                meshes_read += 1
-                if meshes_read == mesh_count:
-                    return lines_read
-
-        return lines_read
-
-    # Generate actual submesh data from the default mesh
-    def __generate_meshes__(self, default_mesh):
-        bone_count = len(self.bones)
-        mtl_count = len(self.materials)
-        for mesh in self.meshes:
-            mesh.bone_groups = [[] for i in range(bone_count)]
-            mesh.material_groups = [[] for i in range(mtl_count)]
-
-        # An array of vertex mappings for each mesh
-        # used in the format vertex_map[mesh][original_vertex]
-        # yields either None (unset) or the new vertex id
-        vertex_map = [[None] * len(default_mesh.verts)
-                      for i in range(len(self.meshes))]
-
-        for face in default_mesh.faces:
-            mesh_id = face.mesh_id
-            mtl_id = face.material_id
-            mesh = self.meshes[mesh_id]
-            for ind in face.indices:
-                vert_id = vertex_map[mesh_id][ind.vertex]
-                if vert_id is None:
-                    vert_id = len(mesh.verts)
-                    vertex_map[mesh_id][ind.vertex] = vert_id
-                    vert = default_mesh.verts[ind.vertex]
-                    mesh.verts.append(vert)
-                    for bone_id, weight in vert.weights:
-                        mesh.bone_groups[bone_id].append((vert_id, weight))
-                ind.vertex = vert_id
-                mesh.material_groups[mtl_id].append(vert_id)
-            mesh.faces.append(face)
-
-        # Remove duplicates
-        for mesh in self.meshes:
-            for group_index, group in enumerate(mesh.bone_groups):
-                mesh.bone_groups[group_index] = list(set(group))
-            for group_index, group in enumerate(mesh.material_groups):
-                mesh.material_groups[group_index] = list(set(group))
-
-    def __load_materials__(self, file, version):
-        lines_read = 0
-
-        material_count = None
-        material = None
-
-        for line in file:
-            lines_read += 1
-
-            line_split = line.split()
-            if not line_split:
-                continue
-
-            for i, split in enumerate(line_split):
-                if split[-1:] == ',':
-                    line_split[i] = split.rstrip(",")
-
-            if material_count is None and line_split[0] == "NUMMATERIALS":
-                material_count = int(line_split[1])
-                self.materials = [None] * material_count
-            elif line_split[0] == "MATERIAL":
-                index = int(line_split[1])
-                if version == 5:
-                    # Legacy XModel materials don't explicitly have a name
-                    #  field, so we simply auto-generate a name
-                    name = "Material_%d" % index
-                    material_type = "Lambert"
-                    images = deserialize_image_string(line_split[2].strip('"'))
-                else:
-                    name = line_split[2].strip('"')
-                    material_type = line_split[3].strip('"')
-                    images = deserialize_image_string(line_split[4].strip('"'))
-                material = Material(name, material_type, images)
-                self.materials[index] = Material(name, material_type, images)
-                material = self.materials[index]
-
-                if version == 5:
-                    continue
-
-            # All of the properties below are only present in version 6
-            elif line_split[0] == "COLOR":
-                material.color = (float(line_split[1]),
-                                  float(line_split[2]),
-                                  float(line_split[3]),
-                                  float(line_split[4]))
-            elif line_split[0] == "TRANSPARENCY":
-                material.transparency = (float(line_split[1]),
-                                         float(line_split[2]),
-                                         float(line_split[3]),
-                                         float(line_split[4]))
-            elif line_split[0] == "AMBIENTCOLOR":
-                material.color_ambient = (float(line_split[1]),
-                                          float(line_split[2]),
-                                          float(line_split[3]),
-                                          float(line_split[4]))
-            elif line_split[0] == "INCANDESCENCE":
-                material.incandescence = (float(line_split[1]),
-                                          float(line_split[2]),
-                                          float(line_split[3]),
-                                          float(line_split[4]))
-            elif line_split[0] == "COEFFS":
-                material.coeffs = (float(line_split[1]), float(line_split[2]))
-            elif line_split[0] == "GLOW":
-                material.glow = (float(line_split[1]), int(line_split[2]))
-            elif line_split[0] == "REFRACTIVE":
-                material.refractive = (int(line_split[1]),
-                                       float(line_split[2]))
-            elif line_split[0] == "SPECULARCOLOR":
-                material.color_specular = (float(line_split[1]),
-                                           float(line_split[2]),
-                                           float(line_split[3]),
-                                           float(line_split[4]))
-            elif line_split[0] == "REFLECTIVECOLOR":
-                material.color_reflective = (float(line_split[1]),
-                                             float(line_split[2]),
-                                             float(line_split[3]),
-                                             float(line_split[4]))
-            elif line_split[0] == "REFLECTIVE":
-                material.reflective = (
-                    int(line_split[1]), float(line_split[2]))
-            elif line_split[0] == "BLINN":
-                material.blinn = (float(line_split[1]), float(line_split[2]))
-            elif line_split[0] == "PHONG":
-                material.phong = float(line_split[1])
-
-        return lines_read
-
-    def normalize_weights(self):
-        """
-        Normalize the bone weights for all verts (in all meshes)
-        """
-        for mesh in self.meshes:
-            for vert in mesh.verts:
-                vert.weights = __normalized__(vert.weights)
-
-    def LoadFile_Raw(self, path, split_meshes=True):
-        file = open(path, "r")
-        # file automatically keeps track of what line its on across calls
-        self.__load_header__(file)
-        self.__load_bones__(file)
-
-        # A global mesh containing all of the vertex and face data for the
-        # entire model
-        default_mesh = Mesh("$default")
-
-        default_mesh.__load_verts__(file, self)
-        default_mesh.__load_faces__(file, self.version)
-
-        if split_meshes:
-            self.__load_meshes__(file)
-        self.__load_materials__(file, self.version)
-
-        if split_meshes:
-            self.__generate_meshes__(default_mesh)
-        else:
-            self.meshes = [default_mesh]
-        file.close()
-
-    # Write an xmodel_export file, by default it uses the objects self.version
-    def WriteFile_Raw(self, path, version=None,
-                      header_message="",
-                      extended_features=True,
-                      strict=False):
-        # If there is no current version, fallback to the argument
-        version = validate_version(self, version)
-
-        if version not in Model.supported_versions:
-            self.version = None
-            vargs = (version, repr(Model.supported_versions))
-            raise ValueError(
-                "Invalid model version: %d - must be one of %s" % vargs)
-
-        # Used to offset the vertex indices for each mesh
-        vert_offsets = [0]
-        for mesh in self.meshes:
-            prev_index = len(vert_offsets) - 1
-            vert_offsets.append(vert_offsets[prev_index] + len(mesh.verts))
-
-        vert_count = vert_offsets[len(vert_offsets) - 1]
-
-        if strict:
-            # TODO: Add cosmetic hierarchy validation
-            assert len(self.materials) < 256
-            assert len(self.meshes) < 256
-            if version < 7:
-                assert vert_count <= 0xFFFF
-
-        file = open(path, "w")
-        file.write("// Export time: %s\n\n" % strftime("%a %b %d %H:%M:%S %Y"))
-
-        if header_message != '':
-            file.write(header_message)
-
-        file.write("MODEL\n")
-        file.write("VERSION %d\n\n" % version)
-
-        # Bone Hierarchy
-        file.write("NUMBONES %d\n" % len(self.bones))
-
-        # NOTE: Cosmetic bones are only used by version 7 and later
-        if version == 7:
-            cosmetics = len([bone for bone in self.bones if bone.cosmetic])
-            if cosmetics > 0:
-                file.write("NUMCOSMETICS %d\n" % cosmetics)
-
-                # Cosmetic bones MUST be written AFTER the standard bones in
-                #  the bone info list, so we need to generate a sorted list
-                #  of index/bone pairs
-                bone_enum = sorted(enumerate(self.bones),
-                                   key=lambda kvp: kvp[1].cosmetic)
-
-                # Allocate space for the bone map before any
-                #  modifications to self.bones
-                bone_map = [None] * len(self.bones)
-
-                # Update the bone list & build old->new index map
-                index_map, self.bones = zip(*bone_enum)
-                for new, old in enumerate(index_map):
-                    bone_map[old] = new
-
-                # Rebuild the parent indices for all non-root bones
-                for bone in self.bones:
-                    if bone.parent != -1:
-                        bone.parent = bone_map[bone.parent]
-
-                # Rebuild the weight tables for all vertices
-                for mesh in self.meshes:
-                    for vert in mesh.verts:
-                        vert.weights = [(bone_map[old_index], weight)
-                                        for old_index, weight in vert.weights]
-
-        # Write the actual bone info
-        for bone_index, bone in enumerate(self.bones):
-            file.write("BONE %d %d \"%s\"\n" %
-                       (bone_index, bone.parent, bone.name))
-
-        file.write("\n")
-
-        # Bone Transform Data
-        for bone_index, bone in enumerate(self.bones):
-            file.write("BONE %d\n" % bone_index)
-            file.write("OFFSET %f %f %f\n" %
-                       (bone.offset[0], bone.offset[1], bone.offset[2]))
-            file.write("SCALE %f %f %f\n" % (1.0, 1.0, 1.0))
-            file.write("X %f %f %f\n" % __clamp_multi__(bone.matrix[0]))
-            file.write("Y %f %f %f\n" % __clamp_multi__(bone.matrix[1]))
-            file.write("Z %f %f %f\n\n" % __clamp_multi__(bone.matrix[2]))
-        file.write("\n")
-
-        # Vertices
-        vert_tok_suffix = "32" if version == 7 and vert_count > 0xFFFF else ""
-        file.write("NUMVERTS%s %d\n" % (vert_tok_suffix, vert_count))
-        for mesh_index, mesh in enumerate(self.meshes):
-            vert_offset = vert_offsets[mesh_index]
-            for vert_index, vert in enumerate(mesh.verts):
-                vert.save(file, vert_index + vert_offset, vert_tok_suffix)
-
-        # Faces
-        face_count = sum([len(mesh.faces) for mesh in self.meshes])
-        file.write("NUMFACES %d\n" % face_count)
-        for mesh_index, mesh in enumerate(self.meshes):
-            vert_offset = vert_offsets[mesh_index]
-            for face in mesh.faces:
-                face.save(file, version, vert_offset, vert_tok_suffix)
-
-        # Meshes
-        file.write("NUMOBJECTS %d\n" % len(self.meshes))
-        for mesh_index, mesh in enumerate(self.meshes):
-            file.write("OBJECT %d \"%s\"\n" % (mesh_index, mesh.name))
-        file.write("\n")
-
-        # Materials
-        file.write("NUMMATERIALS %d\n" % len(self.materials))
-        for material_index, material in enumerate(self.materials):
-            material.save(file, version, material_index,
-                          extended_features=extended_features)
-
-        file.close()
-
-    @staticmethod
-    def FromFile_Raw(filepath, split_meshes=True):
-        '''
-        Load from an XMODEL_EXPORT file and return the resulting Model()
-        '''
-        model = Model()
-        model.LoadFile_Raw(filepath, split_meshes)
-        return model
-
-    def LoadFile_Bin(self, path, split_meshes=True,
-                     is_compressed=True, dump=False):
-        file = open(path, "rb")
-
-        if is_compressed:
-            file = XBinIO.__decompress_internal__(file, dump)
-
-        default_mesh = self.__xbin_loadfile_internal__(file, 'MODEL')
-
-        if split_meshes:
-            self.__generate_meshes__(default_mesh)
-        else:
-            self.meshes = [default_mesh]
-        file.close()
-
-    def WriteFile_Bin(self, path, version=None,
-                      extended_features=True, header_message=""):
-        # If there is no current version, fallback to the argument
-        version = validate_version(self, version)
-        return self.__xbin_writefile_model_internal__(path,
-                                                      version,
-                                                      extended_features,
-                                                      header_message)
-
-    @staticmethod
-    def FromFile_Bin(filepath, split_meshes=True,
-                     is_compressed=True, dump=False):
-        '''
-        Load from an XMODEL_BIN file and return the resulting Model()
-        '''
-        model = Model()
-        model.LoadFile_Bin(filepath, split_meshes, is_compressed, dump)
-        return model
+# <pep8 compliant>
+
+from array import array
+from itertools import chain, repeat
+from time import strftime
+from math import sqrt, floor
+
+import re
+
+from .xbin import XBinIO, validate_version
+from ._parser import ExportParser
+from ._writer import ExportWriter, WRITE_BATCH_SIZE, DEFAULT_FLOAT_FORMAT
+from ._rotation import __matrices_to_quat_list__, __quat_list_to_matrices__
+
+# Parse XMODEL_EXPORT files with the tokenizing ModelExportParser
+#  When disabled the (slower) line based reference parser is used instead
+TOKENIZED_PARSER = True
+
+# Share a single instance of each distinct normal, color, uv & weight tuple
+#  between the vertices & face vertices of a loaded model (see ValuePool)
+INTERN_VALUES = False
+
+
+def __clamp_float__(value, clamp_range=(-1.0, 1.0)):
+    return max(min(value, clamp_range[1]), clamp_range[0])
+
+
+def __clamp_multi__(value, clamp_range=(-1.0, 1.0)):
+    return tuple([max(min(v, clamp_range[1]), clamp_range[0]) for v in value])
+
+# Black Ops Note
+#  NORMAL 0.0 0.0 0.000000000000000000001 <works fine>
+#  NORMAL 0.0 0.0 0.0000000000000000000001 <assert>
+#  NORMAL 0.0 0.0 0.00000000000000000000001 <Vertex normal = 0 error>
+
+
+def __clamp_normal__(value):
+    x, y, z = value
+    if not (-1.0 <= x <= 1.0 and -1.0 <= y <= 1.0 and -1.0 <= z <= 1.0):
+        x, y, z = __clamp_multi__(value)
+    if not (x or y or z):
+        return (0.0, 0.0, 1.0)
+    return (x, y, z)
+
+
+def __normalized__(iterable):
+    d = 1.0 / sqrt(sum([v * v for v in iterable]))
+    return [v * d for v in iterable]
+
+
+def __skip_lines__(file, tokens):
+    '''
+    Skip over lines until one starts with any of the given tokens
+    Returns an iterator over the rest of the file (including that line)
+    '''
+    for line in file:
+        if line.lstrip().startswith(tokens):
+            return chain((line,), file)
+    return file
+
+
+def __parse_sections__(sections):
+    '''
+    Validate a collection of Model.supported_sections (None for all of them)
+    Returns the (sections to load, sections to skip) as frozensets
+    '''
+    supported = Model.supported_sections
+    if sections is None:
+        sections = supported
+    sections = frozenset(sections)
+    unknown = sections.difference(supported)
+    if unknown:
+        fmt = "Invalid model section(s): %s - must be in %s"
+        vargs = (", ".join(sorted(unknown)), repr(supported))
+        raise ValueError(fmt % vargs)
+    return sections, frozenset(supported).difference(sections)
+
+
+def __write_bones_raw__(file, bones, bone_map=None):
+    '''
+    Write the bone info & bone transform data of an XMODEL_EXPORT file
+    bone_map optionally maps the parent indices to the written bone indices
+    '''
+    # Write the actual bone info
+    values = []
+    for bone_index, bone in enumerate(bones):
+        parent = bone.parent
+        if bone_map is not None and parent != -1:
+            parent = bone_map[parent]
+        values.extend((bone_index, parent, bone.name))
+    file.write("BONE %d %d \"%s\"\n" * len(bones) % tuple(values))
+
+    file.write("\n")
+
+    # Bone Transform Data
+    values = []
+    for bone_index, bone in enumerate(bones):
+        values.append(bone_index)
+        values.extend(bone.offset[:3])
+        values.extend((1.0, 1.0, 1.0))
+        values.extend(__clamp_matrix__(bone.matrix))
+    file.write_batch([__bone_transform_format__] * len(bones), values)
+    file.write("\n")
+
+
+def __clamp_matrix__(matrix):
+    '''
+    Returns the values of a 3x3 matrix as a flat list, clamped to [-1, 1]
+    '''
+    values = list(matrix[0][:3])
+    values.extend(matrix[1][:3])
+    values.extend(matrix[2][:3])
+    if min(values) < -1.0 or max(values) > 1.0:
+        return [max(min(v, 1.0), -1.0) for v in values]
+    return values
+
+
+__bone_transform_format__ = ("BONE %d\n"
+                             "OFFSET %f %f %f\n"
+                             "SCALE %f %f %f\n"
+                             "X %f %f %f\n"
+                             "Y %f %f %f\n"
+                             "Z %f %f %f\n\n")
+
+__vertex_formats__ = {}
+
+
+def __vertex_format__(vert_tok_suffix, weight_count):
+    '''
+    Returns the format template of a vertex with weight_count weights
+    '''
+    key = (vert_tok_suffix, weight_count)
+    fmt = __vertex_formats__.get(key)
+    if fmt is None:
+        fmt = ("VERT%s %%d\nOFFSET %%f %%f %%f\nBONES %d\n" %
+               (vert_tok_suffix, weight_count) +
+               "BONE %d %f\n" * weight_count + "\n")
+        __vertex_formats__[key] = fmt
+    return fmt
+
+
+def __face_vertex_format__(version, vert_tok_suffix):
+    if version == 5:
+        return "VERT %d %f %f %f %f %f\n"
+    return ("VERT%s %%d\nNORMAL %%f %%f %%f\n"
+            "COLOR %%f %%f %%f %%f\nUV 1 %%f %%f\n\n" % vert_tok_suffix)
+
+
+def __face_format__(version, vert_tok_suffix):
+    '''
+    Returns the format template of a face (& its 3 face vertices)
+    '''
+    return ("%s %d %d 0 0\n" +
+            __face_vertex_format__(version, vert_tok_suffix) * 3 + "\n")
+
+
+def __extend_face_values__(values, face, version, index_offset):
+    '''
+    Append the values of a face (for the __face_format__ template) to values
+    '''
+    mesh_id = face.mesh_id
+    material_id = face.material_id
+    # Only use TRI16 if we're using version 7 or newer, etc.
+    if version >= 7 and (mesh_id > 255 or material_id > 255):
+        values.append("TRI16")
+    else:
+        values.append("TRI")
+    values.append(mesh_id)
+    values.append(material_id)
+    for index in face.indices[:3]:
+        values.append(index.vertex + index_offset)
+        values.extend(__clamp_normal__(index.normal))
+        if version != 5:
+            values.extend(index.color)
+        values.extend(index.uv)
+
+
+def __write_verts_raw__(file, meshes, vert_offsets, vert_tok_suffix):
+    '''
+    Write the vertices of all of the meshes, WRITE_BATCH_SIZE at a time
+    '''
+    formats = []
+    values = []
+    for mesh, vert_offset in zip(meshes, vert_offsets):
+        for vert_index, vert in enumerate(mesh.verts, vert_offset):
+            weights = vert.weights
+            formats.append(__vertex_format__(vert_tok_suffix, len(weights)))
+            values.append(vert_index)
+            values.extend(vert.offset)
+            for weight in weights:
+                values.extend(weight)
+            if len(formats) == WRITE_BATCH_SIZE:
+                file.write_batch(formats, values)
+                formats = []
+                values = []
+    file.write_batch(formats, values)
+
+
+def __write_faces_raw__(file, version, meshes, vert_offsets,
+                        vert_tok_suffix):
+    '''
+    Write the faces of all of the meshes, WRITE_BATCH_SIZE at a time
+    '''
+    face_format = __face_format__(version, vert_tok_suffix)
+    count = 0
+    values = []
+    for mesh, vert_offset in zip(meshes, vert_offsets):
+        for face in mesh.faces:
+            __extend_face_values__(values, face, version, vert_offset)
+            count += 1
+            if count == WRITE_BATCH_SIZE:
+                file.write_batch([face_format] * count, values)
+                count = 0
+                values = []
+    file.write_batch([face_format] * count, values)
+
+
+def deserialize_image_string(ref_string):
+    if not ref_string:
+        return {"color": "$none.tga"}
+
+    out = {}
+    for key, value in re.findall(r'\s*(\S+?)\s*:\s*(\S+)\s*', ref_string):
+        out[key.lower()] = value.lstrip()
+
+    if not out:
+        out = {"color": ref_string}
+    return out
+
+
+def serialize_image_string(image_dict, extended_features=True):
+    if extended_features is True:
+        out = ""
+        prefix = ''
+        for key, value in image_dict.items():
+            out += "%s%s:%s" % (prefix, key, value)
+            prefix = ' '
+        return out
+    else:
+        # For xmodel_export version 5, the material name and image ref
+        #  may be the same -
+        # in which case - the image dict extension shouldn't be used
+        if 'color' in image_dict:  # use the color map
+            return image_dict['color']
+        elif image_dict != 0:  # if it cant be found, grab the first image
+            key, value = image_dict.items()[0]
+            return value
+        return ""
+
+
+class ValuePool(object):
+    '''
+    Interning pool for the value tuples of a model load - each distinct
+     value is only allocated once, instead of once per (face) vertex
+    Each kind of value has its own table, so a (bone, weight) tuple is never
+     swapped for an equal uv tuple of floats
+    As with any equality based sharing, -0.0 & 0.0 components are considered
+     the same value
+    '''
+    __slots__ = ('normals', 'colors', 'uvs', 'weights')
+
+    def __init__(self):
+        self.normals = {}
+        self.colors = {}
+        self.uvs = {}
+        self.weights = {}
+
+    def intern_weights(self, weights):
+        '''
+        Intern the (bone, weight) tuples of a list of weights in place
+        '''
+        setdefault = self.weights.setdefault
+        for i, weight in enumerate(weights):
+            weights[i] = setdefault(weight, weight)
+
+    def intern_face_vertex(self, vert):
+        '''
+        Intern the normal, color & uv of a FaceVertex
+        '''
+        normal = vert.normal
+        vert.normal = self.normals.setdefault(normal, normal)
+        color = vert.color
+        if color is not None:
+            vert.color = self.colors.setdefault(color, color)
+        uv = vert.uv
+        vert.uv = self.uvs.setdefault(uv, uv)
+
+
+def __rss__():
+    '''
+    Returns the resident set size of this process in bytes (from psutil if
+     it's installed, or /proc on Linux), or None if it can't be measured
+    '''
+    import os
+
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+# Loads a model in a fresh interpreter & prints its RSS before & after the
+#  load along with the load time (see intern_values_report)
+__INTERN_REPORT_SCRIPT__ = '''
+from timeit import default_timer
+from %(package)s import xmodel
+xmodel.INTERN_VALUES = %(intern)r
+before = xmodel.__rss__()
+start = default_timer()
+model = xmodel.Model.%(load)s(%(path)r)
+seconds = default_timer() - start
+print(repr((before, xmodel.__rss__(), seconds)))
+'''
+
+
+def intern_values_report(vert_count=200000):
+    '''
+    Measure how much memory a model with vert_count vertices (& as many
+     faces) takes up once it's loaded, with INTERN_VALUES off & on
+    Each load runs in a fresh interpreter, so the RSS of one load doesn't
+     carry over to the next
+    Returns a list of (file format, INTERN_VALUES, RSS growth in bytes,
+     seconds) tuples - the RSS growth is None if it can't be measured (see
+     __rss__)
+    '''
+    import os
+    import shutil
+    import subprocess
+    import sys
+    import tempfile
+    from ast import literal_eval
+    from ._writer import __benchmark_model__
+
+    package = __name__.rpartition('.')[0]
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package_root] + [path for path in [env.get('PYTHONPATH')] if path])
+
+    model = __benchmark_model__(vert_count)
+
+    results = []
+    temp_dir = tempfile.mkdtemp()
+    try:
+        paths = (('XMODEL_EXPORT', 'FromFile_Raw',
+                  os.path.join(temp_dir, "report.XMODEL_EXPORT")),
+                 ('XMODEL_BIN', 'FromFile_Bin',
+                  os.path.join(temp_dir, "report.xmodel_bin")))
+        model.WriteFile_Raw(paths[0][2], version=6)
+        model.WriteFile_Bin(paths[1][2], version=7)
+
+        for file_format, load, path in paths:
+            for intern in (False, True):
+                script = __INTERN_REPORT_SCRIPT__ % {'package': package,
+                                                     'intern': intern,
+                                                     'load': load,
+                                                     'path': path}
+                output = subprocess.check_output([sys.executable, '-c',
+                                                  script], env=env,
+                                                 universal_newlines=True)
+                before, after, seconds = literal_eval(
+                    output.strip().splitlines()[-1])
+                growth = None if None in (before, after) else after - before
+                results.append((file_format, intern, growth, seconds))
+    finally:
+        shutil.rmtree(temp_dir)
+    return results
+
+
+class Bone(object):
+    __slots__ = ('name', 'parent', 'offset', 'matrix', 'scale', 'cosmetic')
+
+    def __init__(self, name, parent=-1, cosmetic=False):
+        self.name = name
+        self.parent = parent
+        self.offset = None
+        self.matrix = [None] * 3
+        self.scale = (1.0, 1.0, 1.0)
+        self.cosmetic = cosmetic
+
+
+class Vertex(object):
+    __slots__ = ("offset", "weights")
+
+    def __init__(self, offset=None, weights=None):
+        self.offset = offset
+        if weights is None:
+            # An array of tuples in the format (bone index, influence)
+            self.weights = []
+        else:
+            self.weights = weights
+
+    def __load_vert__(self, file, vert_count, mesh, vert_tok='VERT',
+                      pool=None):
+        lines_read = 0
+        state = 0
+
+        vert_index = -1
+
+        bone_count = 0  # The number of bones influencing this vertex
+        bones_read = 0  # The number of bone weights we've read for this vert
+
+        for line in file:
+            lines_read += 1
+
+            line_split = line.split()
+            if not line_split:
+                continue
+
+            for i, split in enumerate(line_split):
+                if split[-1:] == ',':
+                    line_split[i] = split.rstrip(",")
+
+            if state == 0 and line_split[0] == vert_tok:
+                vert_index = int(line_split[1])
+                if vert_index >= vert_count:
+                    fmt = ("vert_count does not index vert_index -- "
+                           "%d not in [0, %d)")
+                    raise ValueError(fmt % (vert_index, vert_count))
+                state = 1
+            elif state == 1 and line_split[0] == "OFFSET":
+                self.offset = tuple([float(v)
+                                     for v in line_split[1:4]])  # TODO
+                state = 2
+            elif state == 2 and line_split[0] == "BONES":
+                bone_count = int(line_split[1])
+                self.weights = [None] * bone_count
+                state = 3
+            elif state == 3 and line_split[0] == "BONE":
+                bone = int(line_split[1])
+                influence = float(line_split[2])
+                self.weights[bones_read] = ((bone, influence))
+                bones_read += 1
+                if bones_read == bone_count:
+                    if pool is not None:
+                        pool.intern_weights(self.weights)
+                    state = -1
+                    return lines_read
+
+        return lines_read
+
+    def save(self, file, index, vert_tok_suffix=""):
+        values = [index]
+        values.extend(self.offset)
+        for weight in self.weights:
+            values.extend(weight)
+        file.write(__vertex_format__(vert_tok_suffix, len(self.weights)) %
+                   tuple(values))
+
+
+class FaceVertex(object):
+    __slots__ = ("vertex", "normal", "color", "uv")
+
+    def __init__(self, vertex=None, normal=None, color=None, uv=None):
+        self.vertex = vertex
+        self.normal = normal
+        self.color = color
+        self.uv = uv
+
+    def save(self, file, version, index_offset, vert_tok_suffix=""):
+        values = [self.vertex + index_offset]
+        values.extend(__clamp_normal__(self.normal))
+        if version != 5:
+            values.extend(self.color)
+        values.extend(self.uv)
+        file.write(__face_vertex_format__(version, vert_tok_suffix) %
+                   tuple(values))
+
+
+class Face(object):
+    __slots__ = ('mesh_id', 'material_id', 'indices')
+
+    def __init__(self, mesh_id, material_id):
+        self.mesh_id = mesh_id
+        self.material_id = material_id
+        self.indices = [None] * 3
+
+    def __load_face__(self, file, version, face_count, vert_tok='VERT',
+                      pool=None):
+        lines_read = 0
+        state = 0
+
+        tri_number = -1
+        vert_number = -1
+
+        for line in file:
+            lines_read += 1
+
+            line_split = line.split()
+            if not line_split:
+                continue
+
+            for i, split in enumerate(line_split):
+                if split[-1:] == ',':
+                    line_split[i] = split.rstrip(",")
+
+            # Support both TRI & TRI16
+            if state == 0 and line_split[0].startswith("TRI"):
+                tri_number += 1
+                self.mesh_id = int(line_split[1])
+                self.material_id = int(line_split[2])
+                state = 1
+            elif state == 1 and line_split[0] == vert_tok:
+                vert = FaceVertex()
+                vert.vertex = int(line_split[1])
+                vert_number += 1
+
+                if version == 5:
+                    vert.normal = tuple([float(v)
+                                         for v in line_split[2:5]])  # TODO
+                    vert.uv = (float(line_split[5]), float(line_split[6]))
+                    if pool is not None:
+                        pool.intern_face_vertex(vert)
+                    self.indices[vert_number] = vert
+                    if vert_number == 2:
+                        return lines_read
+                    else:
+                        continue
+
+                # for Version 6, continue loading the vertex properties for the
+                # last vertex
+                else:
+                    state = 2
+
+            elif state == 2 and line_split[0] == "NORMAL":
+                vert.normal = (float(line_split[1]),
+                               float(line_split[2]),
+                               float(line_split[3]))
+                state = 3
+            elif state == 3 and line_split[0] == "COLOR":
+                vert.color = (float(line_split[1]),
+                              float(line_split[2]),
+                              float(line_split[3]),
+                              float(line_split[4]))
+                state = 4
+            elif state == 4 and line_split[0] == "UV":
+                vert.uv = (float(line_split[2]), float(line_split[3]))
+                if pool is not None:
+                    pool.intern_face_vertex(vert)
+                self.indices[vert_number] = vert
+                if vert_number == 2:
+                    return lines_read
+                else:
+                    state = 1
+
+        return lines_read
+
+    def save(self, file, version, index_offset, vert_tok_suffix=""):
+        values = []
+        __extend_face_values__(values, self, version, index_offset)
+        file.write(__face_format__(version, vert_tok_suffix) % tuple(values))
+
+    def isValid(self):
+        '''
+        Checks to make sure that the face consists of 3 vertices,
+        all of which refer to different vertex indices
+        '''
+        if(len(self.indices) != 3):
+            return False
+
+        indices = [index.vertex for index in self.indices]
+
+        if indices[0] == indices[1]:
+            return False
+
+        if indices[0] == indices[2]:
+            return False
+
+        if indices[1] == indices[2]:
+            return False
+
+        return True
+
+
+class Material(object):
+    __slots__ = (
+        'name', 'type', 'images', 'color',
+        'color_ambient', 'color_specular', 'color_reflective',
+        'transparency', 'incandescence',
+        'coeffs', 'glow',
+        'refractive', 'reflective',
+        'blinn', 'phong'
+    )
+
+    def __init__(self, name, material_type, images):
+        self.name = name
+        self.type = material_type
+        self.images = images
+        self.color = (0.0, 0.0, 0.0, 1.0)
+        self.color_ambient = (0.0, 0.0, 0.0, 1.0)
+        self.color_specular = (-1.0, -1.0, -1.0, 1.0)
+        self.color_reflective = (-1.0, -1.0, -1.0, 1.0)
+        self.transparency = (0.0, 0.0, 0.0, 1.0)
+        self.incandescence = (0.0, 0.0, 0.0, 1.0)
+        self.coeffs = (0.8, 0.0)
+        self.glow = (0.0, 0)
+        self.refractive = (6, 1.0)
+        self.reflective = (-1, 1.0)
+        self.blinn = (-1.0, -1.0)
+        self.phong = -1.0
+
+    def save(self, file, version, material_index, extended_features=True,
+             float_format=None):
+        imgs = serialize_image_string(
+            self.images, extended_features=extended_features)
+        if version == 5:
+            file.write('MATERIAL %d "%s"\n' % (material_index, imgs))
+        else:
+            file.write('MATERIAL %d "%s" "%s" "%s"\n' %
+                       (material_index, self.name, self.type, imgs))
+            values = []
+            for prop in (self.color, self.transparency, self.color_ambient,
+                         self.incandescence, self.coeffs, self.glow,
+                         self.refractive, self.color_specular,
+                         self.color_reflective, self.reflective,
+                         self.blinn):
+                values.extend(prop)
+            values.append(self.phong)
+            if float_format is None:
+                float_format = DEFAULT_FLOAT_FORMAT
+            file.write(float_format.format(__material_format__,
+                                           tuple(values)))
+
+
+__material_format__ = ("COLOR %f %f %f %f\n"
+                       "TRANSPARENCY %f %f %f %f\n"
+                       "AMBIENTCOLOR %f %f %f %f\n"
+                       "INCANDESCENCE %f %f %f %f\n"
+                       "COEFFS %f %f\n"
+                       "GLOW %f %d\n"
+                       "REFRACTIVE %d %f\n"
+                       "SPECULARCOLOR %f %f %f %f\n"
+                       "REFLECTIVECOLOR %f %f %f %f\n"
+                       "REFLECTIVE %d %f\n"
+                       "BLINN %f %f\n"
+                       "PHONG %f\n\n")
+
+
+def __quantize__(values, scale):
+    '''
+    Snap a tuple of floats to a grid with a spacing of 1 / scale
+    '''
+    if values is None:
+        return None
+    return tuple([int(floor(value * scale + 0.5)) for value in values])
+
+
+def __hashable__(values):
+    if values is None or isinstance(values, tuple):
+        return values
+    return tuple(values)
+
+
+class RenderBuffer(object):
+    '''
+    The unique render vertices of a mesh & the index buffer of its faces
+     (see Mesh.weld)
+        vertices - list of (vertex index, normal, color, uv) tuples
+        indices - array of vertex indices (3 per face)
+    '''
+    __slots__ = ('vertices', 'indices')
+
+    def __init__(self, vertices=None, indices=None):
+        self.vertices = [] if vertices is None else vertices
+        self.indices = array('i') if indices is None else indices
+
+    @property
+    def corner_count(self):
+        return len(self.indices)
+
+    @property
+    def dedup_ratio(self):
+        '''
+        The average number of face corners that share each render vertex
+        '''
+        if not self.vertices:
+            return 1.0
+        return len(self.indices) / float(len(self.vertices))
+
+
+class Mesh(object):
+    __slots__ = ('name', 'verts', 'faces', '__vert_tok', '__group_counts',
+                 '__bone_groups', '__bone_groups_key',
+                 '__material_groups', '__material_groups_key')
+
+    def __init__(self, name):
+        self.name = name
+
+        self.verts = []
+        self.faces = []
+
+        # The bone & material groups are derived from the verts & faces on
+        #  first access (see bone_groups & material_groups)
+        # The number of bone & material groups (None to fit the used ids)
+        self.__group_counts = (None, None)
+        self.__bone_groups = None
+        self.__bone_groups_key = None
+        self.__material_groups = None
+        self.__material_groups_key = None
+
+        # Used for handling VERT vs VERT32 without using a ton of if statements
+        self.__vert_tok = 'VERT'
+
+    @property
+    def bone_groups(self):
+        '''
+        The (vertex index, weight) pairs of the vertices that each bone
+         influences - built on first access & cached until verts is replaced
+         or resized (see invalidate_groups)
+        '''
+        key = self.__bone_groups_key
+        if key is None or key[0] is not self.verts or \
+                key[1] != len(self.verts):
+            self.bone_groups = self.__build_bone_groups__()
+        return self.__bone_groups
+
+    @bone_groups.setter
+    def bone_groups(self, groups):
+        self.__bone_groups = groups
+        self.__bone_groups_key = (self.verts, len(self.verts))
+
+    @property
+    def material_groups(self):
+        '''
+        The indices of the vertices that are used by the faces of each
+         material - built on first access & cached until faces is replaced
+         or resized (see invalidate_groups)
+        '''
+        key = self.__material_groups_key
+        if key is None or key[0] is not self.faces or \
+                key[1] != len(self.faces):
+            self.material_groups = self.__build_material_groups__()
+        return self.__material_groups
+
+    @material_groups.setter
+    def material_groups(self, groups):
+        self.__material_groups = groups
+        self.__material_groups_key = (self.faces, len(self.faces))
+
+    def __set_group_counts__(self, bone_count, material_count):
+        self.__group_counts = (bone_count, material_count)
+
+    def __build_bone_groups__(self):
+        verts = self.verts
+        bone_count = self.__group_counts[0]
+        if bone_count is None:
+            bone_count = max([bone_id + 1 for vert in verts
+                              for bone_id, weight in vert.weights] or [0])
+        groups = [[] for i in repeat(None, bone_count)]
+        for vert_id, vert in enumerate(verts):
+            for bone_id, weight in vert.weights:
+                groups[bone_id].append((vert_id, weight))
+        # Remove duplicates
+        return [list(set(group)) for group in groups]
+
+    def __build_material_groups__(self):
+        faces = self.faces
+        material_count = self.__group_counts[1]
+        if material_count is None:
+            material_count = max([face.material_id + 1
+                                  for face in faces] or [0])
+        groups = [[] for i in repeat(None, material_count)]
+        for face in faces:
+            group = groups[face.material_id]
+            for ind in face.indices:
+                group.append(ind.vertex)
+        # Remove duplicates
+        return [list(set(group)) for group in groups]
+
+    def build_groups(self):
+        '''
+        Build the bone & material groups now instead of on first access
+        '''
+        self.bone_groups = self.__build_bone_groups__()
+        self.material_groups = self.__build_material_groups__()
+
+    def invalidate_groups(self):
+        '''
+        Discard the cached bone & material groups - needed after changing
+         the weights of verts or the indices of faces in place
+        '''
+        self.__bone_groups = None
+        self.__bone_groups_key = None
+        self.__material_groups = None
+        self.__material_groups_key = None
+
+    def weld(self, epsilon=None):
+        '''
+        Collapse the face corners that have the same vertex, normal, color &
+         uv into unique render vertices
+        If epsilon is given, normals, colors & uvs are compared on a grid
+         with epsilon spacing instead of exactly - each render vertex keeps
+         the values of the first corner that uses it
+        Returns a RenderBuffer
+        '''
+        if epsilon is None:
+            scale = None
+        elif epsilon > 0.0:
+            scale = 1.0 / epsilon
+        else:
+            raise ValueError("Invalid weld epsilon: %r - must be > 0" %
+                             epsilon)
+
+        vertices = []
+        indices = array('i')
+        lookup = {}
+        # The render vertex of the first corner that used each vertex - most
+        #  corners are an exact match for it, which is much cheaper to check
+        #  than a (nested tuple) hash lookup
+        first = {}
+        for face in self.faces:
+            for ind in face.indices:
+                vertex = ind.vertex
+                corner = (vertex, ind.normal, ind.color, ind.uv)
+                index = first.get(vertex)
+                if index is None or vertices[index] != corner:
+                    try:
+                        if scale is None:
+                            key = corner
+                        else:
+                            key = (vertex, __quantize__(ind.normal, scale),
+                                   __quantize__(ind.color, scale),
+                                   __quantize__(ind.uv, scale))
+                        index = lookup.get(key)
+                    except TypeError:
+                        # The vectors are lists instead of tuples
+                        corner = (vertex, __hashable__(ind.normal),
+                                  __hashable__(ind.color),
+                                  __hashable__(ind.uv))
+                        if scale is None:
+                            key = corner
+                        index = lookup.get(key)
+                    if index is None:
+                        index = lookup[key] = len(vertices)
+                        vertices.append(corner)
+                        first.setdefault(vertex, index)
+                indices.append(index)
+        return RenderBuffer(vertices, indices)
+
+    def __load_verts__(self, file, model, pool=None):
+        lines_read = 0
+        vert_count = 0
+
+        for line in file:
+            lines_read += 1
+
+            line_split = line.split()
+            if not line_split:
+                continue
+
+            if line_split[0] == 'NUMVERTS':
+                self.__vert_tok = 'VERT'
+            elif line_split[0] == 'NUMVERTS32':
+                self.__vert_tok = 'VERT32'
+            else:
+                continue
+
+            vert_count = int(line_split[1])
+            self.verts = [Vertex() for i in range(vert_count)]
+            break
+
+        vert_tok = self.__vert_tok
+        for vertex in self.verts:
+            lines_read += vertex.__load_vert__(file, vert_count, self,
+                                               vert_tok, pool)
+
+        return lines_read
+
+    def __load_faces__(self, file, version, pool=None):
+        lines_read = 0
+        face_count = 0
+
+        for line in file:
+            lines_read += 1
+
+            line_split = line.split()
+            if not line_split:
+                continue
+
+            for i, split in enumerate(line_split):
+                if split[-1:] == ',':
+                    line_split[i] = split.rstrip(",")
+
+            if line_split[0] == "NUMFACES":
+                face_count = int(line_split[1])
+                self.faces = [Face(None, None) for i in range(face_count)]
+                break
+
+        vert_tok = self.__vert_tok
+        for face in self.faces:
+            lines_read += face.__load_face__(file, version, face_count,
+                                             vert_tok, pool)
+
+        return lines_read
+
+
+class ModelExportParser(ExportParser):
+    '''
+    Tokenizing XMODEL_EXPORT parser
+
+    Records using the standard layout (a whole vertex, face or bone
+     transform) are parsed at once, anything else falls back to the handlers
+     for the individual keywords.
+
+    The line based loaders (Model.__load_bones__, Mesh.__load_verts__, etc.)
+     are kept as the reference implementation (see TOKENIZED_PARSER)
+    '''
+    __slots__ = ('model', 'version', 'default_mesh', 'skip_sections',
+                 'bone_count', 'cosmetic_count', 'bones_read',
+                 'vert_count', 'face_count', 'active', 'active_face',
+                 'weight_index', 'corner', 'pool')
+
+    header_keyword = "MODEL"
+
+    # Maps each section (None before the first one) to its keyword -> handler
+    #  table - filled in below
+    section_handlers = {}
+
+    def __init__(self, model, skip_sections=()):
+        ExportParser.__init__(self)
+        self.model = model
+        self.version = None
+        self.default_mesh = Mesh("$default")
+        self.skip_sections = skip_sections
+
+        self.bone_count = 0
+        self.cosmetic_count = 0
+        self.bones_read = 0
+        self.vert_count = 0
+        self.face_count = 0
+
+        self.active = None  # The vertex / face vertex / bone / material
+        self.active_face = None
+        self.weight_index = 0
+        self.corner = 0
+
+        # The ValuePool of the load (see INTERN_VALUES)
+        self.pool = ValuePool() if INTERN_VALUES else None
+
+    def __load_version__(self, version):
+        if version not in Model.supported_versions:
+            fmt = "Invalid model version: %d - must be one of %s"
+            vargs = (version, repr(Model.supported_versions))
+            raise ValueError(fmt % vargs)
+        self.model.version = self.version = version
+
+    def __finalize__(self):
+        '''
+        Fill in the records that were missing from the file
+        '''
+        verts = self.default_mesh.verts
+        verts.extend([Vertex() for i in range(self.vert_count - len(verts))])
+        faces = self.default_mesh.faces
+        faces.extend([Face(None, None)
+                      for i in range(self.face_count - len(faces))])
+        return self.default_mesh
+
+    def __next_section_keywords__(self, section):
+        '''
+        Returns the keywords that start the loaded sections after section
+        '''
+        sections = Model.supported_sections
+        for name in sections[sections.index(section) + 1:]:
+            if name not in self.skip_sections:
+                return ModelExportParser.section_keywords[name]
+        return ()
+
+    # Section Handlers
+
+    def LoadNumBones(self, tokens, pos):
+        if 'bones' in self.skip_sections:
+            return self.__skip_to__(pos + 1,
+                                    self.__next_section_keywords__('bones'))
+        self.bone_count = int(tokens[pos + 1])
+        self.bones_read = 0
+        self.model.bones = [Bone(None)] * self.bone_count
+        self.handlers = self.section_handlers['bones']
+        return pos + 2
+
+    def LoadNumCosmetics(self, tokens, pos):
+        self.cosmetic_count = int(tokens[pos + 1])
+        return pos + 2
+
+    def LoadNumVerts(self, tokens, pos):
+        if 'geometry' in self.skip_sections:
+            return self.__skip_to__(pos + 1,
+                                    self.__next_section_keywords__('geometry'))
+        mesh = self.default_mesh
+        self.vert_count = int(tokens[pos + 1])
+        mesh.verts = []
+        self.handlers = self.section_handlers['verts']
+        return pos + 2
+
+    def LoadNumFaces(self, tokens, pos):
+        mesh = self.default_mesh
+        self.face_count = int(tokens[pos + 1])
+        mesh.faces = []
+        self.active_face = None
+        self.handlers = self.section_handlers['faces']
+        return pos + 2
+
+    def LoadNumObjects(self, tokens, pos):
+        self.model.meshes = [None] * int(tokens[pos + 1])
+        self.handlers = self.section_handlers['objects']
+        return pos + 2
+
+    def LoadNumMaterials(self, tokens, pos):
+        if 'materials' in self.skip_sections:
+            self.done = True
+            return pos + 1
+        self.model.materials = [None] * int(tokens[pos + 1])
+        self.active = None
+        self.handlers = self.section_handlers['materials']
+        return pos + 2
+
+    # Bone Handlers
+
+    def LoadBone(self, tokens, pos):
+        bone_count = self.bone_count
+        if self.bones_read < bone_count:
+            # Bone definition
+            if len(tokens) < pos + 4 and self.__truncated__(tokens, pos + 4):
+                return pos
+            index = int(tokens[pos + 1])
+            cosmetic = (index >= (bone_count - self.cosmetic_count))
+            self.model.bones[index] = Bone(tokens[pos + 3].strip('"'),
+                                           int(tokens[pos + 2]), cosmetic)
+            self.bones_read += 1
+            return pos + 4
+
+        # Bone transform
+        bone_index = int(tokens[pos + 1])
+        if bone_index >= bone_count:
+            fmt = ("bone_count does not index bone_index -- "
+                   "%d not in [0, %d)")
+            raise ValueError(fmt % (bone_index, bone_count))
+        bone = self.model.bones[bone_index]
+        self.active = bone
+
+        # The rest of the bone is loaded by the line handlers if it doesn't
+        #  use the standard layout (or the file ends)
+        p = pos + 2
+        if len(tokens) < p + 16 or tokens[p] != "OFFSET":
+            return p
+        bone.offset = (float(tokens[p + 1]),
+                       float(tokens[p + 2]),
+                       float(tokens[p + 3]))
+        p += 4
+        # SCALE ... is ignored as its always 1
+        if tokens[p] == "SCALE":
+            p += 4
+        if (len(tokens) < p + 12 or tokens[p] != "X" or
+                tokens[p + 4] != "Y" or tokens[p + 8] != "Z"):
+            return p
+        matrix = bone.matrix
+        matrix[0] = (float(tokens[p + 1]),
+                     float(tokens[p + 2]),
+                     float(tokens[p + 3]))
+        matrix[1] = (float(tokens[p + 5]),
+                     float(tokens[p + 6]),
+                     float(tokens[p + 7]))
+        matrix[2] = (float(tokens[p + 9]),
+                     float(tokens[p + 10]),
+                     float(tokens[p + 11]))
+        return p + 12
+
+    def LoadBoneOffset(self, tokens, pos):
+        self.active.offset = (float(tokens[pos + 1]),
+                              float(tokens[pos + 2]),
+                              float(tokens[pos + 3]))
+        return pos + 4
+
+    def LoadBoneX(self, tokens, pos):
+        self.active.matrix[0] = (float(tokens[pos + 1]),
+                                 float(tokens[pos + 2]),
+                                 float(tokens[pos + 3]))
+        return pos + 4
+
+    def LoadBoneY(self, tokens, pos):
+        self.active.matrix[1] = (float(tokens[pos + 1]),
+                                 float(tokens[pos + 2]),
+                                 float(tokens[pos + 3]))
+        return pos + 4
+
+    def LoadBoneZ(self, tokens, pos):
+        self.active.matrix[2] = (float(tokens[pos + 1]),
+                                 float(tokens[pos + 2]),
+                                 float(tokens[pos + 3]))
+        return pos + 4
+
+    # Vertex Handlers
+
+    def LoadVertex(self, tokens, pos):
+        vert_index = int(tokens[pos + 1])
+        vert_count = self.vert_count
+        if vert_index >= vert_count:
+            fmt = ("vert_count does not index vert_index -- "
+                   "%d not in [0, %d)")
+            raise ValueError(fmt % (vert_index, vert_count))
+
+        vertex = Vertex()
+        verts = self.default_mesh.verts
+        # Any extra vertices are parsed but not stored
+        if len(verts) < vert_count:
+            verts.append(vertex)
+        self.active = vertex
+        self.weight_index = 0
+
+        # The rest of the vertex is loaded by the line handlers if it
+        #  doesn't use the standard layout (or the file ends)
+        p = pos + 2
+        if (len(tokens) < p + 6 or tokens[p] != "OFFSET" or
+                tokens[p + 4] != "BONES"):
+            return p
+        bone_count = int(tokens[p + 5])
+        if len(tokens) < p + 6 + 3 * bone_count:
+            return p
+        vertex.offset = (float(tokens[p + 1]),
+                         float(tokens[p + 2]),
+                         float(tokens[p + 3]))
+        vertex.weights = weights = [None] * bone_count
+        p += 6
+        for i in range(bone_count):
+            if tokens[p] != "BONE":
+                self.weight_index = i
+                return p
+            weights[i] = (int(tokens[p + 1]), float(tokens[p + 2]))
+            p += 3
+        if self.pool is not None:
+            self.pool.intern_weights(weights)
+        return p
+
+    def LoadVertexOffset(self, tokens, pos):
+        self.active.offset = (float(tokens[pos + 1]),
+                              float(tokens[pos + 2]),
+                              float(tokens[pos + 3]))
+        return pos + 4
+
+    def LoadVertexBones(self, tokens, pos):
+        self.active.weights = [None] * int(tokens[pos + 1])
+        self.weight_index = 0
+        return pos + 2
+
+    def LoadVertexWeight(self, tokens, pos):
+        weight = (int(tokens[pos + 1]), float(tokens[pos + 2]))
+        if self.pool is not None:
+            weight = self.pool.weights.setdefault(weight, weight)
+        self.active.weights[self.weight_index] = weight
+        self.weight_index += 1
+        return pos + 3
+
+    # Face Handlers
+
+    def LoadFace(self, tokens, pos):
+        face = Face(int(tokens[pos + 1]), int(tokens[pos + 2]))
+        faces = self.default_mesh.faces
+        # Any extra faces are parsed but not stored
+        if len(faces) < self.face_count:
+            faces.append(face)
+        self.active_face = face
+        self.corner = 0
+
+        # Skip the (unused) smoothing group & shape flags
+        p = pos + 3
+        vert_toks = ModelExportParser.vert_tokens
+        end = len(tokens)
+        if end < p + 3:
+            return p
+        if tokens[p] not in vert_toks:
+            p += 2
+            if tokens[p] not in vert_toks:
+                return p
+
+        indices = face.indices
+        pool = self.pool
+        if self.version == 5:
+            for corner in range(3):
+                if end < p + 7 or tokens[p] not in vert_toks:
+                    self.corner = corner
+                    return p
+                indices[corner] = FaceVertex(int(tokens[p + 1]),
+                                             (float(tokens[p + 2]),
+                                              float(tokens[p + 3]),
+                                              float(tokens[p + 4])),
+                                             None,
+                                             (float(tokens[p + 5]),
+                                              float(tokens[p + 6])))
+                if pool is not None:
+                    pool.intern_face_vertex(indices[corner])
+                p += 7
+            self.corner = 3
+            return p
+
+        for corner in range(3):
+            if (end < p + 15 or tokens[p] not in vert_toks or
+                    tokens[p + 2] != "NORMAL" or
+                    tokens[p + 6] != "COLOR" or
+                    tokens[p + 11] != "UV"):
+                self.corner = corner
+                return p
+            indices[corner] = FaceVertex(int(tokens[p + 1]),
+                                         (float(tokens[p + 3]),
+                                          float(tokens[p + 4]),
+                                          float(tokens[p + 5])),
+                                         (float(tokens[p + 7]),
+                                          float(tokens[p + 8]),
+                                          float(tokens[p + 9]),
+                                          float(tokens[p + 10])),
+                                         (float(tokens[p + 13]),
+                                          float(tokens[p + 14])))
+            if pool is not None:
+                pool.intern_face_vertex(indices[corner])
+            # Only the first UV layer is used
+            p += 13 + 2 * int(tokens[p + 12])
+        self.corner = 3
+        return p
+
+    def LoadFaceVertex(self, tokens, pos):
+        face = self.active_face
+        if face is None or self.corner >= 3:
+            return pos + 2
+
+        if (self.version == 5 and len(tokens) < pos + 7 and
+                self.__truncated__(tokens, pos + 7)):
+            return pos
+        vert = FaceVertex(int(tokens[pos + 1]))
+        self.active = vert
+        if self.version == 5:
+            vert.normal = (float(tokens[pos + 2]),
+                           float(tokens[pos + 3]),
+                           float(tokens[pos + 4]))
+            vert.uv = (float(tokens[pos + 5]), float(tokens[pos + 6]))
+            if self.pool is not None:
+                self.pool.intern_face_vertex(vert)
+            face.indices[self.corner] = vert
+            self.corner += 1
+            return pos + 7
+        return pos + 2
+
+    def LoadFaceNormal(self, tokens, pos):
+        self.active.normal = (float(tokens[pos + 1]),
+                              float(tokens[pos + 2]),
+                              float(tokens[pos + 3]))
+        return pos + 4
+
+    def LoadFaceColor(self, tokens, pos):
+        self.active.color = (float(tokens[pos + 1]),
+                             float(tokens[pos + 2]),
+                             float(tokens[pos + 3]),
+                             float(tokens[pos + 4]))
+        return pos + 5
+
+    def LoadFaceUV(self, tokens, pos):
+        vert = self.active
+        vert.uv = (float(tokens[pos + 2]), float(tokens[pos + 3]))
+        if self.pool is not None:
+            self.pool.intern_face_vertex(vert)
+        if self.corner < 3:
+            self.active_face.indices[self.corner] = vert
+            self.corner += 1
+        return pos + 2 + 2 * int(tokens[pos + 1])
+
+    # Object Handlers
+
+    def LoadObject(self, tokens, pos):
+        index = int(tokens[pos + 1])
+        self.model.meshes[index] = Mesh(tokens[pos + 2].strip('"'))
+        return pos + 3
+
+    # Material Handlers
+
+    def LoadMaterial(self, tokens, pos):
+        index = int(tokens[pos + 1])
+        if self.version == 5:
+            # Legacy XModel materials don't explicitly have a name
+            #  field, so we simply auto-generate a name
+            name = "Material_%d" % index
+            material_type = "Lambert"
+            images = deserialize_image_string(tokens[pos + 2].strip('"'))
+            end = pos + 3
+        else:
+            if len(tokens) < pos + 5 and self.__truncated__(tokens, pos + 5):
+                return pos
+            name = tokens[pos + 2].strip('"')
+            material_type = tokens[pos + 3].strip('"')
+            images = deserialize_image_string(tokens[pos + 4].strip('"'))
+            end = pos + 5
+        material = Material(name, material_type, images)
+        self.model.materials[index] = material
+        self.active = material
+        return end
+
+    def LoadMaterialProperty(self, tokens, pos):
+        attr, types = ModelExportParser.material_properties[tokens[pos]]
+        end = pos + 1 + len(types)
+        if len(tokens) < end and self.__truncated__(tokens, end):
+            return pos
+        values = tuple([cast(tokens[pos + 1 + i])
+                        for i, cast in enumerate(types)])
+        # PHONG is a single float
+        setattr(self.active, attr, values if len(values) > 1 else values[0])
+        return end
+
+
+ModelExportParser.vert_tokens = frozenset(("VERT", "VERT32"))
+
+# Material property keyword -> (attribute, value types)
+ModelExportParser.material_properties = {
+    "COLOR": ('color', (float,) * 4),
+    "TRANSPARENCY": ('transparency', (float,) * 4),
+    "AMBIENTCOLOR": ('color_ambient', (float,) * 4),
+    "INCANDESCENCE": ('incandescence', (float,) * 4),
+    "COEFFS": ('coeffs', (float, float)),
+    "GLOW": ('glow', (float, int)),
+    "REFRACTIVE": ('refractive', (int, float)),
+    "SPECULARCOLOR": ('color_specular', (float,) * 4),
+    "REFLECTIVECOLOR": ('color_reflective', (float,) * 4),
+    "REFLECTIVE": ('reflective', (int, float)),
+    "BLINN": ('blinn', (float, float)),
+    "PHONG": ('phong', (float,)),
+}
+
+# The keywords that start each of the Model.supported_sections
+ModelExportParser.section_keywords = {
+    'bones': ("NUMBONES",),
+    'geometry': ("NUMVERTS", "NUMVERTS32"),
+    'materials': ("NUMMATERIALS",),
+}
+
+
+def __build_section_handlers__(cls):
+    '''
+    Build the keyword -> handler tables for each section of the file for
+     the parser class cls
+    The section keywords (NUMBONES, NUMVERTS, ...) are valid in every section
+    '''
+    common = {
+        "NUMBONES": cls.LoadNumBones,
+        "NUMCOSMETICS": cls.LoadNumCosmetics,
+        "NUMVERTS": cls.LoadNumVerts,
+        "NUMVERTS32": cls.LoadNumVerts,
+        "NUMFACES": cls.LoadNumFaces,
+        "NUMOBJECTS": cls.LoadNumObjects,
+        "NUMMATERIALS": cls.LoadNumMaterials,
+    }
+    sections = {
+        None: {},
+        'bones': {
+            "BONE": cls.LoadBone,
+            "OFFSET": cls.LoadBoneOffset,
+            "X": cls.LoadBoneX,
+            "Y": cls.LoadBoneY,
+            "Z": cls.LoadBoneZ,
+        },
+        'verts': {
+            "VERT": cls.LoadVertex,
+            "VERT32": cls.LoadVertex,
+            "OFFSET": cls.LoadVertexOffset,
+            "BONES": cls.LoadVertexBones,
+            "BONE": cls.LoadVertexWeight,
+        },
+        'faces': {
+            "TRI": cls.LoadFace,
+            "TRI16": cls.LoadFace,
+            "VERT": cls.LoadFaceVertex,
+            "VERT32": cls.LoadFaceVertex,
+            "NORMAL": cls.LoadFaceNormal,
+            "COLOR": cls.LoadFaceColor,
+            "UV": cls.LoadFaceUV,
+        },
+        'objects': {
+            "OBJECT": cls.LoadObject,
+        },
+        'materials': dict.fromkeys(cls.material_properties,
+                                   cls.LoadMaterialProperty),
+    }
+    sections['materials']["MATERIAL"] = cls.LoadMaterial
+    for handlers in sections.values():
+        handlers.update(common)
+    return sections
+
+
+def __build_record_sizes__(cls):
+    '''
+    Build the handler -> record size table (see ExportParser.record_sizes)
+     for the parser class cls
+    The records of LoadMaterial & LoadFaceVertex are longer in version 5 /
+     6+ & the bone definitions are longer than the bone transforms, those
+     handlers check the rest of their records themselves
+    '''
+    sizes = dict.fromkeys((cls.LoadNumBones, cls.LoadNumCosmetics,
+                           cls.LoadNumVerts, cls.LoadNumFaces,
+                           cls.LoadNumObjects, cls.LoadNumMaterials,
+                           cls.LoadBone, cls.LoadVertex, cls.LoadVertexBones,
+                           cls.LoadFaceVertex, cls.LoadMaterialProperty), 2)
+    sizes.update(dict.fromkeys((cls.LoadFace, cls.LoadObject,
+                                cls.LoadMaterial, cls.LoadVertexWeight), 3))
+    sizes.update(dict.fromkeys((cls.LoadBoneOffset, cls.LoadBoneX,
+                                cls.LoadBoneY, cls.LoadBoneZ,
+                                cls.LoadVertexOffset, cls.LoadFaceNormal,
+                                cls.LoadFaceUV), 4))
+    sizes[cls.LoadFaceColor] = 5
+    return sizes
+
+
+ModelExportParser.section_handlers = __build_section_handlers__(
+    ModelExportParser)
+ModelExportParser.record_sizes = __build_record_sizes__(ModelExportParser)
+
+
+class Model(XBinIO, object):
+    __slots__ = ('name', 'bones', 'meshes', 'materials', 'sections')
+    supported_versions = [5, 6, 7]
+    # The sections that can be selectively loaded
+    #  'geometry' covers the vertices, faces & objects (meshes)
+    supported_sections = ('bones', 'geometry', 'materials')
+
+    def __init__(self, name='$model'):
+        super(XBinIO, self).__init__()
+        self.name = name
+
+        self.bones = []
+        self.meshes = []
+        self.materials = []
+
+        # The sections that were loaded (see supported_sections)
+        self.sections = frozenset(Model.supported_sections)
+
+    def __load_sections__(self, sections):
+        '''
+        Validate the sections to load & mark them as the loaded sections
+        Returns the sections to skip
+        '''
+        self.sections, skip_sections = __parse_sections__(sections)
+        return skip_sections
+
+    def __load_header__(self, file):
+        lines_read = 0
+        state = 0
+        for line in file:
+            lines_read += 1
+
+            line_split = line.split()
+            if not line_split:
+                continue
+
+            if state == 0 and line_split[0] == "MODEL":
+                state = 1
+            elif state == 1 and line_split[0] == "VERSION":
+                self.version = int(line_split[1])
+                if self.version not in Model.supported_versions:
+                    fmt = "Invalid model version: %d - must be one of %s"
+                    vargs = (self.version, repr(Model.supported_versions))
+                    raise ValueError(fmt % vargs)
+                return lines_read
+
+        return lines_read
+
+    def __load_bone__(self, file, bone_count):
+        lines_read = 0
+
+        # keeps track of the importer state for a given bone
+        state = 0
+
+        bone_index = -1
+        bone = None
+
+        for line in file:
+            lines_read += 1
+
+            line_split = line.split()
+            if not line_split:
+                continue
+
+            for i, split in enumerate(line_split):
+                if split[-1:] == ',':
+                    line_split[i] = split.rstrip(",")
+
+            if state == 0 and line_split[0] == "BONE":
+                bone_index = int(line_split[1])
+                if bone_index >= bone_count:
+                    fmt = ("bone_count does not index bone_index -- "
+                           "%d not in [0, %d)")
+                    raise ValueError(fmt % (bone_index, bone_count))
+                state = 1
+            elif state == 1 and line_split[0] == "OFFSET":
+                bone = self.bones[bone_index]
+                bone.offset = (float(line_split[1]),
+                               float(line_split[2]),
+                               float(line_split[3]))
+                state = 2
+            # SCALE ... is ignored as its always 1
+            elif state == 2 and line_split[0] == "X":
+                x = (float(line_split[1]),
+                     float(line_split[2]),
+                     float(line_split[3]))
+                bone.matrix[0] = x
+                state = 3
+            elif state == 3 and line_split[0] == "Y":
+                y = (float(line_split[1]),
+                     float(line_split[2]),
+                     float(line_split[3]))
+                bone.matrix[1] = y
+                state = 4
+            elif state == 4 and line_split[0] == "Z":
+                z = (float(line_split[1]),
+                     float(line_split[2]),
+                     float(line_split[3]))
+                bone.matrix[2] = z
+                state = -1
+                return lines_read
+
+        return lines_read
+
+    def __load_bones__(self, file):
+        lines_read = 0
+        bone_count = 0
+        bones_read = 0
+        cosmetic_count = 0
+        for line in file:
+            lines_read += 1
+
+            line_split = line.split()
+            if not line_split:
+                continue
+
+            # TODO: Reordering these token checks may improve performance
+            if line_split[0] == "NUMCOSMETICS":
+                cosmetic_count = int(line_split[1])
+            elif line_split[0] == "NUMBONES":
+                bone_count = int(line_split[1])
+                self.bones = [Bone(None)] * bone_count
+            elif line_split[0] == "BONE":
+                index = int(line_split[1])
+                parent = int(line_split[2])
+                cosmetic = (index >= (bone_count - cosmetic_count))
+                self.bones[index] = Bone(line_split[3].strip('"'),
+                                         parent, cosmetic)
+                bones_read += 1
+                if bones_read == bone_count:
+                    break
+
+        for _ in range(bone_count):
+            lines_read += self.__load_bone__(file, bone_count)
+
+        return lines_read
+
+    def __load_meshes__(self, file):
+        lines_read = 0
+        mesh_count = 0
+        meshes_read = 0
+        for line in file:
+            lines_read += 1
+
+            line_split = line.split()
+            if not line_split:
+                continue
+
+            if line_split[0] == "NUMOBJECTS":
+                mesh_count = int(line_split[1])
+                self.meshes = [None] * mesh_count
+            elif line_split[0] == "OBJECT":
+                index = int(line_split[1])
+                self.meshes[index] = Mesh(line_split[2].strip('"'))
+                meshes_read += 1
+                if meshes_read == mesh_count:
+                    return lines_read
+
+        return lines_read
+
+    # Generate actual submesh data from the default mesh
+    def __generate_meshes__(self, default_mesh):
+        bone_count = len(self.bones)
+        mtl_count = len(self.materials)
+        for mesh in self.meshes:
+            mesh.__set_group_counts__(bone_count, mtl_count)
+
+        # The mesh that first used each of the original vertices (-1 if
+        #  unused) & the new vertex id in that mesh
+        # Vertices that are shared by several meshes get their ids in the
+        #  other meshes from shared_map - so the memory used doesn't grow
+        #  with the number of meshes
+        vert_count = len(default_mesh.verts)
+        vertex_owner = array('i', [-1]) * vert_count
+        vertex_map = array('i', [-1]) * vert_count
+        shared_map = {}
+
+        mesh_count = len(self.meshes)
+        for face in default_mesh.faces:
+            mesh_id = face.mesh_id
+            mesh = self.meshes[mesh_id]
+            if mesh_id < 0:
+                mesh_id += mesh_count
+            for ind in face.indices:
+                old_id = ind.vertex
+                owner = vertex_owner[old_id]
+                if owner == mesh_id:
+                    vert_id = vertex_map[old_id]
+                elif owner != -1:
+                    vert_id = shared_map.get((mesh_id, old_id))
+                else:
+                    vert_id = None
+                if vert_id is None:
+                    vert_id = len(mesh.verts)
+                    if owner == -1:
+                        vertex_owner[old_id] = mesh_id
+                        vertex_map[old_id] = vert_id
+                    else:
+                        shared_map[(mesh_id, old_id)] = vert_id
+                    mesh.verts.append(default_mesh.verts[old_id])
+                ind.vertex = vert_id
+            mesh.faces.append(face)
+
+        # Groups can't be built for the sections that weren't loaded
+        for mesh in self.meshes:
+            if 'bones' not in self.sections:
+                mesh.bone_groups = [[] for i in range(bone_count)]
+            if 'materials' not in self.sections:
+                mesh.material_groups = [[] for i in range(mtl_count)]
+
+    def weld(self, epsilon=None):
+        '''
+        Weld the face corners of each mesh (see Mesh.weld)
+        Returns a list of RenderBuffers in the same order as meshes
+        '''
+        return [mesh.weld(epsilon) for mesh in self.meshes]
+
+    def build_groups(self):
+        '''
+        Build the bone & material groups of every mesh now instead of on
+         first access
+        '''
+        for mesh in self.meshes:
+            mesh.build_groups()
+
+    def bone_quaternions(self, orthonormalize=True):
+        '''
+        Returns the rotation of every bone as an (x, y, z, w) quaternion (or
+         None for the bones that don't have a matrix)
+        Every matrix is converted in a single batch, if orthonormalize is
+         True they're re-orthonormalized first (the matrices loaded from
+         xmodel_bin files are quantized)
+        '''
+        quats = iter(__matrices_to_quat_list__(
+            [bone.matrix for bone in self.bones if None not in bone.matrix],
+            orthonormalize))
+        return [next(quats) if None not in bone.matrix else None
+                for bone in self.bones]
+
+    def set_bone_quaternions(self, quats):
+        '''
+        Set the matrix of every bone from its quaternion - quats holds an
+         (x, y, z, w) quaternion (or None to leave the matrix as is) per bone
+        '''
+        if len(quats) != len(self.bones):
+            raise ValueError("Expected a quaternion for each of the %d "
+                             "bones -- got %d" % (len(self.bones), len(quats)))
+        bones = [bone for bone, quat in zip(self.bones, quats)
+                 if quat is not None]
+        matrices = __quat_list_to_matrices__([quat for quat in quats
+                                              if quat is not None])
+        for bone, matrix in zip(bones, matrices):
+            bone.matrix = matrix
+
+    def __load_materials__(self, file, version):
+        lines_read = 0
+
+        material_count = None
+        material = None
+
+        for line in file:
+            lines_read += 1
+
+            line_split = line.split()
+            if not line_split:
+                continue
+
+            for i, split in enumerate(line_split):
+                if split[-1:] == ',':
+                    line_split[i] = split.rstrip(",")
+
+            if material_count is None and line_split[0] == "NUMMATERIALS":
+                material_count = int(line_split[1])
+                self.materials = [None] * material_count
+            elif line_split[0] == "MATERIAL":
+                index = int(line_split[1])
+                if version == 5:
+                    # Legacy XModel materials don't explicitly have a name
+                    #  field, so we simply auto-generate a name
+                    name = "Material_%d" % index
+                    material_type = "Lambert"
+                    images = deserialize_image_string(line_split[2].strip('"'))
+                else:
+                    name = line_split[2].strip('"')
+                    material_type = line_split[3].strip('"')
+                    images = deserialize_image_string(line_split[4].strip('"'))
+                material = Material(name, material_type, images)
+                self.materials[index] = Material(name, material_type, images)
+                material = self.materials[index]
+
+                if version == 5:
+                    continue
+
+            # All of the properties below are only present in version 6
+            elif line_split[0] == "COLOR":
+                material.color = (float(line_split[1]),
+                                  float(line_split[2]),
+                                  float(line_split[3]),
+                                  float(line_split[4]))
+            elif line_split[0] == "TRANSPARENCY":
+                material.transparency = (float(line_split[1]),
+                                         float(line_split[2]),
+                                         float(line_split[3]),
+                                         float(line_split[4]))
+            elif line_split[0] == "AMBIENTCOLOR":
+                material.color_ambient = (float(line_split[1]),
+                                          float(line_split[2]),
+                                          float(line_split[3]),
+                                          float(line_split[4]))
+            elif line_split[0] == "INCANDESCENCE":
+                material.incandescence = (float(line_split[1]),
+                                          float(line_split[2]),
+                                          float(line_split[3]),
+                                          float(line_split[4]))
+            elif line_split[0] == "COEFFS":
+                material.coeffs = (float(line_split[1]), float(line_split[2]))
+            elif line_split[0] == "GLOW":
+                material.glow = (float(line_split[1]), int(line_split[2]))
+            elif line_split[0] == "REFRACTIVE":
+                material.refractive = (int(line_split[1]),
+                                       float(line_split[2]))
+            elif line_split[0] == "SPECULARCOLOR":
+                material.color_specular = (float(line_split[1]),
+                                           float(line_split[2]),
+                                           float(line_split[3]),
+                                           float(line_split[4]))
+            elif line_split[0] == "REFLECTIVECOLOR":
+                material.color_reflective = (float(line_split[1]),
+                                             float(line_split[2]),
+                                             float(line_split[3]),
+                                             float(line_split[4]))
+            elif line_split[0] == "REFLECTIVE":
+                material.reflective = (
+                    int(line_split[1]), float(line_split[2]))
+            elif line_split[0] == "BLINN":
+                material.blinn = (float(line_split[1]), float(line_split[2]))
+            elif line_split[0] == "PHONG":
+                material.phong = float(line_split[1])
+
+        return lines_read
+
+    def normalize_weights(self):
+        """
+        Normalize the bone weights for all verts (in all meshes)
+        """
+        for mesh in self.meshes:
+            for vert in mesh.verts:
+                vert.weights = __normalized__(vert.weights)
+
+    def LoadFile_Raw(self, path, split_meshes=True, sections=None):
+        '''
+        Load an XMODEL_EXPORT file
+        sections can be used to only load some of the supported_sections -
+         the lines of the other sections are skipped without being parsed
+        '''
+        skip_sections = self.__load_sections__(sections)
+        if not TOKENIZED_PARSER:
+            return self.__load_raw_reference__(path, split_meshes,
+                                               skip_sections)
+
+        file = open(path, "r")
+        parser = ModelExportParser(self, skip_sections)
+        default_mesh = parser.parse(file)
+        file.close()
+
+        if 'geometry' in skip_sections:
+            self.meshes = []
+        elif split_meshes:
+            self.__generate_meshes__(default_mesh)
+        else:
+            self.meshes = [default_mesh]
+
+    def __load_raw_reference__(self, path, split_meshes, skip_sections):
+        '''
+        Load an XMODEL_EXPORT file using the line based reference parser
+        '''
+        real_file = open(path, "r")
+        # file automatically keeps track of what line its on across calls
+        file = real_file
+        self.__load_header__(file)
+        if 'bones' not in skip_sections:
+            self.__load_bones__(file)
+
+        if 'geometry' not in skip_sections:
+            # A global mesh containing all of the vertex and face data for the
+            # entire model
+            default_mesh = Mesh("$default")
+            pool = ValuePool() if INTERN_VALUES else None
+
+            file = __skip_lines__(file, ("NUMVERTS",))
+            default_mesh.__load_verts__(file, self, pool)
+            default_mesh.__load_faces__(file, self.version, pool)
+
+            if split_meshes:
+                self.__load_meshes__(file)
+
+        if 'materials' not in skip_sections:
+            file = __skip_lines__(file, ("NUMMATERIALS",))
+            self.__load_materials__(file, self.version)
+
+        if 'geometry' in skip_sections:
+            self.meshes = []
+        elif split_meshes:
+            self.__generate_meshes__(default_mesh)
+        else:
+            self.meshes = [default_mesh]
+        real_file.close()
+
+    # Write an xmodel_export file, by default it uses the objects self.version
+    # float_format is the FloatFormat used for the floats (%f by default)
+    def WriteFile_Raw(self, path, version=None,
+                      header_message="",
+                      extended_features=True,
+                      strict=False,
+                      float_format=None):
+        # If there is no current version, fallback to the argument
+        version = validate_version(self, version)
+
+        if version not in Model.supported_versions:
+            self.version = None
+            vargs = (version, repr(Model.supported_versions))
+            raise ValueError(
+                "Invalid model version: %d - must be one of %s" % vargs)
+
+        # Used to offset the vertex indices for each mesh
+        vert_offsets = [0]
+        for mesh in self.meshes:
+            prev_index = len(vert_offsets) - 1
+            vert_offsets.append(vert_offsets[prev_index] + len(mesh.verts))
+
+        vert_count = vert_offsets[len(vert_offsets) - 1]
+
+        if strict:
+            # TODO: Add cosmetic hierarchy validation
+            assert len(self.materials) < 256
+            assert len(self.meshes) < 256
+            if version < 7:
+                assert vert_count <= 0xFFFF
+
+        file = ExportWriter(open(path, "w"), float_format)
+        file.write("// Export time: %s\n\n" % strftime("%a %b %d %H:%M:%S %Y"))
+
+        if header_message != '':
+            file.write(header_message)
+
+        file.write("MODEL\n")
+        file.write("VERSION %d\n\n" % version)
+
+        # Bone Hierarchy
+        file.write("NUMBONES %d\n" % len(self.bones))
+
+        # NOTE: Cosmetic bones are only used by version 7 and later
+        if version == 7:
+            cosmetics = len([bone for bone in self.bones if bone.cosmetic])
+            if cosmetics > 0:
+                file.write("NUMCOSMETICS %d\n" % cosmetics)
+
+                # Cosmetic bones MUST be written AFTER the standard bones in
+                #  the bone info list, so we need to generate a sorted list
+                #  of index/bone pairs
+                bone_enum = sorted(enumerate(self.bones),
+                                   key=lambda kvp: kvp[1].cosmetic)
+
+                # Allocate space for the bone map before any
+                #  modifications to self.bones
+                bone_map = [None] * len(self.bones)
+
+                # Update the bone list & build old->new index map
+                index_map, self.bones = zip(*bone_enum)
+                for new, old in enumerate(index_map):
+                    bone_map[old] = new
+
+                # Rebuild the parent indices for all non-root bones
+                for bone in self.bones:
+                    if bone.parent != -1:
+                        bone.parent = bone_map[bone.parent]
+
+                # Rebuild the weight tables for all vertices
+                for mesh in self.meshes:
+                    for vert in mesh.verts:
+                        vert.weights = [(bone_map[old_index], weight)
+                                        for old_index, weight in vert.weights]
+
+        __write_bones_raw__(file, self.bones)
+
+        # Vertices
+        vert_tok_suffix = "32" if version == 7 and vert_count > 0xFFFF else ""
+        file.write("NUMVERTS%s %d\n" % (vert_tok_suffix, vert_count))
+        __write_verts_raw__(file, self.meshes, vert_offsets, vert_tok_suffix)
+
+        # Faces
+        face_count = sum([len(mesh.faces) for mesh in self.meshes])
+        file.write("NUMFACES %d\n" % face_count)
+        __write_faces_raw__(file, version, self.meshes, vert_offsets,
+                            vert_tok_suffix)
+
+        # Meshes
+        file.write("NUMOBJECTS %d\n" % len(self.meshes))
+        file.write("".join(["OBJECT %d \"%s\"\n" % (mesh_index, mesh.name)
+                            for mesh_index, mesh in enumerate(self.meshes)]))
+        file.write("\n")
+
+        # Materials
+        file.write("NUMMATERIALS %d\n" % len(self.materials))
+        for material_index, material in enumerate(self.materials):
+            material.save(file, version, material_index,
+                          extended_features=extended_features,
+                          float_format=file.float_format)
+
+        file.close()
+
+    @staticmethod
+    def FromFile_Raw(filepath, split_meshes=True, sections=None):
+        '''
+        Load from an XMODEL_EXPORT file and return the resulting Model()
+        '''
+        model = Model()
+        model.LoadFile_Raw(filepath, split_meshes, sections)
+        return model
+
+    def LoadFile_Bin(self, path, split_meshes=True,
+                     is_compressed=True, dump=False, sections=None):
+        '''
+        Load an XMODEL_BIN file
+        sections can be used to only load some of the supported_sections -
+         the blocks of the other sections are skipped without being decoded
+        '''
+        skip_sections = self.__load_sections__(sections)
+        file = open(path, "rb")
+
+        if is_compressed:
+            file = XBinIO.__decompress_internal__(file, dump)
+
+        default_mesh = self.__xbin_loadfile_internal__(file, 'MODEL',
+                                                       skip_sections)
+
+        if 'geometry' in skip_sections:
+            self.meshes = []
+        elif split_meshes:
+            self.__generate_meshes__(default_mesh)
+        else:
+            self.meshes = [default_mesh]
+        file.close()
+
+    def WriteFile_Bin(self, path, version=None,
+                      extended_features=True, header_message=""):
+        # If there is no current version, fallback to the argument
+        version = validate_version(self, version)
+        return self.__xbin_writefile_model_internal__(path,
+                                                      version,
+                                                      extended_features,
+                                                      header_message)
+
+    @staticmethod
+    def FromFile_Bin(filepath, split_meshes=True,
+                     is_compressed=True, dump=False, sections=None):
+        '''
+        Load from an XMODEL_BIN file and return the resulting Model()
+        '''
+        model = Model()
+        model.LoadFile_Bin(filepath, split_meshes, is_compressed, dump,
+                           sections)
+        return model
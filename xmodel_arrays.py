@@ -0,0 +1,1353 @@
+# <pep8 compliant>
+
+from array import array
+from time import strftime
+
+import struct
+
+from .xbin import XBinIO, XBinDecoder, validate_version
+from .xbin import (__unpack_vertex__, __unpack_vertex_weight__,
+                   __unpack_face_vertex__, __unpack_int16__,
+                   __unpack_int32__, __load_string__, padded,
+                   __model_strings__, __model_head_size__,
+                   __pack_model_head__, __model_tail_size__,
+                   __pack_model_tail__, __pack_uint16_block__,
+                   __pack_uint32_block__, __pack_weight_block__,
+                   __pack_tri_block__, __pack_tri16_block__,
+                   __pack_vertex16__, __pack_vertex32__,
+                   __pack_face_vertex16__, __pack_face_vertex32__,
+                   __clamp_float_to_short__)
+from .xmodel import (Model, Mesh, Vertex, Face, FaceVertex,
+                     ModelExportParser, __build_section_handlers__,
+                     __build_record_sizes__, __parse_sections__,
+                     __write_bones_raw__, __vertex_format__, __face_format__)
+from ._writer import ExportWriter, WRITE_BATCH_SIZE
+
+# Typecode of the (32 bit) integer arrays
+INDEX_TYPE = 'i'
+
+# Default typecode of the float arrays - 'f' (32 bit) is compact, 'd' keeps
+#  the full precision of the floats in a Model
+FLOAT_TYPE = 'f'
+
+# The number of buffered tokens after which the XMODEL_EXPORT parser converts
+#  them into the arrays
+__FLUSH_SIZE__ = 1 << 16
+
+# The maximum number of faces the XMODEL_EXPORT parser loads in a single run
+__MAX_FACE_RUN__ = 1 << 14
+
+# Typecodes that can hold the items of a buffer as they are
+__BUFFER_TYPES__ = frozenset('bBhHiIlLqQfd')
+
+
+def __zeros__(typecode, count):
+    return array(typecode, [0]) * count
+
+
+def __as_array__(values, typecode):
+    '''
+    Returns values as an array - values can be an array, any object that
+     supports the buffer protocol (numpy arrays, memoryviews, ...) or a flat
+     sequence of numbers (which is converted to typecode)
+    Multidimensional buffers are flattened in C order
+    '''
+    if isinstance(values, array):
+        return values
+    try:
+        view = memoryview(values)
+    except TypeError:
+        return array(typecode, values)
+
+    item_type = view.format.lstrip('@=<')
+    if item_type not in __BUFFER_TYPES__:
+        raise ValueError("Unsupported buffer format '%s'" % view.format)
+    result = array(item_type)
+    if result.itemsize != view.itemsize:
+        raise ValueError("Unsupported buffer format '%s'" % view.format)
+    if hasattr(result, 'frombytes'):
+        result.frombytes(view.tobytes())
+    else:
+        result.fromstring(view.tobytes())
+    return result
+
+
+def __build_weight_offsets__(starts, counts, bones, values):
+    '''
+    Build the CSR weight arrays from the (start, count) run of each vertex's
+     weights in bones & values
+    Returns (offsets, bones, values) - the weights are only reordered if the
+     runs aren't already stored in vertex order
+    '''
+    offsets = __zeros__(INDEX_TYPE, len(counts) + 1)
+    total = 0
+    in_order = True
+    for i, count in enumerate(counts):
+        if starts[i] != total:
+            in_order = False
+        total += count
+        offsets[i + 1] = total
+    if in_order and total == len(bones):
+        return offsets, bones, values
+
+    ordered_bones = array(bones.typecode)
+    ordered_values = array(values.typecode)
+    for start, count in zip(starts, counts):
+        ordered_bones.extend(bones[start:start + count])
+        ordered_values.extend(values[start:start + count])
+    return offsets, ordered_bones, ordered_values
+
+
+class ModelArrays(XBinIO, object):
+    '''
+    Columnar (array backed) representation of a Model
+
+    The geometry is stored the way the files lay it out - a single list of
+     vertices and faces for the whole model, where each face stores the
+     index of the mesh (object) it belongs to:
+
+        positions       3 floats per vertex
+        weight_offsets  vertex_count + 1 offsets into weight_bones and
+                         weight_values, the weights of vertex i are the range
+                         [weight_offsets[i], weight_offsets[i + 1])
+        weight_bones    the bone index of each weight
+        weight_values   the influence of each weight
+        face_vertices   3 vertex indices per face
+        normals         3 floats per face vertex (9 per face)
+        colors          4 floats (RGBA) per face vertex (12 per face) or None
+                         if the model has no vertex colors (version 5)
+        uvs             2 floats per face vertex (6 per face)
+        face_meshes     the mesh index of each face
+        face_materials  the material index of each face
+
+    The float arrays use float_type & the integer arrays use INDEX_TYPE. All
+     of them support the buffer protocol (memoryview, numpy.frombuffer, ...)
+
+    The bones & materials are kept as lists of Bone & Material objects and
+     mesh_names holds the name of each mesh
+    '''
+    __slots__ = ('name', 'float_type', 'sections',
+                 'bones', 'materials', 'mesh_names',
+                 'positions', 'weight_offsets', 'weight_bones',
+                 'weight_values', 'face_vertices', 'normals', 'colors', 'uvs',
+                 'face_meshes', 'face_materials')
+    supported_sections = Model.supported_sections
+
+    def __init__(self, name='$model', float_type=FLOAT_TYPE):
+        super(XBinIO, self).__init__()
+        self.name = name
+        self.float_type = float_type
+
+        # The sections that were loaded (see supported_sections)
+        self.sections = frozenset(Model.supported_sections)
+
+        self.bones = []
+        self.materials = []
+        self.mesh_names = []
+        self.__init_verts__(0)
+        self.__init_faces__(0, True)
+
+    def __init_verts__(self, vertex_count):
+        self.positions = __zeros__(self.float_type, 3 * vertex_count)
+        self.weight_offsets = __zeros__(INDEX_TYPE, vertex_count + 1)
+        self.weight_bones = array(INDEX_TYPE)
+        self.weight_values = array(self.float_type)
+
+    def __init_faces__(self, face_count, use_colors):
+        float_type = self.float_type
+        self.face_vertices = __zeros__(INDEX_TYPE, 3 * face_count)
+        self.normals = __zeros__(float_type, 9 * face_count)
+        self.colors = (__zeros__(float_type, 12 * face_count)
+                       if use_colors else None)
+        self.uvs = __zeros__(float_type, 6 * face_count)
+        self.face_meshes = __zeros__(INDEX_TYPE, face_count)
+        self.face_materials = __zeros__(INDEX_TYPE, face_count)
+
+    def __load_sections__(self, sections):
+        self.sections, skip_sections = __parse_sections__(sections)
+        return skip_sections
+
+    def vertex_count(self):
+        return len(self.positions) // 3
+
+    def face_count(self):
+        return len(self.face_meshes)
+
+    @staticmethod
+    def from_model(model, float_type=FLOAT_TYPE):
+        '''
+        Build a ModelArrays from a Model
+        The meshes are merged the same way WriteFile_Raw / WriteFile_Bin
+         merge them, and the Bone & Material objects are shared
+        '''
+        arrays = ModelArrays(model.name, float_type)
+        arrays.version = getattr(model, 'version', None)
+        arrays.sections = model.sections
+        arrays.bones = list(model.bones)
+        arrays.materials = list(model.materials)
+        arrays.mesh_names = [mesh.name for mesh in model.meshes]
+
+        positions = arrays.positions
+        weight_offsets = arrays.weight_offsets
+        weight_bones = arrays.weight_bones
+        weight_values = arrays.weight_values
+        face_vertices = arrays.face_vertices
+        normals = arrays.normals
+        colors = arrays.colors
+        uvs = arrays.uvs
+        face_meshes = arrays.face_meshes
+        face_materials = arrays.face_materials
+
+        corners = [face_vert for mesh in model.meshes
+                   for face in mesh.faces for face_vert in face.indices]
+        missing_colors = [face_vert.color is None for face_vert in corners]
+        if any(missing_colors):
+            if not all(missing_colors):
+                raise ValueError("Can't mix face vertices with & without "
+                                 "colors")
+            arrays.colors = colors = None
+
+        vert_offset = 0
+        for mesh in model.meshes:
+            for vert in mesh.verts:
+                positions.extend(vert.offset)
+                for bone, weight in vert.weights:
+                    weight_bones.append(bone)
+                    weight_values.append(weight)
+                weight_offsets.append(len(weight_bones))
+
+            for face in mesh.faces:
+                if len(face.indices) != 3:
+                    raise ValueError("Faces must have exactly 3 vertices")
+                face_meshes.append(face.mesh_id)
+                face_materials.append(face.material_id)
+                for face_vert in face.indices:
+                    face_vertices.append(face_vert.vertex + vert_offset)
+                    normals.extend(face_vert.normal)
+                    if colors is not None:
+                        colors.extend(face_vert.color)
+                    uvs.extend(face_vert.uv)
+
+            vert_offset += len(mesh.verts)
+
+        return arrays
+
+    def to_model(self, split_meshes=True):
+        '''
+        Build a Model from the arrays - the result is the same as loading
+         the file these arrays were loaded from with split_meshes
+        The Bone & Material objects are shared
+        '''
+        model = Model(self.name)
+        model.version = getattr(self, 'version', None)
+        model.sections = self.sections
+        model.bones = list(self.bones)
+        model.materials = list(self.materials)
+
+        if 'geometry' not in self.sections:
+            model.meshes = []
+            return model
+
+        default_mesh = Mesh("$default")
+
+        positions = self.positions
+        weight_offsets = self.weight_offsets
+        weight_bones = self.weight_bones
+        weight_values = self.weight_values
+        verts = [None] * self.vertex_count()
+        for i in range(len(verts)):
+            start = weight_offsets[i]
+            end = weight_offsets[i + 1]
+            weights = list(zip(weight_bones[start:end],
+                               weight_values[start:end]))
+            verts[i] = Vertex(tuple(positions[3 * i:3 * i + 3]), weights)
+        default_mesh.verts = verts
+
+        face_vertices = self.face_vertices
+        normals = self.normals
+        colors = self.colors
+        uvs = self.uvs
+        face_meshes = self.face_meshes
+        face_materials = self.face_materials
+        faces = [None] * self.face_count()
+        for i in range(len(faces)):
+            face = Face(face_meshes[i], face_materials[i])
+            indices = face.indices
+            for corner in range(3):
+                j = 3 * i + corner
+                color = (tuple(colors[4 * j:4 * j + 4])
+                         if colors is not None else None)
+                indices[corner] = FaceVertex(face_vertices[j],
+                                             tuple(normals[3 * j:3 * j + 3]),
+                                             color,
+                                             tuple(uvs[2 * j:2 * j + 2]))
+            faces[i] = face
+        default_mesh.faces = faces
+
+        if split_meshes:
+            model.meshes = [Mesh(name) for name in self.mesh_names]
+            model.__generate_meshes__(default_mesh)
+        else:
+            model.meshes = [default_mesh]
+        return model
+
+    def LoadFile_Raw(self, path, sections=None):
+        '''
+        Load an XMODEL_EXPORT file straight into the arrays
+        sections can be used to only load some of the supported_sections
+        '''
+        skip_sections = self.__load_sections__(sections)
+        file = open(path, "r")
+        try:
+            ModelArraysParser(self, skip_sections).parse(file)
+        finally:
+            file.close()
+
+    def LoadFile_Bin(self, path, is_compressed=True, dump=False,
+                     sections=None):
+        '''
+        Load an XMODEL_BIN file straight into the arrays
+        sections can be used to only load some of the supported_sections
+        '''
+        skip_sections = self.__load_sections__(sections)
+        file = open(path, "rb")
+
+        if is_compressed:
+            file = XBinIO.__decompress_internal__(file, dump)
+
+        try:
+            self.__xbin_loadfile_internal__(file, 'MODEL', skip_sections,
+                                            ModelArraysDecoder)
+        finally:
+            file.close()
+
+    def WriteFile_Raw(self, path, version=None,
+                      header_message="",
+                      extended_features=True,
+                      strict=False,
+                      float_format=None):
+        '''
+        Write an XMODEL_EXPORT file straight from the arrays - the output is
+         the same as the Model's that from_model was given (or
+         to_model(split_meshes=False)'s)
+        Any of the arrays can be replaced with an object that supports the
+         buffer protocol or a flat sequence
+        float_format is the FloatFormat used for the floats (%f by default)
+        '''
+        # If there is no current version, fallback to the argument
+        version = validate_version(self, version)
+
+        if version not in Model.supported_versions:
+            self.version = None
+            vargs = (version, repr(Model.supported_versions))
+            raise ValueError(
+                "Invalid model version: %d - must be one of %s" % vargs)
+
+        float_type = self.float_type
+        positions = __as_array__(self.positions, float_type)
+        weight_offsets = __as_array__(self.weight_offsets, INDEX_TYPE)
+        weight_bones = __as_array__(self.weight_bones, INDEX_TYPE)
+        weight_values = __as_array__(self.weight_values, float_type)
+        face_vertices = __as_array__(self.face_vertices, INDEX_TYPE)
+        normals = __as_array__(self.normals, float_type)
+        colors = None
+        if self.colors is not None:
+            colors = __as_array__(self.colors, float_type)
+        elif version != 5:
+            raise ValueError("Version %d requires vertex colors" % version)
+        uvs = __as_array__(self.uvs, float_type)
+        face_meshes = __as_array__(self.face_meshes, INDEX_TYPE)
+        face_materials = __as_array__(self.face_materials, INDEX_TYPE)
+
+        vert_count = len(positions) // 3
+
+        if strict:
+            # TODO: Add cosmetic hierarchy validation
+            assert len(self.materials) < 256
+            assert len(self.mesh_names) < 256
+            if version < 7:
+                assert vert_count <= 0xFFFF
+
+        file = ExportWriter(open(path, "w"), float_format)
+        file.write("// Export time: %s\n\n" % strftime("%a %b %d %H:%M:%S %Y"))
+
+        if header_message != '':
+            file.write(header_message)
+
+        file.write("MODEL\n")
+        file.write("VERSION %d\n\n" % version)
+
+        # Bone Hierarchy
+        file.write("NUMBONES %d\n" % len(self.bones))
+
+        # NOTE: Cosmetic bones are only used by version 7 and later
+        #  Like Model.WriteFile_Raw, they're written after the standard
+        #  bones - but the bones & weights are remapped as they're written
+        #  instead of being modified
+        bones = self.bones
+        bone_map = None
+        if version == 7:
+            cosmetics = len([bone for bone in bones if bone.cosmetic])
+            if cosmetics > 0:
+                file.write("NUMCOSMETICS %d\n" % cosmetics)
+                bone_enum = sorted(enumerate(bones),
+                                   key=lambda kvp: kvp[1].cosmetic)
+                bone_map = [None] * len(bones)
+                index_map, bones = zip(*bone_enum)
+                for new, old in enumerate(index_map):
+                    bone_map[old] = new
+                weight_bones = array(INDEX_TYPE, [bone_map[old_index]
+                                                  for old_index
+                                                  in weight_bones])
+
+        __write_bones_raw__(file, bones, bone_map)
+
+        # Vertices
+        vert_tok_suffix = "32" if version == 7 and vert_count > 0xFFFF else ""
+        file.write("NUMVERTS%s %d\n" % (vert_tok_suffix, vert_count))
+        __write_vertices_raw__(file, vert_tok_suffix, positions,
+                               weight_offsets, weight_bones, weight_values)
+
+        # Faces
+        file.write("NUMFACES %d\n" % len(face_meshes))
+        __write_faces_raw__(file, version, vert_tok_suffix, face_vertices,
+                            normals, colors, uvs, face_meshes, face_materials)
+
+        # Meshes
+        file.write("NUMOBJECTS %d\n" % len(self.mesh_names))
+        for mesh_index, name in enumerate(self.mesh_names):
+            file.write("OBJECT %d \"%s\"\n" % (mesh_index, name))
+        file.write("\n")
+
+        # Materials
+        file.write("NUMMATERIALS %d\n" % len(self.materials))
+        for material_index, material in enumerate(self.materials):
+            material.save(file, version, material_index,
+                          extended_features=extended_features,
+                          float_format=file.float_format)
+
+        file.close()
+
+    def WriteFile_Bin(self, path, version=None,
+                      extended_features=True, header_message=""):
+        '''
+        Write an XMODEL_BIN file straight from the arrays - the output is the
+         same as the Model's that from_model was given (or
+         to_model(split_meshes=False)'s)
+        Any of the arrays can be replaced with an object that supports the
+         buffer protocol or a flat sequence
+        '''
+        # If there is no current version, fallback to the argument
+        version = validate_version(self, version)
+        data = __encode_model_arrays__(self, version, extended_features,
+                                       header_message)
+        with open(path, "wb") as real_file:
+            XBinIO.__compress_buffer_internal__(data, real_file,
+                                                close_files=False)
+
+    @staticmethod
+    def FromFile_Raw(filepath, sections=None, float_type=FLOAT_TYPE):
+        '''
+        Load from an XMODEL_EXPORT file and return the resulting ModelArrays
+        '''
+        arrays = ModelArrays(float_type=float_type)
+        arrays.LoadFile_Raw(filepath, sections)
+        return arrays
+
+    @staticmethod
+    def FromFile_Bin(filepath, is_compressed=True, dump=False,
+                     sections=None, float_type=FLOAT_TYPE):
+        '''
+        Load from an XMODEL_BIN file and return the resulting ModelArrays
+        '''
+        arrays = ModelArrays(float_type=float_type)
+        arrays.LoadFile_Bin(filepath, is_compressed, dump, sections)
+        return arrays
+
+
+class ModelArraysParser(ModelExportParser):
+    '''
+    Tokenizing XMODEL_EXPORT parser that fills a ModelArrays
+
+    The tokens of the records using the standard layout are buffered and
+     converted into the arrays in bulk. Any other record is parsed into a
+     temporary Vertex / Face by the ModelExportParser handlers & copied into
+     the arrays once the whole file has been parsed
+    '''
+    __slots__ = ('vert_number', 'face_number', 'face_run',
+                 'pending_verts', 'pending_faces',
+                 'weight_counts', 'buffers',
+                 'position_tokens', 'bone_tokens', 'weight_tokens',
+                 'vertex_tokens', 'normal_tokens', 'color_tokens',
+                 'uv_tokens', 'mesh_tokens', 'material_tokens')
+
+    section_handlers = {}
+    # Maps (version == 5) to the standard face layout - filled in below
+    face_layouts = {}
+
+    def __init__(self, arrays, skip_sections=()):
+        ModelExportParser.__init__(self, arrays, skip_sections)
+        self.vert_number = 0
+        self.face_number = 0
+        # The number of faces to try loading at once (see __load_face_run__)
+        self.face_run = __MAX_FACE_RUN__
+        # (index, Vertex) & (index, Face) for the non-standard records
+        self.pending_verts = []
+        self.pending_faces = []
+        self.weight_counts = []
+        # (tokens, array, type) for each of the token buffers
+        self.buffers = []
+
+        self.position_tokens = []
+        self.bone_tokens = []
+        self.weight_tokens = []
+        self.vertex_tokens = []
+        self.normal_tokens = []
+        self.color_tokens = []
+        self.uv_tokens = []
+        self.mesh_tokens = []
+        self.material_tokens = []
+
+    def __flush__(self):
+        '''
+        Convert the buffered tokens into the arrays
+        '''
+        for tokens, values, cast in self.buffers:
+            values.extend(map(cast, tokens))
+            del tokens[:]
+
+    def __finalize__(self):
+        self.__flush__()
+        arrays = self.model
+        float_type = arrays.float_type
+
+        # Records that were missing from the file are left zeroed
+        positions = arrays.positions
+        positions.extend(__zeros__(float_type,
+                                   3 * self.vert_count - len(positions)))
+        counts = self.weight_counts
+        counts.extend([0] * (self.vert_count - len(counts)))
+
+        bones = arrays.weight_bones
+        values = arrays.weight_values
+        starts = [0] * len(counts)
+        total = 0
+        for i, count in enumerate(counts):
+            starts[i] = total
+            total += count
+        for index, vertex in self.pending_verts:
+            if vertex.offset is not None:
+                positions[3 * index:3 * index + 3] = array(float_type,
+                                                           vertex.offset)
+            starts[index] = len(bones)
+            counts[index] = len(vertex.weights)
+            for bone, weight in vertex.weights:
+                bones.append(bone)
+                values.append(weight)
+        (arrays.weight_offsets, arrays.weight_bones,
+         arrays.weight_values) = __build_weight_offsets__(starts, counts,
+                                                          bones, values)
+
+        missing = self.face_count - len(arrays.face_meshes)
+        arrays.face_vertices.extend(__zeros__(INDEX_TYPE, 3 * missing))
+        arrays.normals.extend(__zeros__(float_type, 9 * missing))
+        if arrays.colors is not None:
+            arrays.colors.extend(__zeros__(float_type, 12 * missing))
+        arrays.uvs.extend(__zeros__(float_type, 6 * missing))
+        arrays.face_meshes.extend(__zeros__(INDEX_TYPE, missing))
+        arrays.face_materials.extend(__zeros__(INDEX_TYPE, missing))
+
+        for index, face in self.pending_faces:
+            for corner, face_vert in enumerate(face.indices):
+                if face_vert is not None:
+                    __store_face_vertex__(arrays, 3 * index + corner,
+                                          face_vert)
+
+    # Section Handlers
+
+    def LoadNumVerts(self, tokens, pos):
+        if 'geometry' in self.skip_sections:
+            return ModelExportParser.LoadNumVerts(self, tokens, pos)
+        arrays = self.model
+        self.vert_count = int(tokens[pos + 1])
+        self.vert_number = 0
+        arrays.__init_verts__(0)
+        self.buffers.extend(((self.position_tokens, arrays.positions, float),
+                             (self.bone_tokens, arrays.weight_bones, int),
+                             (self.weight_tokens, arrays.weight_values,
+                              float)))
+        self.handlers = self.section_handlers['verts']
+        return pos + 2
+
+    def LoadNumFaces(self, tokens, pos):
+        arrays = self.model
+        self.face_count = int(tokens[pos + 1])
+        self.face_number = 0
+        self.active_face = None
+        arrays.__init_faces__(0, self.version != 5)
+        self.buffers.extend(((self.vertex_tokens, arrays.face_vertices, int),
+                             (self.normal_tokens, arrays.normals, float),
+                             (self.uv_tokens, arrays.uvs, float),
+                             (self.mesh_tokens, arrays.face_meshes, int),
+                             (self.material_tokens, arrays.face_materials,
+                              int)))
+        if arrays.colors is not None:
+            self.buffers.append((self.color_tokens, arrays.colors, float))
+        self.handlers = self.section_handlers['faces']
+        return pos + 2
+
+    def LoadNumObjects(self, tokens, pos):
+        self.model.mesh_names = [None] * int(tokens[pos + 1])
+        self.handlers = self.section_handlers['objects']
+        return pos + 2
+
+    # Vertex Handlers
+
+    def LoadVertex(self, tokens, pos):
+        vert_index = int(tokens[pos + 1])
+        vert_count = self.vert_count
+        if vert_index >= vert_count:
+            fmt = ("vert_count does not index vert_index -- "
+                   "%d not in [0, %d)")
+            raise ValueError(fmt % (vert_index, vert_count))
+
+        p = pos + 2
+        number = self.vert_number
+        if number >= vert_count:
+            # Any extra vertices are parsed but not stored
+            self.active = Vertex()
+            return p
+        self.vert_number = number + 1
+
+        if (len(tokens) >= p + 6 and tokens[p] == "OFFSET" and
+                tokens[p + 4] == "BONES"):
+            count = int(tokens[p + 5])
+            end = p + 6 + 3 * count
+            weights = tokens[p + 6:end]
+            if weights[::3].count("BONE") == count:
+                self.position_tokens.extend(tokens[p + 1:p + 4])
+                self.weight_counts.append(count)
+                self.bone_tokens.extend(weights[1::3])
+                self.weight_tokens.extend(weights[2::3])
+                if len(self.position_tokens) >= __FLUSH_SIZE__:
+                    self.__flush__()
+                return end
+
+        vertex = Vertex()
+        self.pending_verts.append((number, vertex))
+        self.position_tokens.extend(("0", "0", "0"))
+        self.weight_counts.append(0)
+        self.active = vertex
+        self.weight_index = 0
+        return p
+
+    # Face Handlers
+
+    def LoadFace(self, tokens, pos):
+        number = self.face_number
+        if number >= self.face_count:
+            # Any extra faces are parsed but not stored
+            return ModelExportParser.LoadFace(self, tokens, pos)
+
+        end = self.__load_face_run__(tokens, pos)
+        if end is not None:
+            return end
+        # Try a longer run again after each face that had to be parsed on
+        #  its own
+        self.face_run += 1
+
+        self.face_number = number + 1
+        self.active_face = None
+        self.mesh_tokens.append(tokens[pos + 1])
+        self.material_tokens.append(tokens[pos + 2])
+
+        # Skip the (unused) smoothing group & shape flags
+        p = pos + 3
+        vert_toks = ModelExportParser.vert_tokens
+        size = len(tokens)
+        if size > p and tokens[p] not in vert_toks:
+            p += 2
+
+        vertex_tokens = self.vertex_tokens
+        normal_tokens = self.normal_tokens
+        uv_tokens = self.uv_tokens
+        if self.version == 5:
+            for corner in range(3):
+                if size < p + 7 or tokens[p] not in vert_toks:
+                    return self.__pending_face__(number, corner, p)
+                vertex_tokens.append(tokens[p + 1])
+                normal_tokens.extend(tokens[p + 2:p + 5])
+                uv_tokens.extend(tokens[p + 5:p + 7])
+                p += 7
+        else:
+            color_tokens = self.color_tokens
+            for corner in range(3):
+                if (size < p + 15 or tokens[p] not in vert_toks or
+                        tokens[p + 2] != "NORMAL" or
+                        tokens[p + 6] != "COLOR" or
+                        tokens[p + 11] != "UV"):
+                    return self.__pending_face__(number, corner, p)
+                vertex_tokens.append(tokens[p + 1])
+                normal_tokens.extend(tokens[p + 3:p + 6])
+                color_tokens.extend(tokens[p + 7:p + 11])
+                uv_tokens.extend(tokens[p + 13:p + 15])
+                # Only the first UV layer is used
+                p += 13 + 2 * int(tokens[p + 12])
+
+        if len(normal_tokens) >= __FLUSH_SIZE__:
+            self.__flush__()
+        return p
+
+    def __load_face_run__(self, tokens, pos):
+        '''
+        Load a run of faces that all use the standard layout at once
+        In that layout every face takes the same number of tokens, so each
+         keyword & value is found at a fixed stride through the token list
+        Returns the position after the run or None if there's no such run
+        '''
+        layout = ModelArraysParser.face_layouts[self.version == 5]
+        stride = layout['stride']
+        count = min(self.face_run, self.face_count - self.face_number,
+                    (len(tokens) - pos) // stride)
+        if count < 2:
+            return None
+
+        end = pos + count * stride
+        for offset, keywords in layout['keywords']:
+            column = tokens[pos + offset:end:stride]
+            if sum([column.count(keyword) for keyword in keywords]) != count:
+                self.face_run = max(self.face_run // 2, 1)
+                return None
+        self.face_run = min(2 * self.face_run, __MAX_FACE_RUN__)
+
+        for buffer, offsets in ((self.mesh_tokens, (1,)),
+                                (self.material_tokens, (2,)),
+                                (self.vertex_tokens, layout['vertex']),
+                                (self.normal_tokens, layout['normal']),
+                                (self.color_tokens, layout['color']),
+                                (self.uv_tokens, layout['uv'])):
+            if not offsets:
+                continue
+            # Interleave the columns of each face
+            size = len(offsets)
+            values = [None] * (count * size)
+            for i, offset in enumerate(offsets):
+                values[i::size] = tokens[pos + offset:end:stride]
+            buffer.extend(values)
+
+        self.face_number += count
+        self.active_face = None
+        if len(self.normal_tokens) >= __FLUSH_SIZE__:
+            self.__flush__()
+        return end
+
+    def __pending_face__(self, number, corner, pos):
+        '''
+        Fall back to parsing the rest of the face (starting at corner) into
+         a temporary Face, the arrays get zeros until the end of the file
+        '''
+        face = Face(None, None)
+        self.pending_faces.append((number, face))
+        self.active_face = face
+        self.corner = corner
+
+        missing = 3 - corner
+        self.vertex_tokens.extend(("0",) * missing)
+        self.normal_tokens.extend(("0",) * (3 * missing))
+        if self.version != 5:
+            self.color_tokens.extend(("0",) * (4 * missing))
+        self.uv_tokens.extend(("0",) * (2 * missing))
+        return pos
+
+    # Object Handlers
+
+    def LoadObject(self, tokens, pos):
+        index = int(tokens[pos + 1])
+        self.model.mesh_names[index] = tokens[pos + 2].strip('"')
+        return pos + 3
+
+
+ModelArraysParser.section_handlers = __build_section_handlers__(
+    ModelArraysParser)
+ModelArraysParser.record_sizes = __build_record_sizes__(ModelArraysParser)
+
+
+def __face_layout__(corner_size, keywords, vertex, normal, color, uv):
+    '''
+    Build the standard layout of a face (see __load_face_run__) from the
+     layout of a face vertex - all of the offsets are relative to the start
+     of the face vertex
+    '''
+    def offsets(columns):
+        return tuple([5 + corner * corner_size + column
+                      for corner in range(3) for column in columns])
+    layout_keywords = [(0, ("TRI", "TRI16"))]
+    for column, keyword in keywords:
+        layout_keywords.extend([(offset, keyword)
+                                for offset in offsets((column,))])
+    return {'stride': 5 + 3 * corner_size,
+            'keywords': layout_keywords,
+            'vertex': offsets(vertex),
+            'normal': offsets(normal),
+            'color': offsets(color),
+            'uv': offsets(uv)}
+
+
+# The standard face layouts - "TRI a b c d" followed by 3 face vertices
+#  Version 5: "VERT i nx ny nz u v"
+#  Version 6+: "VERT i NORMAL x y z COLOR r g b a UV 1 u v"
+ModelArraysParser.face_layouts = {
+    True: __face_layout__(7, ((0, ("VERT", "VERT32")),),
+                          (1,), (2, 3, 4), (), (5, 6)),
+    False: __face_layout__(15, ((0, ("VERT", "VERT32")), (2, ("NORMAL",)),
+                                (6, ("COLOR",)), (11, ("UV",)),
+                                (12, ("1",))),
+                           (1,), (3, 4, 5), (7, 8, 9, 10), (13, 14)),
+}
+
+
+def __store_face_vertex__(arrays, index, face_vert):
+    '''
+    Copy a FaceVertex into the arrays at the given face vertex index
+    '''
+    float_type = arrays.float_type
+    if face_vert.vertex is not None:
+        arrays.face_vertices[index] = face_vert.vertex
+    if face_vert.normal is not None:
+        arrays.normals[3 * index:3 * index + 3] = array(float_type,
+                                                        face_vert.normal)
+    if face_vert.color is not None and arrays.colors is not None:
+        arrays.colors[4 * index:4 * index + 4] = array(float_type,
+                                                       face_vert.color)
+    if face_vert.uv:
+        arrays.uvs[2 * index:2 * index + 2] = array(float_type, face_vert.uv)
+
+
+class ModelArraysDecoder(XBinDecoder):
+    '''
+    Decodes the block stream of an xmodel_bin file into a ModelArrays
+
+    Vertices & face vertices written as the usual fixed run of blocks are
+     unpacked straight into the arrays. Any others are decoded into a
+     temporary Vertex / FaceVertex by the XBinDecoder handlers & copied
+     into the arrays once all of the blocks have been decoded
+    '''
+    __slots__ = ('face_number', 'corner', 'weight_starts', 'weight_counts',
+                 'pending_verts', 'pending_face_verts')
+
+    handlers = {}
+
+    def __init__(self, target, expected_type, skip_sections=()):
+        XBinDecoder.__init__(self, target, expected_type, skip_sections)
+        self.face_number = -1
+        self.corner = 0
+        self.weight_starts = []
+        self.weight_counts = []
+        # (vertex index, Vertex) & (face vertex index, FaceVertex) for the
+        #  non-standard runs of blocks
+        self.pending_verts = []
+        self.pending_face_verts = []
+
+    def result(self):
+        arrays = self.target
+        starts = self.weight_starts
+        counts = self.weight_counts
+        bones = arrays.weight_bones
+        values = arrays.weight_values
+        for index, vertex in self.pending_verts:
+            if vertex.offset is not None:
+                arrays.positions[3 * index:3 * index + 3] = array(
+                    arrays.float_type, vertex.offset)
+            starts[index] = len(bones)
+            counts[index] = len(vertex.weights)
+            for bone, weight in vertex.weights:
+                bones.append(bone)
+                values.append(weight)
+        (arrays.weight_offsets, arrays.weight_bones,
+         arrays.weight_values) = __build_weight_offsets__(starts, counts,
+                                                          bones, values)
+
+        for index, face_vert in self.pending_face_verts:
+            __store_face_vertex__(arrays, index, face_vert)
+        return None
+
+    def LoadVertexCount(self, data, pos):
+        end = XBinDecoder.LoadVertexCount(self, data, pos)
+        self.__init_verts__()
+        return end
+
+    def LoadVertex32Count(self, data, pos):
+        end = XBinDecoder.LoadVertex32Count(self, data, pos)
+        self.__init_verts__()
+        return end
+
+    def __init_verts__(self):
+        count = len(self.dummy_mesh.verts)
+        self.dummy_mesh.verts = []
+        self.target.__init_verts__(count)
+        self.weight_starts = [0] * count
+        self.weight_counts = [0] * count
+
+    def __load_vertex_index__(self, data, pos, index):
+        if self.active_tri is None:
+            return self.__load_vertex__(data, pos, index)
+
+        corner = self.corner
+        self.corner = corner + 1
+        face_vert = FaceVertex(index)
+        self.active_thing = face_vert
+        if corner >= 3 or self.face_number >= self.target.face_count():
+            # Any extra face vertices are decoded but not stored
+            return pos
+
+        arrays = self.target
+        index_pos = 3 * self.face_number + corner
+        try:
+            (normal_hash, nx, ny, nz,
+             color_hash, r, g, b, a,
+             uv_hash, layer_count, u, v) = __unpack_face_vertex__(data, pos)
+        except struct.error:
+            normal_hash = None
+        if (normal_hash != 0x89EC or color_hash != 0x6DD8 or
+                uv_hash != 0x1AD4 or layer_count != 1):
+            self.pending_face_verts.append((index_pos, face_vert))
+            return pos
+
+        arrays.face_vertices[index_pos] = index
+        normals = arrays.normals
+        normals[3 * index_pos] = nx / 32767.0
+        normals[3 * index_pos + 1] = ny / 32767.0
+        normals[3 * index_pos + 2] = nz / 32767.0
+        colors = arrays.colors
+        colors[4 * index_pos] = r / 255.0
+        colors[4 * index_pos + 1] = g / 255.0
+        colors[4 * index_pos + 2] = b / 255.0
+        colors[4 * index_pos + 3] = a / 255.0
+        uvs = arrays.uvs
+        uvs[2 * index_pos] = u
+        uvs[2 * index_pos + 1] = v
+        return pos + 28
+
+    def __load_vertex__(self, data, pos, index):
+        vertex = Vertex()
+        self.active_thing = vertex
+        try:
+            (offset_hash, x, y, z,
+             count_hash, weight_count) = __unpack_vertex__(data, pos)
+        except struct.error:
+            offset_hash = None
+        if offset_hash != 0x9383 or count_hash != 0xEA46:
+            self.pending_verts.append((index, vertex))
+            return pos
+
+        weights = []
+        weight_pos = pos + 20
+        try:
+            for i in range(weight_count):
+                weight_hash, bone, influence = __unpack_vertex_weight__(
+                    data, weight_pos)
+                if weight_hash != 0xF1AB:
+                    break
+                weights.append(bone)
+                weights.append(influence)
+                weight_pos += 8
+        except struct.error:
+            pass
+        if len(weights) != 2 * weight_count:
+            self.pending_verts.append((index, vertex))
+            return pos
+
+        arrays = self.target
+        positions = arrays.positions
+        positions[3 * index] = x
+        positions[3 * index + 1] = y
+        positions[3 * index + 2] = z
+        self.weight_starts[index] = len(arrays.weight_bones)
+        self.weight_counts[index] = weight_count
+        arrays.weight_bones.extend(weights[0::2])
+        arrays.weight_values.extend(weights[1::2])
+        return weight_pos
+
+    def LoadTriCount(self, data, pos):
+        end = XBinDecoder.LoadTriCount(self, data, pos)
+        self.target.__init_faces__(__unpack_int32__(data, pos + 4)[0], True)
+        self.face_number = -1
+        return end
+
+    def __load_tri__(self, object_index, material_index):
+        XBinDecoder.__load_tri__(self, object_index, material_index)
+        # Only the index is needed, the Face itself isn't kept
+        self.dummy_mesh.faces.pop()
+        self.face_number += 1
+        self.corner = 0
+        arrays = self.target
+        if self.face_number < arrays.face_count():
+            arrays.face_meshes[self.face_number] = object_index
+            arrays.face_materials[self.face_number] = material_index
+
+    def LoadObjectCount(self, data, pos):
+        self.target.mesh_names = [None] * __unpack_int16__(data, pos + 2)[0]
+        return pos + 4
+
+    def LoadObjectInfo(self, data, pos):
+        index = __unpack_int16__(data, pos + 2)[0]
+        name, end = __load_string__(data, pos + 4)
+        self.target.mesh_names[index] = name
+        return pos + padded(end - pos)
+
+
+ModelArraysDecoder.handlers = dict(XBinDecoder.handlers)
+ModelArraysDecoder.handlers.update({
+    0x950D: ModelArraysDecoder.LoadVertexCount,
+    0x2AEC: ModelArraysDecoder.LoadVertex32Count,
+    0xBE92: ModelArraysDecoder.LoadTriCount,
+    0x62AF: ModelArraysDecoder.LoadObjectCount,
+    0x87D4: ModelArraysDecoder.LoadObjectInfo,
+})
+
+
+def __uniform_weights__(weight_offsets, start, end):
+    '''
+    Returns the number of weights of each of the vertices in [start, end) or
+     None if they don't all have the same number of weights
+    '''
+    first = weight_offsets[start]
+    weight_count = (weight_offsets[end] - first) // (end - start)
+    if weight_count:
+        expected = array(weight_offsets.typecode,
+                         range(first, first + weight_count * (end - start) + 1,
+                               weight_count))
+    else:
+        expected = array(weight_offsets.typecode, [first]) * (end - start + 1)
+    if weight_offsets[start:end + 1] != expected:
+        return None
+    return weight_count
+
+
+def __clamp_normals__(normals):
+    '''
+    Same as xmodel.__clamp_normal__ for a flat array of normals
+    '''
+    if normals and (min(normals) < -1.0 or max(normals) > 1.0):
+        normals = [max(min(v, 1.0), -1.0) for v in normals]
+    nonzero = list(map(any, zip(normals[0::3], normals[1::3], normals[2::3])))
+    if not all(nonzero):
+        normals = list(normals)
+        for i, is_nonzero in enumerate(nonzero):
+            if not is_nonzero:
+                normals[3 * i:3 * i + 3] = [0.0, 0.0, 1.0]
+    return normals
+
+
+def __clamp_shorts__(values):
+    '''
+    Same as xbin.__clamp_float_to_short__ for a flat array of values
+    '''
+    values = [int(v * 32767) for v in values]
+    if values and (min(values) < -32768 or max(values) > 32767):
+        values = [max(min(v, 32767), -32768) for v in values]
+    return values
+
+
+def __write_vertices_raw__(file, vert_tok_suffix, positions,
+                           weight_offsets, weight_bones, weight_values):
+    '''
+    Write the vertices of an XMODEL_EXPORT file
+    Every batch of vertices is formatted in a single operation - if they all
+     have the same number of weights, their values are interleaved using
+     strided slices
+    '''
+    batch_formats = {}
+    vert_count = len(positions) // 3
+    for start in range(0, vert_count, WRITE_BATCH_SIZE):
+        end = min(start + WRITE_BATCH_SIZE, vert_count)
+        count = end - start
+
+        weight_count = __uniform_weights__(weight_offsets, start, end)
+        if weight_count is None:
+            fmts = []
+            values = []
+            for i in range(start, end):
+                first = weight_offsets[i]
+                last = weight_offsets[i + 1]
+                fmts.append(__vertex_format__(vert_tok_suffix, last - first))
+                values.append(i)
+                values.extend(positions[3 * i:3 * i + 3])
+                for weight in range(first, last):
+                    values.append(weight_bones[weight])
+                    values.append(weight_values[weight])
+            file.write_batch(fmts, values)
+            continue
+
+        fmt = batch_formats.get((weight_count, count))
+        if fmt is None:
+            fmt = __vertex_format__(vert_tok_suffix, weight_count) * count
+            batch_formats[(weight_count, count)] = fmt
+
+        first = weight_offsets[start]
+        last = weight_offsets[end]
+        stride = 4 + 2 * weight_count
+        values = [0] * (stride * count)
+        values[0::stride] = range(start, end)
+        for i in range(3):
+            values[1 + i::stride] = positions[3 * start + i:3 * end:3]
+        for i in range(weight_count):
+            values[4 + 2 * i::stride] = weight_bones[first + i:last:
+                                                     weight_count]
+            values[5 + 2 * i::stride] = weight_values[first + i:last:
+                                                      weight_count]
+        file.write_batch([fmt], values)
+
+
+def __write_faces_raw__(file, version, vert_tok_suffix, face_vertices,
+                        normals, colors, uvs, face_meshes, face_materials):
+    '''
+    Write the faces of an XMODEL_EXPORT file
+    Every batch of faces is formatted in a single operation, with their
+     values interleaved using strided slices
+    '''
+    batch_formats = {}
+    face_format = __face_format__(version, vert_tok_suffix)
+    # The number of values of each face vertex & face
+    vertex_stride = 6 if version == 5 else 10
+    stride = 3 + 3 * vertex_stride
+
+    face_count = len(face_meshes)
+    for start in range(0, face_count, WRITE_BATCH_SIZE):
+        end = min(start + WRITE_BATCH_SIZE, face_count)
+        count = end - start
+
+        fmt = batch_formats.get(count)
+        if fmt is None:
+            fmt = face_format * count
+            batch_formats[count] = fmt
+
+        values = [0] * (stride * count)
+        meshes = face_meshes[start:end]
+        materials = face_materials[start:end]
+        # Only use TRI16 if we're using version 7 or newer, etc.
+        if version >= 7 and (max(meshes) > 255 or max(materials) > 255):
+            values[0::stride] = ["TRI16" if mesh_id > 255 or
+                                 material_id > 255 else "TRI"
+                                 for mesh_id, material_id
+                                 in zip(meshes, materials)]
+        else:
+            values[0::stride] = ["TRI"] * count
+        values[1::stride] = meshes
+        values[2::stride] = materials
+
+        batch_normals = __clamp_normals__(normals[9 * start:9 * end])
+        for corner in range(3):
+            base = 3 + corner * vertex_stride
+            values[base::stride] = face_vertices[3 * start + corner:
+                                                 3 * end:3]
+            for i in range(3):
+                values[base + 1 + i::stride] = batch_normals[3 * corner + i::
+                                                             9]
+            if version == 5:
+                uv_base = base + 4
+            else:
+                for i in range(4):
+                    values[base + 4 + i::stride] = colors[
+                        12 * start + 4 * corner + i:12 * end:12]
+                uv_base = base + 8
+            for i in range(2):
+                values[uv_base + i::stride] = uvs[6 * start + 2 * corner + i:
+                                                  6 * end:6]
+        file.write_batch([fmt], values)
+
+
+def __encode_model_arrays__(arrays, version, extended_features=True,
+                            header_message=""):
+    '''
+    Encode a ModelArrays as the (uncompressed) block stream of an xmodel_bin
+     file - the result is the same as __encode_model__'s for the Model that
+     from_model was given
+    Every batch of vertices (with the same number of weights) & faces is
+     packed with a single struct
+    Returns the buffer (a bytearray)
+    '''
+    float_type = arrays.float_type
+    positions = __as_array__(arrays.positions, float_type)
+    weight_offsets = __as_array__(arrays.weight_offsets, INDEX_TYPE)
+    weight_bones = __as_array__(arrays.weight_bones, INDEX_TYPE)
+    weight_values = __as_array__(arrays.weight_values, float_type)
+    face_vertices = __as_array__(arrays.face_vertices, INDEX_TYPE)
+    normals = __as_array__(arrays.normals, float_type)
+    if arrays.colors is None:
+        raise ValueError("xmodel_bin files require vertex colors")
+    colors = __as_array__(arrays.colors, float_type)
+    uvs = __as_array__(arrays.uvs, float_type)
+    face_meshes = __as_array__(arrays.face_meshes, INDEX_TYPE)
+    face_materials = __as_array__(arrays.face_materials, INDEX_TYPE)
+
+    comment, bone_names, mesh_names, material_strings = __model_strings__(
+        header_message, arrays.bones, arrays.mesh_names, arrays.materials,
+        extended_features)
+    cosmetic_count = len([bone for bone in arrays.bones if bone.cosmetic])
+
+    vert_count = len(positions) // 3
+    weight_count = weight_offsets[vert_count] - weight_offsets[0]
+    face_count = len(face_meshes)
+    tri16_count = 0
+    if face_count and (max(face_meshes) > 255 or max(face_materials) > 255):
+        tri16_count = len([mesh_id for mesh_id, material_id
+                           in zip(face_meshes, face_materials)
+                           if mesh_id > 255 or material_id > 255])
+    use_vertex32 = version == 7 and vert_count > 0xFFFF
+    index_size = 8 if use_vertex32 else 4
+
+    # Compute the exact size of the block stream
+    size = __model_head_size__(comment, bone_names, cosmetic_count)
+    size += index_size + (index_size + 16 + 4) * vert_count
+    size += 8 * weight_count
+    size += 8 + 4 * (face_count + tri16_count)
+    size += 3 * (index_size + 8 + 8 + 12) * face_count
+    size += __model_tail_size__(mesh_names, material_strings)
+
+    buffer = bytearray(size)
+    pos = __pack_model_head__(buffer, 0, version, comment,
+                              arrays.bones, bone_names, cosmetic_count)
+
+    # Vertices
+    if use_vertex32:
+        __pack_uint32_block__(buffer, pos, 0x2AEC, vert_count)
+        pack_vertex = __pack_vertex32__
+        pack_face_vertex = __pack_face_vertex32__
+        vertex_format = 'HxxIHxxfffHh'
+        face_vertex_format = 'HxxIHhhhHxxBBBBHhff'
+        index_hash = 0xB097
+    else:
+        __pack_uint16_block__(buffer, pos, 0x950D, vert_count)
+        pack_vertex = __pack_vertex16__
+        pack_face_vertex = __pack_face_vertex16__
+        vertex_format = 'HHHxxfffHh'
+        face_vertex_format = 'HHHhhhHxxBBBBHhff'
+        index_hash = 0x8F03
+    pos += index_size
+
+    structs = {}
+    vertex_size = index_size + 16 + 4
+    for start in range(0, vert_count, WRITE_BATCH_SIZE):
+        end = min(start + WRITE_BATCH_SIZE, vert_count)
+        count = end - start
+        first = weight_offsets[start]
+        last = weight_offsets[end]
+
+        weights = __uniform_weights__(weight_offsets, start, end)
+        if weights is None:
+            for vert_index in range(start, end):
+                x, y, z = positions[3 * vert_index:3 * vert_index + 3]
+                first = weight_offsets[vert_index]
+                last = weight_offsets[vert_index + 1]
+                pack_vertex(buffer, pos, index_hash, vert_index,
+                            0x9383, x, y, z, 0xEA46, last - first)
+                pos += vertex_size
+                for weight in range(first, last):
+                    __pack_weight_block__(buffer, pos, 0xF1AB,
+                                          weight_bones[weight],
+                                          weight_values[weight])
+                    pos += 8
+            continue
+
+        key = ('vertices', weights, count)
+        pack = structs.get(key)
+        if pack is None:
+            pack = struct.Struct('<' + (vertex_format + 'Hhf' * weights) *
+                                 count)
+            structs[key] = pack
+
+        stride = 8 + 3 * weights
+        values = [0] * (stride * count)
+        values[0::stride] = [index_hash] * count
+        values[1::stride] = range(start, end)
+        values[2::stride] = [0x9383] * count
+        for i in range(3):
+            values[3 + i::stride] = positions[3 * start + i:3 * end:3]
+        values[6::stride] = [0xEA46] * count
+        values[7::stride] = [weights] * count
+        for i in range(weights):
+            values[8 + 3 * i::stride] = [0xF1AB] * count
+            values[9 + 3 * i::stride] = weight_bones[first + i:last:weights]
+            values[10 + 3 * i::stride] = weight_values[first + i:last:
+                                                       weights]
+        pack.pack_into(buffer, pos, *values)
+        pos += pack.size
+
+    # Faces
+    __pack_uint32_block__(buffer, pos, 0xBE92, face_count)
+    pos += 8
+
+    face_vertex_size = index_size + 8 + 8 + 12
+    for start in range(0, face_count, WRITE_BATCH_SIZE):
+        end = min(start + WRITE_BATCH_SIZE, face_count)
+        count = end - start
+        meshes = face_meshes[start:end]
+        materials = face_materials[start:end]
+        batch_normals = __clamp_shorts__(normals[9 * start:9 * end])
+        batch_colors = [int(c * 255) for c in colors[12 * start:12 * end]]
+
+        if max(meshes) > 255 or max(materials) > 255:
+            clamp = __clamp_float_to_short__
+            for face_index in range(start, end):
+                mesh_id = face_meshes[face_index]
+                material_id = face_materials[face_index]
+                if mesh_id > 255 or material_id > 255:
+                    __pack_tri16_block__(buffer, pos, 0x6711, 0x0,
+                                         mesh_id, material_id)
+                    pos += 8
+                else:
+                    __pack_tri_block__(buffer, pos, 0x562F,
+                                       mesh_id, material_id)
+                    pos += 4
+                for corner in range(3 * face_index, 3 * face_index + 3):
+                    nx, ny, nz = normals[3 * corner:3 * corner + 3]
+                    r, g, b, a = colors[4 * corner:4 * corner + 4]
+                    u, v = uvs[2 * corner:2 * corner + 2]
+                    pack_face_vertex(buffer, pos,
+                                     index_hash, face_vertices[corner],
+                                     0x89EC, clamp(nx), clamp(ny), clamp(nz),
+                                     0x6DD8, int(r * 255), int(g * 255),
+                                     int(b * 255), int(a * 255),
+                                     0x1AD4, 1, u, v)
+                    pos += face_vertex_size
+            continue
+
+        key = ('faces', count)
+        pack = structs.get(key)
+        if pack is None:
+            pack = struct.Struct('<' + ('HBB' + face_vertex_format * 3) *
+                                 count)
+            structs[key] = pack
+
+        stride = 48
+        values = [0] * (stride * count)
+        values[0::stride] = [0x562F] * count
+        values[1::stride] = meshes
+        values[2::stride] = materials
+        for corner in range(3):
+            base = 3 + 15 * corner
+            values[base::stride] = [index_hash] * count
+            values[base + 1::stride] = face_vertices[3 * start + corner:
+                                                     3 * end:3]
+            values[base + 2::stride] = [0x89EC] * count
+            for i in range(3):
+                values[base + 3 + i::stride] = batch_normals[3 * corner + i::
+                                                             9]
+            values[base + 6::stride] = [0x6DD8] * count
+            for i in range(4):
+                values[base + 7 + i::stride] = batch_colors[4 * corner + i::
+                                                            12]
+            values[base + 11::stride] = [0x1AD4] * count
+            values[base + 12::stride] = [1] * count
+            for i in range(2):
+                values[base + 13 + i::stride] = uvs[6 * start + 2 * corner +
+                                                    i:6 * end:6]
+        pack.pack_into(buffer, pos, *values)
+        pos += pack.size
+
+    pos = __pack_model_tail__(buffer, pos, mesh_names,
+                              arrays.materials, material_strings)
+
+    assert pos == size
+    return buffer